@@ -2,17 +2,28 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import Optional
+from contextlib import asynccontextmanager
 import os
 
 from database.models import SessionLocal, Usuario, init_db
+from database.database import metricas_pools, cerrar_engine_async
 from api.routers import users, invoices, items_factura
+from auth.security import get_current_principal
 
 init_db()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await cerrar_engine_async()
+
+
 app = FastAPI(
     title="API de Gestión de Facturas y Correos",
     description="API para la gestión de facturas electrónicas extraídas de correos y funcionalidades de usuario.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -21,6 +32,7 @@ app.add_middleware(
     allow_credentials=False,  
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -37,6 +49,11 @@ app.include_router(invoices.router, prefix="/invoices", tags=["Facturas"])
 app.include_router(items_factura.router, prefix="/invoices", tags=["Ítems de Factura"])
 
 
+@app.get("/metrics/pool", tags=["Métricas"], dependencies=[Depends(get_current_principal)])
+async def pool_metrics():
+    return metricas_pools()
+
+
 @app.get("/")
 async def root():
     return {"message": "API de Gestión de Facturas y Correos funcionando correctamente."}
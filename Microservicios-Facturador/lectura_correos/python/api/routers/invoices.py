@@ -1,14 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Dict, Any, Union
 from datetime import date, datetime
 from database.models import SessionLocal, Factura, ItemFactura
 from database.crud import InvoiceCRUD 
-from api.schemas.invoices import Invoice, InvoiceCreate, InvoiceUpdate, ItemFacturaCreate 
+from database.crud_async import AsyncInvoiceCRUD
+from database.database import get_async_db
+from database.paginacion import CursorInvalido
+from database.auditoria import reconstruir_factura
+from storage.blob_store import obtener_blob_store
+from api.schemas.invoices import Invoice, InvoiceCreate, InvoiceUpdate, ItemFacturaCreate, InvoiceListItem, InvoiceListItemWithItems, InvoiceSearchResult 
 from auth.security import get_current_tenant_id # <-- Importar para obtener tenant_id
 
 router = APIRouter()
 
+# Los endpoints `async def` usan AsyncSession (get_async_db); los que dependen de código síncrono
+# (búsqueda, descargas, reconstrucción de versiones) se declaran `def` y FastAPI los ejecuta en
+# el threadpool, sin bloquear el event loop.
 def get_db():
     db = SessionLocal()
     try:
@@ -16,12 +26,14 @@ def get_db():
     finally:
         db.close()
 
-@router.get("/", response_model=List[Invoice], summary="Obtener lista de facturas con filtros y paginación")
+@router.get("/", response_model=List[Union[InvoiceListItemWithItems, InvoiceListItem]], summary="Obtener lista de facturas con filtros y paginación")
 async def get_invoices(
+    response: Response,
     # tenant_id debe ser el primer argumento no predeterminado
     tenant_id: str = Depends(get_current_tenant_id), # <-- Proteger y filtrar por tenant_id
-    skip: int = Query(0, ge=0, description="Número de registros a saltar para paginación"),
+    skip: int = Query(0, ge=0, description="Número de registros a saltar para paginación (preferir `cursor`); con `cursor`, se cuentan desde el cursor"),
     limit: int = Query(100, ge=1, le=500, description="Número máximo de registros a devolver"),
+    cursor: Optional[str] = Query(None, description="Cursor de continuación devuelto en la cabecera X-Next-Cursor de la página anterior"),
     numero_factura: Optional[str] = Query(None, description="Filtrar por número de factura (búsqueda parcial)"),
     nit_proveedor: Optional[str] = Query(None, description="Filtrar por NIT del proveedor"),
     nombre_proveedor: Optional[str] = Query(None, description="Filtrar por nombre del proveedor (búsqueda parcial)"),
@@ -32,54 +44,124 @@ async def get_invoices(
     tipo_documento_dian: Optional[str] = Query(None, description="Filtrar por categoría de proveedor"),
     revisada_manualmente: Optional[bool] = Query(None, description="Filtrar por estado de revisión manual (True/False)"),
     usuario_id: Optional[int] = Query(None, ge=1, description="Filtrar por ID de usuario asociado"),
-    db: Session = Depends(get_db)
+    include: Optional[str] = Query(None, description="Datos adicionales separados por coma; 'items' agrega los ítems de cada factura"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    invoice_crud = InvoiceCRUD(db)
-    invoices = invoice_crud.get_invoices(
-        tenant_id=tenant_id, # <-- Pasar tenant_id
-        skip=skip,
-        limit=limit,
-        numero_factura=numero_factura,
-        nit_proveedor=nit_proveedor,
-        nombre_proveedor=nombre_proveedor,
-        fecha_desde=fecha_desde,
-        fecha_hasta=fecha_hasta,
-        monto_total_min=monto_total_min,
-        monto_total_max=monto_total_max,
-        tipo_documento_dian=tipo_documento_dian,
-        revisada_manualmente=revisada_manualmente,
-        usuario_id=usuario_id
-    )
-    return invoices
+    incluir_items = "items" in {parte.strip() for parte in (include or "").split(",")}
+    invoice_crud = AsyncInvoiceCRUD(db)
+    try:
+        invoices, siguiente_cursor = await invoice_crud.get_invoices(
+            tenant_id=tenant_id, # <-- Pasar tenant_id
+            skip=skip,
+            limit=limit,
+            numero_factura=numero_factura,
+            nit_proveedor=nit_proveedor,
+            nombre_proveedor=nombre_proveedor,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            monto_total_min=monto_total_min,
+            monto_total_max=monto_total_max,
+            tipo_documento_dian=tipo_documento_dian,
+            revisada_manualmente=revisada_manualmente,
+            usuario_id=usuario_id,
+            incluir_items=incluir_items,
+            cursor=cursor
+        )
+    except CursorInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if siguiente_cursor:
+        response.headers["X-Next-Cursor"] = siguiente_cursor
+    modelo = InvoiceListItemWithItems if incluir_items else InvoiceListItem
+    return [modelo.model_validate(invoice) for invoice in invoices]
+
+# Declarada antes de /{invoice_id} para que "search" no se interprete como un ID.
+@router.get("/search", response_model=List[InvoiceSearchResult], summary="Buscar facturas por número, proveedor o descripción de ítems")
+def search_invoices(
+    q: str = Query(..., min_length=1, max_length=200, description="Texto a buscar"),
+    limit: int = Query(20, ge=1, le=100, description="Número máximo de resultados"),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_current_tenant_id)
+):
+    resultados = InvoiceCRUD(db).search_invoices(tenant_id, q, limit=limit)
+    return [
+        InvoiceSearchResult(**InvoiceListItem.model_validate(factura).model_dump(), puntaje=puntaje)
+        for factura, puntaje in resultados
+    ]
 
 @router.get("/{invoice_id}", response_model=Invoice, summary="Obtener detalles de una factura por ID")
 async def get_invoice_details(
     invoice_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id: str = Depends(get_current_tenant_id) # <-- Proteger y filtrar por tenant_id
 ):
-    invoice_crud = InvoiceCRUD(db)
-    invoice = invoice_crud.get_invoice(invoice_id, tenant_id) # <-- Pasar tenant_id
+    invoice_crud = AsyncInvoiceCRUD(db)
+    invoice = await invoice_crud.get_invoice(invoice_id, tenant_id) # <-- Pasar tenant_id
     if not invoice:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Factura no encontrada o no pertenece a su inquilino.")
     return invoice
 
+_TIPOS_CONTENIDO = {'pdf': 'application/pdf', 'xml': 'application/xml'}
+
+def _descargar(invoice_id: int, tipo: str, db: Session, tenant_id: str):
+    encontrado = InvoiceCRUD(db).get_invoice_blob(invoice_id, tenant_id, tipo)
+    if encontrado is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Factura no encontrada o no pertenece a su inquilino.")
+    numero_factura, clave, en_linea = encontrado
+    headers = {"Content-Disposition": f'attachment; filename="{numero_factura or invoice_id}.{tipo}"'}
+    if clave:
+        store = obtener_blob_store()
+        if not store.existe(clave):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"El {tipo.upper()} de la factura no está disponible en el almacén.")
+        return StreamingResponse(store.iterar(clave), media_type=_TIPOS_CONTENIDO[tipo], headers=headers)
+    if en_linea is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"La factura no tiene {tipo.upper()} asociado.")
+    return Response(content=en_linea, media_type=_TIPOS_CONTENIDO[tipo], headers=headers)
+
+@router.get("/{invoice_id}/pdf", summary="Descargar el PDF de una factura")
+def download_invoice_pdf(
+    invoice_id: int,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_current_tenant_id)
+):
+    return _descargar(invoice_id, 'pdf', db, tenant_id)
+
+@router.get("/{invoice_id}/xml", summary="Descargar el XML de una factura")
+def download_invoice_xml(
+    invoice_id: int,
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_current_tenant_id)
+):
+    return _descargar(invoice_id, 'xml', db, tenant_id)
+
+@router.get("/{invoice_id}/version", response_model=Dict[str, Any], summary="Reconstruir la versión de una factura vigente en una fecha")
+def get_invoice_version(
+    invoice_id: int,
+    hasta: Optional[datetime] = Query(None, description="Fecha y hora de la versión a reconstruir (por defecto, la actual)"),
+    db: Session = Depends(get_db),
+    tenant_id: str = Depends(get_current_tenant_id)
+):
+    version = reconstruir_factura(db, invoice_id, tenant_id, hasta)
+    if version is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="La factura no existía en esa fecha o no pertenece a su inquilino.")
+    return version
+
 @router.post("/", response_model=Invoice, status_code=status.HTTP_201_CREATED, summary="Crear una nueva factura manualmente")
 async def create_invoice(
     invoice: InvoiceCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id: str = Depends(get_current_tenant_id) # <-- Proteger y pasar tenant_id
 ):
-    invoice_crud = InvoiceCRUD(db)
+    invoice_crud = AsyncInvoiceCRUD(db)
     items_data = [item.dict() for item in invoice.items]
-    invoice_data = invoice.dict(exclude={'items'})
+    # El inquilino sale del token, no del cuerpo.
+    invoice_data = invoice.dict(exclude={'items', 'tenant_id'})
 
-    invoice_id = invoice_crud.create_invoice(invoice_data, items_data, tenant_id) # <-- Pasar tenant_id
+    invoice_id = await invoice_crud.create_invoice(invoice_data, items_data, tenant_id) # <-- Pasar tenant_id
     if not invoice_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se pudo crear la factura. Verifique los datos o si ya existe un CUFE/Número de factura duplicado.")
     
     # Al recuperar, también filtrar por tenant_id
-    created_invoice = invoice_crud.get_invoice(invoice_id, tenant_id) 
+    created_invoice = await invoice_crud.get_invoice(invoice_id, tenant_id) 
     if not created_invoice:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Factura creada pero no se pudo recuperar.")
     return created_invoice
@@ -88,17 +170,17 @@ async def create_invoice(
 async def update_invoice(
     invoice_id: int, 
     invoice_update: InvoiceUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id: str = Depends(get_current_tenant_id) # <-- Proteger y pasar tenant_id
 ):
-    invoice_crud = InvoiceCRUD(db)
+    invoice_crud = AsyncInvoiceCRUD(db)
     update_data = invoice_update.dict(exclude_unset=True)
     items_data_to_update = None
     if "items" in update_data:
+        # dict(exclude_unset=True) ya convirtió los ítems en diccionarios.
         items_data_to_update = update_data.pop("items")
-        items_data_to_update = [item.dict() for item in items_data_to_update] 
     
-    updated_invoice_id = invoice_crud.update_invoice(
+    updated_invoice_id = await invoice_crud.update_invoice(
         tenant_id=tenant_id, # <-- Mover tenant_id al inicio
         invoice_id=invoice_id, 
         update_data=update_data, 
@@ -108,7 +190,7 @@ async def update_invoice(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Factura no encontrada o error al actualizar o no pertenece a su inquilino.")
     
     # Al recuperar, también filtrar por tenant_id
-    updated_invoice = invoice_crud.get_invoice(updated_invoice_id, tenant_id) 
+    updated_invoice = await invoice_crud.get_invoice(updated_invoice_id, tenant_id) 
     if not updated_invoice:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Factura actualizada pero no se pudo recuperar.")
     return updated_invoice
@@ -116,11 +198,11 @@ async def update_invoice(
 @router.delete("/{invoice_id}", status_code=status.HTTP_204_NO_CONTENT, summary="Eliminar una factura")
 async def delete_invoice(
     invoice_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id: str = Depends(get_current_tenant_id) # <-- Proteger y pasar tenant_id
 ):
-    invoice_crud = InvoiceCRUD(db)
-    success = invoice_crud.delete_invoice(
+    invoice_crud = AsyncInvoiceCRUD(db)
+    success = await invoice_crud.delete_invoice(
         tenant_id=tenant_id, # <-- Mover tenant_id al inicio
         invoice_id=invoice_id
     )
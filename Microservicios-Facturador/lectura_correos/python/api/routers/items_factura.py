@@ -1,28 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-
-from database.models import SessionLocal, Factura
-from database.crud import ItemFacturaCRUD
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from database.models import Factura
+from database.crud_async import AsyncItemFacturaCRUD
+from database.database import get_async_db
+from database.paginacion import CursorInvalido
 from api.schemas.items_factura import ItemFacturaCreate, ItemFactura, ItemFacturaUpdate
 from auth.security import get_current_tenant_id # <-- Importar para obtener tenant_id
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Modificar para que también filtre la factura por tenant_id
 async def check_invoice_exists(
     factura_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id: str = Depends(get_current_tenant_id) # Obtener tenant_id del token
 ):
-    factura = db.query(Factura).filter(Factura.id == factura_id, Factura.tenant_id == tenant_id).first()
+    factura = await db.scalar(
+        select(Factura).options(load_only(Factura.id, Factura.tenant_id))
+        .where(Factura.id == factura_id, Factura.tenant_id == tenant_id)
+    )
     if not factura:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -34,12 +34,12 @@ async def check_invoice_exists(
 async def create_item_for_invoice(
     factura_id: int,
     item: ItemFacturaCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_invoice: Factura = Depends(check_invoice_exists), # Ya valida el tenant_id
     tenant_id: str = Depends(get_current_tenant_id) # Pasar tenant_id al CRUD
 ):
-    item_crud = ItemFacturaCRUD(db)
-    created_item = item_crud.create_item_factura(
+    item_crud = AsyncItemFacturaCRUD(db)
+    created_item_id = await item_crud.create_item_factura(
         factura_id=factura_id,
         descripcion=item.descripcion,
         cantidad=item.cantidad,
@@ -47,33 +47,40 @@ async def create_item_for_invoice(
         valor_total=item.valor_total,
         tenant_id=tenant_id # <-- Pasar tenant_id
     )
-    if not created_item:
+    if not created_item_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se pudo crear el ítem de factura.")
-    return created_item
+    return await item_crud.get_item_factura(item_id=created_item_id, factura_id=factura_id, tenant_id=tenant_id)
 
 @router.get("/{factura_id}/items/", response_model=List[ItemFactura])
 async def get_items_for_invoice(
     factura_id: int,
-    skip: int = 0,
+    response: Response,
+    skip: int = Query(0, ge=0, description="Número de registros a saltar (preferir `cursor`); con `cursor`, se cuentan desde el cursor"),
     limit: int = 100,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None, description="Cursor de continuación devuelto en la cabecera X-Next-Cursor de la página anterior"),
+    db: AsyncSession = Depends(get_async_db),
     current_invoice: Factura = Depends(check_invoice_exists), # Ya valida el tenant_id
     tenant_id: str = Depends(get_current_tenant_id) # Pasar tenant_id al CRUD
 ):
-    item_crud = ItemFacturaCRUD(db)
-    items = item_crud.get_items_by_factura(factura_id=factura_id, tenant_id=tenant_id, skip=skip, limit=limit) # <-- Pasar tenant_id
+    item_crud = AsyncItemFacturaCRUD(db)
+    try:
+        items, siguiente_cursor = await item_crud.get_items_by_factura(factura_id=factura_id, tenant_id=tenant_id, skip=skip, limit=limit, cursor=cursor) # <-- Pasar tenant_id
+    except CursorInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if siguiente_cursor:
+        response.headers["X-Next-Cursor"] = siguiente_cursor
     return items
 
 @router.get("/{factura_id}/items/{item_id}", response_model=ItemFactura)
 async def get_item_from_invoice(
     factura_id: int,
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_invoice: Factura = Depends(check_invoice_exists), # Ya valida el tenant_id
     tenant_id: str = Depends(get_current_tenant_id) # Pasar tenant_id al CRUD
 ):
-    item_crud = ItemFacturaCRUD(db)
-    item = item_crud.get_item_factura(item_id=item_id, factura_id=factura_id, tenant_id=tenant_id) # <-- Pasar tenant_id
+    item_crud = AsyncItemFacturaCRUD(db)
+    item = await item_crud.get_item_factura(item_id=item_id, factura_id=factura_id, tenant_id=tenant_id) # <-- Pasar tenant_id
     if not item:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ítem de factura no encontrado en esta factura o no pertenece a su inquilino.")
     return item
@@ -83,32 +90,32 @@ async def update_item_in_invoice(
     factura_id: int,
     item_id: int,
     item_update: ItemFacturaUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_invoice: Factura = Depends(check_invoice_exists), # Ya valida el tenant_id
     tenant_id: str = Depends(get_current_tenant_id) # Pasar tenant_id al CRUD
 ):
-    item_crud = ItemFacturaCRUD(db)
+    item_crud = AsyncItemFacturaCRUD(db)
     update_data = item_update.dict(exclude_unset=True)
-    updated_item = item_crud.update_item_factura(
+    updated_item_id = await item_crud.update_item_factura(
         tenant_id=tenant_id, # <-- Mover tenant_id al inicio
         item_id=item_id, 
         factura_id=factura_id, 
         update_data=update_data
     )
-    if not updated_item:
+    if not updated_item_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ítem de factura no encontrado en esta factura o no se pudo actualizar o no pertenece a su inquilino.")
-    return updated_item
+    return await item_crud.get_item_factura(item_id=updated_item_id, factura_id=factura_id, tenant_id=tenant_id)
 
 @router.delete("/{factura_id}/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item_from_invoice(
     factura_id: int,
     item_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_invoice: Factura = Depends(check_invoice_exists), # Ya valida el tenant_id
     tenant_id: str = Depends(get_current_tenant_id) # Pasar tenant_id al CRUD
 ):
-    item_crud = ItemFacturaCRUD(db)
-    success = item_crud.delete_item_factura(
+    item_crud = AsyncItemFacturaCRUD(db)
+    success = await item_crud.delete_item_factura(
         tenant_id=tenant_id, # <-- Mover tenant_id al inicio
         item_id=item_id, 
         factura_id=factura_id
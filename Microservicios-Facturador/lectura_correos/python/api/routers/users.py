@@ -92,10 +92,10 @@
 
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from database.models import SessionLocal, Usuario 
-from database.crud import UserCRUD
+from database.crud_async import AsyncUserCRUD
+from database.database import get_async_db
 # Importar la dependencia para obtener el tenant_id y la configuración de encriptación
 from auth.security import get_current_tenant_id, get_current_user_id 
 from config.settings import settings # Para CIPHER_SUITE
@@ -103,27 +103,20 @@ from api.schemas.users import UserCreate, User, UserUpdate
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Proteger todas las rutas de este router con get_current_tenant_id
 # Esto significa que cualquier solicitud a /users/* requerirá un JWT válido
 # que contenga un 'id_empresa' (tenant_id)
 @router.post("/", response_model=User, status_code=status.HTTP_201_CREATED)
 async def create_user(
     user_data: UserCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     # Obtener el tenant_id del usuario que está creando este nuevo usuario
     tenant_id_from_token: str = Depends(get_current_tenant_id) 
 ):
-    user_crud = UserCRUD(db)
+    user_crud = AsyncUserCRUD(db)
     
     # Verificar si el correo ya está registrado para este inquilino
-    db_user = user_crud.get_user_by_email(user_data.correo)
+    db_user = await user_crud.get_user_by_email(user_data.correo)
     if db_user and db_user.tenant_id == tenant_id_from_token: # Filtrar por tenant_id
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -143,31 +136,28 @@ async def create_user(
             )
     
     # Crear el usuario asignándole el tenant_id del token
-    created_user = user_crud.create_user(
+    created_user_id = await user_crud.create_user(
         email=user_data.correo,
         email_account_password_encrypted=encrypted_email_password,
         tenant_id=tenant_id_from_token # <-- Asignar el tenant_id
     )
     
-    if not created_user:
+    if not created_user_id:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al crear el usuario."
         )
-    return created_user
+    return await user_crud.get_user(created_user_id, tenant_id_from_token)
 
 @router.get("/{user_id}", response_model=User)
 async def get_user(
     user_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id_from_token: str = Depends(get_current_tenant_id) # Proteger y filtrar por tenant_id
 ):
-    user_crud = UserCRUD(db)
+    user_crud = AsyncUserCRUD(db)
     # Filtrar por user_id Y tenant_id
-    user = user_crud.db.query(Usuario).filter(
-        Usuario.id == user_id, 
-        Usuario.tenant_id == tenant_id_from_token
-    ).first()
+    user = await user_crud.get_user(user_id, tenant_id_from_token)
     
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado o no pertenece a su inquilino.")
@@ -177,22 +167,22 @@ async def get_user(
 async def get_users(
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id_from_token: str = Depends(get_current_tenant_id) # Proteger y filtrar por tenant_id
 ):
-    user_crud = UserCRUD(db)
+    user_crud = AsyncUserCRUD(db)
     # Obtener usuarios filtrados por tenant_id
-    users = user_crud.get_users(skip=skip, limit=limit, tenant_id=tenant_id_from_token)
+    users = await user_crud.get_users(skip=skip, limit=limit, tenant_id=tenant_id_from_token)
     return users
 
 @router.put("/{user_id}", response_model=User)
 async def update_user(
     user_id: int, 
     user_update: UserUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id_from_token: str = Depends(get_current_tenant_id) # Proteger y filtrar por tenant_id
 ):
-    user_crud = UserCRUD(db)
+    user_crud = AsyncUserCRUD(db)
     update_data = user_update.dict(exclude_unset=True)
     
     encrypted_email_password = None
@@ -208,26 +198,26 @@ async def update_user(
             )
 
     # Actualizar usuario filtrando por user_id Y tenant_id
-    updated_user = user_crud.update_user(
+    updated_user_id = await user_crud.update_user(
         user_id=user_id, 
         tenant_id=tenant_id_from_token, # <-- Pasar el tenant_id
         email_account_password_encrypted=encrypted_email_password,
         **update_data
     )
     
-    if not updated_user:
+    if not updated_user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado o no pertenece a su inquilino.")
-    return updated_user
+    return await user_crud.get_user(updated_user_id, tenant_id_from_token)
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user(
     user_id: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     tenant_id_from_token: str = Depends(get_current_tenant_id) # Proteger y filtrar por tenant_id
 ):
-    user_crud = UserCRUD(db)
+    user_crud = AsyncUserCRUD(db)
     # Eliminar usuario filtrando por user_id Y tenant_id
-    success = user_crud.delete_user(user_id=user_id, tenant_id=tenant_id_from_token) # <-- Pasar el tenant_id
+    success = await user_crud.delete_user(user_id=user_id, tenant_id=tenant_id_from_token) # <-- Pasar el tenant_id
     
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado o no pertenece a su inquilino.")
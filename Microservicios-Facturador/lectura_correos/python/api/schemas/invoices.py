@@ -171,6 +171,36 @@ class InvoiceUpdate(BaseModel):
     items: Optional[List[ItemFacturaCreate]] = None 
     tenant_id: Optional[str] = None
 
+# Respuesta del listado: solo las columnas que se muestran en tablas y filtros (sin XML, PDF
+# ni datos del correo). Los ítems vienen únicamente con `?include=items`.
+class InvoiceListItem(BaseModel):
+    id: int
+    cufe: Optional[str] = None
+    numero_factura: Optional[str] = None
+    fecha_emision: Optional[date] = None
+    fecha_vencimiento: Optional[date] = None
+    monto_subtotal: Optional[float] = None
+    monto_impuesto: Optional[float] = None
+    monto_total: Optional[float] = None
+    moneda: Optional[str] = None
+    nombre_proveedor: Optional[str] = None
+    nit_proveedor: Optional[str] = None
+    nombre_cliente: Optional[str] = None
+    nit_cliente: Optional[str] = None
+    tipo_documento_dian: Optional[str] = None
+    revisada_manualmente: Optional[bool] = None
+    usuario_id: Optional[int] = None
+    procesado_en: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class InvoiceListItemWithItems(InvoiceListItem):
+    items: List[ItemFactura]
+
+class InvoiceSearchResult(InvoiceListItem):
+    puntaje: float
+
 class Invoice(InvoiceBase):
     id: int
     categoria_proveedor_id: Optional[int] = None 
@@ -1,5 +1,9 @@
 # auth/security.py
-from datetime import datetime, timedelta
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends, Header 
@@ -23,13 +27,84 @@ def decode_access_token(token: str):
         # logger.error(f"Error al decodificar o validar JWT: {e}") 
         return None
 
-# Dependencia para obtener el tenantId del token
-# Usamos 'Authorization: Optional[str] = Header(None)' para obtener el encabezado
-# y luego lo procesamos.
-def get_current_tenant_id(authorization: Optional[str] = Header(None)) -> str:
+
+@dataclass(frozen=True)
+class Principal:
+    """Identidad autenticada de la petición, tomada del token."""
+    tenant_id: Optional[str]
+    user_id: Optional[str]
+    expira_en: Optional[float]  # `exp` del token (epoch); None si el token no lo trae
+
+
+class CacheTokens:
     """
-    Dependencia de FastAPI para obtener el tenantId del token del encabezado Authorization.
-    Lanza HTTPException si el token es inválido o le falta el tenantId.
+    LRU acotada de tokens ya verificados, por SHA-256 del token (nunca guarda el token).
+    Cada entrada vence en el `exp` del token, o a los AUTH_TOKEN_CACHE_TTL_SECONDS si no lo trae.
+    """
+
+    def __init__(self, tamano_maximo: int, ttl_sin_exp: float):
+        self.tamano_maximo = tamano_maximo
+        self.ttl_sin_exp = ttl_sin_exp
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[Principal]:
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            principal, vence = entrada
+            if time.time() >= vence:
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+            return principal
+
+    def guardar(self, clave: str, principal: Principal):
+        if self.tamano_maximo <= 0:
+            return
+        vence = time.time() + self.ttl_sin_exp
+        if principal.expira_en is not None:
+            vence = principal.expira_en
+        with self._lock:
+            self._entradas[clave] = (principal, vence)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.tamano_maximo:
+                self._entradas.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+cache_tokens = CacheTokens(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+
+
+def verificar_token(token: str) -> Optional[Principal]:
+    """Principal del token si es válido (consultando primero la caché), None si no lo es."""
+    clave = hashlib.sha256(token.encode()).hexdigest()
+    principal = cache_tokens.obtener(clave)
+    if principal is not None:
+        return principal
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    tenant_id, user_id, exp = payload.get("id_empresa"), payload.get("sub"), payload.get("exp")
+    principal = Principal(
+        tenant_id=str(tenant_id) if tenant_id else None,
+        user_id=str(user_id) if user_id else None,
+        expira_en=float(exp) if exp is not None else None,
+    )
+    cache_tokens.guardar(clave, principal)
+    return principal
+
+
+# Dependencia base de autenticación: FastAPI la resuelve una sola vez por petición aunque la
+# usen varias dependencias (get_current_tenant_id, get_current_user_id) de la misma ruta.
+def get_current_principal(authorization: Optional[str] = Header(None)) -> Principal:
+    """
+    Dependencia de FastAPI que valida el token del encabezado Authorization y retorna el Principal.
+    Lanza HTTPException 401 si falta el token, tiene formato inválido o no es válido.
     """
     if authorization is None:
         raise HTTPException(
@@ -46,63 +121,43 @@ def get_current_tenant_id(authorization: Optional[str] = Header(None)) -> str:
             detail="Formato de token inválido. Debe ser 'Bearer <token>'.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    token = token_parts[1]
 
-    payload = decode_access_token(token)
-    if payload is None:
+    principal = verificar_token(token_parts[1])
+    if principal is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token de autenticación inválido o expirado.",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    tenant_id = payload.get("id_empresa")
-    if not tenant_id:
+    return principal
+
+# Dependencia para obtener el tenantId del token
+def get_current_tenant_id(principal: Principal = Depends(get_current_principal)) -> str:
+    """
+    Dependencia de FastAPI para obtener el tenantId del token del encabezado Authorization.
+    Lanza HTTPException si el token es inválido o le falta el tenantId.
+    """
+    if not principal.tenant_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Token de autenticación no contiene la información del inquilino (id_empresa).",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    return str(tenant_id)
+    return principal.tenant_id
 
 # Dependencia para obtener el user_id del token (opcional, si lo necesitas en rutas)
-def get_current_user_id(authorization: Optional[str] = Header(None)) -> str:
+def get_current_user_id(principal: Principal = Depends(get_current_principal)) -> str:
     """
     Dependencia de FastAPI para obtener el user_id del token del encabezado Authorization.
     Lanza HTTPException si el token es inválido o le falta el user_id.
     """
-    if authorization is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="No se proporcionó token de autenticación en el encabezado Authorization.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    token_parts = authorization.split(" ")
-    if len(token_parts) != 2 or token_parts[0].lower() != "bearer":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Formato de token inválido. Debe ser 'Bearer <token>'.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    token = token_parts[1]
-
-    payload = decode_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token de autenticación inválido o expirado.",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    user_id = payload.get("sub") 
-    if not user_id:
+    if not principal.user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Token de autenticación no contiene el ID de usuario ('sub').",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return str(user_id)
+    return principal.user_id
 
 
 # from datetime import datetime, timedelta
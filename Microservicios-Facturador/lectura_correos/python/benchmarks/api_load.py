@@ -0,0 +1,97 @@
+"""
+Prueba de carga de la API: latencia (p50/p95/p99) con N peticiones concurrentes.
+
+Lanza `--peticiones` GET contra la ruta indicada manteniendo `--concurrencia` en vuelo a la vez
+y reporta percentiles, errores y el estado de los pools (GET /metrics/pool) al terminar. Sin
+`--token` firma uno con SECRET_KEY para `--tenant-id`.
+
+Uso (desde lectura_correos/python):
+    python -m benchmarks.api_load                                   # API local, 200 concurrentes
+    python -m benchmarks.api_load --url http://api:8000 --token <jwt>
+    python -m benchmarks.api_load --ruta "/invoices/?limit=50&include=items" --peticiones 5000
+    python -m benchmarks.api_load --en-proceso                      # sin servidor, vía ASGI
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jose import jwt  # noqa: E402
+from config.settings import settings  # noqa: E402
+
+
+def _token(tenant_id: str) -> str:
+    return jwt.encode({"id_empresa": tenant_id}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+async def _peticion(cliente: httpx.AsyncClient, ruta: str, semaforo: asyncio.Semaphore, latencias: list, errores: dict):
+    async with semaforo:
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.get(ruta)
+            if respuesta.status_code >= 400:
+                errores[respuesta.status_code] = errores.get(respuesta.status_code, 0) + 1
+        except httpx.HTTPError as e:
+            errores[type(e).__name__] = errores.get(type(e).__name__, 0) + 1
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def ejecutar(cliente: httpx.AsyncClient, ruta: str, peticiones: int, concurrencia: int):
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias, errores = [], {}
+    inicio = time.perf_counter()
+    await asyncio.gather(*(_peticion(cliente, ruta, semaforo, latencias, errores) for _ in range(peticiones)))
+    duracion = time.perf_counter() - inicio
+
+    milis = sorted(1000 * l for l in latencias)
+    percentiles = statistics.quantiles(milis, n=100, method="inclusive")
+    print(f"{peticiones} peticiones a {ruta} con {concurrencia} concurrentes en {duracion:.2f} s ({peticiones / duracion:.0f} req/s)")
+    print(f"  p50 {percentiles[49]:.1f} ms   p95 {percentiles[94]:.1f} ms   p99 {percentiles[98]:.1f} ms   máx {milis[-1]:.1f} ms")
+    print(f"  errores: {errores or 'ninguno'}")
+
+    respuesta = await cliente.get("/metrics/pool")
+    if respuesta.status_code == 200:
+        for nombre, pool in respuesta.json().items():
+            print(f"  pool {nombre}: {pool['checkouts']} checkouts, espera media {pool['espera_promedio_ms']} ms, "
+                  f"máxima {pool['espera_maxima_ms']} ms, desbordes {pool['desbordes']}, timeouts {pool['timeouts']}")
+
+
+async def main_async(args):
+    cabeceras = {"Authorization": f"Bearer {args.token or _token(args.tenant_id)}"}
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    if args.en_proceso:
+        from api.main import app
+        from database.database import cerrar_engine_async
+        transporte = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transporte, base_url="http://api", headers=cabeceras, timeout=args.timeout) as cliente:
+                await ejecutar(cliente, args.ruta, args.peticiones, args.concurrencia)
+        finally:
+            # ASGITransport no emite el lifespan de la app: se cierra el pool aquí.
+            await cerrar_engine_async()
+    else:
+        async with httpx.AsyncClient(base_url=args.url, headers=cabeceras, limits=limites, timeout=args.timeout) as cliente:
+            await ejecutar(cliente, args.ruta, args.peticiones, args.concurrencia)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--ruta", default="/invoices/?limit=50", help="Ruta (con query string) a consultar")
+    parser.add_argument("--concurrencia", type=int, default=200)
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--token", help="JWT a enviar; por defecto se firma uno con SECRET_KEY")
+    parser.add_argument("--tenant-id", default="tenant-benchmark", help="id_empresa del token generado")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--en-proceso", action="store_true", help="Llama a api.main.app directamente (ASGI), sin servidor")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
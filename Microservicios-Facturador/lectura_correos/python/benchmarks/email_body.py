@@ -0,0 +1,113 @@
+"""
+Benchmark de la extracción de datos del cuerpo del correo (extraction.email_body).
+
+Compara la implementación anterior (un re.search con IGNORECASE por campo sobre todo el cuerpo)
+contra el extractor actual (etiquetas ubicadas con búsquedas de subcadena sobre el cuerpo
+normalizado y el patrón del valor probado solo ahí). Reporta tiempo total, por correo y los
+correos en que ambos extraen datos distintos.
+
+Uso (desde lectura_correos/python):
+    python -m benchmarks.email_body                    # corpus sintético (texto y HTML)
+    python -m benchmarks.email_body /ruta/a/correos    # *.eml propios
+    python -m benchmarks.email_body --correos 2000 --repeticiones 5
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction.email_body import ExtractorCuerpoCorreo  # noqa: E402
+from benchmarks.keyword_matcher import corpus_sintetico, corpus_directorio  # noqa: E402
+
+
+# --- Implementación anterior (referencia) -------------------------------------------------
+
+def extraer_base(body_content):
+    extracted_data = {}
+    body_content = body_content.replace('\r\n', '\n').replace('\r', '\n')
+    patterns = {
+        'nombre_proveedor': r'Empresa:\s*(.+)',
+        'nit_proveedor': r'Identificación:\s*(\d{9,10})',
+        'fecha_emision': r'Fecha:\s*(\d{4}-\d{2}-\d{2})',
+        'numero_factura': r'Número:\s*([A-Za-z0-9\-\_]+)',
+        'cufe': r'CUFE:\s*([a-f0-9]{64,128})'
+    }
+    for key, pattern in patterns.items():
+        match = re.search(pattern, body_content, re.IGNORECASE)
+        if match:
+            value = match.group(1).strip()
+            if key == 'fecha_emision':
+                try:
+                    extracted_data[key] = datetime.strptime(value, '%Y-%m-%d').date()
+                except ValueError:
+                    continue
+            else:
+                extracted_data[key] = value
+    return extracted_data
+
+
+# --- Corpus ---------------------------------------------------------------------------------
+
+def _con_datos(cuerpos, semilla: int = 11):
+    # Un tercio de los correos trae el bloque de datos que envían los proveedores, al final del
+    # texto (lo habitual tras el saludo), así el extractor tiene que llegar hasta ahí.
+    rng = random.Random(semilla)
+    resultado = []
+    for n, cuerpo in enumerate(cuerpos):
+        if rng.random() < 1 / 3:
+            cuerpo += (
+                f"\r\nEmpresa: Proveedor {n} S.A.S.\r\nIdentificación: {900000000 + n}\r\n"
+                f"Fecha: 2024-{1 + n % 12:02d}-{1 + n % 28:02d}\r\nNúmero: FE-{n}\r\nCUFE: {rng.getrandbits(384):096x}\r\n"
+            )
+        resultado.append(cuerpo)
+    return resultado
+
+
+# --- Medición -------------------------------------------------------------------------------
+
+def _medir(extraer, cuerpos, repeticiones: int):
+    tiempos, resultados = [], None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultados = [extraer(cuerpo) for cuerpo in cuerpos]
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000, resultados
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directorio', nargs='?', help="Directorio con correos .eml")
+    parser.add_argument('--correos', type=int, default=1000, help="Correos del corpus sintético")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.directorio:
+        cuerpos = [cuerpo for _, cuerpo in corpus_directorio(args.directorio)]
+    else:
+        cuerpos = _con_datos([cuerpo for _, cuerpo in corpus_sintetico(args.correos)])
+    if not cuerpos:
+        print("No se encontraron correos.")
+        return
+
+    extractor = ExtractorCuerpoCorreo()
+    tamano = sum(map(len, cuerpos)) / 1024 / 1024
+    base, resultados_base = _medir(extraer_base, cuerpos, args.repeticiones)
+    actual, resultados_actual = _medir(extractor.extraer, cuerpos, args.repeticiones)
+
+    print(f"{len(cuerpos)} correos, {tamano:.1f} MB de cuerpo")
+    print(f"{'extractor':<12}{'total ms':>12}{'µs/correo':>12}{'con datos':>12}")
+    print(f"{'anterior':<12}{base:>12.1f}{1000 * base / len(cuerpos):>12.1f}{sum(map(bool, resultados_base)):>12}")
+    print(f"{'actual':<12}{actual:>12.1f}{1000 * actual / len(cuerpos):>12.1f}{sum(map(bool, resultados_actual)):>12}")
+    print(f"\nAceleración: {base / actual:.2f}x")
+    diferencias = [(b, r) for b, r in zip(resultados_base, resultados_actual) if b != r]
+    print(f"Correos en que difieren: {len(diferencias)}")
+    for b, r in diferencias[:5]:
+        print(f"  anterior={b} actual={r}")
+
+if __name__ == '__main__':
+    main()
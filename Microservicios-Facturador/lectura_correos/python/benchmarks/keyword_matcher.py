@@ -0,0 +1,135 @@
+"""
+Benchmark del filtro de palabras clave de la ingesta (ingestion.keyword_matcher).
+
+Compara, sobre un corpus de correos (asunto + cuerpo, como en email_reader), el filtro anterior
+(lower() y una búsqueda por palabra) contra el detector actual (texto normalizado una vez a bytes
+sin mayúsculas ni tildes). Reporta tiempo total, por correo y los correos en que ambos difieren
+(p. ej. "REMISION" sin tilde, que antes no coincidía con "remisión").
+
+Uso (desde lectura_correos/python):
+    python -m benchmarks.keyword_matcher                    # corpus sintético (texto y HTML)
+    python -m benchmarks.keyword_matcher /ruta/a/correos    # *.eml propios
+    python -m benchmarks.keyword_matcher --correos 2000 --repeticiones 5
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from email import policy
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion.keyword_matcher import DetectorFacturas, PALABRAS_POR_DEFECTO  # noqa: E402
+
+
+# --- Implementación anterior (referencia) -------------------------------------------------
+
+def contiene_factura_base(texto):
+    texto = texto.lower()
+    return any(palabra in texto for palabra in PALABRAS_POR_DEFECTO)
+
+
+# --- Corpus ---------------------------------------------------------------------------------
+
+_PALABRAS = (
+    "hola equipo envío documento adjunto reunión semana próximo saludos cordiales producto "
+    "servicio oferta descuento cliente pago gracias información entrega pedido bodega horario"
+).split()
+
+_ASUNTOS_FACTURA = ("Factura electrónica {n}", "FACTURACION ELECTRONICA - {n}", "Envío de Comprobante {n}",
+                    "Nota Crédito {n}", "Invoice #{n}", "Su estado de cuenta {n}")
+_ASUNTOS_OTROS = ("Novedades de la semana", "Reunión de seguimiento", "Confirmación de pedido {n}",
+                  "Re: documentos pendientes", "Boletín mensual")
+
+
+def _parrafo(rng: random.Random) -> str:
+    return ' '.join(rng.choices(_PALABRAS, k=rng.randint(8, 20))).capitalize() + '.'
+
+def _cuerpo(rng: random.Random, parrafos: int, html: bool, frase: str = None) -> str:
+    partes = [_parrafo(rng) for _ in range(parrafos)]
+    if frase:
+        partes.insert(rng.randint(0, len(partes)), frase)
+    if not html:
+        return '\n\n'.join(partes)
+    # Los HTML de notificaciones y boletines traen mucho marcado por cada línea de texto.
+    return (
+        "<html><head><style>td{font-family:Arial,sans-serif;color:#333333}</style></head><body><table>"
+        + ''.join(f"<tr><td style=\"padding:8px 16px;border-bottom:1px solid #eeeeee\">{p}</td>"
+                  f"<td><img src=\"https://cdn.ejemplo.co/img/{rng.randint(1, 9999)}.png\" width=\"24\"></td></tr>" for p in partes)
+        + "</table></body></html>"
+    )
+
+def corpus_sintetico(correos: int, semilla: int = 7):
+    # Mezcla típica de un buzón de facturación: la mitad son facturas de proveedores, el resto
+    # avisos y boletines (los más grandes, y los que hay que recorrer completos).
+    rng = random.Random(semilla)
+    corpus = []
+    for n in range(correos):
+        tipo = rng.random()
+        if tipo < 0.5:
+            asunto = rng.choice(_ASUNTOS_FACTURA).format(n=f"FE{n:06d}")
+            cuerpo = _cuerpo(rng, rng.randint(3, 40), rng.random() < 0.7, "Adjuntamos la factura electrónica de venta.")
+        elif tipo < 0.7:
+            asunto = rng.choice(_ASUNTOS_OTROS).format(n=n)
+            cuerpo = _cuerpo(rng, rng.randint(20, 300), True, "Encuentre adjunta la REMISION de la mercancía.")
+        else:
+            asunto = rng.choice(_ASUNTOS_OTROS).format(n=n)
+            cuerpo = _cuerpo(rng, rng.randint(100, 2500), True)
+        corpus.append((asunto, cuerpo))
+    return corpus
+
+def corpus_directorio(ruta: str):
+    corpus = []
+    for nombre in sorted(os.listdir(ruta)):
+        if not nombre.lower().endswith('.eml'):
+            continue
+        with open(os.path.join(ruta, nombre), 'rb') as f:
+            mensaje = BytesParser(policy=policy.default).parse(f)
+        parte = mensaje.get_body(preferencelist=('plain', 'html'))
+        corpus.append((str(mensaje.get('Subject') or ''), parte.get_content() if parte else ''))
+    return corpus
+
+
+# --- Medición -------------------------------------------------------------------------------
+
+def _medir(filtro, corpus, repeticiones: int):
+    tiempos, resultados = [], None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        # Igual que email_reader: el cuerpo solo se revisa si el asunto no coincide.
+        resultados = [filtro(asunto) or filtro(cuerpo) for asunto, cuerpo in corpus]
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000, resultados
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directorio', nargs='?', help="Directorio con correos .eml")
+    parser.add_argument('--correos', type=int, default=1000, help="Correos del corpus sintético")
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = corpus_directorio(args.directorio) if args.directorio else corpus_sintetico(args.correos)
+    if not corpus:
+        print("No se encontraron correos.")
+        return
+
+    detector = DetectorFacturas(PALABRAS_POR_DEFECTO)
+    tamano = sum(len(a) + len(c) for a, c in corpus) / 1024 / 1024
+    base, resultados_base = _medir(contiene_factura_base, corpus, args.repeticiones)
+    actual, resultados_actual = _medir(detector.coincide, corpus, args.repeticiones)
+
+    print(f"{len(corpus)} correos, {tamano:.1f} MB de asunto + cuerpo")
+    print(f"{'filtro':<12}{'total ms':>12}{'µs/correo':>12}{'coincidencias':>16}")
+    print(f"{'anterior':<12}{base:>12.1f}{1000 * base / len(corpus):>12.1f}{sum(resultados_base):>16}")
+    print(f"{'actual':<12}{actual:>12.1f}{1000 * actual / len(corpus):>12.1f}{sum(resultados_actual):>16}")
+    print(f"\nAceleración: {base / actual:.2f}x")
+    diferencias = [(a, b, r) for (a, _), b, r in zip(corpus, resultados_base, resultados_actual) if b != r]
+    print(f"Correos en que difieren: {len(diferencias)}")
+    for asunto, b, r in diferencias[:5]:
+        print(f"  anterior={b!s:<5} actual={r!s:<5} {asunto[:60]}")
+
+if __name__ == '__main__':
+    main()
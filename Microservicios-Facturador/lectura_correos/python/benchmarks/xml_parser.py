@@ -0,0 +1,183 @@
+"""
+Micro-benchmark de extraction.xml_parser.parse_invoice_xml.
+
+Compara el tiempo por factura del parser actual (un solo recorrido incremental con el mapa
+UBL precompilado) contra la implementación anterior (árbol completo + búsquedas `.//`).
+
+Uso (desde lectura_correos/python):
+    python -m benchmarks.xml_parser                  # corpus sintético tipo DIAN
+    python -m benchmarks.xml_parser /ruta/a/xmls     # *.xml propios (Invoice o AttachedDocument)
+    python -m benchmarks.xml_parser --lineas 1000 --repeticiones 20
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction.xml_parser import NAMESPACES, parse_invoice_xml, extract_nested_invoice_xml  # noqa: E402
+
+
+# --- Implementación anterior (referencia) -------------------------------------------------
+
+def _base_text(element, path):
+    node = element.find(path, NAMESPACES)
+    return node.text.strip() if node is not None and node.text else None
+
+def _base_float(element, path):
+    text_value = _base_text(element, path)
+    if text_value is None:
+        return None
+    try:
+        if ',' in text_value:
+            return float(text_value.replace('.', '').replace(',', '.'))
+        return float(re.sub(r'[^\d.]', '', text_value))
+    except ValueError:
+        return None
+
+def _base_date(element, path):
+    text_value = _base_text(element, path)
+    try:
+        return datetime.strptime(text_value, '%Y-%m-%d').date() if text_value else None
+    except ValueError:
+        return None
+
+def parse_invoice_xml_base(xml_content):
+    root = ET.fromstring(re.sub(r'[^\x09\x0A\x0D\x20-\x7E\x80-\xFF]+', ' ', xml_content))
+    data = {
+        'cufe': _base_text(root, './/cbc:UUID'),
+        'numero_factura': _base_text(root, './/cbc:ID'),
+        'fecha_emision': _base_date(root, './/cbc:IssueDate'),
+        'hora_emision': _base_text(root, './/cbc:IssueTime'),
+        'moneda': _base_text(root, './/cbc:DocumentCurrencyCode'),
+        'monto_subtotal': _base_float(root, './/cac:LegalMonetaryTotal/cbc:LineExtensionAmount'),
+        'monto_total': _base_float(root, './/cac:LegalMonetaryTotal/cbc:PayableAmount'),
+        'fecha_vencimiento': _base_date(root, './/cac:PaymentMeans/cbc:PaymentDueDate'),
+        'metodo_pago': _base_text(root, './/cac:PaymentMeans/cbc:PaymentMeansCode'),
+    }
+    for clave, sufijo, nit, correo in (('AccountingSupplierParty', 'proveedor', 'nit_proveedor', 'email_proveedor'),
+                                       ('AccountingCustomerParty', 'cliente', 'nit_cliente', 'correo_cliente_asociado')):
+        party = root.find(f'.//cac:{clave}/cac:Party', NAMESPACES)
+        if party:
+            data[f'nombre_{sufijo}'] = _base_text(party, './/cac:PartyLegalEntity/cbc:RegistrationName') or \
+                                       _base_text(party, './/cac:PartyName/cbc:Name')
+            data[nit] = _base_text(party, './/cac:PartyTaxScheme/cbc:CompanyID')
+            data[correo] = _base_text(party, './/cac:Contact/cbc:ElectronicMail')
+    total_tax = 0.0
+    for node in root.findall('.//cac:TaxTotal', NAMESPACES):
+        total_tax += _base_float(node, './/cbc:TaxAmount') or 0.0
+    data['monto_impuesto'] = total_tax or None
+    data['items'] = [{
+        'cantidad': _base_float(line, './/cbc:InvoicedQuantity'),
+        'descripcion': _base_text(line, './/cac:Item/cbc:Description'),
+        'valor_unitario': _base_float(line, './/cac:Price/cbc:PriceAmount'),
+        'valor_total': _base_float(line, './/cbc:LineExtensionAmount'),
+    } for line in root.findall('.//cac:InvoiceLine', NAMESPACES)]
+    return data
+
+
+# --- Corpus ---------------------------------------------------------------------------------
+
+def _party(nombre, nit, correo):
+    return (
+        f"<cac:Party><cac:PartyName><cbc:Name>{nombre} SAS</cbc:Name></cac:PartyName>"
+        f"<cac:PartyTaxScheme><cbc:RegistrationName>{nombre}</cbc:RegistrationName>"
+        f"<cbc:CompanyID schemeID=\"7\" schemeName=\"31\">{nit}</cbc:CompanyID></cac:PartyTaxScheme>"
+        f"<cac:PartyLegalEntity><cbc:RegistrationName>{nombre} S.A.S.</cbc:RegistrationName></cac:PartyLegalEntity>"
+        f"<cac:Contact><cbc:ElectronicMail>{correo}</cbc:ElectronicMail></cac:Contact></cac:Party>"
+    )
+
+def factura_sintetica(numero: int, lineas: int, firma_kb: int = 16) -> str:
+    """Factura UBL 2.1 con la forma de las de la DIAN: extensiones y firma al inicio, IVA por línea."""
+    firma = "".join(f"<ds:Reference><ds:DigestValue>{'x' * 120}</ds:DigestValue></ds:Reference>" for _ in range(firma_kb * 6))
+    detalle = "".join(
+        f"<cac:InvoiceLine><cbc:ID>{i}</cbc:ID><cbc:InvoicedQuantity unitCode=\"EA\">{i}.00</cbc:InvoicedQuantity>"
+        f"<cbc:LineExtensionAmount currencyID=\"COP\">{i * 1000}.00</cbc:LineExtensionAmount>"
+        f"<cac:TaxTotal><cbc:TaxAmount currencyID=\"COP\">{i * 190}.00</cbc:TaxAmount>"
+        f"<cac:TaxSubtotal><cbc:TaxAmount currencyID=\"COP\">{i * 190}.00</cbc:TaxAmount></cac:TaxSubtotal></cac:TaxTotal>"
+        f"<cac:Item><cbc:Description>Producto {i}</cbc:Description></cac:Item>"
+        f"<cac:Price><cbc:PriceAmount currencyID=\"COP\">1000.00</cbc:PriceAmount></cac:Price></cac:InvoiceLine>"
+        for i in range(1, lineas + 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2" '
+        f'xmlns:cac="{NAMESPACES["cac"]}" xmlns:cbc="{NAMESPACES["cbc"]}" xmlns:ext="{NAMESPACES["ext"]}" '
+        f'xmlns:sts="{NAMESPACES["sts"]}" xmlns:ds="{NAMESPACES["ds"]}">'
+        "<ext:UBLExtensions><ext:UBLExtension><ext:ExtensionContent><sts:DianExtensions>"
+        "<sts:InvoiceControl><sts:InvoiceAuthorization>18760000001</sts:InvoiceAuthorization></sts:InvoiceControl>"
+        "</sts:DianExtensions></ext:ExtensionContent></ext:UBLExtension>"
+        f"<ext:UBLExtension><ext:ExtensionContent><ds:Signature><ds:SignedInfo>{firma}</ds:SignedInfo></ds:Signature>"
+        "</ext:ExtensionContent></ext:UBLExtension></ext:UBLExtensions>"
+        f"<cbc:UBLVersionID>UBL 2.1</cbc:UBLVersionID><cbc:ID>SETP99{numero:07d}</cbc:ID>"
+        f"<cbc:UUID schemeName=\"CUFE-SHA384\">{numero:096x}</cbc:UUID>"
+        "<cbc:IssueDate>2024-03-01</cbc:IssueDate><cbc:IssueTime>10:00:00-05:00</cbc:IssueTime>"
+        "<cbc:DocumentCurrencyCode>COP</cbc:DocumentCurrencyCode>"
+        f"<cac:AccountingSupplierParty>{_party('Proveedor', '900123456', 'facturacion@proveedor.co')}</cac:AccountingSupplierParty>"
+        f"<cac:AccountingCustomerParty>{_party('Cliente', '800654321', 'compras@cliente.co')}</cac:AccountingCustomerParty>"
+        "<cac:PaymentMeans><cbc:ID>1</cbc:ID><cbc:PaymentMeansCode>10</cbc:PaymentMeansCode>"
+        "<cbc:PaymentDueDate>2024-03-31</cbc:PaymentDueDate></cac:PaymentMeans>"
+        f"<cac:TaxTotal><cbc:TaxAmount currencyID=\"COP\">{sum(range(1, lineas + 1)) * 190}.00</cbc:TaxAmount></cac:TaxTotal>"
+        f"<cac:LegalMonetaryTotal><cbc:LineExtensionAmount currencyID=\"COP\">{sum(range(1, lineas + 1)) * 1000}.00</cbc:LineExtensionAmount>"
+        f"<cbc:PayableAmount currencyID=\"COP\">{sum(range(1, lineas + 1)) * 1190}.00</cbc:PayableAmount></cac:LegalMonetaryTotal>"
+        f"{detalle}</Invoice>"
+    )
+
+def corpus_sintetico(lineas: int):
+    # Mezcla típica: la mayoría con pocas líneas y algunas grandes.
+    tamanos = [1, 2, 3, 5, 8, 12, 20, 40] + ([lineas] if lineas else [])
+    return [(f"sintetica_{n}_lineas.xml", factura_sintetica(i, n)) for i, n in enumerate(tamanos, start=1)]
+
+def corpus_directorio(ruta: str):
+    corpus = []
+    for nombre in sorted(os.listdir(ruta)):
+        if not nombre.lower().endswith('.xml'):
+            continue
+        with open(os.path.join(ruta, nombre), 'rb') as f:
+            xml = extract_nested_invoice_xml(f.read())
+        if xml:
+            corpus.append((nombre, xml))
+    return corpus
+
+
+# --- Medición -------------------------------------------------------------------------------
+
+def _medir(funcion, xml: str, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(xml)
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directorio', nargs='?', help="Directorio con XMLs de facturas DIAN")
+    parser.add_argument('--lineas', type=int, default=2000, help="Líneas de la factura grande del corpus sintético")
+    parser.add_argument('--repeticiones', type=int, default=15)
+    args = parser.parse_args()
+
+    corpus = corpus_directorio(args.directorio) if args.directorio else corpus_sintetico(args.lineas)
+    if not corpus:
+        print("No se encontraron XMLs de factura.")
+        return
+
+    print(f"{'archivo':<36}{'KB':>8}{'anterior ms':>14}{'actual ms':>12}{'x':>7}")
+    totales_base, totales_actual = [], []
+    for nombre, xml in corpus:
+        base = _medir(parse_invoice_xml_base, xml, args.repeticiones)
+        actual = _medir(parse_invoice_xml, xml, args.repeticiones)
+        totales_base.append(base)
+        totales_actual.append(actual)
+        print(f"{nombre[:35]:<36}{len(xml) / 1024:>8.0f}{base:>14.3f}{actual:>12.3f}{base / actual:>7.2f}")
+
+    base, actual = statistics.mean(totales_base), statistics.mean(totales_actual)
+    print(f"\nMedia por factura ({len(corpus)} facturas): anterior {base:.3f} ms, actual {actual:.3f} ms ({base / actual:.2f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -63,21 +63,59 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     DATABASE_URL: str
+    DATABASE_ASYNC_URL: Optional[str] = None # por defecto, DATABASE_URL con el driver asíncrono (aiomysql)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800 # -1 = sin reciclar
+    DB_POOL_PRE_PING: bool = True
     PDF_INPUT_DIR: str = "/app/data/pdf_inbox" 
     PDF_PROCESSED_DIR: str = "/app/data/pdf_processed" 
     PDF_ERROR_DIR: str = "/app/data/pdf_errors" 
     TMP_DIR: str = "/app/tmp" 
     LEARNED_PATTERNS_FILE: str = "/app/learning/learned_patterns.json" 
+    INVOICE_KEYWORDS_FILE: str = "/app/config/palabras_factura.json"
+    EMAIL_BODY_TEMPLATES_FILE: str = "/app/config/plantillas_cuerpo.json"
     TESSERACT_LANG: str = "spa"
     SPACY_MODEL: str = "es_core_news_sm"
     LOG_LEVEL: str = "INFO" #
     EMAIL_IMAP_SERVER: str = "imap.gmail.com"
+    EMAIL_IMAP_PORT: int = 993
+    EMAIL_IMAP_SSL: bool = True
+    EMAIL_INGESTION_MODE: str = "polling" # "polling" (ciclos cada EMAIL_CHECK_INTERVAL_SECONDS) o "idle" (IMAP IDLE con conexión persistente)
+    EMAIL_IDLE_RENEW_SECONDS: int = 1500
+    EMAIL_IDLE_BACKOFF_MAX_SECONDS: int = 300
     EMAIL_FETCH_LIMIT: int = 200 
+    EMAIL_FETCH_MODE: str = "incremental" # "incremental" (UID SEARCH desde el último UID visto) o "recientes" (últimos EMAIL_FETCH_LIMIT)
     EMAIL_CHECK_INTERVAL_SECONDS: int = 10
+    EMAIL_POLL_ADAPTIVE: bool = True
+    EMAIL_POLL_MIN_SECONDS: int = 10
+    EMAIL_POLL_MAX_SECONDS: int = 1800
+    EMAIL_POLL_BACKOFF_FACTOR: float = 2.0
+    EMAIL_FETCH_MAX_WORKERS: int = 16
+    EMAIL_IMAP_TIMEOUT_SECONDS: int = 30
+    EMAIL_MAILBOX_TIMEOUT_SECONDS: int = 120
+    EMAIL_MARK_SEEN: bool = True
+    UID_RETENTION_DAYS: int = 90
+    CREDENTIAL_CACHE_REFRESH_SECONDS: int = 600
     PROCESSING_INTERVAL_SECONDS: int = 5
+    PROCESSING_WORKERS: int = 4
+    QUEUE_LEASE_SECONDS: int = 600
+    QUEUE_MAX_ATTEMPTS: int = 5
+    PARSE_PROCESS_WORKERS: int = 0 # 0 = un proceso por CPU
+    PARSE_BATCH_SIZE: int = 20
+    PARSE_TIMEOUT_SECONDS: float = 300.0
+    AUDIT_BATCH_SIZE: int = 500
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    AUDIT_QUEUE_MAX_SIZE: int = 50000
+    AUDIT_RETRY_BACKOFF_MAX_SECONDS: float = 60.0
+    BLOB_STORE_BACKEND: str = "local" # "local" (archivos por SHA-256) u "object" (interfaz de almacenamiento de objetos)
+    BLOB_STORE_DIR: str = "/app/data/blobs"
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_TOKEN_CACHE_SIZE: int = 1024
+    AUTH_TOKEN_CACHE_TTL_SECONDS: int = 300
     ENCRYPTION_KEY: str
     _cipher_suite: Optional[Fernet] = None
 
@@ -0,0 +1,345 @@
+import re
+import json
+import time
+import queue
+import hashlib
+import atexit
+import logging
+import threading
+from contextvars import ContextVar
+from datetime import datetime, date
+from typing import Any, Dict, List, Optional
+from sqlalchemy import event, insert, inspect, select, Date, DateTime
+from sqlalchemy.orm import Session
+from database.models import Factura, ItemFactura, FacturaAudit, ItemFacturaAudit
+from storage.blob_store import obtener_blob_store
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Auditoría fuera de la ruta de escritura: los eventos de sesión capturan qué facturas e
+# ítems se insertaron, modificaron o borraron en cada flush; al confirmar la transacción esos
+# cambios pasan a una cola en memoria y un hilo los escribe por lotes en facturas_audit e
+# items_factura_audit. Si la transacción termina sin confirmarse, sus cambios se descartan. La
+# cola no se persiste: lo que no llegó a escribirse se pierde si el proceso termina, y con la
+# base caída y la cola llena se descartan lotes (ver EscritorAuditoria.descartados).
+
+# Usuario/tenant de auditoría por hilo (o tarea): los trabajadores de la cola procesan
+# facturas de distintos tenants en paralelo y no deben pisarse estos valores.
+CURRENT_AUDIT_USER_ID: ContextVar[Optional[int]] = ContextVar("CURRENT_AUDIT_USER_ID", default=None)
+CURRENT_AUDIT_TENANT_ID: ContextVar[Optional[str]] = ContextVar("CURRENT_AUDIT_TENANT_ID", default=None)
+
+_CLAVE_SESION = "auditoria_pendiente"
+
+# Columnas grandes: en `cambios` solo viaja su SHA-256. El contenido de cada versión queda en el
+# almacén de blobs (direccionado por ese mismo SHA-256): se audita xml_blob_key/pdf_blob_key y,
+# si el PDF o el XML quedaron en línea, su hash, que es también su clave en el almacén.
+_COLUMNA_XML = 'texto_crudo_xml'
+_COLUMNAS_HASH = {_COLUMNA_XML, 'contenido_pdf_binario'}
+_ES_HASH = re.compile(r'[0-9a-f]{64}')
+
+
+def _hash(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    return hashlib.sha256(valor.encode('utf-8') if isinstance(valor, str) else valor).hexdigest()
+
+
+def _json(valor):
+    return valor.isoformat() if isinstance(valor, (datetime, date)) else valor
+
+
+def _valores(estado, anteriores: bool = False) -> Dict[str, Any]:
+    # Solo atributos ya cargados: un flush nunca dispara consultas extra por la auditoría.
+    valores = {}
+    for columna in estado.mapper.columns:
+        clave = columna.key
+        if clave not in estado.dict:
+            continue
+        valores[clave] = estado.dict[clave]
+        if anteriores:
+            historial = estado.attrs[clave].history
+            if historial.deleted:
+                valores[clave] = historial.deleted[0]
+    return valores
+
+
+def _diferencias(anteriores: Dict[str, Any], nuevos: Dict[str, Any]) -> Dict[str, list]:
+    """{"columna": [anterior, nuevo]} con las columnas que cambiaron."""
+    cambios = {}
+    for clave in nuevos.keys() | anteriores.keys():
+        anterior, nuevo = anteriores.get(clave), nuevos.get(clave)
+        if clave in ('id', 'tenant_id') or anterior == nuevo:
+            continue
+        if clave in _COLUMNAS_HASH:
+            anterior, nuevo = _hash(anterior), _hash(nuevo)
+        cambios[clave] = [_json(anterior), _json(nuevo)]
+    return cambios
+
+
+def filas_de_auditoria(modelo, operacion: str, anteriores: Optional[Dict[str, Any]], nuevos: Optional[Dict[str, Any]],
+                       usuario_auditoria_id: Optional[int]) -> List[tuple]:
+    """Filas (tabla, valores) para auditar un cambio de Factura o ItemFactura."""
+    valores = nuevos if nuevos is not None else anteriores
+    cambios = _diferencias(anteriores or {}, nuevos or {})
+    if operacion == 'UPDATE' and not cambios:
+        return []
+    fila = {
+        "tipo_operacion": operacion,
+        "usuario_auditoria_id": usuario_auditoria_id,
+        "fecha_modificacion": datetime.now(),
+        "cambios": json.dumps(cambios, default=str),
+        "tenant_id": valores.get('tenant_id'),
+    }
+    if modelo is Factura:
+        fila.update(id_factura=valores.get('id'), hash_xml=valores.get('xml_blob_key') or _hash(valores.get(_COLUMNA_XML)))
+        return [(FacturaAudit.__table__, fila)]
+    fila.update(id_item_factura=valores.get('id'), factura_id=valores.get('factura_id'))
+    return [(ItemFacturaAudit.__table__, fila)]
+
+
+def _cambios_del_flush(session: Session) -> List[tuple]:
+    usuario_auditoria_id = CURRENT_AUDIT_USER_ID.get()
+    cambios = []
+    for objetos, operacion in ((session.new, 'INSERT'), (session.dirty, 'UPDATE'), (session.deleted, 'DELETE')):
+        for obj in objetos:
+            modelo = type(obj)
+            if modelo not in (Factura, ItemFactura):
+                continue
+            if operacion == 'UPDATE' and not session.is_modified(obj, include_collections=False):
+                continue
+            estado = inspect(obj)
+            if operacion == 'INSERT':
+                anteriores, nuevos = None, _valores(estado)
+            elif operacion == 'UPDATE':
+                anteriores, nuevos = _valores(estado, anteriores=True), _valores(estado)
+                # La identidad va siempre aunque no haya cambiado.
+                for clave in ('id', 'factura_id', 'tenant_id'):
+                    if clave in anteriores:
+                        nuevos.setdefault(clave, anteriores[clave])
+            else:
+                anteriores, nuevos = _valores(estado), None
+            cambios.extend(filas_de_auditoria(modelo, operacion, anteriores, nuevos, usuario_auditoria_id))
+    return cambios
+
+
+@event.listens_for(Session, "after_flush")
+def _capturar_cambios(session: Session, flush_context):
+    # En after_flush las listas new/dirty/deleted y el historial de atributos aún reflejan
+    # el estado previo al flush, y los objetos nuevos ya tienen id.
+    cambios = _cambios_del_flush(session)
+    if cambios:
+        session.info.setdefault(_CLAVE_SESION, []).extend(cambios)
+
+
+@event.listens_for(Session, "after_commit")
+def _encolar_al_confirmar(session: Session):
+    cambios = session.info.pop(_CLAVE_SESION, None)
+    if cambios:
+        escritor.encolar(session.get_bind(), cambios)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _descartar_sin_confirmar(session: Session, transaction):
+    # Tras un commit after_commit ya se llevó los cambios; si la transacción raíz termina de otra
+    # forma (rollback, o close() con un flush sin confirmar) no deben auditarse.
+    if transaction.parent is None:
+        session.info.pop(_CLAVE_SESION, None)
+
+
+def agregar_a_sesion(session: Session, filas: List[tuple]):
+    """Para escrituras con INSERT de Core (sin eventos ORM): se auditan al confirmar la sesión."""
+    session.info.setdefault(_CLAVE_SESION, []).extend(filas)
+
+
+def _decodificar(modelo, valores: Dict[str, Any]) -> Dict[str, Any]:
+    columnas = modelo.__table__.columns
+    for clave, valor in valores.items():
+        if isinstance(valor, str) and clave in columnas:
+            tipo = columnas[clave].type
+            try:
+                if isinstance(tipo, DateTime):
+                    valores[clave] = datetime.fromisoformat(valor)
+                elif isinstance(tipo, Date):
+                    valores[clave] = date.fromisoformat(valor[:10])
+            except ValueError:
+                pass
+    return valores
+
+
+def _revertir(modelo, estado: Optional[Dict[str, Any]], registro) -> Optional[Dict[str, Any]]:
+    # Deshace un registro de auditoría sobre `estado` (la versión inmediatamente posterior).
+    if registro.tipo_operacion == 'INSERT':
+        return None
+    if registro.cambios is not None:
+        cambios = json.loads(registro.cambios)
+        if registro.tipo_operacion == 'DELETE':
+            estado = {}
+        estado = dict(estado or {})
+        estado.update(_decodificar(modelo, {clave: anterior for clave, (anterior, _) in cambios.items()}))
+        return estado
+    # Registros anteriores al formato por diferencias: datos_anteriores trae la fila completa.
+    if registro.datos_anteriores:
+        return _decodificar(modelo, json.loads(registro.datos_anteriores))
+    return estado
+
+
+def reconstruir_factura(db: Session, factura_id: int, tenant_id: str, hasta: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    Versión de la factura (con sus ítems) vigente en `hasta`, o la actual si es None.
+    Se parte del estado actual (o del último borrado) y se deshacen hacia atrás los cambios
+    auditados posteriores a `hasta`. Devuelve None si la factura no existía en ese momento.
+    """
+    columnas = [c for c in Factura.__table__.columns if c.name != 'contenido_pdf_binario']
+    actual = db.execute(select(*columnas).where(Factura.id == factura_id, Factura.tenant_id == tenant_id)).mappings().first()
+    estado = dict(actual) if actual else None
+    items = {
+        fila['id']: dict(fila) for fila in db.execute(
+            select(ItemFactura.__table__).where(ItemFactura.factura_id == factura_id, ItemFactura.tenant_id == tenant_id)
+        ).mappings()
+    } if actual else {}
+
+    if hasta is not None:
+        registros = db.query(FacturaAudit).filter(
+            FacturaAudit.id_factura == factura_id, FacturaAudit.tenant_id == tenant_id, FacturaAudit.fecha_modificacion > hasta
+        ).order_by(FacturaAudit.id.desc()).all()
+        for registro in registros:
+            estado = _revertir(Factura, estado, registro)
+            if estado is not None:
+                estado.update(id=factura_id, tenant_id=tenant_id)
+        registros_items = db.query(ItemFacturaAudit).filter(
+            ItemFacturaAudit.factura_id == factura_id, ItemFacturaAudit.tenant_id == tenant_id, ItemFacturaAudit.fecha_modificacion > hasta
+        ).order_by(ItemFacturaAudit.id.desc()).all()
+        for registro in registros_items:
+            item = _revertir(ItemFactura, items.get(registro.id_item_factura), registro)
+            if item is None:
+                items.pop(registro.id_item_factura, None)
+            else:
+                items[registro.id_item_factura] = dict(item, id=registro.id_item_factura, factura_id=factura_id, tenant_id=tenant_id)
+
+    if estado is None:
+        return None
+    estado.pop('contenido_pdf_binario', None)
+    xml = estado.get(_COLUMNA_XML)
+    clave_xml = estado.get('xml_blob_key') or (xml if isinstance(xml, str) and _ES_HASH.fullmatch(xml) else None)
+    if clave_xml:
+        # Los blobs no se borran al cambiar la factura: cada versión auditada sigue en el almacén.
+        try:
+            estado[_COLUMNA_XML] = obtener_blob_store().leer(clave_xml).decode('utf-8')
+        except FileNotFoundError:
+            logger.warning(f"XML {clave_xml} de la factura {factura_id} no está en el almacén de blobs.")
+    estado['items'] = sorted(items.values(), key=lambda item: item['id'])
+    return estado
+
+
+class EscritorAuditoria:
+    def __init__(self, tamano_lote: int, intervalo: float, maximo_en_cola: int):
+        self._cola = queue.Queue(maxsize=maximo_en_cola)
+        self._tamano_lote = tamano_lote
+        self._intervalo = intervalo
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Registros descartados porque la base no respondía con la cola llena.
+        self.descartados = 0
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._ejecutar, name="escritor-auditoria", daemon=True)
+                self._hilo.start()
+
+    def encolar(self, bind, cambios: List[tuple]):
+        self._iniciar()
+        for tabla, fila in cambios:
+            # Si la cola está llena se espera, frenando a quien escribe; mientras tanto el hilo
+            # escritor descarta el lote que no pudo escribir (ver _escribir).
+            self._cola.put((bind, tabla, fila))
+
+    def _ejecutar(self):
+        while True:
+            try:
+                primero = self._cola.get(timeout=self._intervalo)
+            except queue.Empty:
+                continue
+            if primero is None:
+                self._cola.task_done()
+                return
+            lote = [primero]
+            while len(lote) < self._tamano_lote:
+                try:
+                    siguiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    self._cola.put(None)
+                    self._cola.task_done()
+                    break
+                lote.append(siguiente)
+            try:
+                self._escribir(lote)
+            finally:
+                for _ in lote:
+                    self._cola.task_done()
+
+    def _escribir(self, lote: List[tuple]):
+        grupos: Dict[tuple, List[Dict[str, Any]]] = {}
+        for bind, tabla, fila in lote:
+            grupos.setdefault((bind, tabla), []).append(fila)
+        for (bind, tabla), filas in grupos.items():
+            espera = self._intervalo
+            while True:
+                try:
+                    with bind.begin() as conexion:
+                        for grupo in _agrupar_por_claves(filas).values():
+                            conexion.execute(insert(tabla), grupo)
+                    break
+                except Exception as e:
+                    # Mientras haya lugar en la cola se reintenta (la base puede estar caída un
+                    # rato); con la cola llena ya se frena a quien escribe y se descarta el lote.
+                    if self._cola.full():
+                        self.descartados += len(filas)
+                        logger.error(
+                            f"No se pudieron escribir {len(filas)} registro(s) de auditoría en '{tabla.name}' y la cola está llena; "
+                            f"se descartan ({self.descartados} descartado(s) en total): {e}", exc_info=True
+                        )
+                        break
+                    logger.warning(f"Error escribiendo auditoría en '{tabla.name}', reintentando en {espera:.1f}s: {e}")
+                    time.sleep(espera)
+                    espera = min(espera * 2, settings.AUDIT_RETRY_BACKOFF_MAX_SECONDS)
+
+    def vaciar(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que se escriba todo lo encolado; False si no terminó dentro de `timeout`."""
+        if self._hilo is None:
+            return True
+        listo = threading.Event()
+
+        def esperar():
+            self._cola.join()
+            listo.set()
+
+        threading.Thread(target=esperar, daemon=True).start()
+        return listo.wait(timeout)
+
+    def detener(self, timeout: float = 10.0):
+        if self._hilo is None or not self._hilo.is_alive():
+            return
+        self._cola.put(None)
+        self._hilo.join(timeout)
+        if self._hilo.is_alive():
+            logger.warning(f"El escritor de auditoría no terminó en {timeout}s; quedan {self._cola.qsize()} registro(s) sin escribir.")
+
+
+def _agrupar_por_claves(filas: List[Dict[str, Any]]) -> Dict[frozenset, List[Dict[str, Any]]]:
+    # executemany necesita las mismas columnas en todas las filas (un DELETE trae menos que un INSERT).
+    grupos: Dict[frozenset, List[Dict[str, Any]]] = {}
+    for fila in filas:
+        grupos.setdefault(frozenset(fila), []).append(fila)
+    return grupos
+
+
+escritor = EscritorAuditoria(
+    tamano_lote=settings.AUDIT_BATCH_SIZE,
+    intervalo=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    maximo_en_cola=settings.AUDIT_QUEUE_MAX_SIZE,
+)
+atexit.register(escritor.detener)
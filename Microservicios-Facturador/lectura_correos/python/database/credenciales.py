@@ -0,0 +1,87 @@
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional
+from sqlalchemy import func, or_
+from database.models import SessionLocal, Usuario
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Caché en proceso de los usuarios con su contraseña IMAP ya descifrada, para la ingesta.
+# Cada ciclo solo consulta COUNT y MAX(updated_at) de `usuarios`; si cambiaron se recargan las
+# filas con updated_at desde la última marca, y Fernet solo descifra cuando cambia el par
+# (id de usuario, SHA-256 del texto cifrado). Cada CREDENTIAL_CACHE_REFRESH_SECONDS se recorre
+# la tabla completa (sin volver a descifrar lo conocido) por si hubo cambios fuera del ORM.
+# La caché vive en el worker y los usuarios se crean o editan desde la API (otro contenedor),
+# así que no hay invalidación explícita: es esa consulta de COUNT/MAX(updated_at) la que
+# detecta los cambios entre procesos.
+
+
+def _huella(cifrado: Optional[str]) -> Optional[str]:
+    return hashlib.sha256(cifrado.encode()).hexdigest() if cifrado is not None else None
+
+
+class CacheCredenciales:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usuarios: Dict[int, dict] = {}
+        self._total = None
+        self._marca = None
+        self._completa_en = None
+
+    def obtener(self) -> List[dict]:
+        with self._lock, SessionLocal() as session:
+            total, marca = session.query(func.count(Usuario.id), func.max(Usuario.updated_at)).one()
+            vencida = self._completa_en is None or time.monotonic() - self._completa_en > settings.CREDENTIAL_CACHE_REFRESH_SECONDS
+            if not vencida and total == self._total and marca == self._marca:
+                return self._lista()
+
+            consulta = session.query(Usuario.id, Usuario.correo, Usuario.tenant_id, Usuario.email_account_password_encrypted)
+            if not vencida and self._marca is not None:
+                # `>=`: DATETIME tiene resolución de segundos y puede haber cambios en el mismo segundo.
+                consulta = consulta.filter(or_(Usuario.updated_at >= self._marca, Usuario.updated_at.is_(None)))
+            filas = consulta.all()
+            for fila in filas:
+                self._guardar(*fila)
+
+            if vencida:
+                vigentes = {fila.id for fila in filas}
+            elif len(self._usuarios) != total:
+                # Hubo borrados: basta con los ids (índice primario), sin tocar las contraseñas.
+                vigentes = {fila[0] for fila in session.query(Usuario.id)}
+            else:
+                vigentes = None
+            if vigentes is not None:
+                for user_id in set(self._usuarios) - vigentes:
+                    del self._usuarios[user_id]
+
+            self._total, self._marca = total, marca
+            if vencida:
+                self._completa_en = time.monotonic()
+            logger.info(f"Caché de credenciales actualizada: {len(filas)} usuario(s) leídos, {len(self._usuarios)} en caché.")
+            return self._lista()
+
+    def _guardar(self, user_id: int, correo: str, tenant_id: Optional[str], cifrado: Optional[str]):
+        huella = _huella(cifrado)
+        anterior = self._usuarios.get(user_id)
+        if anterior is not None and anterior["huella"] == huella:
+            anterior.update(correo=correo, tenant_id=tenant_id)
+            return
+        password = None
+        try:
+            password = settings.CIPHER_SUITE.decrypt(cifrado.encode()).decode()
+        except Exception as e:
+            # Se recuerda el fallo: no se reintenta hasta que cambie el texto cifrado.
+            logger.error(f"Error desencriptando contraseña de {correo}: {e}", exc_info=True)
+        self._usuarios[user_id] = {"correo": correo, "password": password, "tenant_id": tenant_id, "huella": huella}
+
+    def _lista(self) -> List[dict]:
+        return [
+            {"correo": u["correo"], "password": u["password"], "tenant_id": u["tenant_id"]}
+            for _, u in sorted(self._usuarios.items()) if u["password"] is not None
+        ]
+
+
+cache_credenciales = CacheCredenciales()
@@ -1,238 +1,39 @@
 import logging
-from sqlalchemy.orm import Session
-from sqlalchemy import text, inspect
-from sqlalchemy.exc import IntegrityError, OperationalError, DataError
+from sqlalchemy.orm import Session, load_only, noload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import text, inspect, insert, select, exists, or_, case, func
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError, DataError, DBAPIError
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
-import json
-from datetime import datetime, date
-from typing import List, Dict, Any, Optional
+from collections import defaultdict
+from datetime import date
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 # Asegurarse de que todos los modelos necesarios estén importados
 from database.models import Factura, ItemFactura, Usuario, FacturaAudit, ItemFacturaAudit, Supplier
+from storage.blob_store import obtener_blob_store
+from database.paginacion import paginar
+from database.auditoria import CURRENT_AUDIT_USER_ID, CURRENT_AUDIT_TENANT_ID, agregar_a_sesion, filas_de_auditoria
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
-CURRENT_AUDIT_USER_ID = None
-CURRENT_AUDIT_TENANT_ID = None 
-
 def set_current_audit_user_id(user_id: int):
-    global CURRENT_AUDIT_USER_ID
-    CURRENT_AUDIT_USER_ID = user_id
+    CURRENT_AUDIT_USER_ID.set(user_id)
 
 def set_current_audit_tenant_id(tenant_id: str):
-    global CURRENT_AUDIT_TENANT_ID
-    CURRENT_AUDIT_TENANT_ID = tenant_id
+    CURRENT_AUDIT_TENANT_ID.set(tenant_id)
 
 def audit_log(func):
+    # Confirma la operación CRUD. Los registros de auditoría los capturan los eventos de sesión
+    # de database/auditoria.py y se escriben en segundo plano después del commit.
     def wrapper(self, *args, **kwargs):
         session = self.db
-        obj = None
-        old_data = None
-        object_type = None
-        object_id_for_audit = None 
-        
-        # La forma más segura de obtener tenant_id para el decorador es que sea un argumento explícito
-        # en los métodos CRUD que se auditan.
-        audit_tenant_id = kwargs.get('tenant_id') 
-        if not audit_tenant_id:
-            # Heurística: si el primer argumento es una cadena y parece un tenant_id
-            if args and isinstance(args[0], str) and len(args[0]) > 5:
-                audit_tenant_id = args[0]
-            # Heurística: si el segundo argumento es una cadena y parece un tenant_id (para update/delete)
-            elif len(args) > 1 and isinstance(args[1], str) and len(args[1]) > 5:
-                audit_tenant_id = args[1]
-
-
-        if func.__name__ in ['update_invoice', 'delete_invoice']:
-            # Para update_invoice(self, tenant_id, invoice_id, ...)
-            # Para delete_invoice(self, tenant_id, invoice_id)
-            invoice_id = args[1] 
-            obj = session.query(Factura).filter(Factura.id == invoice_id, Factura.tenant_id == audit_tenant_id).first()
-            object_type = 'Factura'
-            object_id_for_audit = invoice_id
-            if not obj:
-                logger.warning(f"Objeto Factura no encontrado para auditoría en {func.__name__} con ID {invoice_id} y tenant_id {audit_tenant_id}")
-                return func(self, *args, **kwargs)
-        elif func.__name__ in ['update_item_factura', 'delete_item_factura']:
-            # Para update_item_factura(self, tenant_id, item_id, factura_id, ...)
-            # Para delete_item_factura(self, tenant_id, item_id, factura_id)
-            item_id = args[1] 
-            factura_id = args[2] 
-            obj = session.query(ItemFactura).filter(ItemFactura.id == item_id, ItemFactura.factura_id == factura_id, ItemFactura.tenant_id == audit_tenant_id).first()
-            object_type = 'ItemFactura'
-            object_id_for_audit = item_id
-            if not obj:
-                logger.warning(f"Objeto ItemFactura no encontrado para auditoría en {func.__name__} con ID {item_id}, FacturaID {factura_id} y tenant_id {audit_tenant_id}")
-                return func(self, *args, **kwargs)
-
-        if obj:
-            exclude_cols = ['contenido_pdf_binario'] 
-            obj_dict = {c.name: getattr(obj, c.name) for c in obj.__table__.columns if c.name not in exclude_cols}
-            for k, v in obj_dict.items():
-                if isinstance(v, (datetime, date)):
-                    obj_dict[k] = v.isoformat()
-            old_data = json.dumps(obj_dict, default=str)
-            logger.debug(f"Datos anteriores para auditoría ({func.__name__}, {object_type}): {old_data}")
-        
         try:
             result = func(self, *args, **kwargs)
-            session.commit() 
-            
-            if func.__name__ == 'create_invoice':
-                new_invoice_id = result
-                if new_invoice_id:
-                    new_obj = session.query(Factura).filter(Factura.id == new_invoice_id, Factura.tenant_id == audit_tenant_id).first()
-                    if new_obj:
-                        audit_entry = FacturaAudit(
-                            id_factura=new_obj.id,
-                            procesado_en=new_obj.procesado_en,
-                            ruta_archivo_original=new_obj.ruta_archivo_original,
-                            asunto_correo=new_obj.asunto_correo,
-                            remitente_correo=new_obj.remitente_correo,
-                            correo_cliente_asociado=new_obj.correo_cliente_asociado,
-                            cufe=new_obj.cufe,
-                            numero_factura=new_obj.numero_factura,
-                            fecha_emision=new_obj.fecha_emision,
-                            hora_emision=new_obj.hora_emision,
-                            monto_subtotal=new_obj.monto_subtotal,
-                            monto_impuesto=new_obj.monto_impuesto,
-                            monto_total=new_obj.monto_total,
-                            moneda=new_obj.moneda,
-                            nombre_proveedor=new_obj.nombre_proveedor,
-                            nit_proveedor=new_obj.nit_proveedor,
-                            email_proveedor=new_obj.email_proveedor,
-                            nombre_cliente=new_obj.nombre_cliente,
-                            nit_cliente=new_obj.nit_cliente,
-                            fecha_vencimiento=new_obj.fecha_vencimiento,
-                            metodo_pago=new_obj.metodo_pago,
-                            texto_crudo_xml=new_obj.texto_crudo_xml,
-                            tipo_documento_dian=new_obj.tipo_documento_dian, 
-                            revisada_manualmente=new_obj.revisada_manualmente,
-                            usuario_id_asociado_factura=new_obj.usuario_id,
-                            tipo_operacion='INSERT',
-                            usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                            datos_anteriores=None,
-                            tenant_id=new_obj.tenant_id 
-                        )
-                        session.add(audit_entry)
-                        for item in new_obj.items:
-                            item_audit_entry = ItemFacturaAudit(
-                                id_item_factura=item.id,
-                                factura_id=item.factura_id,
-                                descripcion=item.descripcion,
-                                cantidad=item.cantidad,
-                                valor_unitario=item.valor_unitario,
-                                valor_total=item.valor_total,
-                                tipo_operacion='INSERT',
-                                usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                                datos_anteriores=None,
-                                tenant_id=item.tenant_id 
-                            )
-                            session.add(item_audit_entry)
-                        session.commit()
-            
-            elif func.__name__ == 'update_invoice':
-                updated_invoice_id = result
-                if updated_invoice_id:
-                    updated_obj = session.query(Factura).filter(Factura.id == updated_invoice_id, Factura.tenant_id == audit_tenant_id).first()
-                    if updated_obj:
-                        audit_entry = FacturaAudit(
-                            id_factura=updated_obj.id,
-                            procesado_en=updated_obj.procesado_en,
-                            ruta_archivo_original=updated_obj.ruta_archivo_original,
-                            asunto_correo=updated_obj.asunto_correo,
-                            remitente_correo=updated_obj.remitente_correo,
-                            correo_cliente_asociado=updated_obj.correo_cliente_asociado,
-                            cufe=updated_obj.cufe,
-                            numero_factura=updated_obj.numero_factura,
-                            fecha_emision=updated_obj.fecha_emision,
-                            hora_emision=updated_obj.hora_emision,
-                            monto_subtotal=updated_obj.monto_subtotal,
-                            monto_impuesto=updated_obj.monto_impuesto,
-                            monto_total=updated_obj.monto_total,
-                            moneda=updated_obj.moneda,
-                            nombre_proveedor=updated_obj.nombre_proveedor,
-                            nit_proveedor=updated_obj.nit_proveedor,
-                            email_proveedor=updated_obj.email_proveedor,
-                            nombre_cliente=updated_obj.nombre_cliente,
-                            nit_cliente=updated_obj.nit_cliente,
-                            fecha_vencimiento=updated_obj.fecha_vencimiento,
-                            metodo_pago=updated_obj.metodo_pago,
-                            texto_crudo_xml=updated_obj.texto_crudo_xml,
-                            tipo_documento_dian=updated_obj.tipo_documento_dian, 
-                            revisada_manualmente=updated_obj.revisada_manualmente,
-                            usuario_id_asociado_factura=updated_obj.usuario_id,
-                            tipo_operacion='UPDATE',
-                            usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                            datos_anteriores=old_data,
-                            tenant_id=updated_obj.tenant_id 
-                        )
-                        session.add(audit_entry)
-                        session.commit()
-            elif func.__name__ == 'delete_invoice':
-                deleted_invoice_id = object_id_for_audit 
-                audit_entry = FacturaAudit(
-                    id_factura=deleted_invoice_id,
-                    tipo_operacion='DELETE',
-                    usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                    datos_anteriores=old_data,
-                    tenant_id=audit_tenant_id 
-                )
-                session.add(audit_entry)
-                logger.warning("Auditoría de ítems eliminados en delete_invoice: Considerar triggers de DB o capturar ítems antes de la eliminación.")
-                session.commit()
-            elif func.__name__ == 'create_item_factura':
-                new_item_id = result
-                if new_item_id:
-                    new_item_obj = session.query(ItemFactura).filter(ItemFactura.id == new_item_id, ItemFactura.tenant_id == audit_tenant_id).first()
-                    if new_item_obj:
-                        item_audit_entry = ItemFacturaAudit(
-                            id_item_factura=new_item_obj.id,
-                            factura_id=new_item_obj.factura_id,
-                            descripcion=new_item_obj.descripcion,
-                            cantidad=new_item_obj.cantidad,
-                            valor_unitario=new_item_obj.valor_unitario,
-                            valor_total=new_item_obj.valor_total,
-                            tipo_operacion='INSERT',
-                            usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                            datos_anteriores=None,
-                            tenant_id=new_item_obj.tenant_id 
-                        )
-                        session.add(item_audit_entry)
-                        session.commit()
-            elif func.__name__ == 'update_item_factura':
-                updated_item_id = result 
-                if updated_item_id:
-                    updated_item_obj = session.query(ItemFactura).filter(ItemFactura.id == updated_item_id, ItemFactura.tenant_id == audit_tenant_id).first()
-                    if updated_item_obj:
-                        item_audit_entry = ItemFacturaAudit(
-                            id_item_factura=updated_item_obj.id,
-                            factura_id=updated_item_obj.factura_id,
-                            descripcion=updated_item_obj.descripcion,
-                            cantidad=updated_item_obj.cantidad,
-                            valor_unitario=updated_item_obj.valor_unitario,
-                            valor_total=updated_item_obj.valor_total,
-                            tipo_operacion='UPDATE',
-                            usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                            datos_anteriores=old_data,
-                            tenant_id=updated_item_obj.tenant_id 
-                        )
-                        session.add(item_audit_entry)
-                        session.commit()
-            elif func.__name__ == 'delete_item_factura':
-                deleted_item_id = object_id_for_audit
-                item_audit_entry = ItemFacturaAudit(
-                    id_item_factura=deleted_item_id,
-                    factura_id=args[2], 
-                    tipo_operacion='DELETE',
-                    usuario_auditoria_id=CURRENT_AUDIT_USER_ID,
-                    datos_anteriores=old_data,
-                    tenant_id=audit_tenant_id 
-                )
-                session.add(item_audit_entry)
-                session.commit()
-
-            return result 
+            session.commit()
+            return result
         except (IntegrityError, DataError, OperationalError) as e:
             session.rollback()
             logger.error(f"Error de base de datos en {func.__name__}: {e}", exc_info=True)
@@ -242,21 +43,23 @@ def audit_log(func):
                     invoice_data_retry = args[0].copy()
                     items_data_retry = args[1]
                     tenant_id_param = args[2] 
-                    if 'contenido_pdf_binario' in invoice_data_retry:
+                    if invoice_data_retry.get('contenido_pdf_binario') is not None:
                         invoice_data_retry['contenido_pdf_binario'] = None
-                    return func(self, invoice_data_retry, items_data_retry, tenant_id_param)
+                        return wrapper(self, invoice_data_retry, items_data_retry, tenant_id_param)
                 elif func.__name__ == 'update_invoice':
                     tenant_id_param = args[0]
                     invoice_id_param = args[1]
                     update_data_retry = args[2].copy()
                     items_data_retry = args[3] if len(args) > 3 else None
-                    if 'contenido_pdf_binario' in update_data_retry:
+                    if update_data_retry.get('contenido_pdf_binario') is not None:
                         update_data_retry['contenido_pdf_binario'] = None
-                    return func(self, tenant_id_param, invoice_id_param, update_data_retry, items_data_retry) 
+                        return wrapper(self, tenant_id_param, invoice_id_param, update_data_retry, items_data_retry) 
             raise 
         except Exception as e:
             session.rollback()
             logger.error(f"Error inesperado durante {func.__name__}: {e}", exc_info=True)
+            if isinstance(e, DBAPIError) and _es_transitorio(e):
+                raise
             raise
     return wrapper
 
@@ -337,6 +140,120 @@ class UserCRUD:
             logger.error(f"Error al eliminar usuario con ID {user_id}: {e}", exc_info=True)
             return False
 
+# Tope de bytes por sentencia INSERT de varias filas (XML y PDF viajan en la misma fila),
+# holgado frente al max_allowed_packet por defecto de MySQL.
+_MAX_BYTES_POR_INSERT = 16 * 1024 * 1024
+
+def _filas_homogeneas(tabla, filas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Un INSERT de varias filas exige las mismas claves en todas; las que faltan toman el
+    # default escalar de la columna. Las columnas que no trae ninguna fila usan su default normal.
+    columnas = {c.name: c for c in tabla.columns}
+    claves = {k for fila in filas for k in fila if k in columnas}
+    homogeneas = []
+    for fila in filas:
+        homogenea = {}
+        for clave in claves:
+            if clave in fila:
+                homogenea[clave] = fila[clave]
+            else:
+                default = columnas[clave].default
+                homogenea[clave] = default.arg if default is not None and default.is_scalar else None
+        homogeneas.append(homogenea)
+    return homogeneas
+
+def _bloques_por_tamano(filas: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    bloque, acumulado = [], 0
+    for fila in filas:
+        tamano = sum(len(v) for v in fila.values() if isinstance(v, (bytes, str)))
+        if bloque and acumulado + tamano > _MAX_BYTES_POR_INSERT:
+            yield bloque
+            bloque, acumulado = [], 0
+        bloque.append(fila)
+        acumulado += tamano
+    if bloque:
+        yield bloque
+
+# Columnas de InvoiceListItem (api/schemas/invoices.py).
+_COLUMNAS_LISTADO = (
+    Factura.id, Factura.cufe, Factura.numero_factura, Factura.fecha_emision, Factura.fecha_vencimiento,
+    Factura.monto_subtotal, Factura.monto_impuesto, Factura.monto_total, Factura.moneda,
+    Factura.nombre_proveedor, Factura.nit_proveedor, Factura.nombre_cliente, Factura.nit_cliente,
+    Factura.tipo_documento_dian, Factura.revisada_manualmente, Factura.usuario_id, Factura.procesado_en,
+)
+# Orden estable del listado (más recientes primero); lo cubre el índice ix_facturas_tenant_procesado_id.
+ORDEN_FACTURAS = ((Factura.procesado_en, True), (Factura.id, True))
+def filtrar_facturas(
+    consulta,
+    tenant_id: str,
+    numero_factura: Optional[str] = None,
+    nit_proveedor: Optional[str] = None,
+    nombre_proveedor: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    monto_total_min: Optional[float] = None,
+    monto_total_max: Optional[float] = None,
+    tipo_documento_dian: Optional[str] = None,
+    revisada_manualmente: Optional[bool] = None,
+    usuario_id: Optional[int] = None
+):
+    """Filtros y columnas del listado de facturas sobre una Query (InvoiceCRUD) o un select() (crud_async)."""
+    # Solo las columnas del listado; los ítems, si se piden, se cargan después (ver asignar_items).
+    query = consulta.options(
+        load_only(*_COLUMNAS_LISTADO),
+        noload(Factura.items),
+    ).filter(Factura.tenant_id == tenant_id)
+    if numero_factura:
+        query = query.filter(Factura.numero_factura.ilike(f"%{numero_factura}%"))
+    if nit_proveedor:
+        query = query.filter(Factura.nit_proveedor == nit_proveedor)
+    if nombre_proveedor:
+        query = query.filter(Factura.nombre_proveedor.ilike(f"%{nombre_proveedor}%"))
+    if fecha_desde:
+        query = query.filter(Factura.fecha_emision >= fecha_desde)
+    if fecha_hasta:
+        query = query.filter(Factura.fecha_emision <= fecha_hasta)
+    if monto_total_min:
+        query = query.filter(Factura.monto_total >= monto_total_min)
+    if monto_total_max:
+        query = query.filter(Factura.monto_total <= monto_total_max)
+    if tipo_documento_dian: 
+        query = query.filter(Factura.tipo_documento_dian == tipo_documento_dian) 
+    if revisada_manualmente is not None:
+        query = query.filter(Factura.revisada_manualmente == revisada_manualmente)
+    if usuario_id:
+        query = query.filter(Factura.usuario_id == usuario_id)
+    return query
+
+# ngram_token_size por defecto de MySQL: textos más cortos no producen tokens que buscar.
+_LONGITUD_MINIMA_NGRAM = 2
+
+def _externalizar_blobs(data: Dict[str, Any]):
+    # El PDF y el XML van al almacén de blobs; la fila solo guarda su clave (SHA-256).
+    for columna, columna_clave in (('contenido_pdf_binario', 'pdf_blob_key'), ('texto_crudo_xml', 'xml_blob_key')):
+        contenido = data.get(columna)
+        if contenido is None:
+            continue
+        try:
+            datos = contenido.encode('utf-8') if isinstance(contenido, str) else contenido
+            data[columna_clave] = obtener_blob_store().guardar(datos)
+            data[columna] = None
+        except Exception as e:
+            logger.error(f"No se pudo guardar '{columna}' en el almacén de blobs; se guardará en línea: {e}", exc_info=True)
+
+def _es_transitorio(error: DBAPIError) -> bool:
+    # Conexión perdida, deadlock, timeout de bloqueo: reintentar más tarde puede funcionar.
+    return isinstance(error, OperationalError) or error.connection_invalidated
+
+def asignar_items(facturas: List[Factura], items) -> None:
+    # paginar pide una fila de más para saber si hay otra página; con selectinload esos limit+1
+    # ids irían en dos tandas de IN cuando limit es 500. Los ítems de las facturas ya recortadas
+    # se leen en una sola consulta y se asignan sin marcar la relación como modificada.
+    por_factura = {factura.id: [] for factura in facturas}
+    for item in items:
+        por_factura[item.factura_id].append(item)
+    for factura in facturas:
+        set_committed_value(factura, 'items', por_factura[factura.id])
+
 class InvoiceCRUD:
     def __init__(self, db: Session):
         self.db = db
@@ -371,6 +288,7 @@ class InvoiceCRUD:
             else:
                 pass 
 
+            _externalizar_blobs(invoice_data)
             new_invoice = Factura(**{k: v for k, v in invoice_data.items() if k != 'items'}, tenant_id=tenant_id)
             self.db.add(new_invoice)
             self.db.flush() 
@@ -393,10 +311,262 @@ class InvoiceCRUD:
                 invoice_data['contenido_pdf_binario'] = None
                 return self.create_invoice(invoice_data, items_data, tenant_id)
             return None
+        except DBAPIError as e:
+            self.db.rollback()
+            if _es_transitorio(e):
+                # Conexión perdida, deadlock, timeout de bloqueo...: no es un "no se pudo guardar"
+                # definitivo, así que se propaga para que el llamador reintente.
+                logger.error(f"Error transitorio de base de datos al crear factura: {e}", exc_info=True)
+                raise
+            logger.error(f"Error de base de datos al crear factura: {e}", exc_info=True)
+            return None
         except Exception as e:
+            # Datos inválidos o error de programación: reintentar daría el mismo resultado.
             self.db.rollback()
             logger.error(f"Error inesperado al crear factura: {e}", exc_info=True)
             return None
+
+    def get_invoice(self, invoice_id: int, tenant_id: str) -> Optional[Factura]:
+        return self.db.query(Factura).filter(Factura.id == invoice_id, Factura.tenant_id == tenant_id).first()
+
+    def get_invoice_blob(self, invoice_id: int, tenant_id: str, tipo: str) -> Optional[Tuple[Optional[str], Optional[str], Optional[bytes]]]:
+        """
+        (numero_factura, clave_blob, contenido_en_linea) del PDF (tipo='pdf') o XML (tipo='xml').
+        Solo lee la columna en línea si la factura es anterior al almacén de blobs.
+        """
+        columna, columna_clave = {
+            'pdf': (Factura.contenido_pdf_binario, Factura.pdf_blob_key),
+            'xml': (Factura.texto_crudo_xml, Factura.xml_blob_key),
+        }[tipo]
+        fila = self.db.query(Factura.numero_factura, columna_clave).filter(Factura.id == invoice_id, Factura.tenant_id == tenant_id).first()
+        if not fila:
+            return None
+        numero_factura, clave = fila
+        if clave:
+            return numero_factura, clave, None
+        en_linea = self.db.query(columna).filter(Factura.id == invoice_id).scalar()
+        if isinstance(en_linea, str):
+            en_linea = en_linea.encode('utf-8')
+        return numero_factura, None, en_linea
+
+    def get_invoice_owner_by_cufe(self, cufe: str) -> Optional[tuple]:
+        # El CUFE es único en toda la tabla (no por tenant), igual que la restricción de la base.
+        row = self.db.query(Factura.id, Factura.tenant_id).filter(Factura.cufe == cufe).first()
+        return (row[0], row[1]) if row else None
+
+    def invoice_exists(self, invoice_id: int, tenant_id: str) -> bool:
+        return self.db.query(Factura.id).filter(Factura.id == invoice_id, Factura.tenant_id == tenant_id).first() is not None
+
+    def create_invoices_bulk(self, facturas: List[Tuple[Dict[str, Any], List[Dict[str, Any]], str]]) -> Optional[List[Tuple[Optional[int], bool]]]:
+        """
+        Guarda varias facturas (invoice_data, items_data, tenant_id) en una sola transacción,
+        con INSERT de varias filas para facturas, ítems y auditoría.
+        Devuelve un (invoice_id, creada) por factura, en el mismo orden: si el CUFE ya existía
+        para el mismo tenant se devuelve ese id con creada=False; los conflictos con otro tenant
+        o por número de factura quedan en (None, False) sin afectar al resto del lote.
+        Devuelve None si el lote falló por sus datos (IntegrityError/DataError u otro error no
+        transitorio), para reintentar factura por factura; los errores transitorios (conexión,
+        deadlock...) se propagan.
+        """
+        if not facturas:
+            return []
+        try:
+            resultado = self._insertar_lote(facturas)
+            self.db.commit()
+            return resultado
+        except DataError as e:
+            self.db.rollback()
+            if "Data too long for column" in str(e) or "Incorrect string value" in str(e):
+                logger.warning("Reintentando create_invoices_bulk sin contenido binario debido a error de tamaño/codificación.")
+                for invoice_data, _, _ in facturas:
+                    invoice_data['contenido_pdf_binario'] = None
+                try:
+                    resultado = self._insertar_lote(facturas)
+                    self.db.commit()
+                    return resultado
+                except Exception as e:
+                    self.db.rollback()
+                    if isinstance(e, DBAPIError) and _es_transitorio(e):
+                        raise
+                    logger.error(f"Error al reintentar lote de {len(facturas)} facturas: {e}", exc_info=True)
+                    return None
+            logger.error(f"DataError al crear lote de {len(facturas)} facturas: {e}", exc_info=True)
+            return None
+        except IntegrityError as e:
+            self.db.rollback()
+            logger.error(f"Error de integridad al crear lote de {len(facturas)} facturas: {e}", exc_info=True)
+            return None
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error inesperado al crear lote de {len(facturas)} facturas: {e}", exc_info=True)
+            if isinstance(e, DBAPIError) and _es_transitorio(e):
+                raise
+            return None
+
+    def _insertar_lote(self, facturas: List[Tuple[Dict[str, Any], List[Dict[str, Any]], str]]) -> List[Tuple[Optional[int], bool]]:
+        tabla = Factura.__table__
+        resultado: List[Tuple[Optional[int], bool]] = [(None, False)] * len(facturas)
+
+        # Proveedores de todo el lote en una consulta.
+        nits = {(tenant_id, data.get('nit_proveedor')) for data, _, tenant_id in facturas if data.get('nit_proveedor')}
+        proveedores = {}
+        if nits:
+            try:
+                filas = self.db.query(Supplier.id, Supplier.nit, Supplier.tenant_id).filter(
+                    Supplier.nit.in_({nit for _, nit in nits}), Supplier.tenant_id.in_({tenant for tenant, _ in nits})
+                ).all()
+                proveedores = {(tenant, nit): proveedor_id for proveedor_id, nit, tenant in filas}
+            except OperationalError as e:
+                logger.error(f"Error de conexión/operación al consultar tabla 'suppliers': {e}", exc_info=True)
+                logger.warning("Las facturas del lote se guardarán sin proveedor_id debido a error de DB en consulta de proveedores.")
+
+        existentes = self._facturas_por_clave(
+            [data.get('cufe') for data, _, _ in facturas], [data.get('numero_factura') for data, _, _ in facturas], bloquear=True
+        )
+
+        # Primera aparición de cada clave en el lote: las repeticiones reciben el mismo resultado.
+        nuevas, repetidas, vistas = [], {}, {}
+        for posicion, (data, items, tenant_id) in enumerate(facturas):
+            data.pop('id', None)
+            cufe, numero = data.get('cufe'), data.get('numero_factura')
+            if not cufe and not numero:
+                logger.warning(f"Factura sin CUFE ni número de factura en lote para tenant '{tenant_id}'. No se guardará.")
+                continue
+            existente = existentes.get(('cufe', cufe)) if cufe else None
+            if existente:
+                if existente['tenant_id'] == tenant_id:
+                    resultado[posicion] = (existente['id'], False)
+                else:
+                    logger.warning(f"CUFE {cufe} ya está registrado para otro tenant. La factura no se guardará para '{tenant_id}'.")
+                continue
+            if numero and ('numero', numero) in existentes:
+                logger.error(f"Error de integridad al crear factura: el número {numero} ya existe con otro CUFE (tenant: '{tenant_id}').")
+                continue
+            clave = ('cufe', cufe) if cufe else ('numero', numero)
+            if clave in vistas:
+                repetidas[posicion] = vistas[clave]
+                continue
+            if numero and ('numero', numero) in vistas:
+                logger.error(f"Error de integridad al crear factura: el número {numero} se repite en el lote con otro CUFE (tenant: '{tenant_id}').")
+                continue
+            vistas[clave] = posicion
+            if numero:
+                vistas[('numero', numero)] = posicion
+
+            _externalizar_blobs(data)
+            proveedor_id = proveedores.get((tenant_id, data.get('nit_proveedor')))
+            data['proveedor_id'] = proveedor_id
+            if proveedor_id is None:
+                data['revisada_manualmente'] = False
+                data['tipo_documento_dian'] = data.get('tipo_documento_dian', 'Por revisar')
+            nuevas.append(posicion)
+
+        if nuevas:
+            # Cuáles insertó esta transacción: con RETURNING (SQLite >= 3.35) el INSERT devuelve
+            # solo las filas que no chocaron. En MySQL la verificación previa bloqueó las claves
+            # (FOR UPDATE), así que nadie más pudo insertarlas: toda fila nueva es nuestra.
+            insertadas = set() if self._insert_con_returning() else None
+            filas = _filas_homogeneas(tabla, [dict(facturas[p][0], tenant_id=facturas[p][2]) for p in nuevas])
+            for bloque in _bloques_por_tamano(filas):
+                sentencia = self._insert_sin_conflicto(tabla, bloque)
+                if insertadas is None:
+                    self.db.execute(sentencia)
+                else:
+                    insertadas.update(self.db.execute(sentencia.returning(tabla.c.id)).scalars())
+
+            # Ids generados: una sola consulta por las claves únicas del lote.
+            guardadas = self._facturas_por_clave(
+                [facturas[p][0].get('cufe') for p in nuevas], [facturas[p][0].get('numero_factura') for p in nuevas]
+            )
+            creadas = []
+            for posicion in nuevas:
+                data, items, tenant_id = facturas[posicion]
+                fila = guardadas.get(('cufe', data['cufe'])) if data.get('cufe') else guardadas.get(('numero', data['numero_factura']))
+                if not fila or fila['tenant_id'] != tenant_id or fila['cufe'] != data.get('cufe'):
+                    logger.error(f"Conflicto de CUFE/número al insertar factura {data.get('numero_factura')} en lote para tenant '{tenant_id}'. No se guardó.")
+                    continue
+                if insertadas is not None and fila['id'] not in insertadas:
+                    # Otro proceso la insertó entre la verificación previa y este INSERT: es un duplicado.
+                    resultado[posicion] = (fila['id'], False)
+                    continue
+                resultado[posicion] = (fila['id'], True)
+                creadas.append(posicion)
+
+            self._insertar_items_y_auditoria(facturas, resultado, creadas)
+
+        for posicion, original in repetidas.items():
+            invoice_id, _ = resultado[original]
+            if invoice_id and facturas[original][2] == facturas[posicion][2]:
+                resultado[posicion] = (invoice_id, False)
+        logger.info(f"Lote de {len(facturas)} factura(s): {sum(1 for _, creada in resultado if creada)} creada(s).")
+        return resultado
+
+    def _facturas_por_clave(self, cufes: List[Optional[str]], numeros: List[Optional[str]], bloquear: bool = False) -> Dict[tuple, Dict[str, Any]]:
+        cufes, numeros = {c for c in cufes if c}, {n for n in numeros if n}
+        condiciones = []
+        if cufes:
+            condiciones.append(Factura.cufe.in_(cufes))
+        if numeros:
+            condiciones.append(Factura.numero_factura.in_(numeros))
+        if not condiciones:
+            return {}
+        consulta = select(Factura.id, Factura.tenant_id, Factura.cufe, Factura.numero_factura).where(or_(*condiciones))
+        if bloquear and self.db.get_bind().dialect.name == 'mysql':
+            # Con REPEATABLE READ bloquea también las claves que aún no existen, hasta el commit.
+            consulta = consulta.with_for_update()
+        encontradas = {}
+        for fila in self.db.execute(consulta).mappings():
+            fila = dict(fila)
+            if fila['cufe']:
+                encontradas[('cufe', fila['cufe'])] = fila
+            if fila['numero_factura']:
+                encontradas[('numero', fila['numero_factura'])] = fila
+        return encontradas
+
+    def _insert_con_returning(self) -> bool:
+        dialecto = self.db.get_bind().dialect
+        return dialecto.name == 'sqlite' and dialecto.insert_returning
+
+    def _insert_sin_conflicto(self, tabla, filas: List[Dict[str, Any]]):
+        # Una fila que choca por CUFE/número (p. ej. insertada por otro proceso tras la
+        # verificación previa) se omite sin abortar la sentencia ni el resto del lote.
+        dialecto = self.db.get_bind().dialect.name
+        if dialecto == 'mysql':
+            sentencia = mysql_insert(tabla).values(filas)
+            return sentencia.on_duplicate_key_update(id=tabla.c.id)
+        if dialecto == 'sqlite':
+            return sqlite_insert(tabla).values(filas).on_conflict_do_nothing()
+        return insert(tabla).values(filas)
+
+    def _insertar_items_y_auditoria(self, facturas, resultado, creadas: List[int]):
+        if not creadas:
+            return
+        items = []
+        for posicion in creadas:
+            invoice_id, _ = resultado[posicion]
+            _, items_data, tenant_id = facturas[posicion]
+            for item_data in items_data:
+                item_data.pop('id', None)
+                items.append(dict(item_data, factura_id=invoice_id, tenant_id=tenant_id))
+        if items:
+            self.db.execute(insert(ItemFactura.__table__), _filas_homogeneas(ItemFactura.__table__, items))
+
+        # La auditoría se escribe en segundo plano tras el commit (database/auditoria.py).
+        usuario_auditoria_id = CURRENT_AUDIT_USER_ID.get()
+        auditoria = []
+        for posicion in creadas:
+            data, _, tenant_id = facturas[posicion]
+            valores = dict(data, id=resultado[posicion][0], tenant_id=tenant_id)
+            auditoria.extend(filas_de_auditoria(Factura, 'INSERT', None, valores, data.get('usuario_id') or usuario_auditoria_id))
+
+        if items:
+            usuarios = {resultado[p][0]: facturas[p][0].get('usuario_id') for p in creadas}
+            items_guardados = self.db.execute(
+                select(ItemFactura.__table__).where(ItemFactura.factura_id.in_(usuarios))
+            ).mappings()
+            for item in items_guardados:
+                auditoria.extend(filas_de_auditoria(ItemFactura, 'INSERT', None, dict(item), usuarios[item['factura_id']] or usuario_auditoria_id))
+        agregar_a_sesion(self.db, auditoria)
     
     def get_invoices(
         self,
@@ -412,30 +582,81 @@ class InvoiceCRUD:
         monto_total_max: Optional[float] = None,
         tipo_documento_dian: Optional[str] = None, 
         revisada_manualmente: Optional[bool] = None,
-        usuario_id: Optional[int] = None
-    ) -> List[Factura]:
-        query = self.db.query(Factura).filter(Factura.tenant_id == tenant_id)
-        if numero_factura:
-            query = query.filter(Factura.numero_factura.ilike(f"%{numero_factura}%"))
-        if nit_proveedor:
-            query = query.filter(Factura.nit_proveedor == nit_proveedor)
-        if nombre_proveedor:
-            query = query.filter(Factura.nombre_proveedor.ilike(f"%{nombre_proveedor}%"))
-        if fecha_desde:
-            query = query.filter(Factura.fecha_emision >= fecha_desde)
-        if fecha_hasta:
-            query = query.filter(Factura.fecha_emision <= fecha_hasta)
-        if monto_total_min:
-            query = query.filter(Factura.monto_total >= monto_total_min)
-        if monto_total_max:
-            query = query.filter(Factura.monto_total <= monto_total_max)
-        if tipo_documento_dian: 
-            query = query.filter(Factura.tipo_documento_dian == tipo_documento_dian) 
-        if revisada_manualmente is not None:
-            query = query.filter(Factura.revisada_manualmente == revisada_manualmente)
-        if usuario_id:
-            query = query.filter(Factura.usuario_id == usuario_id)
-        return query.offset(skip).limit(limit).all()
+        usuario_id: Optional[int] = None,
+        incluir_items: bool = False,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Factura], Optional[str]]:
+        query = self.consulta_facturas(
+            tenant_id,
+            numero_factura=numero_factura,
+            nit_proveedor=nit_proveedor,
+            nombre_proveedor=nombre_proveedor,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            monto_total_min=monto_total_min,
+            monto_total_max=monto_total_max,
+            tipo_documento_dian=tipo_documento_dian,
+            revisada_manualmente=revisada_manualmente,
+            usuario_id=usuario_id
+        )
+        facturas, siguiente_cursor = paginar(query, ORDEN_FACTURAS, limit, cursor=cursor, skip=skip)
+        if incluir_items and facturas:
+            items = self.db.query(ItemFactura).filter(ItemFactura.factura_id.in_([f.id for f in facturas])).order_by(ItemFactura.factura_id, ItemFactura.id)
+            asignar_items(facturas, items)
+        return facturas, siguiente_cursor
+
+    def consulta_facturas(self, tenant_id: str, **filtros):
+        """Consulta filtrada del listado, sin orden ni página (ver database/verificar_indices.py)."""
+        return filtrar_facturas(self.db.query(Factura), tenant_id, **filtros)
+
+    def search_invoices(self, tenant_id: str, texto: str, limit: int = 20) -> List[Tuple[Factura, float]]:
+        """Facturas cuyo número, proveedor o ítems coinciden con `texto`, de mayor a menor puntaje."""
+        texto = texto.strip()
+        if not texto:
+            return []
+        if self.db.get_bind().dialect.name == "mysql" and len(texto) >= _LONGITUD_MINIMA_NGRAM:
+            puntajes = self._puntajes_texto_completo(tenant_id, texto, limit)
+        else:
+            puntajes = self._puntajes_like(tenant_id, texto, limit)
+        ids = sorted(puntajes, key=lambda factura_id: (puntajes[factura_id], factura_id), reverse=True)[:limit]
+        if not ids:
+            return []
+        facturas = {
+            factura.id: factura
+            for factura in self.db.query(Factura).options(load_only(*_COLUMNAS_LISTADO), noload(Factura.items))
+            .filter(Factura.id.in_(ids), Factura.tenant_id == tenant_id).all()
+        }
+        return [(facturas[factura_id], puntajes[factura_id]) for factura_id in ids if factura_id in facturas]
+
+    def _puntajes_texto_completo(self, tenant_id: str, texto: str, limit: int) -> Dict[int, float]:
+        # Índices FULLTEXT ngram de la migración 0003; el puntaje es la relevancia que da MySQL,
+        # sumando la coincidencia en la factura y la del mejor de sus ítems.
+        en_factura = match(Factura.numero_factura, Factura.nombre_proveedor, against=texto).in_natural_language_mode()
+        en_item = match(ItemFactura.descripcion, against=texto).in_natural_language_mode()
+        puntajes: Dict[int, float] = defaultdict(float)
+        for factura_id, puntaje in self.db.query(Factura.id, en_factura).filter(
+            en_factura, Factura.tenant_id == tenant_id
+        ).order_by(en_factura.desc()).limit(limit):
+            puntajes[factura_id] += float(puntaje)
+        mejor_item = func.max(en_item)
+        for factura_id, puntaje in self.db.query(ItemFactura.factura_id, mejor_item).filter(
+            en_item, ItemFactura.tenant_id == tenant_id
+        ).group_by(ItemFactura.factura_id).order_by(mejor_item.desc()).limit(limit):
+            puntajes[factura_id] += float(puntaje)
+        return puntajes
+
+    def _puntajes_like(self, tenant_id: str, texto: str, limit: int) -> Dict[int, float]:
+        # Respaldo sin índices de texto completo (SQLite, o texto más corto que un token ngram).
+        patron = "%" + texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        puntaje = (
+            case((Factura.numero_factura == texto, 5.0), (Factura.numero_factura.ilike(patron, escape="\\"), 2.0), else_=0.0)
+            + case((Factura.nombre_proveedor.ilike(patron, escape="\\"), 1.0), else_=0.0)
+            + case((exists().where(ItemFactura.factura_id == Factura.id, ItemFactura.descripcion.ilike(patron, escape="\\")), 1.0), else_=0.0)
+        )
+        filas = self.db.query(Factura.id, puntaje).filter(Factura.tenant_id == tenant_id, puntaje > 0).order_by(
+            puntaje.desc(), Factura.id.desc()
+        ).limit(limit)
+        return {factura_id: float(valor) for factura_id, valor in filas}
 
     @audit_log
     def update_invoice(self, tenant_id: str, invoice_id: int, update_data: Dict[str, Any], items_data: Optional[List[Dict[str, Any]]] = None) -> Optional[int]: # <-- tenant_id al inicio
@@ -445,6 +666,7 @@ class InvoiceCRUD:
             return None
 
         try:
+            _externalizar_blobs(update_data)
             for key, value in update_data.items():
                 if hasattr(invoice, key) and key not in ['id', 'items', 'tenant_id']:
                     setattr(invoice, key, value)
@@ -466,7 +688,9 @@ class InvoiceCRUD:
                 invoice.tipo_documento_dian = update_data['tipo_documento_dian']
 
             if items_data is not None:
-                self.db.query(ItemFactura).filter(ItemFactura.factura_id == invoice.id, ItemFactura.tenant_id == tenant_id).delete()
+                # Borrado por la sesión (no DELETE masivo) para que cada ítem quede auditado.
+                for item in list(invoice.items):
+                    self.db.delete(item)
                 self.db.flush() 
                 for item_data in items_data:
                     item_data.pop('id', None) 
@@ -542,11 +766,12 @@ class ItemFacturaCRUD:
             ItemFactura.tenant_id == tenant_id
         ).first()
     
-    def get_items_by_factura(self, factura_id: int, tenant_id: str, skip: int = 0, limit: int = 100) -> List[ItemFactura]:
-        return self.db.query(ItemFactura).filter(
+    def get_items_by_factura(self, factura_id: int, tenant_id: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[ItemFactura], Optional[str]]:
+        query = self.db.query(ItemFactura).filter(
             ItemFactura.factura_id == factura_id,
             ItemFactura.tenant_id == tenant_id
-        ).offset(skip).limit(limit).all()
+        )
+        return paginar(query, ((ItemFactura.id, False),), limit, cursor=cursor, skip=skip)
     
     @audit_log
     def update_item_factura(self, tenant_id: str, item_id: int, factura_id: int, update_data: Any) -> Optional[int]: # <-- tenant_id al inicio
@@ -0,0 +1,130 @@
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+from database.models import SessionLocal, Factura, ItemFactura, Usuario
+from database.crud import InvoiceCRUD, ItemFacturaCRUD, UserCRUD, ORDEN_FACTURAS, filtrar_facturas, asignar_items
+from database.paginacion import consulta_pagina, recortar_pagina
+
+logger = logging.getLogger(__name__)
+
+# Variantes asíncronas de los CRUD para los endpoints de la API. Las lecturas van por
+# AsyncSession y no bloquean el event loop; las escrituras siguen en los CRUD síncronos (auditoría
+# por eventos de sesión, almacén de blobs, reintentos de audit_log) y corren en el threadpool con
+# su propia sesión. Devuelven ids: el endpoint vuelve a leer el registro con la sesión asíncrona.
+
+
+class _AsyncCRUD:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _escribir(self, operacion: Callable[[Any], Any]):
+        def ejecutar():
+            with SessionLocal() as db:
+                return operacion(db)
+        resultado = await run_in_threadpool(ejecutar)
+        # Termina la transacción de lectura de esta sesión: con REPEATABLE READ (MySQL) la
+        # relectura no vería lo que acaba de confirmar la sesión del threadpool. La sesión no
+        # expira al confirmar (expire_on_commit=False): sin expire_all, una fila leída antes de
+        # escribir se devolvería con los valores viejos desde el identity map.
+        await self.db.commit()
+        self.db.expire_all()
+        return resultado
+
+
+class AsyncInvoiceCRUD(_AsyncCRUD):
+    async def get_invoice(self, invoice_id: int, tenant_id: str) -> Optional[Factura]:
+        return await self.db.scalar(
+            select(Factura).options(selectinload(Factura.items))
+            .where(Factura.id == invoice_id, Factura.tenant_id == tenant_id)
+        )
+
+    async def get_invoices(
+        self,
+        tenant_id: str,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        incluir_items: bool = False,
+        **filtros: Any
+    ) -> Tuple[List[Factura], Optional[str]]:
+        """Igual que InvoiceCRUD.get_invoices (mismos filtros, orden y cursor)."""
+        consulta = consulta_pagina(filtrar_facturas(select(Factura), tenant_id, **filtros), ORDEN_FACTURAS, limit + 1, cursor=cursor, skip=skip)
+        facturas, siguiente_cursor = recortar_pagina(list((await self.db.scalars(consulta)).all()), ORDEN_FACTURAS, limit)
+        if incluir_items and facturas:
+            items = await self.db.scalars(
+                select(ItemFactura).where(ItemFactura.factura_id.in_([f.id for f in facturas])).order_by(ItemFactura.factura_id, ItemFactura.id)
+            )
+            asignar_items(facturas, items)
+        return facturas, siguiente_cursor
+
+    async def create_invoice(self, invoice_data: Dict[str, Any], items_data: List[Dict[str, Any]], tenant_id: str) -> Optional[int]:
+        return await self._escribir(lambda db: InvoiceCRUD(db).create_invoice(invoice_data, items_data, tenant_id))
+
+    async def update_invoice(self, tenant_id: str, invoice_id: int, update_data: Dict[str, Any], items_data: Optional[List[Dict[str, Any]]] = None) -> Optional[int]:
+        return await self._escribir(lambda db: InvoiceCRUD(db).update_invoice(tenant_id, invoice_id, update_data, items_data))
+
+    async def delete_invoice(self, tenant_id: str, invoice_id: int) -> bool:
+        return await self._escribir(lambda db: InvoiceCRUD(db).delete_invoice(tenant_id=tenant_id, invoice_id=invoice_id))
+
+
+class AsyncItemFacturaCRUD(_AsyncCRUD):
+    async def get_item_factura(self, item_id: int, factura_id: int, tenant_id: str) -> Optional[ItemFactura]:
+        return await self.db.scalar(
+            select(ItemFactura).where(
+                ItemFactura.id == item_id,
+                ItemFactura.factura_id == factura_id,
+                ItemFactura.tenant_id == tenant_id
+            )
+        )
+
+    async def get_items_by_factura(self, factura_id: int, tenant_id: str, skip: int = 0, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[ItemFactura], Optional[str]]:
+        orden = ((ItemFactura.id, False),)
+        consulta = consulta_pagina(
+            select(ItemFactura).where(ItemFactura.factura_id == factura_id, ItemFactura.tenant_id == tenant_id),
+            orden, limit + 1, cursor=cursor, skip=skip
+        )
+        return recortar_pagina(list((await self.db.scalars(consulta)).all()), orden, limit)
+
+    async def create_item_factura(self, factura_id: int, descripcion: str, cantidad: float, valor_unitario: float, valor_total: float, tenant_id: str) -> Optional[int]:
+        return await self._escribir(lambda db: ItemFacturaCRUD(db).create_item_factura(
+            factura_id=factura_id, descripcion=descripcion, cantidad=cantidad,
+            valor_unitario=valor_unitario, valor_total=valor_total, tenant_id=tenant_id
+        ))
+
+    async def update_item_factura(self, tenant_id: str, item_id: int, factura_id: int, update_data: Any) -> Optional[int]:
+        return await self._escribir(lambda db: ItemFacturaCRUD(db).update_item_factura(tenant_id, item_id, factura_id, update_data))
+
+    async def delete_item_factura(self, tenant_id: str, item_id: int, factura_id: int) -> bool:
+        return await self._escribir(lambda db: ItemFacturaCRUD(db).delete_item_factura(tenant_id, item_id, factura_id))
+
+
+class AsyncUserCRUD(_AsyncCRUD):
+    async def get_user_by_email(self, email: str) -> Optional[Usuario]:
+        return await self.db.scalar(select(Usuario).where(Usuario.correo == email))
+
+    async def get_user(self, user_id: int, tenant_id: str) -> Optional[Usuario]:
+        return await self.db.scalar(select(Usuario).where(Usuario.id == user_id, Usuario.tenant_id == tenant_id))
+
+    async def get_users(self, skip: int = 0, limit: int = 100, tenant_id: Optional[str] = None) -> List[Usuario]:
+        consulta = select(Usuario)
+        if tenant_id:
+            consulta = consulta.where(Usuario.tenant_id == tenant_id)
+        return list((await self.db.scalars(consulta.offset(skip).limit(limit))).all())
+
+    async def create_user(self, email: str, email_account_password_encrypted: Optional[str], tenant_id: Optional[str] = None) -> Optional[int]:
+        def crear(db):
+            usuario = UserCRUD(db).create_user(email, email_account_password_encrypted, tenant_id)
+            return usuario.id if usuario else None
+        return await self._escribir(crear)
+
+    async def update_user(self, user_id: int, tenant_id: str, email_account_password_encrypted: Optional[str] = None, **update_data: Any) -> Optional[int]:
+        def actualizar(db):
+            usuario = UserCRUD(db).update_user(user_id, tenant_id, email_account_password_encrypted, **update_data)
+            return usuario.id if usuario else None
+        return await self._escribir(actualizar)
+
+    async def delete_user(self, user_id: int, tenant_id: str) -> bool:
+        return await self._escribir(lambda db: UserCRUD(db).delete_user(user_id=user_id, tenant_id=tenant_id))
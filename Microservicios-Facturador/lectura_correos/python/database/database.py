@@ -1,14 +1,200 @@
+import time
 import logging
+import threading
+from typing import Any, Dict
 from config.settings import settings
-from database.models import Base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 
 logger = logging.getLogger(__name__)
 
-engine = create_engine(settings.DATABASE_URL)
+# Única fábrica de engines del servicio: la API, el worker de ingesta y los scripts comparten
+# este engine (database.models lo reexporta) y su pool, configurado desde settings.DB_POOL_*.
+# Los endpoints asíncronos de la API usan además un AsyncEngine con los mismos parámetros.
+
+# Límites (segundos) de los tramos del histograma de espera por una conexión del pool.
+_TRAMOS_ESPERA = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class MetricasPool:
+    """Espera por conexiones, conexiones en uso y desbordes del pool, para GET /metrics/pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.tramos = [0] * (len(_TRAMOS_ESPERA) + 1)
+        self.desbordes = 0
+        self.timeouts = 0
+        self.conexiones_creadas = 0
+        self.invalidaciones = 0
+
+    def registrar_espera(self, segundos: float, desborde: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total += segundos
+            self.espera_maxima = max(self.espera_maxima, segundos)
+            self.tramos[next((i for i, limite in enumerate(_TRAMOS_ESPERA) if segundos <= limite), len(_TRAMOS_ESPERA))] += 1
+            if desborde:
+                self.desbordes += 1
+
+    def registrar_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def registrar_conexion(self):
+        with self._lock:
+            self.conexiones_creadas += 1
+
+    def registrar_invalidacion(self):
+        with self._lock:
+            self.invalidaciones += 1
+
+    def resumen(self, pool: QueuePool) -> Dict[str, Any]:
+        with self._lock:
+            tramos = {f"<={limite}s": n for limite, n in zip(_TRAMOS_ESPERA, self.tramos)}
+            tramos[f">{_TRAMOS_ESPERA[-1]}s"] = self.tramos[-1]
+            return {
+                "tamano": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "en_uso": pool.checkedout(),
+                "disponibles": pool.checkedin(),
+                "overflow_actual": max(pool.overflow(), 0),
+                "checkouts": self.checkouts,
+                "espera_promedio_ms": round(1000 * self.espera_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "espera_maxima_ms": round(1000 * self.espera_maxima, 3),
+                "espera_por_tramo": tramos,
+                "desbordes": self.desbordes,
+                "timeouts": self.timeouts,
+                "conexiones_creadas": self.conexiones_creadas,
+                "invalidaciones": self.invalidaciones,
+            }
+
+
+class _PoolInstrumentado:
+    """Mide cuánto espera cada checkout y si tuvo que abrir una conexión de desborde."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metricas = MetricasPool()
+
+    def _do_get(self):
+        overflow_antes = self.overflow()
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except PoolTimeoutError:
+            self.metricas.registrar_timeout()
+            logger.warning(f"Timeout esperando una conexión del pool ({self.checkedout()} en uso, overflow {self.overflow()}).")
+            raise
+        self.metricas.registrar_espera(time.perf_counter() - inicio, desborde=self.overflow() > max(overflow_antes, 0))
+        return conexion
+
+    def recreate(self):
+        # Lo usa SQLAlchemy al invalidar el pool completo; el nuevo pool conserva las métricas.
+        nuevo = super().recreate()
+        nuevo.metricas = self.metricas
+        return nuevo
+
+
+class QueuePoolInstrumentado(_PoolInstrumentado, QueuePool):
+    pass
+
+
+class AsyncAdaptedQueuePoolInstrumentado(_PoolInstrumentado, AsyncAdaptedQueuePool):
+    pass
+
+
+def _parametros_pool() -> Dict[str, Any]:
+    return dict(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+def _instrumentar(motor):
+    event.listen(motor, "connect", lambda *_: motor.pool.metricas.registrar_conexion())
+    event.listen(motor, "invalidate", lambda *_: motor.pool.metricas.registrar_invalidacion())
+    return motor
+
+
+def crear_engine(url: str = None, **kwargs):
+    """Engine con el pool instrumentado y los parámetros DB_POOL_* de settings."""
+    return _instrumentar(create_engine(url or settings.DATABASE_URL, poolclass=QueuePoolInstrumentado, **_parametros_pool(), **kwargs))
+
+
+# Driver asíncrono equivalente a cada driver síncrono de DATABASE_URL.
+_DRIVERS_ASYNC = {
+    "mysql": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def url_async(url: str) -> str:
+    url = make_url(url)
+    if url.drivername not in _DRIVERS_ASYNC:
+        raise ValueError(f"No hay driver asíncrono configurado para '{url.drivername}'; defina DATABASE_ASYNC_URL.")
+    return url.set(drivername=_DRIVERS_ASYNC[url.drivername]).render_as_string(hide_password=False)
+
+
+def crear_engine_async(url: str = None, **kwargs):
+    """AsyncEngine para la API (aiomysql), con el mismo pool instrumentado y parámetros."""
+    motor = create_async_engine(
+        url or settings.DATABASE_ASYNC_URL or url_async(settings.DATABASE_URL),
+        poolclass=AsyncAdaptedQueuePoolInstrumentado, **_parametros_pool(), **kwargs
+    )
+    _instrumentar(motor.sync_engine)
+    return motor
+
+
+def metricas_pool(motor=None) -> Dict[str, Any]:
+    pool = (motor or engine).pool
+    return pool.metricas.resumen(pool)
+
+
+engine = crear_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# El engine asíncrono solo lo usa la API: se crea con la primera petición, así el worker de
+# ingesta no necesita el driver asíncrono.
+_engine_async = None
+_AsyncSessionLocal = None
+
+def obtener_engine_async():
+    global _engine_async, _AsyncSessionLocal
+    if _engine_async is None:
+        _engine_async = crear_engine_async()
+        _AsyncSessionLocal = async_sessionmaker(_engine_async, expire_on_commit=False, autoflush=False)
+    return _engine_async
+
+async def cerrar_engine_async():
+    """Cierra las conexiones del pool asíncrono (al apagar la API)."""
+    global _engine_async, _AsyncSessionLocal
+    if _engine_async is not None:
+        await _engine_async.dispose()
+        _engine_async = _AsyncSessionLocal = None
+
+def metricas_pools() -> Dict[str, Any]:
+    metricas = {"sync": metricas_pool()}
+    if _engine_async is not None:
+        metricas["async"] = metricas_pool(_engine_async.sync_engine)
+    return metricas
+
+async def get_async_db():
+    obtener_engine_async()
+    async with _AsyncSessionLocal() as db:
+        yield db
+
 def get_db():
     db = SessionLocal()
     try:
@@ -17,9 +203,5 @@ def get_db():
         db.close()
 
 def init_db():
-    try:
-        Base.metadata.create_all(bind=engine)
-        logger.info("Tablas creadas/verificadas correctamente.")
-    except Exception as e:
-        logger.critical(f"Error al inicializar la base de datos: {e}", exc_info=True)
-        raise
\ No newline at end of file
+    from database.models import init_db as inicializar
+    inicializar()
@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Date, Boolean, Text, LargeBinary, ForeignKey, inspect
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy import text, Index, Column, Integer, String, Float, DateTime, Date, Boolean, Text, LargeBinary, ForeignKey, inspect
+from sqlalchemy.orm import declarative_base, relationship, deferred
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.mysql import LONGBLOB, TINYINT 
+from sqlalchemy.dialects.mysql import LONGBLOB, LONGTEXT, TINYINT 
+import os
 import json 
 from config.settings import settings
 from typing import Optional
@@ -16,6 +17,8 @@ class Usuario(Base):
     is_active = Column(Boolean, default=True)
     email_account_password_encrypted = Column(String(255), nullable=True)
     tenant_id = Column(String(255), index=True, nullable=True) 
+    # Lo usa la caché de credenciales de la ingesta para recargar solo los usuarios modificados.
+    updated_at = Column(DateTime, nullable=True, default=func.now(), onupdate=func.now(), index=True)
 
     facturas = relationship("Factura", back_populates="usuario")
     def __repr__(self):
@@ -24,7 +27,9 @@ class Usuario(Base):
 class Factura(Base):
     __tablename__ = "facturas"
     id = Column(Integer, primary_key=True, index=True)
-    procesado_en = Column(DateTime, default=func.now())
+    # Por defecto en Python (no func.now()): en SQLite el valor queda con el mismo formato
+    # (con microsegundos) que los parámetros, y la comparación del cursor keyset es consistente.
+    procesado_en = Column(DateTime, default=datetime.now)
     ruta_archivo_original = Column(String(500), nullable=True)
     asunto_correo = Column(String(500), nullable=True)
     remitente_correo = Column(String(255), nullable=True)
@@ -44,8 +49,12 @@ class Factura(Base):
     nit_cliente = Column(String(50), nullable=True)
     fecha_vencimiento = Column(Date, nullable=True)
     metodo_pago = Column(String(100), nullable=True)
-    texto_crudo_xml = Column(Text, nullable=True)
-    contenido_pdf_binario = Column(LONGBLOB, nullable=True)
+    # Contenidos pesados: fuera de la fila (storage/blob_store.py), referenciados por su SHA-256.
+    # Las columnas en línea quedan para filas antiguas y solo se cargan si se piden (deferred).
+    texto_crudo_xml = deferred(Column(Text, nullable=True))
+    contenido_pdf_binario = deferred(Column(LONGBLOB, nullable=True))
+    xml_blob_key = Column(String(64), nullable=True)
+    pdf_blob_key = Column(String(64), nullable=True)
     tipo_documento_dian = Column(String(100),  nullable=True) 
     revisada_manualmente = Column(TINYINT, default=0, nullable=True) 
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True) 
@@ -54,7 +63,24 @@ class Factura(Base):
     items = relationship("ItemFactura", back_populates="factura", cascade="all, delete-orphan")
     usuario = relationship("Usuario", back_populates="facturas") 
     
-    tenant_id = Column(String(255), index=True, nullable=True) 
+    tenant_id = Column(String(255), nullable=True) 
+
+    # Todas las consultas filtran primero por inquilino: los índices empiezan por tenant_id (que
+    # por eso no tiene índice propio). Los filtros de igualdad terminan en (procesado_en, id), el
+    # orden del listado, para paginar por cursor sin ordenar; los rangos (fecha_emision,
+    # monto_total) recorren ix_facturas_tenant_procesado_id en ese orden. Se crean con migraciones
+    # (migraciones/versions) y `python -m database.verificar_indices` comprueba que los filtros
+    # del listado los usan sin ordenar aparte.
+    __table_args__ = (
+        Index("ix_facturas_tenant_procesado_id", "tenant_id", "procesado_en", "id"),
+        Index("ix_facturas_tenant_nit_procesado_id", "tenant_id", "nit_proveedor", "procesado_en", "id"),
+        Index("ix_facturas_tenant_usuario_procesado_id", "tenant_id", "usuario_id", "procesado_en", "id"),
+        Index("ix_facturas_tenant_revisada_procesado_id", "tenant_id", "revisada_manualmente", "procesado_en", "id"),
+        Index("ix_facturas_tenant_tipo_procesado_id", "tenant_id", "tipo_documento_dian", "procesado_en", "id"),
+        # Búsqueda de GET /invoices/search (solo MySQL; en otros motores se busca con LIKE).
+        Index("ft_facturas_numero_proveedor", "numero_factura", "nombre_proveedor",
+              mysql_prefix="FULLTEXT", mysql_with_parser="ngram").ddl_if(dialect="mysql"),
+    )
 
     def __repr__(self):
         return (f"<Factura(id={self.id}, numero='{self.numero_factura}', "
@@ -73,6 +99,12 @@ class ItemFactura(Base):
     
     tenant_id = Column(String(255), index=True, nullable=True) 
 
+    __table_args__ = (
+        Index("ix_items_factura_factura_id_id", "factura_id", "id"),
+        Index("ft_items_factura_descripcion", "descripcion",
+              mysql_prefix="FULLTEXT", mysql_with_parser="ngram").ddl_if(dialect="mysql"),
+    )
+
     def __repr__(self):
         return (f"<ItemFactura(id={self.id}, id_factura={self.factura_id}, "
                 f"descripcion='{self.descripcion}', total={self.valor_total}, tenant_id='{self.tenant_id}')>")
@@ -80,7 +112,7 @@ class ItemFactura(Base):
 class FacturaAudit(Base):
     __tablename__ = "facturas_audit"
     id = Column(Integer, primary_key=True, index=True)
-    id_factura = Column(Integer, nullable=False) 
+    id_factura = Column(Integer, nullable=False, index=True) 
     
     procesado_en = Column(DateTime, nullable=True)
     ruta_archivo_original = Column(String(500), nullable=True)
@@ -110,6 +142,9 @@ class FacturaAudit(Base):
     tipo_operacion = Column(String(10), nullable=False) 
     usuario_auditoria_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True) 
     datos_anteriores = Column(Text, nullable=True) 
+    # Formato compacto: {"columna": [anterior, nuevo]} solo con lo que cambió; el XML va por hash.
+    cambios = Column(Text().with_variant(LONGTEXT, "mysql"), nullable=True)
+    hash_xml = Column(String(64), nullable=True)
     
     tenant_id = Column(String(255), index=True, nullable=True) 
 
@@ -121,7 +156,7 @@ class ItemFacturaAudit(Base):
     __tablename__ = "items_factura_audit"
     id = Column(Integer, primary_key=True, index=True)
     id_item_factura = Column(Integer, nullable=False) 
-    factura_id = Column(Integer, nullable=False) 
+    factura_id = Column(Integer, nullable=False, index=True) 
     descripcion = Column(String(500), nullable=True)
     cantidad = Column(Float, nullable=True)
     valor_unitario = Column(Float, nullable=True)
@@ -131,6 +166,7 @@ class ItemFacturaAudit(Base):
     tipo_operacion = Column(String(10), nullable=False) 
     usuario_auditoria_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True) 
     datos_anteriores = Column(Text, nullable=True) 
+    cambios = Column(Text, nullable=True)
     
     tenant_id = Column(String(255), index=True, nullable=True) 
 
@@ -170,24 +206,56 @@ class Supplier(Base):
 
 
 DATABASE_URL = settings.DATABASE_URL
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine y sesiones vienen de la fábrica única de database/database.py.
+from database.database import engine, SessionLocal  # noqa: E402
+
+# Revisión que corresponde al esquema que dejaba create_all antes de usar migraciones.
+REVISION_BASE = "0001"
+
+def _agregar_columnas_faltantes():
+    # create_all no modifica tablas existentes: columnas e índices nuevos se agregan aquí.
+    inspector = inspect(engine)
+    with engine.begin() as conexion:
+        for tabla in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+            existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name not in existentes:
+                    tipo = columna.type.compile(dialect=engine.dialect)
+                    conexion.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo} NULL"))
+                    print(f"Columna '{tabla.name}.{columna.name}' agregada.")
+            indices = {i["name"] for i in inspector.get_indexes(tabla.name)}
+            for indice in tabla.indexes:
+                if indice.name not in indices:
+                    indice.create(bind=conexion)
+
+_DIRECTORIO_PROYECTO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def configuracion_alembic(conexion=None):
+    from alembic.config import Config
+    config = Config(os.path.join(_DIRECTORIO_PROYECTO, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(_DIRECTORIO_PROYECTO, "migraciones"))
+    if conexion is not None:
+        config.attributes["connection"] = conexion
+    return config
 
 def init_db():
+    # El esquema lo manejan las migraciones de migraciones/versions. Las bases creadas antes con
+    # create_all se completan una última vez y se marcan en la revisión base antes de migrar.
+    from alembic import command
     try:
         inspector = inspect(engine)
-        required_tables = [
-            "usuarios", "facturas", "items_factura",
-            "facturas_audit", "items_factura_audit", "suppliers" 
-        ]
-        
-        for table_name in required_tables:
-            if not inspector.has_table(table_name):
-               
-                pass 
-        Base.metadata.create_all(bind=engine) 
+        if inspector.has_table("facturas") and not inspector.has_table("alembic_version"):
+            Base.metadata.create_all(bind=engine)
+            _agregar_columnas_faltantes()
+            with engine.begin() as conexion:
+                command.stamp(configuracion_alembic(conexion), REVISION_BASE)
+            print(f"Base de datos existente marcada en la revisión base {REVISION_BASE}.")
+        with engine.begin() as conexion:
+            command.upgrade(configuracion_alembic(conexion), "head")
         
-        print("Base de datos inicializada y tablas creadas/verificadas.")
+        print("Base de datos inicializada y migrada a la última revisión.")
     except Exception as e:
         print(f"Error al inicializar la base de datos: {e}")
         raise 
@@ -0,0 +1,108 @@
+import json
+import base64
+from datetime import datetime, date
+from typing import Any, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, or_
+
+# Paginación por cursor (keyset): en vez de OFFSET, cada página continúa después de la última
+# fila de la anterior comparando las columnas de orden, así que el costo no crece con la
+# profundidad. El cursor es opaco para el cliente: base64 de los valores de esa última fila.
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def _a_json(valor: Any) -> Any:
+    if isinstance(valor, datetime):
+        return {"dt": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"d": valor.isoformat()}
+    return valor
+
+
+def _desde_json(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        if "dt" in valor:
+            return datetime.fromisoformat(valor["dt"])
+        if "d" in valor:
+            return date.fromisoformat(valor["d"])
+        raise CursorInvalido("Cursor inválido.")
+    return valor
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    crudo = json.dumps([_a_json(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str, num_columnas: int) -> List[Any]:
+    try:
+        crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(crudo)
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido("Cursor inválido.") from e
+    if not isinstance(valores, list) or len(valores) != num_columnas:
+        raise CursorInvalido("Cursor inválido.")
+    try:
+        return [_desde_json(v) for v in valores]
+    except (ValueError, TypeError) as e:
+        # CursorInvalido es un ValueError: también se relanza tal cual desde aquí.
+        raise CursorInvalido("Cursor inválido.") from e
+
+
+def _despues_de(columna, valor, descendente: bool):
+    """Filas que van estrictamente después de `valor` en el orden de `columna` (NULL al final en DESC, al inicio en ASC, como MySQL)."""
+    if valor is None:
+        return columna.isnot(None) if not descendente else None
+    if descendente:
+        return or_(columna < valor, columna.is_(None))
+    return columna > valor
+
+
+def _igual_a(columna, valor):
+    return columna.is_(None) if valor is None else columna == valor
+
+
+def filtro_keyset(orden: Sequence[Tuple[Any, bool]], valores: Sequence[Any]):
+    """
+    Condición "(c1, c2, ...) después de (v1, v2, ...)" para `orden` = [(columna, descendente), ...].
+    La última columna debe ser única (el id) para que el orden sea total.
+    """
+    condiciones = []
+    for i, ((columna, descendente), valor) in enumerate(zip(orden, valores)):
+        despues = _despues_de(columna, valor, descendente)
+        if despues is None:
+            continue
+        iguales = [_igual_a(c, v) for (c, _), v in zip(orden[:i], valores[:i])]
+        condiciones.append(and_(*iguales, despues) if iguales else despues)
+    return or_(*condiciones)
+
+
+def consulta_pagina(query, orden: Sequence[Tuple[Any, bool]], limit: int, cursor: Optional[str] = None, skip: int = 0):
+    """La consulta de una página sin ejecutar; sirve igual para Query y para select() (crud_async)."""
+    if cursor:
+        query = query.filter(filtro_keyset(orden, decodificar_cursor(cursor, len(orden))))
+    query = query.order_by(*[columna.desc() if descendente else columna.asc() for columna, descendente in orden])
+    if skip:
+        query = query.offset(skip)
+    return query.limit(limit)
+
+
+def paginar(query, orden: Sequence[Tuple[Any, bool]], limit: int, cursor: Optional[str] = None, skip: int = 0) -> Tuple[list, Optional[str]]:
+    """
+    Aplica orden, cursor y límite a `query`; devuelve (filas, cursor de la siguiente página o None).
+    `skip` se mantiene por compatibilidad con los clientes que paginan por desplazamiento; junto
+    con `cursor` salta filas contadas desde el cursor, no desde el inicio del listado.
+    """
+    filas = consulta_pagina(query, orden, limit + 1, cursor=cursor, skip=skip).all()
+    return recortar_pagina(filas, orden, limit)
+
+
+def recortar_pagina(filas: list, orden: Sequence[Tuple[Any, bool]], limit: int) -> Tuple[list, Optional[str]]:
+    """Filas pedidas con limit + 1: las primeras `limit` y, si sobró una, el cursor de la siguiente página."""
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    ultima = filas[-1]
+    return filas, codificar_cursor([getattr(ultima, columna.key) for columna, _ in orden])
@@ -0,0 +1,208 @@
+"""
+Comprueba con EXPLAIN que cada combinación de filtros de GET /invoices (InvoiceCRUD.get_invoices)
+usa el índice esperado de `facturas`, con las columnas clave esperadas, en vez de recorrer la
+tabla u otro índice menos selectivo, y que el índice entrega las filas en el orden del listado
+(sin "USE TEMP B-TREE FOR ORDER BY" en SQLite ni filesort en MySQL). Termina con código 1 si
+alguna no lo hace, para usarlo como chequeo de regresión después de tocar índices o consultas.
+
+Antes de comprobar se siembran filas de prueba (para el inquilino indicado y otro más) y se
+ejecuta ANALYZE, para que el optimizador decida con estadísticas y no sobre una tabla casi
+vacía; al terminar se borran. Con --sin-sembrar se usa solo lo que ya hay en la base (p. ej. una
+copia de producción).
+
+Uso (desde lectura_correos/python):
+    python -m database.verificar_indices [--tenant-id ID] [--filas N] [--sin-sembrar]
+"""
+import os
+import re
+import sys
+import json
+import argparse
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text, insert, delete  # noqa: E402
+from database.models import SessionLocal, engine, Factura, Usuario  # noqa: E402
+from database.crud import InvoiceCRUD, ORDEN_FACTURAS  # noqa: E402
+from database.paginacion import consulta_pagina, codificar_cursor  # noqa: E402
+
+_POR_PROCESADO = ("ix_facturas_tenant_procesado_id", ("tenant_id",))
+_POR_NIT = ("ix_facturas_tenant_nit_procesado_id", ("tenant_id", "nit_proveedor"))
+_POR_TIPO = ("ix_facturas_tenant_tipo_procesado_id", ("tenant_id", "tipo_documento_dian"))
+_POR_REVISADA = ("ix_facturas_tenant_revisada_procesado_id", ("tenant_id", "revisada_manualmente"))
+_POR_USUARIO = ("ix_facturas_tenant_usuario_procesado_id", ("tenant_id", "usuario_id"))
+
+# (nombre, filtros, índice esperado, columnas clave esperadas), según los datos sembrados. Los
+# filtros con LIKE '%...%' no pueden usar índice y los rangos (fechas, montos) no pueden dar el
+# orden del listado: se resuelven recorriendo ix_facturas_tenant_procesado_id en ese orden hasta
+# llenar la página. Los filtros de igualdad usan su índice, que termina en (procesado_en, id).
+CASOS = (
+    ("solo inquilino", {}, *_POR_PROCESADO),
+    ("numero_factura", {"numero_factura": "FE-1"}, *_POR_PROCESADO),
+    ("nit_proveedor", {"nit_proveedor": "900123456"}, *_POR_NIT),
+    ("nombre_proveedor", {"nombre_proveedor": "ACME"}, *_POR_PROCESADO),
+    ("fecha_desde", {"fecha_desde": date(2024, 1, 1)}, *_POR_PROCESADO),
+    ("rango de fechas", {"fecha_desde": date(2024, 1, 1), "fecha_hasta": date(2024, 1, 31)}, *_POR_PROCESADO),
+    ("monto_total_min", {"monto_total_min": 1000.0}, *_POR_PROCESADO),
+    ("rango de montos", {"monto_total_min": 1000.0, "monto_total_max": 1500.0}, *_POR_PROCESADO),
+    ("tipo_documento_dian", {"tipo_documento_dian": "Nota Crédito"}, *_POR_TIPO),
+    ("revisada_manualmente", {"revisada_manualmente": True}, *_POR_REVISADA),
+    ("usuario_id", {"usuario_id": 1}, *_POR_USUARIO),
+    ("nit_proveedor + rango de fechas", {"nit_proveedor": "900123456", "fecha_desde": date(2024, 1, 1), "fecha_hasta": date(2024, 12, 31)}, *_POR_NIT),
+    ("usuario_id + revisada_manualmente", {"usuario_id": 1, "revisada_manualmente": True}, *_POR_USUARIO),
+)
+
+_PREFIJO_SEMBRADO = "VERIF-INDICES-"
+_DOMINIO_SEMBRADO = "@verificar-indices.invalid"
+_TIPOS_DOCUMENTO = ("Factura Electrónica", "Nota Crédito", "Nota Débito", "Documento Soporte", "Factura de Exportación") + tuple(
+    f"Tipo {i}" for i in range(15)
+)
+_USUARIOS_SEMBRADOS = 50
+_COLUMNA_EN_CLAVE = re.compile(r"(\w+)\s*(?:=|>|<|IS\b)")
+
+
+def _sql(query) -> str:
+    return str(query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _facturas_sembradas(tenant_id: str, usuarios: list, filas: int):
+    inicio = datetime(2023, 1, 1)
+    for i in range(filas):
+        yield {
+            "tenant_id": tenant_id,
+            "numero_factura": f"{_PREFIJO_SEMBRADO}{tenant_id}-{i}",
+            "procesado_en": inicio + timedelta(minutes=i),
+            "fecha_emision": date(2023, 1, 1) + timedelta(days=i % 730),
+            "nit_proveedor": str(900123456 + i % 500),
+            "nombre_proveedor": f"Proveedor {i % 500}",
+            "monto_total": float((i * 37) % 50000),
+            "tipo_documento_dian": _TIPOS_DOCUMENTO[i % len(_TIPOS_DOCUMENTO)],
+            "revisada_manualmente": i % 20 == 0,
+            "usuario_id": usuarios[i % len(usuarios)] if i % 2 == 0 else None,
+        }
+
+
+def sembrar(db, tenant_id: str, filas: int) -> int:
+    """Inserta filas de prueba para `tenant_id` y otro inquilino; devuelve el id de un usuario sembrado."""
+    usuarios = {}
+    for inquilino in (tenant_id, f"{tenant_id}-otro"):
+        db.execute(insert(Usuario), [
+            {"correo": f"{inquilino}-{i}{_DOMINIO_SEMBRADO}", "tenant_id": inquilino, "is_active": True}
+            for i in range(_USUARIOS_SEMBRADOS)
+        ])
+        usuarios[inquilino] = [fila[0] for fila in db.query(Usuario.id).filter(
+            Usuario.tenant_id == inquilino, Usuario.correo.like(f"%{_DOMINIO_SEMBRADO}")
+        ).order_by(Usuario.id)]
+        facturas = list(_facturas_sembradas(inquilino, usuarios[inquilino], filas))
+        for inicio in range(0, len(facturas), 1000):
+            db.execute(insert(Factura), facturas[inicio:inicio + 1000])
+    db.commit()
+    return usuarios[tenant_id][0]
+
+
+def limpiar(db):
+    db.execute(delete(Factura).where(Factura.numero_factura.like(f"{_PREFIJO_SEMBRADO}%")))
+    db.execute(delete(Usuario).where(Usuario.correo.like(f"%{_DOMINIO_SEMBRADO}")))
+    db.commit()
+
+
+def analizar(db):
+    db.execute(text("ANALYZE" if engine.dialect.name == "sqlite" else "ANALYZE TABLE facturas"))
+    db.commit()
+
+
+def _accesos_mysql(nodo):
+    # EXPLAIN FORMAT=JSON anida las tablas bajo ordering_operation, nested_loop, etc.
+    if isinstance(nodo, dict):
+        if nodo.get("table_name") == "facturas":
+            yield nodo
+        for valor in nodo.values():
+            yield from _accesos_mysql(valor)
+    elif isinstance(nodo, list):
+        for valor in nodo:
+            yield from _accesos_mysql(valor)
+
+
+def _ordena_mysql(nodo) -> bool:
+    if isinstance(nodo, dict):
+        return bool(nodo.get("using_filesort") or nodo.get("using_temporary_table")) or any(
+            _ordena_mysql(valor) for valor in nodo.values()
+        )
+    return isinstance(nodo, list) and any(_ordena_mysql(valor) for valor in nodo)
+
+
+def _plan(conexion, sql: str):
+    """[(tipo de acceso, índice, columnas clave)] para `facturas`, si ordena aparte y la descripción del plan."""
+    if engine.dialect.name == "sqlite":
+        detalles = [fila[-1] for fila in conexion.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        accesos = []
+        for detalle in detalles:
+            partes = re.match(r"(SEARCH|SCAN) facturas(?: USING (?:COVERING )?INDEX (\w+))?(?: \((.*)\))?", detalle)
+            if partes:
+                columnas = tuple(dict.fromkeys(_COLUMNA_EN_CLAVE.findall(partes.group(3) or "")))
+                accesos.append((partes.group(1), partes.group(2), columnas))
+        return accesos, any("TEMP B-TREE" in detalle for detalle in detalles), "; ".join(detalles)
+    plan = json.loads(conexion.execute(text(f"EXPLAIN FORMAT=JSON {sql}")).scalar())
+    accesos = [
+        (tabla.get("access_type"), tabla.get("key"), tuple(tabla.get("used_key_parts") or ()))
+        for tabla in _accesos_mysql(plan)
+    ]
+    ordena = _ordena_mysql(plan)
+    descripcion = "; ".join(f"type={tipo} key={indice} key_parts={list(columnas)}" for tipo, indice, columnas in accesos)
+    return accesos, ordena, f"{descripcion}{'; using_filesort' if ordena else ''}"
+
+
+def _usa_indice(accesos, indice: str, columnas: tuple) -> bool:
+    # Las columnas clave esperadas deben ser el comienzo de las usadas: con cursor el optimizador
+    # puede además acotar por procesado_en.
+    return bool(accesos) and all(
+        tipo not in ("SCAN", "ALL", "index") and nombre == indice and usadas[:len(columnas)] == columnas
+        for tipo, nombre, usadas in accesos
+    )
+
+
+def verificar(tenant_id: str, filas: int = 0) -> bool:
+    db = SessionLocal()
+    crud = InvoiceCRUD(db)
+    cursor = codificar_cursor([datetime(2023, 1, 2), 1000])
+    todo_bien = True
+    try:
+        usuario_id = sembrar(db, tenant_id, filas) if filas else 1
+        analizar(db)
+        conexion = db.connection()
+        for nombre, filtros, indice, columnas in CASOS:
+            if "usuario_id" in filtros:
+                filtros = {**filtros, "usuario_id": usuario_id}
+            for con_cursor in (False, True):
+                query = consulta_pagina(crud.consulta_facturas(tenant_id, **filtros), ORDEN_FACTURAS, 100, cursor=cursor if con_cursor else None)
+                accesos, ordena, plan = _plan(conexion, _sql(query))
+                # El índice debe dar también el orden del listado: ordenar aparte obliga a leer
+                # todas las filas que pasan el filtro antes de devolver la primera página.
+                correcto = _usa_indice(accesos, indice, columnas) and not ordena
+                todo_bien = todo_bien and correcto
+                etiqueta = f"{nombre}{' (cursor)' if con_cursor else ''}"
+                esperado = f"se esperaba {indice} ({', '.join(columnas)}) sin ordenar aparte"
+                print(f"[{'OK' if correcto else 'INCORRECTO'}] {etiqueta}: {plan}{'' if correcto else f' — {esperado}'}")
+    finally:
+        db.rollback()
+        if filas:
+            limpiar(db)
+        db.close()
+    return todo_bien
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tenant-id", default="tenant-verificacion", help="Inquilino usado en las consultas")
+    parser.add_argument("--filas", type=int, default=5000, help="Facturas de prueba a sembrar por inquilino")
+    parser.add_argument("--sin-sembrar", action="store_true", help="No sembrar filas: usar los datos que ya tiene la base")
+    args = parser.parse_args()
+    if not verificar(args.tenant_id, 0 if args.sin_sembrar else args.filas):
+        print("Hay filtros del listado de facturas que no usan el índice esperado o lo ordenan aparte.")
+        sys.exit(1)
+    print("Todos los filtros del listado de facturas usan el índice esperado.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from config.settings import settings
+from ingestion.keyword_matcher import normalizar
+
+logger = logging.getLogger(__name__)
+
+# Datos de la factura escritos en el cuerpo del correo ("Empresa: ...", "CUFE: ..."). Cada campo
+# es una etiqueta literal seguida del patrón de su valor. El cuerpo se normaliza una vez a bytes
+# sin mayúsculas ni tildes (un carácter por byte, así las posiciones coinciden con el texto) y
+# las etiquetas se ubican con búsquedas de subcadena de CPython; el patrón del valor solo se
+# prueba donde aparece su etiqueta. En HTML de cientos de KB esto es mucho más rápido que una
+# alternancia de `re` con IGNORECASE, que prueba cada posición del texto.
+#
+# Los inquilinos pueden registrar plantillas por proveedor en EMAIL_BODY_TEMPLATES_FILE (JSON),
+# que se recarga cuando el archivo cambia:
+#   {"tenants": {"<tenant_id>": [{"proveedor": "ACME S.A.S.", "remitente": "@acme.com.co",
+#     "campos": {"numero_factura": {"etiqueta": "Factura No.", "patron": "([A-Z0-9-]+)"},
+#                "fecha_emision": {"etiqueta": "Expedida el", "patron": "(\\d{2}/\\d{2}/\\d{4})", "formato": "%d/%m/%Y"}}}]}}
+# Lo que la plantilla no encuentra lo completan los campos por defecto.
+
+# Cada cuánto se revisa si el archivo de plantillas cambió.
+_INTERVALO_RECARGA_SEGUNDOS = 5.0
+
+
+class CampoCuerpo:
+    """Etiqueta, patrón del valor (su primer grupo, o todo el patrón si no tiene) y, para fechas, el formato."""
+
+    def __init__(self, etiqueta: str, patron: str, formato: Optional[str] = None):
+        self.etiqueta = normalizar(etiqueta)
+        self.regex = re.compile(r'\s*(?:' + patron + ')', re.IGNORECASE)
+        self.formato = formato
+
+    def valor(self, texto: str, posicion: int) -> Tuple[bool, Any]:
+        match = self.regex.match(texto, posicion)
+        if not match:
+            return False, None
+        valor = (match.group(1) if self.regex.groups else match.group(0)).strip()
+        if self.formato:
+            try:
+                return True, datetime.strptime(valor, self.formato).date()
+            except ValueError:
+                return True, None
+        return True, valor
+
+
+CAMPOS_POR_DEFECTO = {
+    'nombre_proveedor': CampoCuerpo('Empresa:', r'(.+)'),
+    'nit_proveedor': CampoCuerpo('Identificación:', r'(\d{9,10})'),
+    'fecha_emision': CampoCuerpo('Fecha:', r'(\d{4}-\d{2}-\d{2})', '%Y-%m-%d'),
+    'numero_factura': CampoCuerpo('Número:', r'([A-Za-z0-9\-\_]+)'),
+    'cufe': CampoCuerpo('CUFE:', r'([a-f0-9]{64,128})'),
+}
+
+
+class ExtractorCuerpoCorreo:
+    """Extrae del cuerpo de un correo los campos indicados (por defecto, los de CAMPOS_POR_DEFECTO)."""
+
+    def __init__(self, campos: Optional[Dict[str, CampoCuerpo]] = None):
+        self.campos = CAMPOS_POR_DEFECTO if campos is None else campos
+
+    def extraer(self, texto: str, excluir: Tuple[str, ...] = ()) -> Dict[str, Any]:
+        texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+        clave = normalizar(texto)
+        datos = {}
+        for nombre, campo in self.campos.items():
+            if nombre in excluir:
+                continue
+            # Como antes, decide la primera aparición de la etiqueta cuyo valor tiene la forma
+            # esperada; una fecha con esa forma pero inválida deja el campo vacío.
+            posicion = clave.find(campo.etiqueta)
+            while posicion != -1:
+                encontrado, valor = campo.valor(texto, posicion + len(campo.etiqueta))
+                if encontrado:
+                    if valor is not None:
+                        datos[nombre] = valor
+                    break
+                posicion = clave.find(campo.etiqueta, posicion + 1)
+        return datos
+
+
+extractor_por_defecto = ExtractorCuerpoCorreo()
+
+
+class PlantillaProveedor:
+    def __init__(self, datos: dict):
+        self.proveedor = datos.get("proveedor")
+        self.remitente = (datos.get("remitente") or "").lower()
+        self.extractor = ExtractorCuerpoCorreo({
+            nombre: CampoCuerpo(campo["etiqueta"], campo.get("patron", r'(.+)'), campo.get("formato"))
+            for nombre, campo in (datos.get("campos") or {}).items()
+        })
+
+    def aplica(self, remitente: str) -> bool:
+        # Sin "remitente" la plantilla vale para todos los correos del inquilino.
+        return not self.remitente or self.remitente in remitente.lower()
+
+
+class ConfiguracionPlantillas:
+    """Plantillas por inquilino a partir del archivo de plantillas, recargado si cambia."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._plantillas: Dict[str, List[PlantillaProveedor]] = {}
+        self._mtime = None
+        self._revisado_en = None
+
+    def _recargar_si_cambio(self):
+        ahora = time.monotonic()
+        if self._revisado_en is not None and ahora - self._revisado_en < _INTERVALO_RECARGA_SEGUNDOS:
+            return
+        self._revisado_en = ahora
+        try:
+            mtime = os.path.getmtime(self.ruta)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        self._plantillas = {}
+        if mtime is None:
+            return
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+        except Exception as e:
+            logger.error(f"Error leyendo el archivo de plantillas de cuerpo {self.ruta}: {e}", exc_info=True)
+            return
+        for tenant_id, plantillas in (datos.get("tenants") or {}).items():
+            for plantilla in plantillas:
+                try:
+                    self._plantillas.setdefault(tenant_id, []).append(PlantillaProveedor(plantilla))
+                except Exception as e:
+                    logger.error(f"Plantilla de cuerpo inválida para tenant '{tenant_id}' ({plantilla.get('proveedor')}): {e}")
+        logger.info(f"Plantillas de cuerpo cargadas de {self.ruta}: {sum(map(len, self._plantillas.values()))} para {len(self._plantillas)} inquilino(s).")
+
+    def plantilla(self, tenant_id: Optional[str], remitente: str) -> Optional[PlantillaProveedor]:
+        with self._lock:
+            self._recargar_si_cambio()
+            return next((p for p in self._plantillas.get(tenant_id, ()) if p.aplica(remitente)), None)
+
+
+configuracion_plantillas = ConfiguracionPlantillas(settings.EMAIL_BODY_TEMPLATES_FILE)
+
+
+def extraer_cuerpo_correo(texto: str, tenant_id: Optional[str] = None, remitente: str = "") -> Dict[str, Any]:
+    plantilla = configuracion_plantillas.plantilla(tenant_id, remitente or "")
+    if plantilla is None:
+        return extractor_por_defecto.extraer(texto)
+    datos = plantilla.extractor.extraer(texto)
+    if plantilla.proveedor:
+        datos.setdefault('nombre_proveedor', plantilla.proveedor)
+    datos.update(extractor_por_defecto.extraer(texto, excluir=tuple(datos)))
+    return datos
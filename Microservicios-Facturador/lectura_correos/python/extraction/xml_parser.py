@@ -17,23 +17,27 @@ NAMESPACES = {
     'xades141': 'http://uri.etsi.org/01903/v1.4.1#'
 }
 
+_CARACTERES_INVALIDOS = re.compile(r'[^\x09\x0A\x0D\x20-\x7E\x80-\xFF]+')
+_TAMANO_BLOQUE = 64 * 1024
+
+def _limpiar_xml(xml_string: str) -> str:
+    return _CARACTERES_INVALIDOS.sub(' ', xml_string)
+
 def clean_and_parse_xml_string(xml_string: str) -> Optional[ET.Element]:
     if not xml_string or not xml_string.strip():
         logger.warning("Se recibió cadena XML vacía o solo espacios.")
         return None
-    cleaned_xml_string = re.sub(r'[^\x09\x0A\x0D\x20-\x7E\x80-\xFF]+', ' ', xml_string)
+    cleaned_xml_string = _limpiar_xml(xml_string)
     try:
         return ET.fromstring(cleaned_xml_string)
     except ET.ParseError as e:
         logger.error(f"Error al parsear XML: {e}")
         return None
 
-def get_xml_text(element, path, namespaces):
-    node = element.find(path, namespaces)
+def _texto(node) -> Optional[str]:
     return node.text.strip() if node is not None and node.text else None
 
-def get_xml_float(element, path, namespaces):
-    text_value = get_xml_text(element, path, namespaces)
+def _a_float(text_value: Optional[str], path: str) -> Optional[float]:
     if text_value is None:
         return None
     try:
@@ -48,14 +52,210 @@ def get_xml_float(element, path, namespaces):
         logger.warning(f"No se pudo convertir '{text_value}' a float ({path})")
         return None
 
-def get_xml_date(element, path, namespaces):
-    text_value = get_xml_text(element, path, namespaces)
+def _a_fecha(text_value: Optional[str], path: str):
     try:
         return datetime.strptime(text_value, '%Y-%m-%d').date() if text_value else None
     except ValueError:
         logger.warning(f"Fecha inválida: '{text_value}' ({path})")
         return None
 
+def get_xml_text(element, path, namespaces):
+    return _texto(element.find(path, namespaces))
+
+def get_xml_float(element, path, namespaces):
+    return _a_float(get_xml_text(element, path, namespaces), path)
+
+def get_xml_date(element, path, namespaces):
+    return _a_fecha(get_xml_text(element, path, namespaces), path)
+
+def _qname(tag: str) -> str:
+    prefijo, nombre = tag.split(':')
+    return f"{{{NAMESPACES[prefijo]}}}{nombre}"
+
+_UBL_EXTENSIONS = _qname('ext:UBLExtensions')
+
+def _hijos_de_raiz(xml_string: str):
+    """
+    Recorre el documento una sola vez con un parser incremental y entrega cada hijo directo
+    de la raíz cuando termina de leerse. Después de entregarlo se desprende de la raíz, así
+    que la memoria no crece con el número de líneas. Los bloques de firma
+    (`ext:UBLExtensions`) se vacían a medida que se leen y nunca se entregan.
+    Lanza ET.ParseError si el XML no es válido.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    raiz = None
+    profundidad = 0
+    en_extensiones = False
+    for inicio in range(0, len(xml_string), _TAMANO_BLOQUE):
+        parser.feed(xml_string[inicio:inicio + _TAMANO_BLOQUE])
+        for evento, elem in parser.read_events():
+            if evento == 'start':
+                profundidad += 1
+                if raiz is None:
+                    raiz = elem
+                elif profundidad == 2 and elem.tag == _UBL_EXTENSIONS:
+                    en_extensiones = True
+                continue
+            profundidad -= 1
+            if profundidad == 1:
+                if en_extensiones:
+                    en_extensiones = False
+                else:
+                    yield raiz, elem
+                raiz.remove(elem)
+            elif en_extensiones:
+                elem.clear()
+    parser.close()
+
+# Mapa declarativo UBL -> campos de Factura. Cada entrada es un hijo directo de la raíz:
+#   etiqueta: (modo, ancla, [(campo, ruta relativa | (ruta, alternativa, ...), tipo)])
+# modo "primero": gana la primera aparición de cada campo; "suma": se suman todos los
+# valores; "lista": cada elemento produce un ítem. Si hay `ancla` (p. ej. cac:Party), los
+# campos solo se asignan cuando ese nodo existe y sus rutas son relativas a él.
+# Se compila una sola vez, al importar el módulo, a tuplas de etiquetas en notación Clark.
+MAPA_UBL = {
+    'cbc:UUID': ('primero', None, [('cufe', '.', 'texto')]),
+    'cbc:ID': ('primero', None, [('numero_factura', '.', 'texto')]),
+    'cbc:IssueDate': ('primero', None, [('fecha_emision', '.', 'fecha')]),
+    'cbc:IssueTime': ('primero', None, [('hora_emision', '.', 'texto')]),
+    'cbc:DocumentCurrencyCode': ('primero', None, [('moneda', '.', 'texto')]),
+    'cac:LegalMonetaryTotal': ('primero', None, [
+        ('monto_subtotal', 'cbc:LineExtensionAmount', 'float'),
+        ('monto_total', 'cbc:PayableAmount', 'float'),
+    ]),
+    'cac:PaymentMeans': ('primero', None, [
+        ('fecha_vencimiento', 'cbc:PaymentDueDate', 'fecha'),
+        ('metodo_pago', 'cbc:PaymentMeansCode', 'texto'),
+    ]),
+    'cac:AccountingSupplierParty': ('primero', 'cac:Party', [
+        ('nombre_proveedor', ('cac:PartyLegalEntity/cbc:RegistrationName', 'cac:PartyName/cbc:Name'), 'texto'),
+        ('nit_proveedor', 'cac:PartyTaxScheme/cbc:CompanyID', 'texto'),
+        ('email_proveedor', 'cac:Contact/cbc:ElectronicMail', 'texto'),
+    ]),
+    'cac:AccountingCustomerParty': ('primero', 'cac:Party', [
+        ('nombre_cliente', ('cac:PartyLegalEntity/cbc:RegistrationName', 'cac:PartyName/cbc:Name'), 'texto'),
+        ('nit_cliente', 'cac:PartyTaxScheme/cbc:CompanyID', 'texto'),
+        ('correo_cliente_asociado', 'cac:Contact/cbc:ElectronicMail', 'texto'),
+    ]),
+    # Solo los TaxTotal del documento: los de cada línea ya están incluidos en estos.
+    'cac:TaxTotal': ('suma', None, [('monto_impuesto', 'cbc:TaxAmount', 'float')]),
+    'cac:InvoiceLine': ('lista', None, [
+        ('cantidad', 'cbc:InvoicedQuantity', 'float'),
+        ('descripcion', 'cac:Item/cbc:Description', 'texto'),
+        ('valor_unitario', 'cac:Price/cbc:PriceAmount', 'float'),
+        ('valor_total', 'cbc:LineExtensionAmount', 'float'),
+    ]),
+}
+
+_CONVERSORES = {
+    'texto': lambda node, ruta: _texto(node),
+    'float': lambda node, ruta: _a_float(_texto(node), ruta),
+    'fecha': lambda node, ruta: _a_fecha(_texto(node), ruta),
+}
+
+def _compilar_ruta(ruta: str) -> tuple:
+    return () if ruta == '.' else tuple(_qname(paso) for paso in ruta.split('/'))
+
+def _compilar_mapa(mapa: dict) -> dict:
+    compilado = {}
+    for etiqueta, (modo, ancla, campos) in mapa.items():
+        campos_compilados = []
+        for campo, rutas, tipo in campos:
+            rutas = rutas if isinstance(rutas, tuple) else (rutas,)
+            campos_compilados.append((
+                campo,
+                tuple(_compilar_ruta(ruta) for ruta in rutas),
+                _CONVERSORES[tipo],
+                f"{etiqueta}/{rutas[0]}",
+            ))
+        compilado[_qname(etiqueta)] = (modo, _compilar_ruta(ancla) if ancla else None, campos_compilados)
+    return compilado
+
+_MAPA_COMPILADO = _compilar_mapa(MAPA_UBL)
+_CAMPOS_INICIALES = [
+    campo
+    for modo, ancla, campos in MAPA_UBL.values() if modo == 'primero' and ancla is None
+    for campo, _, _ in campos
+]
+_CAMPOS_SUMA = [campo for modo, _, campos in MAPA_UBL.values() if modo == 'suma' for campo, _, _ in campos]
+
+def _buscar(elem, ruta: tuple, pos: int = 0):
+    # Equivale a elem.find() con una ruta de hijos directos ya resuelta.
+    if pos == len(ruta):
+        return elem
+    etiqueta = ruta[pos]
+    for hijo in elem:
+        if hijo.tag == etiqueta:
+            encontrado = _buscar(hijo, ruta, pos + 1)
+            if encontrado is not None:
+                return encontrado
+    return None
+
+def _primera_ruta(elem, rutas: tuple):
+    if len(rutas) == 1:
+        return _buscar(elem, rutas[0])
+    # Con alternativas gana la primera ruta que tenga texto.
+    for ruta in rutas:
+        node = _buscar(elem, ruta)
+        if _texto(node):
+            return node
+    return None
+
+def _extraer_factura(xml_string: str) -> Dict[str, Any]:
+    data = dict.fromkeys(_CAMPOS_INICIALES)
+    asignados = set()
+    sumas = dict.fromkeys(_CAMPOS_SUMA, 0.0)
+    items = []
+    for _, elem in _hijos_de_raiz(xml_string):
+        seccion = _MAPA_COMPILADO.get(elem.tag)
+        if seccion is None:
+            continue
+        modo, ancla, campos = seccion
+        if ancla is not None:
+            elem = _buscar(elem, ancla)
+            if elem is None or not len(elem):
+                continue
+
+        if modo == 'lista':
+            items.append({
+                campo: convertir(_primera_ruta(elem, rutas), etiqueta)
+                for campo, rutas, convertir, etiqueta in campos
+            })
+        elif modo == 'suma':
+            for campo, rutas, convertir, etiqueta in campos:
+                val = convertir(_primera_ruta(elem, rutas), etiqueta)
+                if val:
+                    sumas[campo] += val
+        else:
+            for campo, rutas, convertir, etiqueta in campos:
+                if campo not in asignados:
+                    asignados.add(campo)
+                    data[campo] = convertir(_primera_ruta(elem, rutas), etiqueta)
+
+    for campo, total in sumas.items():
+        data[campo] = total if total > 0 else None
+    data['items'] = items
+    return data
+
+_ATTACHMENT = _qname('cac:Attachment')
+_MARCAS_FACTURA = ('<Invoice', '<FacturaElectronica', '<DianExtensions>')
+
+def _descripcion_adjunta(xml_string: str) -> Optional[str]:
+    # Se detiene en el primer `cac:Attachment` de la raíz (AttachedDocument de la DIAN).
+    for _, elem in _hijos_de_raiz(xml_string):
+        if elem.tag == _ATTACHMENT:
+            desc_node = elem.find('cac:ExternalReference/cbc:Description', NAMESPACES)
+            if desc_node is not None and desc_node.text:
+                return desc_node.text
+    return None
+
+def _con_limpieza(funcion, xml_string: str):
+    # Los caracteres inválidos solo se reemplazan si el documento original no parsea.
+    try:
+        return funcion(xml_string)
+    except ET.ParseError:
+        return funcion(_limpiar_xml(xml_string))
+
 def extract_nested_invoice_xml(zip_xml_content: bytes) -> Optional[str]:
     try:
         xml_string = zip_xml_content.decode('utf-8')
@@ -63,15 +263,15 @@ def extract_nested_invoice_xml(zip_xml_content: bytes) -> Optional[str]:
             logger.warning("Contenido XML decodificado está vacío.")
             return None
 
-        root = clean_and_parse_xml_string(xml_string)
-        if root is None:
+        try:
+            descripcion = _con_limpieza(_descripcion_adjunta, xml_string)
+        except ET.ParseError as e:
+            logger.error(f"Error al parsear XML: {e}")
             return None
-
-        desc_node = root.find('.//cac:Attachment/cac:ExternalReference/cbc:Description', NAMESPACES)
-        if desc_node is not None and desc_node.text:
-            return desc_node.text
+        if descripcion:
+            return descripcion
         
-        if any(tag in xml_string for tag in ['<Invoice', '<FacturaElectronica', '<DianExtensions>']):
+        if any(tag in xml_string for tag in _MARCAS_FACTURA):
             return xml_string
     except Exception as e:
         logger.error(f"Error al extraer XML anidado: {e}", exc_info=True)
@@ -82,56 +282,15 @@ def parse_invoice_xml(xml_content: str) -> Optional[Dict[str, Any]]:
         logger.warning("Contenido XML vacío, no se procesará.")
         return None
 
-    root = clean_and_parse_xml_string(xml_content)
-    if root is None:
+    try:
+        data = _con_limpieza(_extraer_factura, xml_content)
+    except ET.ParseError as e:
+        logger.error(f"Error al parsear XML: {e}")
         logger.error("No se pudo obtener la raíz XML, contenido inválido.")
         return None
-
-    try:
-        data = {
-            'cufe': get_xml_text(root, './/cbc:UUID', NAMESPACES),
-            'numero_factura': get_xml_text(root, './/cbc:ID', NAMESPACES),
-            'fecha_emision': get_xml_date(root, './/cbc:IssueDate', NAMESPACES),
-            'hora_emision': get_xml_text(root, './/cbc:IssueTime', NAMESPACES),
-            'moneda': get_xml_text(root, './/cbc:DocumentCurrencyCode', NAMESPACES),
-            'monto_subtotal': get_xml_float(root, './/cac:LegalMonetaryTotal/cbc:LineExtensionAmount', NAMESPACES),
-            'monto_total': get_xml_float(root, './/cac:LegalMonetaryTotal/cbc:PayableAmount', NAMESPACES),
-            'fecha_vencimiento': get_xml_date(root, './/cac:PaymentMeans/cbc:PaymentDueDate', NAMESPACES),
-            'metodo_pago': get_xml_text(root, './/cac:PaymentMeans/cbc:PaymentMeansCode', NAMESPACES),
-        }
-
-        supplier = root.find('.//cac:AccountingSupplierParty/cac:Party', NAMESPACES)
-        if supplier:
-            data['nombre_proveedor'] = get_xml_text(supplier, './/cac:PartyLegalEntity/cbc:RegistrationName', NAMESPACES) or \
-                                       get_xml_text(supplier, './/cac:PartyName/cbc:Name', NAMESPACES)
-            data['nit_proveedor'] = get_xml_text(supplier, './/cac:PartyTaxScheme/cbc:CompanyID', NAMESPACES)
-            data['email_proveedor'] = get_xml_text(supplier, './/cac:Contact/cbc:ElectronicMail', NAMESPACES)
-
-        customer = root.find('.//cac:AccountingCustomerParty/cac:Party', NAMESPACES)
-        if customer:
-            data['nombre_cliente'] = get_xml_text(customer, './/cac:PartyLegalEntity/cbc:RegistrationName', NAMESPACES) or \
-                                     get_xml_text(customer, './/cac:PartyName/cbc:Name', NAMESPACES)
-            data['nit_cliente'] = get_xml_text(customer, './/cac:PartyTaxScheme/cbc:CompanyID', NAMESPACES)
-            data['correo_cliente_asociado'] = get_xml_text(customer, './/cac:Contact/cbc:ElectronicMail', NAMESPACES)
-
-        total_tax = 0.0
-        for node in root.findall('.//cac:TaxTotal', NAMESPACES):
-            val = get_xml_float(node, './/cbc:TaxAmount', NAMESPACES)
-            if val:
-                total_tax += val
-        data['monto_impuesto'] = total_tax if total_tax > 0 else None
-
-        data['items'] = []
-        for line in root.findall('.//cac:InvoiceLine', NAMESPACES):
-            data['items'].append({
-                'cantidad': get_xml_float(line, './/cbc:InvoicedQuantity', NAMESPACES),
-                'descripcion': get_xml_text(line, './/cac:Item/cbc:Description', NAMESPACES),
-                'valor_unitario': get_xml_float(line, './/cac:Price/cbc:PriceAmount', NAMESPACES),
-                'valor_total': get_xml_float(line, './/cbc:LineExtensionAmount', NAMESPACES),
-            })
-
-        data['texto_crudo_xml'] = xml_content
-        return data
     except Exception as e:
         logger.error(f"Error al parsear XML: {e}", exc_info=True)
         return None
+
+    data['texto_crudo_xml'] = xml_content
+    return data
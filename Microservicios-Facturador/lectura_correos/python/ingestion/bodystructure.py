@@ -0,0 +1,236 @@
+import re
+import base64
+import quopri
+import logging
+from email.header import decode_header, make_header
+from urllib.parse import unquote
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Utilidades para leer respuestas crudas de `UID FETCH` (imaplib) sin descargar el mensaje
+# completo: se parsea BODYSTRUCTURE para saber qué partes existen y luego se piden solo
+# las secciones necesarias (texto y adjuntos) con BODY.PEEK[<sección>].
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\}$')
+
+
+class _Literal(bytes):
+    pass
+
+
+class _Atomo(str):
+    pass
+
+
+def _tokenizar_texto(texto: bytes, tokens: list):
+    i, n = 0, len(texto)
+    while i < n:
+        c = texto[i:i + 1]
+        if c == b' ':
+            i += 1
+        elif c in (b'(', b')'):
+            tokens.append(c.decode())
+            i += 1
+        elif c == b'"':
+            i += 1
+            valor = bytearray()
+            while i < n and texto[i:i + 1] != b'"':
+                if texto[i:i + 1] == b'\\' and i + 1 < n:
+                    i += 1
+                valor += texto[i:i + 1]
+                i += 1
+            i += 1
+            tokens.append(bytes(valor))
+        else:
+            inicio = i
+            profundidad = 0
+            while i < n:
+                c = texto[i:i + 1]
+                if c == b'[':
+                    profundidad += 1
+                elif c == b']':
+                    profundidad -= 1
+                elif profundidad == 0 and c in (b' ', b'(', b')'):
+                    break
+                i += 1
+            atomo = texto[inicio:i].decode('ascii', errors='replace')
+            tokens.append(None if atomo.upper() == 'NIL' else _Atomo(atomo))
+
+
+def _tokenizar(data: list) -> list:
+    tokens = []
+    for item in data:
+        if isinstance(item, tuple):
+            cabecera, literal = item[0], item[1]
+            match = _LITERAL_RE.search(cabecera)
+            _tokenizar_texto(cabecera[:match.start()] if match else cabecera, tokens)
+            tokens.append(_Literal(literal))
+        elif isinstance(item, (bytes, bytearray)):
+            _tokenizar_texto(bytes(item), tokens)
+    return tokens
+
+
+def _es_delimitador(token, delimitador: str) -> bool:
+    return type(token) is str and token == delimitador
+
+
+def _construir(tokens: list, pos: int):
+    token = tokens[pos]
+    if _es_delimitador(token, '('):
+        lista = []
+        pos += 1
+        while pos < len(tokens) and not _es_delimitador(tokens[pos], ')'):
+            valor, pos = _construir(tokens, pos)
+            lista.append(valor)
+        return lista, pos + 1
+    return token, pos + 1
+
+
+def parsear_respuesta_fetch(data: list) -> Dict[int, Dict[str, Any]]:
+    """Convierte la respuesta de `client.uid('FETCH', ...)` en {uid: {ITEM: valor}}."""
+    tokens = _tokenizar(data)
+    resultado = {}
+    pos = 0
+    while pos < len(tokens):
+        if not isinstance(tokens[pos], _Atomo) or not tokens[pos].isdigit():
+            pos += 1
+            continue
+        if pos + 1 >= len(tokens) or not _es_delimitador(tokens[pos + 1], '('):
+            pos += 1
+            continue
+        lista, pos = _construir(tokens, pos + 1)
+        items = {}
+        for i in range(0, len(lista) - 1, 2):
+            clave = lista[i]
+            if isinstance(clave, str):
+                items[clave.upper().replace('.PEEK', '')] = lista[i + 1]
+        if 'UID' in items:
+            try:
+                resultado[int(items['UID'])] = items
+            except (TypeError, ValueError):
+                continue
+    return resultado
+
+
+def _texto(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    if isinstance(valor, bytes):
+        return valor.decode('utf-8', errors='replace')
+    return str(valor)
+
+
+def _parametros(lista) -> Dict[str, str]:
+    params = {}
+    if isinstance(lista, list):
+        for i in range(0, len(lista) - 1, 2):
+            clave = _texto(lista[i])
+            if clave:
+                params[clave.lower()] = _texto(lista[i + 1]) or ''
+    return params
+
+
+def _decodificar_rfc2231(valor: str) -> str:
+    # charset'idioma'texto%20codificado
+    partes = valor.split("'", 2)
+    if len(partes) != 3:
+        return unquote(valor)
+    charset = partes[0] or 'utf-8'
+    try:
+        return unquote(partes[2], encoding=charset, errors='replace')
+    except LookupError:
+        return unquote(partes[2], errors='replace')
+
+
+def _nombre_archivo(params: Dict[str, str]) -> Optional[str]:
+    for base in ('filename', 'name'):
+        if params.get(base):
+            valor = params[base]
+            if '=?' in valor:
+                try:
+                    valor = str(make_header(decode_header(valor)))
+                except Exception:
+                    pass
+            return valor
+        if params.get(f'{base}*'):
+            return _decodificar_rfc2231(params[f'{base}*'])
+        continuaciones = sorted(
+            (k for k in params if re.fullmatch(rf'{base}\*\d+\*?', k)),
+            key=lambda k: int(re.search(r'\d+', k).group())
+        )
+        if continuaciones:
+            valor = ''.join(params[k] for k in continuaciones)
+            return _decodificar_rfc2231(valor) if continuaciones[0].endswith('*') else valor
+    return None
+
+
+def listar_partes(estructura, seccion: str = '') -> List[Dict[str, Any]]:
+    """Aplana un BODYSTRUCTURE en una lista de partes hoja con su número de sección."""
+    if not isinstance(estructura, list) or not estructura:
+        return []
+
+    if isinstance(estructura[0], list):
+        partes = []
+        numero = 0
+        for elemento in estructura:
+            if not isinstance(elemento, list):
+                break
+            numero += 1
+            sub = f"{seccion}.{numero}" if seccion else str(numero)
+            partes.extend(listar_partes(elemento, sub))
+        return partes
+
+    tipo = (_texto(estructura[0]) or '').lower()
+    subtipo = (_texto(estructura[1]) or '').lower() if len(estructura) > 1 else ''
+    params = _parametros(estructura[2]) if len(estructura) > 2 else {}
+    codificacion = (_texto(estructura[5]) or '7bit').lower() if len(estructura) > 5 else '7bit'
+    try:
+        tamano = int(estructura[6]) if len(estructura) > 6 and estructura[6] is not None else 0
+    except (TypeError, ValueError):
+        tamano = 0
+
+    # Posición de la disposición según el tipo (RFC 3501, 7.4.2)
+    if tipo == 'text':
+        idx_disposicion = 9
+    elif tipo == 'message' and subtipo == 'rfc822':
+        idx_disposicion = 11
+    else:
+        idx_disposicion = 8
+
+    disposicion, params_disposicion = None, {}
+    if len(estructura) > idx_disposicion and isinstance(estructura[idx_disposicion], list) and estructura[idx_disposicion]:
+        disposicion = (_texto(estructura[idx_disposicion][0]) or '').lower()
+        if len(estructura[idx_disposicion]) > 1:
+            params_disposicion = _parametros(estructura[idx_disposicion][1])
+
+    return [{
+        'seccion': seccion or '1',
+        'tipo': f"{tipo}/{subtipo}",
+        'charset': params.get('charset') or 'utf-8',
+        'codificacion': codificacion,
+        'tamano': tamano,
+        'disposicion': disposicion,
+        'nombre': _nombre_archivo(params_disposicion) or _nombre_archivo(params),
+    }]
+
+
+def decodificar_parte(contenido: bytes, codificacion: str) -> bytes:
+    codificacion = (codificacion or '').lower()
+    if codificacion == 'base64':
+        try:
+            return base64.b64decode(contenido, validate=False)
+        except Exception as e:
+            logger.warning(f"No se pudo decodificar parte base64: {e}")
+            return b''
+    if codificacion == 'quoted-printable':
+        return quopri.decodestring(contenido)
+    return contenido
+
+
+def decodificar_texto(contenido: bytes, codificacion: str, charset: str) -> str:
+    datos = decodificar_parte(contenido, codificacion)
+    try:
+        return datos.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return datos.decode('utf-8', errors='replace')
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from config.settings import settings
+from ingestion.spool import limpiar_spool
+
+logger = logging.getLogger(__name__)
+
+# Cola persistente entre la lectura de buzones y el procesamiento de adjuntos. Cada adjunto
+# es una fila que apunta a su archivo en el spool; un trabajador la reserva por un tiempo
+# limitado (lease) y la borra solo cuando la factura quedó guardada. Si el proceso se cae a
+# mitad, la reserva vence (o se libera al arrancar) y el adjunto se vuelve a entregar.
+COLA_DB_PATH = os.path.join(settings.TMP_DIR, "cola_trabajo.sqlite3")
+
+PENDIENTE = 'pendiente'
+EN_PROCESO = 'en_proceso'
+FALLIDO = 'fallido'
+
+_ESPERA_MAXIMA_SEGUNDOS = 1.0
+_REINTENTO_BASE_SEGUNDOS = 30
+_REINTENTO_MAXIMO_SEGUNDOS = 3600
+
+_COLUMNAS_RESERVA = "id, tenant_id, filename, sha256, ruta, tamano, cuerpo_sha256, cuerpo_ruta, metadatos, intentos"
+# UPDATE ... RETURNING necesita SQLite >= 3.35; con una versión anterior se eligen los ids y se
+# reservan dentro de la misma transacción BEGIN IMMEDIATE.
+_CON_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class ColaTrabajo:
+    def __init__(self, ruta: str = COLA_DB_PATH):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        # FULL: una vez encolado, el UID del correo se marca como procesado en el buzón.
+        self._conexion.execute("PRAGMA synchronous=FULL")
+        self._conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tenant_id TEXT NOT NULL,
+                correo_cliente TEXT,
+                uid TEXT,
+                filename TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                ruta TEXT NOT NULL,
+                tamano INTEGER NOT NULL,
+                cuerpo_sha256 TEXT,
+                cuerpo_ruta TEXT,
+                metadatos TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                disponible_en REAL NOT NULL,
+                reserva TEXT,
+                ultimo_error TEXT,
+                creado_en REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, disponible_en, id);
+        """)
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Condition(self._lock)
+
+    def _transaccion(self, sentencias):
+        self._conexion.execute("BEGIN IMMEDIATE")
+        try:
+            resultado = sentencias(self._conexion)
+            self._conexion.execute("COMMIT")
+            return resultado
+        except Exception:
+            self._conexion.execute("ROLLBACK")
+            raise
+
+    def encolar_correo(self, correo: Dict[str, Any]) -> int:
+        """Registra todos los adjuntos (ya en el spool) de un correo en una sola transacción."""
+        metadatos = json.dumps({
+            "asunto_correo": correo.get("subject"),
+            "remitente_correo": correo.get("from", "desconocido"),
+            "correo_cliente_asociado": correo.get("correo_cliente"),
+            "uid": correo.get("uid"),
+            "tenant_id": correo.get("tenant_id"),
+        }, ensure_ascii=False)
+        cuerpo = correo.get("body") or {}
+        ahora = time.time()
+        filas = [
+            (correo.get("tenant_id"), correo.get("correo_cliente"), str(correo.get("uid")),
+             adjunto["filename"], adjunto["sha256"], adjunto["ruta"], adjunto["tamano"],
+             cuerpo.get("sha256"), cuerpo.get("ruta"), metadatos, PENDIENTE, ahora, ahora)
+            for adjunto in correo.get("adjuntos", [])
+        ]
+        if not filas:
+            return 0
+        with self._hay_trabajo:
+            self._transaccion(lambda c: c.executemany(
+                "INSERT INTO trabajos (tenant_id, correo_cliente, uid, filename, sha256, ruta, tamano, cuerpo_sha256, cuerpo_ruta, "
+                "metadatos, estado, disponible_en, creado_en) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", filas
+            ))
+            self._hay_trabajo.notify(len(filas))
+        return len(filas)
+
+    def _reservar_disponibles(self, maximo: int) -> List[Dict[str, Any]]:
+        ahora = time.time()
+        reserva = uuid.uuid4().hex
+        # También se recuperan reservas vencidas de trabajadores colgados.
+        disponibles = "SELECT id FROM trabajos WHERE estado IN (?, ?) AND disponible_en <= ? AND intentos < ? ORDER BY id LIMIT ?"
+        parametros = (PENDIENTE, EN_PROCESO, ahora, settings.QUEUE_MAX_ATTEMPTS, maximo)
+        actualizar = "UPDATE trabajos SET estado = ?, reserva = ?, disponible_en = ?, intentos = intentos + 1 WHERE id IN "
+        parametros_reserva = (EN_PROCESO, reserva, ahora + settings.QUEUE_LEASE_SECONDS)
+        if _CON_RETURNING:
+            filas = self._conexion.execute(
+                f"{actualizar}({disponibles}) RETURNING {_COLUMNAS_RESERVA}", parametros_reserva + parametros
+            ).fetchall()
+        else:
+            def reservar(conexion):
+                ids = [fila[0] for fila in conexion.execute(disponibles, parametros)]
+                if not ids:
+                    return []
+                conexion.execute(f"{actualizar}({', '.join('?' * len(ids))})", parametros_reserva + tuple(ids))
+                return conexion.execute(f"SELECT {_COLUMNAS_RESERVA} FROM trabajos WHERE reserva = ?", (reserva,)).fetchall()
+            filas = self._transaccion(reservar)
+        trabajos = []
+        for fila in sorted(filas):
+            metadatos = json.loads(fila[8])
+            metadatos["body"] = {"sha256": fila[6], "ruta": fila[7]} if fila[7] else None
+            trabajos.append({
+                "id": fila[0],
+                "tenant_id": fila[1],
+                "filename": fila[2],
+                "adjunto": {"sha256": fila[3], "ruta": fila[4], "tamano": fila[5]},
+                "metadatos": metadatos,
+                "intentos": fila[9],
+                "reserva": reserva,
+            })
+        return trabajos
+
+    def reservar_lote(self, maximo: int, timeout: float) -> List[Dict[str, Any]]:
+        """Entrega hasta `maximo` adjuntos disponibles, en orden de llegada; lista vacía si no hubo trabajo en `timeout` segundos."""
+        fin = time.monotonic() + timeout
+        with self._hay_trabajo:
+            while True:
+                trabajos = self._reservar_disponibles(maximo)
+                if trabajos:
+                    return trabajos
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    return []
+                # Se despierta periódicamente para tomar reintentos programados y reservas vencidas.
+                self._hay_trabajo.wait(min(restante, _ESPERA_MAXIMA_SEGUNDOS))
+
+    def reservar(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Entrega el siguiente adjunto disponible o None si no hubo trabajo en `timeout` segundos."""
+        trabajos = self.reservar_lote(1, timeout)
+        return trabajos[0] if trabajos else None
+
+    def confirmar(self, trabajo: Dict[str, Any]):
+        with self._lock:
+            borradas = self._conexion.execute(
+                "DELETE FROM trabajos WHERE id = ? AND reserva = ?", (trabajo["id"], trabajo["reserva"])
+            ).rowcount
+        if not borradas:
+            logger.warning(f"La reserva del trabajo {trabajo['id']} ('{trabajo['filename']}') venció antes de confirmarse.")
+
+    def fallar(self, trabajo: Dict[str, Any], error: str):
+        # Reintento con espera exponencial; al agotar los intentos queda como fallido para revisión.
+        agotado = trabajo["intentos"] >= settings.QUEUE_MAX_ATTEMPTS
+        espera = min(_REINTENTO_BASE_SEGUNDOS * 2 ** (trabajo["intentos"] - 1), _REINTENTO_MAXIMO_SEGUNDOS)
+        with self._lock:
+            self._conexion.execute(
+                "UPDATE trabajos SET estado = ?, reserva = NULL, disponible_en = ?, ultimo_error = ? "
+                "WHERE id = ? AND reserva = ?",
+                (FALLIDO if agotado else PENDIENTE, time.time() + espera, error[:2000], trabajo["id"], trabajo["reserva"])
+            )
+        if agotado:
+            logger.error(f"Trabajo {trabajo['id']} ('{trabajo['filename']}') marcado como fallido tras {trabajo['intentos']} intento(s).")
+
+    def recuperar_reservas(self) -> int:
+        """Al arrancar, ninguna reserva tiene dueño: se devuelven a la cola (o a fallidos si ya agotaron intentos)."""
+        with self._lock:
+            def liberar(conexion):
+                conexion.execute(
+                    "UPDATE trabajos SET estado = ?, reserva = NULL WHERE estado = ? AND intentos >= ?",
+                    (FALLIDO, EN_PROCESO, settings.QUEUE_MAX_ATTEMPTS)
+                )
+                return conexion.execute(
+                    "UPDATE trabajos SET estado = ?, reserva = NULL, disponible_en = ? WHERE estado = ?",
+                    (PENDIENTE, time.time(), EN_PROCESO)
+                ).rowcount
+            recuperados = self._transaccion(liberar)
+        if recuperados:
+            logger.warning(f"{recuperados} adjunto(s) en proceso durante la última parada vuelven a la cola.")
+        return recuperados
+
+    def limpiar_spool(self) -> int:
+        # Los fallidos conservan sus archivos para poder revisarlos o reencolarlos.
+        with self._lock:
+            referenciados = {
+                fila[0] for fila in self._conexion.execute(
+                    "SELECT sha256 FROM trabajos UNION SELECT cuerpo_sha256 FROM trabajos WHERE cuerpo_sha256 IS NOT NULL"
+                )
+            }
+        return limpiar_spool(referenciados)
+
+    def contar(self) -> Dict[str, int]:
+        with self._lock:
+            filas = self._conexion.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall()
+        return {estado: total for estado, total in filas}
@@ -1,76 +1,284 @@
 import os
-from imap_tools import MailBox
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from imap_tools import MailBox, MailBoxUnencrypted, MailMessageFlags
 import logging
-from database.models import SessionLocal, Usuario
+from typing import Dict
+from email.parser import BytesHeaderParser
+from email.policy import default as default_policy
+from email.utils import parseaddr
+from database.credenciales import cache_credenciales
 from config.settings import settings
-from ingestion.utils import cargar_uids_procesados, guardar_uid
+from ingestion.utils import guardar_uid, guardar_uids, filtrar_uids_no_procesados, cargar_estado_buzon, guardar_estado_buzon, UIDVALIDITY_DESCONOCIDO
+from ingestion.bodystructure import parsear_respuesta_fetch, listar_partes, decodificar_parte, decodificar_texto
+from ingestion.spool import guardar_en_spool, guardar_texto_en_spool
+from ingestion import keyword_matcher
 
 logger = logging.getLogger(__name__)
 
-def contiene_factura(texto):
-    texto = texto.lower()
-    palabras_clave = [
-        "factura", "invoice", "comprobante", "recibo", "cuenta",
-        "estado de cuenta", "billing", "cxc", "facturación",
-        "orden de compra", "remisión", "nota crédito", "nota débito"
-    ]
-    return any(palabra in texto for palabra in palabras_clave)
+def contiene_factura(texto, tenant_id=None):
+    # Palabras clave por inquilino (INVOICE_KEYWORDS_FILE), sin distinguir mayúsculas ni tildes.
+    return keyword_matcher.contiene_factura(texto, tenant_id)
 
 def obtener_usuarios_db():
-    usuarios_list = []
+    # Las contraseñas descifradas vienen de la caché de credenciales: sin cambios en `usuarios`
+    # no se descifra nada ni se recorre la tabla.
     try:
-        with SessionLocal() as session:
-            for user in session.query(Usuario).all():
-                try:
-                    decrypted_password = settings.CIPHER_SUITE.decrypt(user.email_account_password_encrypted.encode()).decode()
-                    usuarios_list.append({
-                        "correo": user.correo,
-                        "password": decrypted_password,
-                        "tenant_id": user.tenant_id 
-                    })
-                except Exception as e:
-                    logger.error(f"Error desencriptando contraseña de {user.correo}: {e}", exc_info=True)
+        return cache_credenciales.obtener()
     except Exception as e:
         logger.error(f"Error al consultar usuarios: {e}", exc_info=True)
-    return usuarios_list
+    return []
 
-def obtener_correos_con_facturas():
-    correos = []
+EXTENSIONES_FACTURA = ('.pdf', '.zip', '.xml')
+TAMANO_LOTE_UIDS = 100
+# Tope (tamaño codificado según BODYSTRUCTURE) de adjuntos pedidos en un mismo FETCH.
+MAX_BYTES_POR_FETCH = 8 * 1024 * 1024
+_CABECERAS = 'BODY.PEEK[HEADER.FIELDS (FROM SUBJECT)]'
+
+def _uid_fetch(mailbox, uids, items):
+    typ, data = mailbox.client.uid('FETCH', ','.join(str(uid) for uid in uids), items)
+    if typ != 'OK':
+        raise RuntimeError(f"UID FETCH falló ({typ}): {data}")
+    return parsear_respuesta_fetch(data)
+
+def _seccion(items, prefijo):
+    # Los servidores pueden devolver la sección con otro formato (comillas, origen <0>...).
+    for clave, valor in items.items():
+        if clave.startswith(prefijo):
+            return valor
+    return None
+
+def _uids_nuevos(mailbox, email):
+    estado_servidor = mailbox.folder.status('INBOX', ['UIDVALIDITY', 'UIDNEXT'])
+    uidvalidity = estado_servidor.get('UIDVALIDITY')
+    estado = cargar_estado_buzon(email)
+
+    if estado.get('uidvalidity') == uidvalidity and estado.get('ultimo_uid'):
+        ultimo_uid = int(estado['ultimo_uid'])
+        uidnext = estado_servidor.get('UIDNEXT')
+        if uidnext and uidnext <= ultimo_uid + 1:
+            return uidvalidity, ultimo_uid, []
+        # `UID n:*` siempre incluye el último mensaje aunque su UID sea menor que n.
+        uids = sorted(uid for uid in map(int, mailbox.uids(f'UID {ultimo_uid + 1}:*')) if uid > ultimo_uid)
+    else:
+        if estado:
+            logger.warning(f"UIDVALIDITY de {email} cambió ({estado.get('uidvalidity')} -> {uidvalidity}). Se reinicia la lectura incremental.")
+        ultimo_uid = 0
+        uids = sorted(map(int, mailbox.uids('ALL')))[-settings.EMAIL_FETCH_LIMIT:]
+
+    return uidvalidity, ultimo_uid, uids[:settings.EMAIL_FETCH_LIMIT]
+
+def _descargar_secciones(mailbox, uid, partes):
+    if not partes:
+        return {}
+    items = ' '.join(f"BODY.PEEK[{parte['seccion']}]" for parte in partes)
+    return _uid_fetch(mailbox, [uid], f'(UID {items})').get(uid, {})
+
+def _agrupar_por_tamano(partes):
+    grupos, actual, acumulado = [], [], 0
+    for parte in partes:
+        if actual and acumulado + parte['tamano'] > MAX_BYTES_POR_FETCH:
+            grupos.append(actual)
+            actual, acumulado = [], 0
+        actual.append(parte)
+        acumulado += parte['tamano']
+    if actual:
+        grupos.append(actual)
+    return grupos
+
+def _guardar_partes(respuesta, partes):
+    return [
+        {"filename": p['nombre'], **guardar_en_spool(decodificar_parte(_seccion(respuesta, f"BODY[{p['seccion']}]") or b'', p['codificacion']))}
+        for p in partes
+    ]
+
+def _procesar_mensaje(mailbox, uid, items, usuario):
+    partes = listar_partes(items.get('BODYSTRUCTURE'))
+    adjuntos = [p for p in partes if p['nombre'] and p['nombre'].lower().endswith(EXTENSIONES_FACTURA)]
+    if not adjuntos:
+        return None
+
+    cabecera = BytesHeaderParser(policy=default_policy).parsebytes(_seccion(items, 'BODY[HEADER') or b'')
+    asunto = str(cabecera.get('Subject') or '')
+    remitente = parseaddr(str(cabecera.get('From') or ''))[1]
+
+    textos = [p for p in partes if p['tipo'] == 'text/plain' and p['disposicion'] != 'attachment' and not p['nombre']]
+    if not textos:
+        textos = [p for p in partes if p['tipo'] == 'text/html' and p['disposicion'] != 'attachment' and not p['nombre']]
+
+    # Los adjuntos se piden en grupos acotados por tamaño y cada grupo se escribe al spool
+    # antes de pedir el siguiente. Si el asunto ya pasa el filtro, el texto viaja junto
+    # con el primer grupo en una sola ida y vuelta.
+    asunto_coincide = contiene_factura(asunto, usuario["tenant_id"])
+    grupos = _agrupar_por_tamano(adjuntos)
+    primer_grupo = grupos.pop(0) if asunto_coincide else []
+    respuesta = _descargar_secciones(mailbox, uid, textos + primer_grupo)
+    cuerpo = ''.join(
+        decodificar_texto(_seccion(respuesta, f"BODY[{p['seccion']}]") or b'', p['codificacion'], p['charset'])
+        for p in textos
+    )
+
+    if not asunto_coincide and not contiene_factura(cuerpo, usuario["tenant_id"]):
+        return None
+
+    adjuntos_spool = _guardar_partes(respuesta, primer_grupo)
+    del respuesta
+    for grupo in grupos:
+        adjuntos_spool.extend(_guardar_partes(_descargar_secciones(mailbox, uid, grupo), grupo))
+
+    return {
+        "from": remitente,
+        "subject": asunto,
+        "uid": str(uid),
+        "adjuntos": adjuntos_spool,
+        "correo_cliente": usuario["correo"],
+        "body": guardar_texto_en_spool(cuerpo),
+        "tenant_id": usuario["tenant_id"]
+    }
+
+def _marcar_vistos(mailbox, uids, email):
+    # Las partes se piden con BODY.PEEK, que no marca el mensaje como leído (la lectura con
+    # fetch() de antes sí lo hacía). Qué correos ya se procesaron no depende del flag \Seen sino
+    # del registro de UIDs (ingestion/utils.py); EMAIL_MARK_SEEN solo mantiene el aviso visible
+    # en el buzón para los correos con facturas ya encolados.
+    if not uids or not settings.EMAIL_MARK_SEEN:
+        return
+    try:
+        mailbox.flag([str(uid) for uid in uids], MailMessageFlags.SEEN, True)
+    except Exception as e:
+        logger.warning(f"No se pudieron marcar como leídos {len(uids)} correo(s) de {email}: {e}")
+
+def _leer_buzon_incremental(mailbox, usuario, limite, entregar):
+    # Solo se piden los UIDs posteriores al último visto; de cada mensaje se baja primero
+    # BODYSTRUCTURE y cabeceras, y las partes (texto/adjuntos) únicamente si hacen falta.
+    email = usuario["correo"]
+    uidvalidity, ultimo_uid, uids = _uids_nuevos(mailbox, email)
+    if not uids:
+        return 0
+
+    entregados = 0
+    agotado = False
+    for inicio in range(0, len(uids), TAMANO_LOTE_UIDS):
+        lote = uids[inicio:inicio + TAMANO_LOTE_UIDS]
+        pendientes = set(filtrar_uids_no_procesados(email, uidvalidity, lote))
+        estructuras = _uid_fetch(mailbox, sorted(pendientes), f'(UID BODYSTRUCTURE {_CABECERAS})') if pendientes else {}
+        nuevos = []
+        try:
+            for uid in lote:
+                if time.monotonic() > limite:
+                    agotado = True
+                    break
+                items = estructuras.get(uid)
+                if items:
+                    correo = _procesar_mensaje(mailbox, uid, items, usuario)
+                    if correo:
+                        entregar(correo)
+                        entregados += 1
+                        nuevos.append(uid)
+                ultimo_uid = uid
+        finally:
+            # Solo se marcan los UIDs ya entregados; si algo falla, el resto se relee.
+            guardar_uids(nuevos, email, uidvalidity)
+            _marcar_vistos(mailbox, nuevos, email)
+        if agotado:
+            logger.warning(f"Tiempo agotado leyendo el buzón {email} ({settings.EMAIL_MAILBOX_TIMEOUT_SECONDS}s). Se continuará desde el UID {ultimo_uid + 1} en el próximo ciclo.")
+            break
+
+    guardar_estado_buzon(email, uidvalidity, ultimo_uid)
+    return entregados
+
+def _leer_buzon_recientes(mailbox, usuario, limite, entregar):
+    # Los últimos EMAIL_FETCH_LIMIT mensajes, del más nuevo al más viejo. Como en la lectura
+    # incremental, se baja primero BODYSTRUCTURE y cabeceras y las partes solo si hacen falta.
+    email = usuario["correo"]
+    uids = sorted(map(int, mailbox.uids('ALL')))[-settings.EMAIL_FETCH_LIMIT:][::-1]
+    pendientes = filtrar_uids_no_procesados(email, UIDVALIDITY_DESCONOCIDO, uids)
+    entregados = 0
+    for inicio in range(0, len(pendientes), TAMANO_LOTE_UIDS):
+        lote = pendientes[inicio:inicio + TAMANO_LOTE_UIDS]
+        estructuras = _uid_fetch(mailbox, lote, f'(UID BODYSTRUCTURE {_CABECERAS})')
+        for uid in lote:
+            if time.monotonic() > limite:
+                logger.warning(f"Tiempo agotado leyendo el buzón {email} ({settings.EMAIL_MAILBOX_TIMEOUT_SECONDS}s). Se continuará en el próximo ciclo.")
+                return entregados
+            items = estructuras.get(uid)
+            correo = _procesar_mensaje(mailbox, uid, items, usuario) if items else None
+            if correo:
+                entregar(correo)
+                entregados += 1
+                guardar_uid(str(uid), email)
+                _marcar_vistos(mailbox, [uid], email)
+    return entregados
+
+def abrir_buzon(usuario):
+    # EMAIL_IMAP_SSL=false permite apuntar a un servidor IMAP local sin TLS (pruebas).
+    if settings.EMAIL_IMAP_SSL:
+        mailbox = MailBox(settings.EMAIL_IMAP_SERVER, port=settings.EMAIL_IMAP_PORT, timeout=settings.EMAIL_IMAP_TIMEOUT_SECONDS)
+    else:
+        mailbox = MailBoxUnencrypted(settings.EMAIL_IMAP_SERVER, port=settings.EMAIL_IMAP_PORT, timeout=settings.EMAIL_IMAP_TIMEOUT_SECONDS)
+    return mailbox.login(usuario["correo"], usuario["password"], 'INBOX')
+
+def leer_buzon_abierto(mailbox, usuario, entregar):
+    # Cada lectura tiene un presupuesto de tiempo propio: si se agota, se corta y los mensajes
+    # restantes se recogen en la siguiente. Cada correo con facturas se pasa a `entregar`
+    # antes de marcar su UID como procesado; devuelve cuántos hubo.
+    limite = time.monotonic() + settings.EMAIL_MAILBOX_TIMEOUT_SECONDS
+    if settings.EMAIL_FETCH_MODE == "incremental":
+        return _leer_buzon_incremental(mailbox, usuario, limite, entregar)
+    return _leer_buzon_recientes(mailbox, usuario, limite, entregar)
+
+def leer_buzon(usuario, entregar):
+    with abrir_buzon(usuario) as mailbox:
+        return leer_buzon_abierto(mailbox, usuario, entregar)
+
+def usuarios_con_credenciales():
+    usuarios = []
     for usuario in obtener_usuarios_db():
-        email, password, tenant_id = usuario.get("correo"), usuario.get("password"), usuario.get("tenant_id") 
-        if not email or not password or not tenant_id: 
+        email, password, tenant_id = usuario.get("correo"), usuario.get("password"), usuario.get("tenant_id")
+        if not email or not password or not tenant_id:
             logger.warning(f"Usuario {email} no tiene correo, contraseña o tenant_id configurado. Saltando.")
             continue
+        usuarios.append(usuario)
+    return usuarios
 
-        uids_procesados = cargar_uids_procesados(email)
-        try:
-            with MailBox(settings.EMAIL_IMAP_SERVER).login(email, password, 'INBOX') as mailbox:
-                for msg in mailbox.fetch(reverse=True, limit=settings.EMAIL_FETCH_LIMIT):
-                    if str(msg.uid) in uids_procesados:
-                        continue
-
-                    cuerpo = msg.text or msg.html or ""
-                    asunto = msg.subject or ""
-
-                    if (contiene_factura(cuerpo) or contiene_factura(asunto)) and msg.attachments:
-                        adjuntos = [
-                            {"filename": att.filename, "payload_binary": att.payload}
-                            for att in msg.attachments
-                            if att.filename.lower().endswith(('.pdf', '.zip', '.xml'))
-                        ]
-
-                        if adjuntos:
-                            correos.append({
-                                "from": msg.from_ or "",
-                                "subject": asunto,
-                                "uid": msg.uid,
-                                "adjuntos_binarios": adjuntos,
-                                "correo_cliente": email, 
-                                "body": cuerpo,
-                                "tenant_id": tenant_id 
-                            })
-                            guardar_uid(str(msg.uid), email)
-        except Exception as e:
-            logger.error(f"Error leyendo correos de {email}: {e}", exc_info=True)
-
-    return correos
+def _leer_en_paralelo(tarea, usuarios=None):
+    # Los buzones se leen en paralelo (con un tope global de conexiones) y el resultado de
+    # cada uno se entrega apenas ese buzón termina, sin esperar a los demás.
+    if usuarios is None:
+        usuarios = usuarios_con_credenciales()
+    if not usuarios:
+        return
+
+    max_workers = max(1, min(settings.EMAIL_FETCH_MAX_WORKERS, len(usuarios)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="imap") as executor:
+        futuros = {executor.submit(tarea, usuario): usuario["correo"] for usuario in usuarios}
+        for futuro in as_completed(futuros):
+            email = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                logger.error(f"Error leyendo correos de {email}: {e}", exc_info=True)
+                continue
+            yield email, resultado
+
+def obtener_correos_con_facturas():
+    # Generador: devuelve los correos buzón por buzón. Adjuntos y cuerpo ya están en el
+    # spool; el correo solo lleva sus manejadores.
+    def leer(usuario):
+        correos = []
+        leer_buzon(usuario, correos.append)
+        return correos
+
+    for email, correos in _leer_en_paralelo(leer):
+        logger.info(f"Buzón {email} leído: {len(correos)} correo(s) con facturas.")
+        yield from correos
+
+def encolar_correos_con_facturas(cola, usuarios=None) -> Dict[str, int]:
+    # Cada correo se persiste en la cola desde el hilo que lee su buzón, antes de marcar su
+    # UID como procesado. Devuelve cuántos se encolaron por buzón; los buzones que fallaron
+    # no aparecen.
+    leidos = {}
+    for email, encolados in _leer_en_paralelo(lambda usuario: leer_buzon(usuario, cola.encolar_correo), usuarios):
+        logger.info(f"Buzón {email} leído: {encolados} correo(s) con facturas encolados.")
+        leidos[email] = encolados
+    return leidos
@@ -0,0 +1,136 @@
+import re
+import time
+import random
+import logging
+import threading
+from typing import Callable, Dict
+from config.settings import settings
+from ingestion.email_reader import abrir_buzon, leer_buzon_abierto, usuarios_con_credenciales
+
+logger = logging.getLogger(__name__)
+
+# Modo de ingesta por IMAP IDLE (EMAIL_INGESTION_MODE=idle): una conexión persistente por
+# buzón que queda en IDLE y, cuando el servidor avisa EXISTS, lee solo los UIDs nuevos con el
+# mismo lector incremental del modo polling. Si la conexión se cae se reconecta con backoff
+# exponencial; el login se hace una vez por conexión y no en cada ciclo.
+
+_EXISTS = re.compile(rb'^\* \d+ EXISTS', re.IGNORECASE)
+_BYE = re.compile(rb'^\* BYE', re.IGNORECASE)
+# Cada cuánto se revisa, dentro de un IDLE, si hay que detener el oyente.
+_INTERVALO_POLL_SEGUNDOS = 5.0
+_BACKOFF_INICIAL_SEGUNDOS = 1.0
+# Una conexión que duró al menos esto reinicia el backoff al caerse.
+_CONEXION_ESTABLE_SEGUNDOS = 60.0
+
+
+class ConexionPerdida(Exception):
+    pass
+
+
+class OyenteIdle(threading.Thread):
+    """Mantiene un buzón en IDLE y entrega sus correos con facturas a `entregar`."""
+
+    def __init__(self, usuario: Dict, entregar: Callable[[Dict], None]):
+        super().__init__(name=f"idle-{usuario['correo']}", daemon=True)
+        self.usuario = usuario
+        self.entregar = entregar
+        self.detener = threading.Event()
+
+    def run(self):
+        email = self.usuario["correo"]
+        fallos = 0
+        while not self.detener.is_set():
+            mailbox, conectado_en = None, None
+            try:
+                mailbox = abrir_buzon(self.usuario)
+                conectado_en = time.monotonic()
+                logger.info(f"Conexión IDLE abierta para {email}.")
+                # Al (re)conectar se recoge lo que llegó mientras no hubo conexión.
+                self._leer(mailbox)
+                self._escuchar(mailbox)
+            except Exception as e:
+                if self.detener.is_set():
+                    break
+                if conectado_en is not None and time.monotonic() - conectado_en >= _CONEXION_ESTABLE_SEGUNDOS:
+                    fallos = 0
+                fallos += 1
+                espera = min(settings.EMAIL_IDLE_BACKOFF_MAX_SECONDS, _BACKOFF_INICIAL_SEGUNDOS * 2 ** (fallos - 1))
+                espera *= random.uniform(0.5, 1.0)
+                logger.warning(f"Conexión IDLE de {email} perdida ({type(e).__name__}: {e}). Reintento {fallos} en {espera:.1f}s.")
+                self.detener.wait(espera)
+            finally:
+                if mailbox is not None:
+                    _cerrar(mailbox)
+        logger.info(f"Oyente IDLE de {email} detenido.")
+
+    def _leer(self, mailbox):
+        entregados = leer_buzon_abierto(mailbox, self.usuario, self.entregar)
+        if entregados:
+            logger.info(f"Buzón {self.usuario['correo']}: {entregados} correo(s) con facturas encolados.")
+
+    def _escuchar(self, mailbox):
+        # El IDLE se renueva cada EMAIL_IDLE_RENEW_SECONDS (RFC 2177 pide menos de 29 minutos);
+        # cada renovación incluye una lectura incremental, que sin novedades es un solo STATUS.
+        while not self.detener.is_set():
+            renovar_en = time.monotonic() + settings.EMAIL_IDLE_RENEW_SECONDS
+            hay_nuevos = False
+            mailbox.idle.start()
+            while not hay_nuevos and not self.detener.is_set() and time.monotonic() < renovar_en:
+                intervalo = min(_INTERVALO_POLL_SEGUNDOS, max(0.0, renovar_en - time.monotonic()))
+                inicio = time.monotonic()
+                respuestas = mailbox.idle.poll(timeout=intervalo)
+                if any(_BYE.match(r) for r in respuestas):
+                    raise ConexionPerdida("el servidor cerró la sesión (BYE)")
+                if not respuestas and time.monotonic() - inicio < intervalo / 2:
+                    # El socket quedó legible sin líneas completas: el servidor cerró.
+                    raise ConexionPerdida("el servidor cerró la conexión")
+                hay_nuevos = any(_EXISTS.match(r) for r in respuestas)
+            mailbox.idle.stop()
+            if self.detener.is_set():
+                return
+            self._leer(mailbox)
+
+
+def _cerrar(mailbox):
+    try:
+        mailbox.logout()
+    except Exception:
+        # La conexión ya estaba caída; basta con soltar el socket.
+        try:
+            mailbox.client.shutdown()
+        except Exception:
+            pass
+
+
+class EscuchaIdle:
+    """Arranca un OyenteIdle por buzón y los sincroniza con los usuarios de la base."""
+
+    def __init__(self, entregar: Callable[[Dict], None]):
+        self.entregar = entregar
+        self.oyentes: Dict[str, OyenteIdle] = {}
+
+    def sincronizar(self):
+        usuarios = {u["correo"]: u for u in usuarios_con_credenciales()}
+        if not usuarios and self.oyentes:
+            # Sin usuarios suele ser un fallo al consultar la base: se conservan los oyentes.
+            logger.warning("No se obtuvieron usuarios con credenciales; se mantienen las conexiones IDLE actuales.")
+            return len(self.oyentes)
+        for email, oyente in list(self.oyentes.items()):
+            usuario = usuarios.get(email)
+            # Un buzón eliminado, con otra contraseña u otro inquilino se vuelve a conectar.
+            if usuario is None or usuario != oyente.usuario or not oyente.is_alive():
+                oyente.detener.set()
+                del self.oyentes[email]
+        for email, usuario in usuarios.items():
+            if email not in self.oyentes:
+                oyente = OyenteIdle(usuario, self.entregar)
+                self.oyentes[email] = oyente
+                oyente.start()
+        return len(self.oyentes)
+
+    def detener(self):
+        for oyente in self.oyentes.values():
+            oyente.detener.set()
+        for oyente in self.oyentes.values():
+            oyente.join(timeout=_INTERVALO_POLL_SEGUNDOS * 2)
+        self.oyentes.clear()
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import logging
+import threading
+import unicodedata
+from typing import Dict, Iterable, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Filtro de correos con facturas por palabras clave. El texto, que puede ser un HTML de cientos
+# de KB, se normaliza una sola vez y en C: se codifica en Latin-1 (lo que no cabe queda como "?")
+# y una tabla de 256 bytes pasa a minúscula y quita las tildes, así "REMISION" encuentra
+# "remisión" y al revés. Sobre esos bytes cada palabra es una búsqueda de subcadena de CPython,
+# que en estos tamaños resulta más rápida que una alternancia de `re` o que Aho-Corasick.
+#
+# Las palabras salen de INVOICE_KEYWORDS_FILE (JSON) y se recargan cuando el archivo cambia:
+#   {"palabras": [...], "tenants": {"<tenant_id>": {"agregar": [...], "excluir": [...]}}}
+
+PALABRAS_POR_DEFECTO = (
+    "factura", "invoice", "comprobante", "recibo", "cuenta",
+    "estado de cuenta", "billing", "cxc", "facturación",
+    "orden de compra", "remisión", "nota crédito", "nota débito",
+)
+
+# Cada cuánto se revisa si el archivo de palabras cambió.
+_INTERVALO_RECARGA_SEGUNDOS = 5.0
+
+
+def _tabla_latin1() -> bytes:
+    tabla = bytearray(range(256))
+    for codigo in range(0x41, 0x100):
+        letra = unicodedata.normalize('NFKD', chr(codigo).lower())[0]
+        if letra.isascii() and letra.isalpha():
+            tabla[codigo] = ord(letra)
+    return bytes(tabla)
+
+_TABLA_LATIN1 = _tabla_latin1()
+
+
+def normalizar(texto: str) -> bytes:
+    return texto.encode('latin-1', 'replace').translate(_TABLA_LATIN1)
+
+
+class DetectorFacturas:
+    """Busca cualquiera de `palabras` (sin distinguir mayúsculas ni tildes) en un texto."""
+
+    def __init__(self, palabras: Iterable[str]):
+        normalizadas = list(dict.fromkeys(normalizar(p).strip() for p in palabras if p.strip()))
+        # Una palabra que contiene a otra nunca decide nada ("estado de cuenta" ya incluye "cuenta").
+        # Se conserva el orden del archivo: las más frecuentes primero cortan antes la búsqueda.
+        self.palabras = tuple(p for p in normalizadas if not any(o != p and o in p for o in normalizadas))
+
+    def coincide(self, texto: Optional[str]) -> bool:
+        if not texto or not self.palabras:
+            return False
+        texto = normalizar(texto)
+        return any(palabra in texto for palabra in self.palabras)
+
+
+class ConfiguracionPalabras:
+    """Detectores por inquilino a partir del archivo de palabras, recargado si cambia."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._detectores: Dict[Optional[str], DetectorFacturas] = {}
+        self._palabras = PALABRAS_POR_DEFECTO
+        self._tenants: Dict[str, dict] = {}
+        self._mtime = None
+        self._revisado_en = None
+
+    def _recargar_si_cambio(self):
+        ahora = time.monotonic()
+        if self._revisado_en is not None and ahora - self._revisado_en < _INTERVALO_RECARGA_SEGUNDOS:
+            return
+        self._revisado_en = ahora
+        try:
+            mtime = os.path.getmtime(self.ruta)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        self._detectores.clear()
+        if mtime is None:
+            logger.warning(f"No existe el archivo de palabras clave {self.ruta}; se usan las palabras por defecto.")
+            self._palabras, self._tenants = PALABRAS_POR_DEFECTO, {}
+            return
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            self._palabras = tuple(datos.get("palabras") or PALABRAS_POR_DEFECTO)
+            self._tenants = datos.get("tenants") or {}
+            logger.info(f"Palabras clave cargadas de {self.ruta}: {len(self._palabras)} por defecto, {len(self._tenants)} inquilino(s) con ajustes.")
+        except Exception as e:
+            logger.error(f"Error leyendo el archivo de palabras clave {self.ruta}; se usan las palabras por defecto: {e}", exc_info=True)
+            self._palabras, self._tenants = PALABRAS_POR_DEFECTO, {}
+
+    def detector(self, tenant_id: Optional[str] = None) -> DetectorFacturas:
+        with self._lock:
+            self._recargar_si_cambio()
+            clave = tenant_id if tenant_id in self._tenants else None
+            detector = self._detectores.get(clave)
+            if detector is None:
+                ajustes = self._tenants.get(clave, {}) if clave is not None else {}
+                excluidas = {normalizar(p) for p in ajustes.get("excluir", [])}
+                palabras = [p for p in (*self._palabras, *ajustes.get("agregar", [])) if normalizar(p) not in excluidas]
+                detector = self._detectores[clave] = DetectorFacturas(palabras)
+            return detector
+
+
+configuracion_palabras = ConfiguracionPalabras(settings.INVOICE_KEYWORDS_FILE)
+
+
+def contiene_factura(texto: Optional[str], tenant_id: Optional[str] = None) -> bool:
+    return configuracion_palabras.detector(tenant_id).coincide(texto)
@@ -0,0 +1,68 @@
+import time
+import logging
+from typing import Dict, List, Optional
+from config.settings import settings
+from ingestion.utils import cargar_planificaciones, guardar_planificacion
+
+logger = logging.getLogger(__name__)
+
+# Planificador del modo polling: cada buzón tiene su propia próxima lectura. La tasa de
+# llegada de correos con facturas se estima con una media móvil exponencial; un buzón activo
+# se lee cada EMAIL_POLL_MIN_SECONDS y uno sin novedades alarga su intervalo por
+# EMAIL_POLL_BACKOFF_FACTOR hasta EMAIL_POLL_MAX_SECONDS. El estado vive en la base SQLite de
+# la ingesta, así que un reinicio no vuelve a leer todos los buzones al ritmo mínimo.
+
+# Peso de la última lectura en la media móvil de la tasa.
+_ALFA_TASA = 0.3
+# El intervalo objetivo es esta fracción del tiempo medio entre llegadas.
+_FRACCION_ENTRE_LLEGADAS = 0.25
+
+
+def _acotar(intervalo: float) -> float:
+    return max(float(settings.EMAIL_POLL_MIN_SECONDS), min(float(settings.EMAIL_POLL_MAX_SECONDS), intervalo))
+
+
+class PlanificadorBuzones:
+    """Decide qué buzones toca leer y reprograma cada uno según lo que trajo su lectura."""
+
+    def __init__(self):
+        self._estado: Dict[str, dict] = cargar_planificaciones()
+        if self._estado:
+            logger.info(f"Planificación de {len(self._estado)} buzón(es) recuperada.")
+
+    def pendientes(self, usuarios: List[dict], ahora: Optional[float] = None) -> List[dict]:
+        # Un buzón sin planificación (nuevo) se lee de inmediato.
+        ahora = time.time() if ahora is None else ahora
+        return [u for u in usuarios if self._estado.get(u["correo"], {}).get("proxima_lectura", 0) <= ahora]
+
+    def proxima_lectura(self, usuarios: List[dict]) -> Optional[float]:
+        if not usuarios:
+            return None
+        return min(self._estado.get(u["correo"], {}).get("proxima_lectura", 0) for u in usuarios)
+
+    def registrar_lectura(self, email: str, encolados: int, ahora: Optional[float] = None):
+        ahora = time.time() if ahora is None else ahora
+        estado = self._estado.get(email)
+        if estado is None:
+            estado = {"tasa": 0.0, "intervalo": float(settings.EMAIL_POLL_MIN_SECONDS), "ultima_lectura": None}
+        transcurrido = ahora - estado["ultima_lectura"] if estado["ultima_lectura"] else estado["intervalo"]
+        tasa = _ALFA_TASA * (encolados / max(transcurrido, 1.0)) + (1 - _ALFA_TASA) * estado["tasa"]
+
+        segun_tasa = _acotar(_FRACCION_ENTRE_LLEGADAS / tasa) if tasa > 0 else float(settings.EMAIL_POLL_MAX_SECONDS)
+        if encolados:
+            intervalo = segun_tasa
+        else:
+            intervalo = _acotar(min(estado["intervalo"] * settings.EMAIL_POLL_BACKOFF_FACTOR, segun_tasa))
+        self._guardar(email, tasa, intervalo, ahora, ahora + intervalo)
+
+    def registrar_fallo(self, email: str, ahora: Optional[float] = None):
+        # Un buzón que falla (credenciales, servidor caído) también espera más entre intentos.
+        ahora = time.time() if ahora is None else ahora
+        estado = self._estado.get(email) or {"tasa": 0.0, "intervalo": float(settings.EMAIL_POLL_MIN_SECONDS), "ultima_lectura": None}
+        intervalo = _acotar(estado["intervalo"] * settings.EMAIL_POLL_BACKOFF_FACTOR)
+        self._guardar(email, estado["tasa"], intervalo, estado["ultima_lectura"], ahora + intervalo)
+
+    def _guardar(self, email: str, tasa: float, intervalo: float, ultima_lectura: Optional[float], proxima_lectura: float):
+        self._estado[email] = {"tasa": tasa, "intervalo": intervalo, "ultima_lectura": ultima_lectura, "proxima_lectura": proxima_lectura}
+        guardar_planificacion(email, tasa, intervalo, ultima_lectura, proxima_lectura)
+        logger.debug(f"Buzón {email}: {tasa * 3600:.2f} correo(s)/h, próxima lectura en {intervalo:.0f}s.")
@@ -0,0 +1,88 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Optional, Union
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Adjuntos y cuerpos de correo se escriben a disco apenas se descargan, en archivos
+# direccionados por su SHA-256 (spool/ab/cd/<sha256>). Por la cola y hacia InvoiceService
+# solo viajan manejadores {"sha256", "ruta", "tamano"}; un mismo contenido recibido varias
+# veces ocupa un único archivo.
+SPOOL_DIR = os.path.join(settings.TMP_DIR, "spool")
+
+# Un archivo sin referencias en la cola se borra pasado este tiempo desde su última escritura.
+_ANTIGUEDAD_MINIMA_SEGUNDOS = 3600
+
+Manejador = Dict[str, Any]
+
+
+def _ruta(sha256: str) -> str:
+    return os.path.join(SPOOL_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def guardar_en_spool(datos: bytes) -> Manejador:
+    sha256 = hashlib.sha256(datos).hexdigest()
+    ruta = _ruta(sha256)
+    if os.path.exists(ruta):
+        # Se refresca la fecha para que la limpieza no lo borre mientras se encola.
+        os.utime(ruta)
+    else:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(datos)
+            os.replace(temporal, ruta)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+    return {"sha256": sha256, "ruta": ruta, "tamano": len(datos)}
+
+
+def guardar_texto_en_spool(texto: str) -> Manejador:
+    return guardar_en_spool(texto.encode('utf-8'))
+
+
+def es_manejador(valor) -> bool:
+    return isinstance(valor, dict) and "ruta" in valor and "sha256" in valor
+
+
+def leer_bytes(contenido: Union[bytes, Manejador]) -> bytes:
+    if es_manejador(contenido):
+        with open(contenido["ruta"], 'rb') as f:
+            return f.read()
+    return contenido
+
+
+def leer_texto(contenido: Union[str, Manejador, None]) -> Optional[str]:
+    if es_manejador(contenido):
+        return leer_bytes(contenido).decode('utf-8', errors='replace')
+    return contenido
+
+
+def limpiar_spool(referenciados: Iterable[str]) -> int:
+    """Borra los archivos del spool que ya no referencia ningún trabajo pendiente."""
+    referenciados = set(referenciados)
+    limite = time.time() - _ANTIGUEDAD_MINIMA_SEGUNDOS
+    borrados = 0
+    for directorio, _, archivos in os.walk(SPOOL_DIR):
+        for nombre in archivos:
+            if nombre in referenciados:
+                continue
+            ruta = os.path.join(directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+                    borrados += 1
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error limpiando archivo del spool {ruta}: {e}", exc_info=True)
+    if borrados:
+        logger.info(f"Limpieza del spool: {borrados} archivo(s) eliminados.")
+    return borrados
@@ -1,33 +1,241 @@
 import os
 import json
+import time
+import sqlite3
 import logging
+import threading
+from typing import Iterable, List, Optional
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Estado local de la ingesta (UIDs procesados y posición incremental de cada buzón) en una
+# base SQLite indexada. Los antiguos archivos `<email>_uids.json` se migran la primera vez
+# que se consulta cada buzón.
 PROCESSED_UIDS_DIR = os.path.join(settings.TMP_DIR, "processed_uids")
+ESTADO_DB_PATH = os.path.join(settings.TMP_DIR, "ingestion_estado.sqlite3")
 
-def _get_uids_file_path(email_address: str) -> str:
-    os.makedirs(PROCESSED_UIDS_DIR, exist_ok=True)
-    safe_email = email_address.replace('@', '_at_').replace('.', '_dot_')
-    return os.path.join(PROCESSED_UIDS_DIR, f"{safe_email}_uids.json")
+# Los UIDs de modo "recientes" no conocen el UIDVALIDITY del buzón y se guardan con este valor.
+UIDVALIDITY_DESCONOCIDO = 0
+_MAX_PARAMETROS_SQLITE = 900
 
-def cargar_uids_procesados(email_address: str) -> set:
-    file_path = _get_uids_file_path(email_address)
-    if os.path.exists(file_path):
+_INTERVALO_COMPACTACION_SEGUNDOS = 24 * 3600
+
+_conexion = None
+_lock = threading.RLock()
+_migrados = set()
+_ultima_compactacion = {}
+
+def _conectar() -> sqlite3.Connection:
+    global _conexion
+    if _conexion is None:
+        os.makedirs(os.path.dirname(ESTADO_DB_PATH), exist_ok=True)
+        conexion = sqlite3.connect(ESTADO_DB_PATH, check_same_thread=False, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript("""
+            CREATE TABLE IF NOT EXISTS uids_procesados (
+                correo TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL,
+                uid INTEGER NOT NULL,
+                procesado_en REAL NOT NULL,
+                PRIMARY KEY (correo, uidvalidity, uid)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS estado_buzones (
+                correo TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL,
+                ultimo_uid INTEGER NOT NULL,
+                actualizado_en REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS planificacion_buzones (
+                correo TEXT PRIMARY KEY,
+                tasa REAL NOT NULL,
+                intervalo REAL NOT NULL,
+                ultima_lectura REAL,
+                proxima_lectura REAL NOT NULL
+            );
+        """)
+        _conexion = conexion
+    return _conexion
+
+def _safe_email(email_address: str) -> str:
+    return email_address.replace('@', '_at_').replace('.', '_dot_')
+
+def _migrar_legado(email_address: str, uidvalidity: int):
+    # Importa (una sola vez) los JSON del almacenamiento anterior y los renombra a *.migrado.
+    if email_address in _migrados:
+        return
+    conexion = _conectar()
+    base = os.path.join(PROCESSED_UIDS_DIR, _safe_email(email_address))
+
+    uids_path = f"{base}_uids.json"
+    if os.path.exists(uids_path):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return set(json.load(f))
+            with open(uids_path, 'r', encoding='utf-8') as f:
+                uids = json.load(f)
+            _insertar(conexion, email_address, uidvalidity, uids)
+            os.replace(uids_path, f"{uids_path}.migrado")
+            logger.info(f"Migrados {len(uids)} UIDs legados de {email_address} al almacén SQLite.")
         except Exception as e:
-            logger.error(f"Error cargando UIDs para {email_address}: {e}", exc_info=True)
+            logger.error(f"Error migrando UIDs legados de {email_address}: {e}", exc_info=True)
+
+    _migrados.add(email_address)
+
+def _insertar(conexion: sqlite3.Connection, email_address: str, uidvalidity: int, uids: Iterable):
+    ahora = time.time()
+    conexion.execute("BEGIN")
+    try:
+        conexion.executemany(
+            "INSERT OR IGNORE INTO uids_procesados (correo, uidvalidity, uid, procesado_en) VALUES (?, ?, ?, ?)",
+            ((email_address, uidvalidity, int(uid), ahora) for uid in uids)
+        )
+        conexion.execute("COMMIT")
+    except Exception:
+        conexion.execute("ROLLBACK")
+        raise
+
+def cargar_uids_procesados(email_address: str, uidvalidity: int = UIDVALIDITY_DESCONOCIDO) -> set:
+    try:
+        with _lock:
+            _migrar_legado(email_address, uidvalidity)
+            filas = _conectar().execute(
+                "SELECT uid FROM uids_procesados WHERE correo = ? AND uidvalidity = ?",
+                (email_address, uidvalidity)
+            ).fetchall()
+        return {str(fila[0]) for fila in filas}
+    except Exception as e:
+        logger.error(f"Error cargando UIDs para {email_address}: {e}", exc_info=True)
     return set()
 
-def guardar_uid(uid: str, email_address: str):
-    uids = cargar_uids_procesados(email_address)
-    uids.add(uid)
-    file_path = _get_uids_file_path(email_address)
+def filtrar_uids_no_procesados(email_address: str, uidvalidity: int, uids: List[int]) -> List[int]:
+    # Consulta indexada por lote: no hace falta cargar el historial completo del buzón.
+    if not uids:
+        return []
+    procesados = set()
+    with _lock:
+        _migrar_legado(email_address, uidvalidity)
+        conexion = _conectar()
+        # Los UIDs sin UIDVALIDITY (modo "recientes") solo valen mientras el buzón no haya
+        # reiniciado su UIDVALIDITY; después los mismos números son mensajes nuevos.
+        estado = conexion.execute("SELECT uidvalidity FROM estado_buzones WHERE correo = ?", (email_address,)).fetchone()
+        desconocido = UIDVALIDITY_DESCONOCIDO if estado is None or estado[0] == uidvalidity else uidvalidity
+        for inicio in range(0, len(uids), _MAX_PARAMETROS_SQLITE):
+            lote = [int(uid) for uid in uids[inicio:inicio + _MAX_PARAMETROS_SQLITE]]
+            marcadores = ','.join('?' * len(lote))
+            filas = conexion.execute(
+                f"SELECT uid FROM uids_procesados WHERE correo = ? AND uidvalidity IN (?, ?) AND uid IN ({marcadores})",
+                (email_address, uidvalidity, desconocido, *lote)
+            ).fetchall()
+            procesados.update(fila[0] for fila in filas)
+    return [uid for uid in uids if int(uid) not in procesados]
+
+def guardar_uids(uids: Iterable, email_address: str, uidvalidity: int = UIDVALIDITY_DESCONOCIDO):
+    uids = list(uids)
+    if not uids:
+        return
+    try:
+        with _lock:
+            _insertar(_conectar(), email_address, uidvalidity, uids)
+    except Exception as e:
+        logger.error(f"Error guardando {len(uids)} UIDs para {email_address}: {e}", exc_info=True)
+
+def guardar_uid(uid: str, email_address: str, uidvalidity: int = UIDVALIDITY_DESCONOCIDO):
+    guardar_uids([uid], email_address, uidvalidity)
+
+def cargar_estado_buzon(email_address: str) -> dict:
+    # {"uidvalidity": int, "ultimo_uid": int} del último ciclo incremental, o {} si no hay.
+    try:
+        with _lock:
+            _migrar_legado(email_address, UIDVALIDITY_DESCONOCIDO)
+            fila = _conectar().execute(
+                "SELECT uidvalidity, ultimo_uid FROM estado_buzones WHERE correo = ?",
+                (email_address,)
+            ).fetchone()
+        if fila:
+            return {"uidvalidity": fila[0], "ultimo_uid": fila[1]}
+    except Exception as e:
+        logger.error(f"Error cargando estado del buzón {email_address}: {e}", exc_info=True)
+    return {}
+
+def guardar_estado_buzon(email_address: str, uidvalidity: int, ultimo_uid: int):
+    try:
+        with _lock:
+            conexion = _conectar()
+            anterior = conexion.execute(
+                "SELECT uidvalidity FROM estado_buzones WHERE correo = ?", (email_address,)
+            ).fetchone()
+            conexion.execute(
+                "INSERT INTO estado_buzones (correo, uidvalidity, ultimo_uid, actualizado_en) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(correo) DO UPDATE SET uidvalidity = excluded.uidvalidity, "
+                "ultimo_uid = excluded.ultimo_uid, actualizado_en = excluded.actualizado_en",
+                (email_address, uidvalidity, ultimo_uid, time.time())
+            )
+        vencida = time.time() - _ultima_compactacion.get(email_address, 0) > _INTERVALO_COMPACTACION_SEGUNDOS
+        reiniciado = anterior is not None and anterior[0] != uidvalidity
+        if anterior is None or reiniciado or vencida:
+            compactar_uids(email_address, uidvalidity, reiniciado=reiniciado)
+    except Exception as e:
+        logger.error(f"Error guardando estado del buzón {email_address}: {e}", exc_info=True)
+
+def cargar_planificaciones() -> dict:
+    # {correo: {"tasa", "intervalo", "ultima_lectura", "proxima_lectura"}} del planificador de polling.
+    try:
+        with _lock:
+            filas = _conectar().execute(
+                "SELECT correo, tasa, intervalo, ultima_lectura, proxima_lectura FROM planificacion_buzones"
+            ).fetchall()
+        return {
+            fila[0]: {"tasa": fila[1], "intervalo": fila[2], "ultima_lectura": fila[3], "proxima_lectura": fila[4]}
+            for fila in filas
+        }
+    except Exception as e:
+        logger.error(f"Error cargando la planificación de buzones: {e}", exc_info=True)
+    return {}
+
+def guardar_planificacion(email_address: str, tasa: float, intervalo: float, ultima_lectura: Optional[float], proxima_lectura: float):
+    try:
+        with _lock:
+            _conectar().execute(
+                "INSERT INTO planificacion_buzones (correo, tasa, intervalo, ultima_lectura, proxima_lectura) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(correo) DO UPDATE SET tasa = excluded.tasa, intervalo = excluded.intervalo, "
+                "ultima_lectura = excluded.ultima_lectura, proxima_lectura = excluded.proxima_lectura",
+                (email_address, tasa, intervalo, ultima_lectura, proxima_lectura)
+            )
+    except Exception as e:
+        logger.error(f"Error guardando la planificación del buzón {email_address}: {e}", exc_info=True)
+
+def compactar_uids(email_address: str, uidvalidity_vigente: int, retencion_dias: Optional[int] = None, reiniciado: bool = False):
+    """
+    Política de retención:
+    - Los UIDs de un UIDVALIDITY distinto al vigente ya no identifican ningún mensaje y se borran.
+    - Los UIDs por debajo de la marca incremental nunca se vuelven a pedir al servidor, así
+      que se conservan solo `UID_RETENTION_DAYS` días como red de seguridad (igual que los
+      UIDs sin UIDVALIDITY heredados del modo "recientes").
+    - Si el servidor reinició el UIDVALIDITY (`reiniciado`), los UIDs del modo "recientes"
+      también se borran: sus números ahora pueden ser de mensajes nuevos.
+    """
+    retencion_dias = settings.UID_RETENTION_DAYS if retencion_dias is None else retencion_dias
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(list(uids), f, ensure_ascii=False)
+        with _lock:
+            conexion = _conectar()
+            conservar = uidvalidity_vigente if reiniciado else UIDVALIDITY_DESCONOCIDO
+            borrados = conexion.execute(
+                "DELETE FROM uids_procesados WHERE correo = ? AND uidvalidity NOT IN (?, ?)",
+                (email_address, uidvalidity_vigente, conservar)
+            ).rowcount
+            fila = conexion.execute(
+                "SELECT ultimo_uid FROM estado_buzones WHERE correo = ? AND uidvalidity = ?",
+                (email_address, uidvalidity_vigente)
+            ).fetchone()
+            if fila and retencion_dias:
+                limite = time.time() - retencion_dias * 86400
+                borrados += conexion.execute(
+                    "DELETE FROM uids_procesados WHERE correo = ? AND procesado_en < ? "
+                    "AND (uidvalidity = ? OR (uidvalidity = ? AND uid <= ?))",
+                    (email_address, limite, UIDVALIDITY_DESCONOCIDO, uidvalidity_vigente, fila[0])
+                ).rowcount
+            _ultima_compactacion[email_address] = time.time()
+        if borrados:
+            logger.info(f"Compactación de UIDs de {email_address}: {borrados} registro(s) eliminados.")
     except Exception as e:
-        logger.error(f"Error guardando UID {uid} para {email_address}: {e}", exc_info=True)
+        logger.error(f"Error compactando UIDs de {email_address}: {e}", exc_info=True)
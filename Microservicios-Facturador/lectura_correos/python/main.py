@@ -2,11 +2,16 @@ import os
 import sys
 import time
 import logging
+import threading
 from datetime import datetime
 from config.settings import settings
 from database.models import init_db 
-from ingestion.email_reader import obtener_correos_con_facturas
-from services.invoice_service import InvoiceService
+from ingestion.email_reader import encolar_correos_con_facturas, usuarios_con_credenciales
+from ingestion.cola_trabajo import ColaTrabajo
+from ingestion.idle_listener import EscuchaIdle
+from ingestion.scheduler import PlanificadorBuzones
+from services.invoice_service import InvoiceService, crear_pool_procesos
+from services.deduplicacion import obtener_contadores
 
 logging.basicConfig(
     level=settings.LOG_LEVEL,
@@ -14,6 +19,50 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _fallar_trabajo(cola: ColaTrabajo, trabajo: dict, error: Exception):
+    logger.error(f"Error procesando '{trabajo['filename']}' para tenant '{trabajo['tenant_id']}' (intento {trabajo['intentos']}): {error}")
+    try:
+        cola.fallar(trabajo, str(error))
+    except Exception as e_cola:
+        logger.error(f"No se pudo reprogramar el trabajo {trabajo['id']}: {e_cola}", exc_info=True)
+
+def procesar_cola(cola: ColaTrabajo, pool_procesos):
+    # Cada trabajador tiene su propio InvoiceService (y sesión de base de datos); el parseo
+    # de cada lote se reparte en el pool de procesos compartido.
+    invoice_service = InvoiceService()
+    while True:
+        lote, terminados = [], set()
+        try:
+            lote = cola.reservar_lote(settings.PARSE_BATCH_SIZE, timeout=settings.PROCESSING_INTERVAL_SECONDS)
+            if not lote:
+                continue
+            inicio = time.time()
+            documentos = [(t["filename"], t["adjunto"], t["metadatos"], t["tenant_id"]) for t in lote]
+            resultados = invoice_service.process_documents(documentos, executor=pool_procesos, tamano_lote=len(lote))
+            for trabajo, (invoice_id, error) in zip(lote, resultados):
+                terminados.add(trabajo["id"])
+                if error is not None:
+                    _fallar_trabajo(cola, trabajo, error)
+                    continue
+                if invoice_id:
+                    logger.info(f"Adjunto '{trabajo['filename']}' de {trabajo['metadatos'].get('remitente_correo')} (tenant: {trabajo['tenant_id']}) procesado.")
+                else:
+                    logger.warning(f"Adjunto '{trabajo['filename']}' (tenant: {trabajo['tenant_id']}) descartado: no contiene una factura que se pueda guardar.")
+                # Solo se confirman la factura guardada y los descartes definitivos; los errores
+                # transitorios (base caída, deadlock...) llegan con `error` y se reintentan.
+                cola.confirmar(trabajo)
+            logger.info(f"Lote de {len(lote)} adjunto(s) procesado en {time.time() - inicio:.2f}s.")
+        except Exception as e:
+            if not lote:
+                logger.error(f"Error leyendo la cola de trabajo: {e}", exc_info=True)
+                time.sleep(settings.PROCESSING_INTERVAL_SECONDS)
+                continue
+            logger.error(f"Error procesando lote de {len(lote)} adjunto(s): {e}", exc_info=True)
+            invoice_service.db_session.rollback()
+            for trabajo in lote:
+                if trabajo["id"] not in terminados:
+                    _fallar_trabajo(cola, trabajo, e)
+
 def run_invoice_processing_loop():
     try:
         init_db()
@@ -22,52 +71,38 @@ def run_invoice_processing_loop():
         sys.exit(1)
 
     os.makedirs(settings.TMP_DIR, exist_ok=True)
-    logger.info("Servicio iniciado correctamente.")
 
-    invoice_service = InvoiceService()
+    cola = ColaTrabajo()
+    cola.recuperar_reservas()
+    cola.limpiar_spool()
+    pool_procesos = crear_pool_procesos()
+    for numero in range(max(1, settings.PROCESSING_WORKERS)):
+        threading.Thread(target=procesar_cola, args=(cola, pool_procesos), name=f"procesador-{numero + 1}", daemon=True).start()
+    logger.info(f"Servicio iniciado correctamente con {max(1, settings.PROCESSING_WORKERS)} trabajador(es) de procesamiento.")
+
+    if settings.EMAIL_INGESTION_MODE == "idle":
+        run_idle_loop(cola)
+        return
+
+    planificador = PlanificadorBuzones() if settings.EMAIL_POLL_ADAPTIVE else None
     error_count = 0
     max_errors = 5
 
     while True:
         start_loop_time = time.time()
-        logger.info("Iniciando ciclo de procesamiento de correos.")
+        espera = settings.EMAIL_CHECK_INTERVAL_SECONDS
+        logger.info("Iniciando ciclo de lectura de correos.")
         try:
-            correos_encontrados = obtener_correos_con_facturas()
+            # La lectura solo encola; los trabajadores procesan en paralelo mientras tanto.
+            if planificador is None:
+                leidos = encolar_correos_con_facturas(cola)
+            else:
+                espera, leidos = _leer_buzones_planificados(cola, planificador)
+            logger.info(f"{sum(leidos.values())} correo(s) con facturas encolados de {len(leidos)} buzón(es). Estado de la cola: {cola.contar()}")
+            logger.info(f"Deduplicación desde el ciclo anterior: {obtener_contadores(reiniciar=True)}")
+            cola.limpiar_spool()
             error_count = 0
 
-            for correo in correos_encontrados or []:
-                correo_inicio = time.time()
-                remitente = correo.get("from", "desconocido")
-                adjuntos = correo.get("adjuntos_binarios", [])
-                tenant_id_del_correo = correo.get("tenant_id")
-                if not tenant_id_del_correo:
-                    logger.warning(f"Correo de {remitente} (UID: {correo.get('uid')}) no tiene tenant_id. Saltando procesamiento.")
-                    continue
-
-                for adjunto in adjuntos:
-                    filename = adjunto["filename"]
-                    payload = adjunto["payload_binary"]
-                    try:
-                        invoice_id = invoice_service.process_document(
-                            filename, 
-                            payload, 
-                            {
-                                "asunto_correo": correo.get("subject"),
-                                "remitente_correo": remitente,
-                                "correo_cliente_asociado": correo.get("correo_cliente"),
-                                "uid": correo.get("uid"),
-                                "body": correo.get("body"),
-                                "tenant_id": tenant_id_del_correo 
-                            },
-                            tenant_id=tenant_id_del_correo 
-                        )
-                        if invoice_id:
-                            logger.info(f"Correo de {remitente} (tenant: {tenant_id_del_correo}) procesado en {time.time() - correo_inicio:.2f}s.")
-                        else:
-                            logger.warning(f"No se pudo guardar la factura para '{filename}' (tenant: {tenant_id_del_correo}).")
-                    except Exception as e:
-                        logger.error(f"Error procesando '{filename}' para tenant '{tenant_id_del_correo}': {e}", exc_info=True)
-
         except Exception as e:
             error_count += 1
             logger.critical(f"Fallo en la ingesta de correos: {e}", exc_info=True)
@@ -76,8 +111,41 @@ def run_invoice_processing_loop():
                 break
 
         elapsed = time.time() - start_loop_time
-        logger.info(f"Ciclo completo en {elapsed:.2f}s. Esperando {settings.EMAIL_CHECK_INTERVAL_SECONDS}s...")
-        time.sleep(settings.EMAIL_CHECK_INTERVAL_SECONDS)
+        logger.info(f"Ciclo completo en {elapsed:.2f}s. Esperando {espera:.0f}s...")
+        time.sleep(espera)
+
+def _leer_buzones_planificados(cola: ColaTrabajo, planificador: PlanificadorBuzones):
+    # Solo se leen los buzones cuya próxima lectura ya venció. La espera hasta el siguiente
+    # ciclo no pasa de EMAIL_CHECK_INTERVAL_SECONDS para que los usuarios nuevos entren pronto.
+    usuarios = usuarios_con_credenciales()
+    pendientes = planificador.pendientes(usuarios)
+    leidos = encolar_correos_con_facturas(cola, pendientes) if pendientes else {}
+    for usuario in pendientes:
+        if usuario["correo"] in leidos:
+            planificador.registrar_lectura(usuario["correo"], leidos[usuario["correo"]])
+        else:
+            planificador.registrar_fallo(usuario["correo"])
+    logger.info(f"{len(pendientes)} de {len(usuarios)} buzón(es) tocaban lectura en este ciclo.")
+    proxima = planificador.proxima_lectura(usuarios)
+    espera = settings.EMAIL_CHECK_INTERVAL_SECONDS if proxima is None else proxima - time.time()
+    return max(1.0, min(float(settings.EMAIL_CHECK_INTERVAL_SECONDS), espera)), leidos
+
+def run_idle_loop(cola: ColaTrabajo):
+    # Cada buzón encola desde su propia conexión IDLE; este ciclo solo sincroniza los oyentes
+    # con los usuarios de la base y hace el mantenimiento que en polling va tras cada lectura.
+    escucha = EscuchaIdle(cola.encolar_correo)
+    try:
+        while True:
+            try:
+                conectados = escucha.sincronizar()
+                logger.info(f"{conectados} buzón(es) en IDLE. Estado de la cola: {cola.contar()}")
+                logger.info(f"Deduplicación desde el ciclo anterior: {obtener_contadores(reiniciar=True)}")
+                cola.limpiar_spool()
+            except Exception as e:
+                logger.error(f"Error en el mantenimiento de la ingesta IDLE: {e}", exc_info=True)
+            time.sleep(settings.EMAIL_CHECK_INTERVAL_SECONDS)
+    finally:
+        escucha.detener()
 
 if __name__ == "__main__":
     logger.info("Inicializando servicio de procesamiento de facturas...")
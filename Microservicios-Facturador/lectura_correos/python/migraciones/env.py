@@ -0,0 +1,48 @@
+from logging.config import fileConfig
+
+from alembic import context
+from config.settings import settings
+from database.database import engine
+from database.models import Base
+
+config = context.config
+
+# Desde init_db() llega la conexión ya abierta y el logging de la aplicación no se toca.
+conexion_externa = config.attributes.get("connection")
+if config.config_file_name is not None and conexion_externa is None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def _configurar(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        compare_type=True,
+        render_as_batch=settings.DATABASE_URL.startswith("sqlite"),
+        **kwargs
+    )
+
+
+def run_migrations_offline():
+    _configurar(url=settings.DATABASE_URL, literal_binds=True, dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    if conexion_externa is not None:
+        _configurar(connection=conexion_externa)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+    with engine.connect() as conexion:
+        _configurar(connection=conexion)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
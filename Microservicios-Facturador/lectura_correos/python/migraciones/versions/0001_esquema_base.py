@@ -0,0 +1,199 @@
+"""esquema base (el que creaba Base.metadata.create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TINYINT = sa.SmallInteger().with_variant(mysql.TINYINT(), "mysql")
+LONGBLOB = sa.LargeBinary().with_variant(mysql.LONGBLOB(), "mysql")
+LONGTEXT = sa.Text().with_variant(mysql.LONGTEXT(), "mysql")
+
+
+def _existe(tabla: str) -> bool:
+    # `suppliers` la puede haber creado antes el servicio de NestJS que comparte la base.
+    return sa.inspect(op.get_bind()).has_table(tabla)
+
+
+def upgrade():
+    if not _existe("usuarios"):
+        op.create_table(
+            "usuarios",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("correo", sa.String(255), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=True),
+            sa.Column("email_account_password_encrypted", sa.String(255), nullable=True),
+            sa.Column("tenant_id", sa.String(255), nullable=True),
+        )
+        op.create_index("ix_usuarios_id", "usuarios", ["id"])
+        op.create_index("ix_usuarios_correo", "usuarios", ["correo"], unique=True)
+        op.create_index("ix_usuarios_tenant_id", "usuarios", ["tenant_id"])
+
+    if not _existe("suppliers"):
+        op.create_table(
+            "suppliers",
+            sa.Column("id", sa.String(36), primary_key=True),
+            sa.Column("nit", sa.String(255), nullable=True),
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("contact_person", sa.String(255), nullable=True),
+            sa.Column("phone", sa.String(255), nullable=True),
+            sa.Column("email", sa.String(255), nullable=True),
+            sa.Column("address", sa.String(255), nullable=True),
+            sa.Column("notes", sa.String(255), nullable=True),
+            sa.Column("is_active", TINYINT, nullable=False),
+            sa.Column("verification_digit", sa.String(255), nullable=True),
+            sa.Column("city", sa.String(255), nullable=True),
+            sa.Column("notifications_enabled", TINYINT, nullable=False),
+            sa.Column("document_type", sa.String(255), nullable=True),
+            sa.Column("contact_first_name", sa.String(255), nullable=True),
+            sa.Column("contact_middle_name", sa.String(255), nullable=True),
+            sa.Column("contact_last_name", sa.String(255), nullable=True),
+            sa.Column("contact_second_last_name", sa.String(255), nullable=True),
+            sa.Column("commercial_name", sa.String(255), nullable=True),
+            sa.Column("bank_account_type", sa.String(255), nullable=True),
+            sa.Column("bank_account_number", sa.String(255), nullable=True),
+            sa.Column("bank_name", sa.String(255), nullable=True),
+            sa.Column("category_id", sa.String(255), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=False),
+            sa.Column("tenant_id", sa.String(255), nullable=True),
+        )
+        op.create_index("ix_suppliers_id", "suppliers", ["id"])
+        op.create_index("ix_suppliers_tenant_id", "suppliers", ["tenant_id"])
+
+    if not _existe("facturas"):
+        op.create_table(
+            "facturas",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("procesado_en", sa.DateTime(), nullable=True),
+            sa.Column("ruta_archivo_original", sa.String(500), nullable=True),
+            sa.Column("asunto_correo", sa.String(500), nullable=True),
+            sa.Column("remitente_correo", sa.String(255), nullable=True),
+            sa.Column("correo_cliente_asociado", sa.String(255), nullable=True),
+            sa.Column("cufe", sa.String(200), nullable=True),
+            sa.Column("numero_factura", sa.String(100), nullable=True),
+            sa.Column("fecha_emision", sa.Date(), nullable=True),
+            sa.Column("hora_emision", sa.String(50), nullable=True),
+            sa.Column("monto_subtotal", sa.Float(), nullable=True),
+            sa.Column("monto_impuesto", sa.Float(), nullable=True),
+            sa.Column("monto_total", sa.Float(), nullable=True),
+            sa.Column("moneda", sa.String(10), nullable=True),
+            sa.Column("nombre_proveedor", sa.String(255), nullable=True),
+            sa.Column("nit_proveedor", sa.String(50), nullable=True),
+            sa.Column("email_proveedor", sa.String(255), nullable=True),
+            sa.Column("nombre_cliente", sa.String(255), nullable=True),
+            sa.Column("nit_cliente", sa.String(50), nullable=True),
+            sa.Column("fecha_vencimiento", sa.Date(), nullable=True),
+            sa.Column("metodo_pago", sa.String(100), nullable=True),
+            sa.Column("texto_crudo_xml", sa.Text(), nullable=True),
+            sa.Column("contenido_pdf_binario", LONGBLOB, nullable=True),
+            sa.Column("xml_blob_key", sa.String(64), nullable=True),
+            sa.Column("pdf_blob_key", sa.String(64), nullable=True),
+            sa.Column("tipo_documento_dian", sa.String(100), nullable=True),
+            sa.Column("revisada_manualmente", TINYINT, nullable=True),
+            sa.Column("usuario_id", sa.Integer(), sa.ForeignKey("usuarios.id"), nullable=True),
+            sa.Column("proveedor_id", sa.String(36), sa.ForeignKey("suppliers.id"), nullable=True),
+            sa.Column("tenant_id", sa.String(255), nullable=True),
+        )
+        op.create_index("ix_facturas_id", "facturas", ["id"])
+        op.create_index("ix_facturas_cufe", "facturas", ["cufe"], unique=True)
+        op.create_index("ix_facturas_numero_factura", "facturas", ["numero_factura"], unique=True)
+        op.create_index("ix_facturas_nit_proveedor", "facturas", ["nit_proveedor"])
+        op.create_index("ix_facturas_tenant_id", "facturas", ["tenant_id"])
+
+    if not _existe("items_factura"):
+        op.create_table(
+            "items_factura",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("factura_id", sa.Integer(), sa.ForeignKey("facturas.id"), nullable=False),
+            sa.Column("descripcion", sa.String(500), nullable=True),
+            sa.Column("cantidad", sa.Float(), nullable=True),
+            sa.Column("valor_unitario", sa.Float(), nullable=True),
+            sa.Column("valor_total", sa.Float(), nullable=True),
+            sa.Column("tenant_id", sa.String(255), nullable=True),
+        )
+        op.create_index("ix_items_factura_id", "items_factura", ["id"])
+        op.create_index("ix_items_factura_tenant_id", "items_factura", ["tenant_id"])
+
+    if not _existe("facturas_audit"):
+        op.create_table(
+            "facturas_audit",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("id_factura", sa.Integer(), nullable=False),
+            sa.Column("procesado_en", sa.DateTime(), nullable=True),
+            sa.Column("ruta_archivo_original", sa.String(500), nullable=True),
+            sa.Column("asunto_correo", sa.String(500), nullable=True),
+            sa.Column("remitente_correo", sa.String(255), nullable=True),
+            sa.Column("correo_cliente_asociado", sa.String(255), nullable=True),
+            sa.Column("cufe", sa.String(200), nullable=True),
+            sa.Column("numero_factura", sa.String(100), nullable=True),
+            sa.Column("fecha_emision", sa.Date(), nullable=True),
+            sa.Column("hora_emision", sa.String(50), nullable=True),
+            sa.Column("monto_subtotal", sa.Float(), nullable=True),
+            sa.Column("monto_impuesto", sa.Float(), nullable=True),
+            sa.Column("monto_total", sa.Float(), nullable=True),
+            sa.Column("moneda", sa.String(10), nullable=True),
+            sa.Column("nombre_proveedor", sa.String(255), nullable=True),
+            sa.Column("nit_proveedor", sa.String(50), nullable=True),
+            sa.Column("email_proveedor", sa.String(255), nullable=True),
+            sa.Column("nombre_cliente", sa.String(255), nullable=True),
+            sa.Column("nit_cliente", sa.String(50), nullable=True),
+            sa.Column("fecha_vencimiento", sa.Date(), nullable=True),
+            sa.Column("metodo_pago", sa.String(100), nullable=True),
+            sa.Column("texto_crudo_xml", sa.Text(), nullable=True),
+            sa.Column("tipo_documento_dian", sa.String(100), nullable=True),
+            sa.Column("revisada_manualmente", sa.Boolean(), nullable=True),
+            sa.Column("usuario_id_asociado_factura", sa.Integer(), nullable=True),
+            sa.Column("fecha_modificacion", sa.DateTime(), nullable=False),
+            sa.Column("tipo_operacion", sa.String(10), nullable=False),
+            sa.Column("usuario_auditoria_id", sa.Integer(), sa.ForeignKey("usuarios.id"), nullable=True),
+            sa.Column("datos_anteriores", sa.Text(), nullable=True),
+            sa.Column("cambios", LONGTEXT, nullable=True),
+            sa.Column("hash_xml", sa.String(64), nullable=True),
+            sa.Column("tenant_id", sa.String(255), nullable=True),
+        )
+        op.create_index("ix_facturas_audit_id", "facturas_audit", ["id"])
+        op.create_index("ix_facturas_audit_id_factura", "facturas_audit", ["id_factura"])
+        op.create_index("ix_facturas_audit_tenant_id", "facturas_audit", ["tenant_id"])
+
+    if not _existe("items_factura_audit"):
+        op.create_table(
+            "items_factura_audit",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("id_item_factura", sa.Integer(), nullable=False),
+            sa.Column("factura_id", sa.Integer(), nullable=False),
+            sa.Column("descripcion", sa.String(500), nullable=True),
+            sa.Column("cantidad", sa.Float(), nullable=True),
+            sa.Column("valor_unitario", sa.Float(), nullable=True),
+            sa.Column("valor_total", sa.Float(), nullable=True),
+            sa.Column("fecha_modificacion", sa.DateTime(), nullable=False),
+            sa.Column("tipo_operacion", sa.String(10), nullable=False),
+            sa.Column("usuario_auditoria_id", sa.Integer(), sa.ForeignKey("usuarios.id"), nullable=True),
+            sa.Column("datos_anteriores", sa.Text(), nullable=True),
+            sa.Column("cambios", sa.Text(), nullable=True),
+            sa.Column("tenant_id", sa.String(255), nullable=True),
+        )
+        op.create_index("ix_items_factura_audit_id", "items_factura_audit", ["id"])
+        op.create_index("ix_items_factura_audit_factura_id", "items_factura_audit", ["factura_id"])
+        op.create_index("ix_items_factura_audit_tenant_id", "items_factura_audit", ["tenant_id"])
+
+    if not _existe("contenidos_xml"):
+        op.create_table(
+            "contenidos_xml",
+            sa.Column("sha256", sa.String(64), primary_key=True),
+            sa.Column("contenido", LONGTEXT, nullable=False),
+            sa.Column("creado_en", sa.DateTime(), nullable=False),
+        )
+
+
+def downgrade():
+    for tabla in ("contenidos_xml", "items_factura_audit", "facturas_audit", "items_factura", "facturas", "usuarios"):
+        op.drop_table(tabla)
@@ -0,0 +1,44 @@
+"""índices compuestos por inquilino para los filtros y la paginación del listado de facturas
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+INDICES = (
+    ("facturas", "ix_facturas_tenant_procesado_id", ["tenant_id", "procesado_en", "id"]),
+    ("facturas", "ix_facturas_tenant_fecha_emision_id", ["tenant_id", "fecha_emision", "id"]),
+    ("facturas", "ix_facturas_tenant_nit_proveedor", ["tenant_id", "nit_proveedor"]),
+    ("facturas", "ix_facturas_tenant_usuario_id", ["tenant_id", "usuario_id"]),
+    ("facturas", "ix_facturas_tenant_monto_total", ["tenant_id", "monto_total"]),
+    ("facturas", "ix_facturas_tenant_revisada_procesado", ["tenant_id", "revisada_manualmente", "procesado_en"]),
+    ("facturas", "ix_facturas_tenant_tipo_documento", ["tenant_id", "tipo_documento_dian"]),
+    ("items_factura", "ix_items_factura_factura_id_id", ["factura_id", "id"]),
+)
+
+
+def _indices(tabla: str) -> set:
+    return {i["name"] for i in sa.inspect(op.get_bind()).get_indexes(tabla)}
+
+
+def upgrade():
+    # Las bases adoptadas desde create_all pueden tener ya algunos de estos índices.
+    for tabla, nombre, columnas in INDICES:
+        if nombre not in _indices(tabla):
+            op.create_index(nombre, tabla, columnas)
+    # Prefijo de todos los anteriores: ya no aporta y encarece cada escritura.
+    if "ix_facturas_tenant_id" in _indices("facturas"):
+        op.drop_index("ix_facturas_tenant_id", table_name="facturas")
+
+
+def downgrade():
+    op.create_index("ix_facturas_tenant_id", "facturas", ["tenant_id"])
+    for tabla, nombre, _ in reversed(INDICES):
+        op.drop_index(nombre, table_name=tabla)
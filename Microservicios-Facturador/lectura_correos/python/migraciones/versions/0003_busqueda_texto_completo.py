@@ -0,0 +1,37 @@
+"""índices FULLTEXT (ngram) para la búsqueda de facturas por número, proveedor y descripción de ítems
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# El parser ngram (tokens de ngram_token_size caracteres, 2 por defecto) encuentra fragmentos
+# dentro de números de factura y nombres, que el parser por palabras no separa. MySQL mantiene
+# estos índices al escribir; en otros motores la búsqueda cae a LIKE y no se crea nada.
+INDICES = (
+    ("facturas", "ft_facturas_numero_proveedor", ["numero_factura", "nombre_proveedor"]),
+    ("items_factura", "ft_items_factura_descripcion", ["descripcion"]),
+)
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "mysql":
+        return
+    inspector = sa.inspect(op.get_bind())
+    for tabla, nombre, columnas in INDICES:
+        if nombre not in {i["name"] for i in inspector.get_indexes(tabla)}:
+            op.create_index(nombre, tabla, columnas, mysql_prefix="FULLTEXT", mysql_with_parser="ngram")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "mysql":
+        return
+    for tabla, nombre, _ in INDICES:
+        op.drop_index(nombre, table_name=tabla)
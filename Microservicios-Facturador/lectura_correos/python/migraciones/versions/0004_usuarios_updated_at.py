@@ -0,0 +1,33 @@
+"""usuarios.updated_at para refrescar la caché de credenciales de forma incremental
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Las bases adoptadas desde create_all ya pueden traer la columna (sin valores).
+    if "updated_at" not in {c["name"] for c in inspector.get_columns("usuarios")}:
+        if bind.dialect.name == "mysql":
+            # También cambia con UPDATEs hechos a mano, fuera del ORM.
+            op.execute("ALTER TABLE usuarios ADD COLUMN updated_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+        else:
+            op.add_column("usuarios", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE usuarios SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+    if "ix_usuarios_updated_at" not in {i["name"] for i in inspector.get_indexes("usuarios")}:
+        op.create_index("ix_usuarios_updated_at", "usuarios", ["updated_at"])
+
+
+def downgrade():
+    op.drop_index("ix_usuarios_updated_at", table_name="usuarios")
+    op.drop_column("usuarios", "updated_at")
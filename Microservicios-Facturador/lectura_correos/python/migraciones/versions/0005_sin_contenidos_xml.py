@@ -0,0 +1,28 @@
+"""elimina contenidos_xml: las versiones del XML auditado se leen del almacén de blobs
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "contenidos_xml" in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_table("contenidos_xml")
+
+
+def downgrade():
+    op.create_table(
+        "contenidos_xml",
+        sa.Column("sha256", sa.String(64), primary_key=True),
+        sa.Column("contenido", sa.Text().with_variant(mysql.LONGTEXT(), "mysql"), nullable=False),
+        sa.Column("creado_en", sa.DateTime(), nullable=False),
+    )
@@ -0,0 +1,53 @@
+"""índices por inquilino terminados en (procesado_en, id) para paginar el listado sin ordenar
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# Filtros de igualdad del listado: con el orden del listado como sufijo, el índice entrega las
+# filas ya ordenadas y el cursor se resuelve dentro de él (sin "USE TEMP B-TREE"/filesort).
+NUEVOS = (
+    ("ix_facturas_tenant_nit_procesado_id", ["tenant_id", "nit_proveedor", "procesado_en", "id"]),
+    ("ix_facturas_tenant_usuario_procesado_id", ["tenant_id", "usuario_id", "procesado_en", "id"]),
+    ("ix_facturas_tenant_revisada_procesado_id", ["tenant_id", "revisada_manualmente", "procesado_en", "id"]),
+    ("ix_facturas_tenant_tipo_procesado_id", ["tenant_id", "tipo_documento_dian", "procesado_en", "id"]),
+)
+# Los de 0002 que reemplazan. Los de rango (fecha_emision, monto_total) obligaban a ordenar todo
+# el rango en cada página; sin ellos el rango se filtra recorriendo ix_facturas_tenant_procesado_id.
+ANTERIORES = (
+    ("ix_facturas_tenant_nit_proveedor", ["tenant_id", "nit_proveedor"]),
+    ("ix_facturas_tenant_usuario_id", ["tenant_id", "usuario_id"]),
+    ("ix_facturas_tenant_revisada_procesado", ["tenant_id", "revisada_manualmente", "procesado_en"]),
+    ("ix_facturas_tenant_tipo_documento", ["tenant_id", "tipo_documento_dian"]),
+    ("ix_facturas_tenant_fecha_emision_id", ["tenant_id", "fecha_emision", "id"]),
+    ("ix_facturas_tenant_monto_total", ["tenant_id", "monto_total"]),
+)
+
+
+def _indices() -> set:
+    return {i["name"] for i in sa.inspect(op.get_bind()).get_indexes("facturas")}
+
+
+def upgrade():
+    # Primero los nuevos, para que ningún filtro quede sin índice mientras tanto.
+    for nombre, columnas in NUEVOS:
+        if nombre not in _indices():
+            op.create_index(nombre, "facturas", columnas)
+    for nombre, _ in ANTERIORES:
+        if nombre in _indices():
+            op.drop_index(nombre, table_name="facturas")
+
+
+def downgrade():
+    for nombre, columnas in ANTERIORES:
+        op.create_index(nombre, "facturas", columnas)
+    for nombre, _ in reversed(NUEVOS):
+        op.drop_index(nombre, table_name="facturas")
@@ -0,0 +1,35 @@
+"""trigger en SQLite para que usuarios.updated_at cambie también con UPDATEs fuera del ORM
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+# En MySQL la columna ya es ON UPDATE CURRENT_TIMESTAMP (0004). SQLite no tiene ese modificador:
+# sin el trigger, un UPDATE hecho a mano no movería MAX(updated_at) y la caché de credenciales
+# no vería el cambio hasta el recorrido completo. Si el UPDATE ya fijó updated_at no se toca.
+TRIGGER = "tr_usuarios_updated_at"
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {TRIGGER}
+        AFTER UPDATE ON usuarios
+        FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE usuarios SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+    """)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute(f"DROP TRIGGER IF EXISTS {TRIGGER}")
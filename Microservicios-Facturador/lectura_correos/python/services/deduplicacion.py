@@ -0,0 +1,91 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Caché local (SQLite) de adjuntos ya convertidos en factura, por tenant y SHA-256 del
+# contenido. Un mismo ZIP reenviado, copiado a varios usuarios o reintentado se resuelve
+# con una consulta aquí, sin descomprimir ni parsear el XML.
+DEDUP_DB_PATH = os.path.join(settings.TMP_DIR, "dedup_adjuntos.sqlite3")
+
+_conexion = None
+_lock = threading.Lock()
+_contadores = Counter()
+
+def _conectar() -> sqlite3.Connection:
+    global _conexion
+    if _conexion is None:
+        os.makedirs(os.path.dirname(DEDUP_DB_PATH), exist_ok=True)
+        conexion = sqlite3.connect(DEDUP_DB_PATH, check_same_thread=False, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS adjuntos_procesados (
+                tenant_id TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                factura_id INTEGER NOT NULL,
+                registrado_en REAL NOT NULL,
+                PRIMARY KEY (tenant_id, sha256)
+            ) WITHOUT ROWID
+        """)
+        _conexion = conexion
+    return _conexion
+
+def buscar_factura_por_hash(tenant_id: str, sha256: str) -> Optional[int]:
+    try:
+        with _lock:
+            fila = _conectar().execute(
+                "SELECT factura_id FROM adjuntos_procesados WHERE tenant_id = ? AND sha256 = ?",
+                (tenant_id, sha256)
+            ).fetchone()
+        return fila[0] if fila else None
+    except Exception as e:
+        logger.error(f"Error consultando caché de deduplicación: {e}", exc_info=True)
+    return None
+
+def registrar_hash(tenant_id: str, sha256: str, factura_id: int):
+    try:
+        with _lock:
+            _conectar().execute(
+                "INSERT OR REPLACE INTO adjuntos_procesados (tenant_id, sha256, factura_id, registrado_en) VALUES (?, ?, ?, ?)",
+                (tenant_id, sha256, factura_id, time.time())
+            )
+    except Exception as e:
+        logger.error(f"Error registrando adjunto en caché de deduplicación: {e}", exc_info=True)
+
+def olvidar_hash(tenant_id: str, sha256: str):
+    try:
+        with _lock:
+            _conectar().execute(
+                "DELETE FROM adjuntos_procesados WHERE tenant_id = ? AND sha256 = ?", (tenant_id, sha256)
+            )
+    except Exception as e:
+        logger.error(f"Error eliminando adjunto de caché de deduplicación: {e}", exc_info=True)
+
+def contar(evento: str, cantidad: int = 1):
+    with _lock:
+        _contadores[evento] += cantidad
+
+def contar_omitido(motivo: str, tamano: int = 0):
+    """Adjunto que no genera escritura por ser duplicado ("hash" o "cufe")."""
+    with _lock:
+        _contadores[f"duplicados_{motivo}"] += 1
+        _contadores["omitidos"] += 1
+        _contadores["bytes_omitidos"] += tamano
+
+def obtener_contadores(reiniciar: bool = False) -> Dict[str, int]:
+    """
+    Contadores desde el último reinicio: adjuntos, guardadas, omitidos (= duplicados_hash +
+    duplicados_cufe) y bytes_omitidos (tamaño de los adjuntos omitidos por cualquiera de los dos).
+    """
+    with _lock:
+        resultado = dict(_contadores)
+        if reiniciar:
+            _contadores.clear()
+    return resultado
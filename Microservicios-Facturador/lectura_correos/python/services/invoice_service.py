@@ -1,16 +1,182 @@
 import os
 import zipfile
+import hashlib
 import io
 import logging
 import re
-from typing import Dict, Any, Optional
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Executor, TimeoutError as FuturoVencido
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Dict, Any, Optional, Union, Iterable, Iterator, Tuple
 from datetime import datetime, date
+from config.settings import settings
 from database.models import SessionLocal, Usuario 
 from database.crud import InvoiceCRUD, UserCRUD, set_current_audit_tenant_id, set_current_audit_user_id 
 from extraction.xml_parser import parse_invoice_xml, extract_nested_invoice_xml
+from extraction.email_body import extraer_cuerpo_correo
+from ingestion.spool import es_manejador, leer_bytes, leer_texto
+from services.deduplicacion import buscar_factura_por_hash, registrar_hash, olvidar_hash, contar, contar_omitido
 
 logger = logging.getLogger(__name__)
 
+# (filename, contenido o manejador del spool, email_metadata, tenant_id)
+Documento = Tuple[str, Union[bytes, Dict[str, Any]], Optional[Dict[str, Any]], Optional[str]]
+
+_NUMERO_EN_ASUNTO = re.compile(r'\b[A-Z0-9\-]{3,20}\b')
+_NIT_EN_ASUNTO = re.compile(r'\b\d{9,10}\b')
+_NOMBRE_REMITENTE = re.compile(r'^(.*?)<.*>$')
+
+def extraer_documento(filename: str, file_binary_content: Union[bytes, Dict[str, Any]], email_metadata: Dict[str, Any] = None, tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Parte pura del procesamiento (descompresión, parseo del XML, datos del cuerpo del correo
+    y valores por defecto), sin acceso a la base de datos. Es una función de módulo para
+    poder ejecutarse en un pool de procesos.
+    """
+    email_metadata = email_metadata or {}
+    # Los trabajos de la cola guardan asunto_correo/remitente_correo/correo_cliente_asociado;
+    # las llamadas directas traen el correo tal como lo lee el lector (subject/from/correo_cliente).
+    asunto = email_metadata.get("asunto_correo") or email_metadata.get("subject", "")
+    remitente = email_metadata.get("remitente_correo") or email_metadata.get("from", "")
+    correo_cliente = email_metadata.get("correo_cliente_asociado") or email_metadata.get("correo_cliente") or remitente
+    extracted_invoice_data = {
+        "procesado_en": datetime.now(),
+        "ruta_archivo_original": filename,
+        "cufe": None,
+        "numero_factura": None,
+        "fecha_emision": None,
+        "hora_emision": None,
+        "monto_subtotal": None,
+        "monto_impuesto": None,
+        "monto_total": None,
+        "moneda": None,
+        "nombre_proveedor": None,
+        "nit_proveedor": None,
+        "email_proveedor": None,
+        "nombre_cliente": None,
+        "nit_cliente": None,
+        "fecha_vencimiento": None,
+        "metodo_pago": None,
+        "texto_crudo_xml": None,
+        "contenido_pdf_binario": None,
+        "usuario_id": None, 
+        "items": [],
+        "asunto_correo": asunto,
+        "remitente_correo": remitente,
+        "correo_cliente_asociado": correo_cliente,
+        "uid": email_metadata.get("uid"),
+        # No añadir tenant_id aquí, se pasará como argumento separado al CRUD
+        # "tenant_id": tenant_id 
+    }
+
+    xml_content_str = None
+    pdf_binary_content = None
+
+    if filename.lower().endswith('.zip'):
+        try:
+            origen = file_binary_content["ruta"] if es_manejador(file_binary_content) else io.BytesIO(file_binary_content)
+            with zipfile.ZipFile(origen, 'r') as zf:
+                for zinfo in zf.infolist():
+                    with zf.open(zinfo.filename) as f:
+                        inner_file_binary = f.read()
+                        if zinfo.filename.lower().endswith('.xml'):
+                            xml = extract_nested_invoice_xml(inner_file_binary)
+                            if xml:
+                                xml_content_str = xml
+                        elif zinfo.filename.lower().endswith('.pdf'):
+                            pdf_binary_content = inner_file_binary
+        except Exception as e:
+            logger.error(f"Error procesando archivo ZIP {filename}: {e}", exc_info=True)
+            return None
+    elif filename.lower().endswith('.pdf'):
+        pdf_binary_content = leer_bytes(file_binary_content)
+    elif filename.lower().endswith('.xml'):
+        try:
+            xml_content_str = leer_bytes(file_binary_content).decode('utf-8')
+        except UnicodeDecodeError:
+            logger.error(f"Error de decodificación Unicode para archivo XML {filename}.", exc_info=True)
+            return None
+    else:
+        logger.warning(f"Tipo de archivo no soportado o desconocido: {filename}")
+        return None
+    
+    parsed_xml_data = None
+    if xml_content_str:
+        try:
+            parsed_xml_data = parse_invoice_xml(xml_content_str)
+            if parsed_xml_data:
+                extracted_invoice_data.update(parsed_xml_data)
+                extracted_invoice_data['texto_crudo_xml'] = xml_content_str
+        except Exception as e:
+            logger.warning(f"Error al parsear XML de {filename}: {e}", exc_info=True)
+    
+    email_body_content = leer_texto(email_metadata.get("body"))
+    if email_body_content:
+        extracted_from_body = extraer_cuerpo_correo(email_body_content, tenant_id or email_metadata.get("tenant_id"), remitente)
+        for key, value in extracted_from_body.items():
+            if value is not None and not extracted_invoice_data.get(key): 
+                extracted_invoice_data[key] = value
+
+    if pdf_binary_content:
+        extracted_invoice_data['contenido_pdf_binario'] = pdf_binary_content
+    
+    if not extracted_invoice_data.get('numero_factura'):
+        match = _NUMERO_EN_ASUNTO.search(extracted_invoice_data.get('asunto_correo', ''))
+        if match:
+            extracted_invoice_data['numero_factura'] = match.group(0).strip()
+        else:
+            extracted_invoice_data['numero_factura'] = extracted_invoice_data.get('uid') or f"TEMP_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+    
+    if not extracted_invoice_data.get('nit_proveedor'):
+        match = _NIT_EN_ASUNTO.search(extracted_invoice_data.get('asunto_correo', ''))
+        if match:
+            extracted_invoice_data['nit_proveedor'] = match.group(0)
+    
+    if not extracted_invoice_data.get('nombre_proveedor') and extracted_invoice_data.get('remitente_correo'):
+        match_name = _NOMBRE_REMITENTE.match(extracted_invoice_data['remitente_correo'])
+        if match_name:
+            extracted_invoice_data['nombre_proveedor'] = match_name.group(1).strip()
+        else:
+            extracted_invoice_data['nombre_proveedor'] = extracted_invoice_data['remitente_correo'].split('@')[0].replace('.', ' ').title()
+
+    return extracted_invoice_data
+
+class PoolProcesos(Executor):
+    """
+    ProcessPoolExecutor que se reemplaza por uno nuevo cuando un proceso muere (p. ej. por falta
+    de memoria). Un ProcessPoolExecutor roto rechaza todo lo que se le envíe después, y el pool se
+    comparte entre los trabajadores durante toda la vida del servicio.
+    """
+
+    def __init__(self, max_workers: int):
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool = self._nuevo_pool()
+
+    def _nuevo_pool(self) -> ProcessPoolExecutor:
+        # "spawn": el worker tiene hilos (IMAP, cola) y conexiones abiertas que no deben heredarse con fork.
+        return ProcessPoolExecutor(max_workers=self._max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, fn, /, *args, **kwargs):
+        pool = self._pool
+        try:
+            return pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    logger.warning("Un proceso del pool de parseo terminó abruptamente. Se crea un pool nuevo.")
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._nuevo_pool()
+                pool = self._pool
+            return pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+def crear_pool_procesos(max_workers: Optional[int] = None) -> PoolProcesos:
+    return PoolProcesos(max_workers or settings.PARSE_PROCESS_WORKERS or os.cpu_count() or 1)
+
 class InvoiceService:
     def __init__(self):
         self.db_session = SessionLocal()
@@ -24,139 +190,38 @@ class InvoiceService:
         except Exception as e:
             logger.error(f"Error al cerrar la sesión de base de datos: {e}", exc_info=True)
 
-    def _extract_from_email_body(self, body_content: str) -> Dict[str, Any]:
-        extracted_data = {}
-        body_content = body_content.replace('\r\n', '\n').replace('\r', '\n')
-        patterns = {
-            'nombre_proveedor': r'Empresa:\s*(.+)',
-            'nit_proveedor': r'Identificación:\s*(\d{9,10})',
-            'fecha_emision': r'Fecha:\s*(\d{4}-\d{2}-\d{2})',
-            'numero_factura': r'Número:\s*([A-Za-z0-9\-\_]+)',
-            'cufe': r'CUFE:\s*([a-f0-9]{64,128})'
-        }
-        for key, pattern in patterns.items():
-            match = re.search(pattern, body_content, re.IGNORECASE)
-            if match:
-                value = match.group(1).strip()
-                if key == 'fecha_emision':
-                    try:
-                        extracted_data[key] = datetime.strptime(value, '%Y-%m-%d').date()
-                    except ValueError:
-                        continue
-                else:
-                    extracted_data[key] = value
-        return extracted_data
-
-    def process_document(self, filename: str, file_binary_content: bytes, email_metadata: Dict[str, Any] = None, tenant_id: str = None) -> Optional[int]:
-        email_metadata = email_metadata or {}
-        
-        if tenant_id is None:
-            tenant_id = email_metadata.get("tenant_id")
-
-        if tenant_id is None:
-            logger.error(f"No se pudo determinar el tenant_id para el procesamiento de la factura '{filename}'. Saltando.")
-            return None
-
+    def _buscar_duplicado(self, filename: str, file_binary_content: Union[bytes, Dict[str, Any]], tenant_id: str) -> Tuple[str, int, Optional[int]]:
+        # Un adjunto idéntico ya convertido en factura se resuelve sin descomprimir ni parsear.
+        contar("adjuntos")
+        if es_manejador(file_binary_content):
+            sha256, tamano = file_binary_content["sha256"], file_binary_content.get("tamano", 0)
+        else:
+            sha256, tamano = hashlib.sha256(file_binary_content).hexdigest(), len(file_binary_content)
+        factura_existente = buscar_factura_por_hash(tenant_id, sha256)
+        if factura_existente:
+            if self.invoice_crud.invoice_exists(factura_existente, tenant_id):
+                contar_omitido("hash", tamano)
+                logger.info(f"Adjunto '{filename}' ya procesado como factura {factura_existente} (tenant: {tenant_id}). Se omite.")
+                return sha256, tamano, factura_existente
+            olvidar_hash(tenant_id, sha256)
+        return sha256, tamano, None
+
+    def _guardar_documento(self, filename: str, extracted_invoice_data: Dict[str, Any], tenant_id: str, sha256: str, tamano: int = 0) -> Optional[int]:
         set_current_audit_tenant_id(tenant_id)
-        
-        extracted_invoice_data = {
-            "procesado_en": datetime.now(),
-            "ruta_archivo_original": filename,
-            "cufe": None,
-            "numero_factura": None,
-            "fecha_emision": None,
-            "hora_emision": None,
-            "monto_subtotal": None,
-            "monto_impuesto": None,
-            "monto_total": None,
-            "moneda": None,
-            "nombre_proveedor": None,
-            "nit_proveedor": None,
-            "email_proveedor": None,
-            "nombre_cliente": None,
-            "nit_cliente": None,
-            "fecha_vencimiento": None,
-            "metodo_pago": None,
-            "texto_crudo_xml": None,
-            "contenido_pdf_binario": None,
-            "usuario_id": None, 
-            "items": [],
-            "asunto_correo": email_metadata.get("subject", ""),
-            "remitente_correo": email_metadata.get("from", ""),
-            "correo_cliente_asociado": email_metadata.get("correo_cliente") or email_metadata.get("from", ""),
-            "uid": email_metadata.get("uid"),
-            # No añadir tenant_id aquí, se pasará como argumento separado al CRUD
-            # "tenant_id": tenant_id 
-        }
-
-        xml_content_str = None
-        pdf_binary_content = None
-
-        if filename.lower().endswith('.zip'):
-            try:
-                with zipfile.ZipFile(io.BytesIO(file_binary_content), 'r') as zf:
-                    for zinfo in zf.infolist():
-                        with zf.open(zinfo.filename) as f:
-                            inner_file_binary = f.read()
-                            if zinfo.filename.lower().endswith('.xml'):
-                                xml = extract_nested_invoice_xml(inner_file_binary)
-                                if xml:
-                                    xml_content_str = xml
-                            elif zinfo.filename.lower().endswith('.pdf'):
-                                pdf_binary_content = inner_file_binary
-            except Exception as e:
-                logger.error(f"Error procesando archivo ZIP {filename}: {e}", exc_info=True)
-                return None
-        elif filename.lower().endswith('.pdf'):
-            pdf_binary_content = file_binary_content
-        elif filename.lower().endswith('.xml'):
-            try:
-                xml_content_str = file_binary_content.decode('utf-8')
-            except UnicodeDecodeError:
-                logger.error(f"Error de decodificación Unicode para archivo XML {filename}.", exc_info=True)
+        set_current_audit_user_id(None)
+
+        cufe = extracted_invoice_data.get('cufe')
+        if cufe:
+            propietario = self.invoice_crud.get_invoice_owner_by_cufe(cufe)
+            if propietario:
+                factura_id, tenant_propietario = propietario
+                contar_omitido("cufe", tamano)
+                if tenant_propietario == tenant_id:
+                    registrar_hash(tenant_id, sha256, factura_id)
+                    logger.info(f"CUFE de '{filename}' ya registrado como factura {factura_id} (tenant: {tenant_id}). Se omite.")
+                    return factura_id
+                logger.warning(f"CUFE de '{filename}' ya está registrado para otro tenant. La factura no se guardará para '{tenant_id}'.")
                 return None
-        else:
-            logger.warning(f"Tipo de archivo no soportado o desconocido: {filename}")
-            return None
-        
-        parsed_xml_data = None
-        if xml_content_str:
-            try:
-                parsed_xml_data = parse_invoice_xml(xml_content_str)
-                if parsed_xml_data:
-                    extracted_invoice_data.update(parsed_xml_data)
-                    extracted_invoice_data['texto_crudo_xml'] = xml_content_str
-            except Exception as e:
-                logger.warning(f"Error al parsear XML de {filename}: {e}", exc_info=True)
-        
-        email_body_content = email_metadata.get("body")
-        if email_body_content:
-            extracted_from_body = self._extract_from_email_body(email_body_content)
-            for key, value in extracted_from_body.items():
-                if value is not None and not extracted_invoice_data.get(key): 
-                    extracted_invoice_data[key] = value
-
-        if pdf_binary_content:
-            extracted_invoice_data['contenido_pdf_binario'] = pdf_binary_content
-        
-        if not extracted_invoice_data.get('numero_factura'):
-            match = re.search(r'\b[A-Z0-9\-]{3,20}\b', extracted_invoice_data.get('asunto_correo', ''))
-            if match:
-                extracted_invoice_data['numero_factura'] = match.group(0).strip()
-            else:
-                extracted_invoice_data['numero_factura'] = extracted_invoice_data.get('uid') or f"TEMP_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
-        
-        if not extracted_invoice_data.get('nit_proveedor'):
-            match = re.search(r'\b\d{9,10}\b', extracted_invoice_data.get('asunto_correo', ''))
-            if match:
-                extracted_invoice_data['nit_proveedor'] = match.group(0)
-        
-        if not extracted_invoice_data.get('nombre_proveedor') and extracted_invoice_data.get('remitente_correo'):
-            match_name = re.match(r'^(.*?)<.*>$', extracted_invoice_data['remitente_correo'])
-            if match_name:
-                extracted_invoice_data['nombre_proveedor'] = match_name.group(1).strip()
-            else:
-                extracted_invoice_data['nombre_proveedor'] = extracted_invoice_data['remitente_correo'].split('@')[0].replace('.', ' ').title()
         
         correo_cliente_asociado_final = extracted_invoice_data.get('correo_cliente_asociado')
         if correo_cliente_asociado_final:
@@ -178,12 +243,178 @@ class InvoiceService:
         invoice_id = self.invoice_crud.create_invoice(extracted_invoice_data, items_to_save, tenant_id)
         
         if invoice_id:
+            contar("guardadas")
+            registrar_hash(tenant_id, sha256, invoice_id)
             logger.info(f"Factura procesada y guardada con éxito. ID: {invoice_id}. Número: {extracted_invoice_data.get('numero_factura')}")
         else:
             logger.error(f"Fallo al guardar la factura para el archivo: {filename}. Revisa logs del CRUD para más detalles.")
         
         return invoice_id if invoice_id else None
 
+    def process_document(self, filename: str, file_binary_content: Union[bytes, Dict[str, Any]], email_metadata: Dict[str, Any] = None, tenant_id: str = None) -> Optional[int]:
+        # `file_binary_content` puede ser el contenido o un manejador del spool ({"ruta", "sha256", ...}).
+        email_metadata = email_metadata or {}
+        
+        if tenant_id is None:
+            tenant_id = email_metadata.get("tenant_id")
+
+        if tenant_id is None:
+            logger.error(f"No se pudo determinar el tenant_id para el procesamiento de la factura '{filename}'. Saltando.")
+            return None
+
+        sha256, tamano, factura_existente = self._buscar_duplicado(filename, file_binary_content, tenant_id)
+        if factura_existente:
+            return factura_existente
+
+        extracted_invoice_data = extraer_documento(filename, file_binary_content, email_metadata, tenant_id)
+        if extracted_invoice_data is None:
+            return None
+        return self._guardar_documento(filename, extracted_invoice_data, tenant_id, sha256, tamano)
+
+    def process_documents(self, documentos: Iterable[Documento], executor: Optional[Executor] = None, tamano_lote: Optional[int] = None) -> Iterator[Tuple[Optional[int], Optional[Exception]]]:
+        """
+        Versión por lotes de `process_document` para reprocesos grandes. La descompresión y el
+        parseo se reparten en un pool de procesos; los resultados se guardan en el orden de
+        entrada, lote a lote, mientras el pool ya parsea el lote siguiente.
+        Entrega un (invoice_id, error) por documento, en el mismo orden. (None, None) indica un
+        descarte definitivo (tipo no soportado, sin número ni CUFE, CUFE de otro tenant, conflicto
+        de número); cualquier fallo que pueda resolverse reintentando llega como (None, error),
+        incluidos la caída de un proceso del pool y el parseo que supera PARSE_TIMEOUT_SECONDS.
+        """
+        tamano_lote = tamano_lote or settings.PARSE_BATCH_SIZE
+        propio = executor is None
+        if propio:
+            executor = crear_pool_procesos()
+        try:
+            documentos = iter(documentos)
+            pendiente = self._enviar_lote(executor, list(islice(documentos, tamano_lote)))
+            while pendiente:
+                siguiente = self._enviar_lote(executor, list(islice(documentos, tamano_lote)))
+                yield from self._guardar_lote(pendiente)
+                pendiente = siguiente
+        finally:
+            if propio:
+                executor.shutdown(wait=True)
+
+    def _enviar_lote(self, executor: Executor, lote: list) -> list:
+        enviados = []
+        for filename, file_binary_content, email_metadata, tenant_id in lote:
+            email_metadata = email_metadata or {}
+            tenant_id = tenant_id or email_metadata.get("tenant_id")
+            if tenant_id is None:
+                logger.error(f"No se pudo determinar el tenant_id para el procesamiento de la factura '{filename}'. Saltando.")
+                enviados.append((filename, None, None, 0, None, None))
+                continue
+            try:
+                sha256, tamano, factura_existente = self._buscar_duplicado(filename, file_binary_content, tenant_id)
+            except Exception as e:
+                enviados.append((filename, tenant_id, None, 0, None, e))
+                continue
+            if factura_existente:
+                enviados.append((filename, tenant_id, sha256, tamano, factura_existente, None))
+                continue
+            try:
+                futuro = executor.submit(extraer_documento, filename, file_binary_content, email_metadata, tenant_id)
+            except Exception as e:
+                enviados.append((filename, tenant_id, sha256, tamano, None, e))
+                continue
+            enviados.append((filename, tenant_id, sha256, tamano, futuro, None))
+        return enviados
+
+    def _guardar_lote(self, enviados: list) -> Iterator[Tuple[Optional[int], Optional[Exception]]]:
+        # Todas las facturas nuevas del lote se escriben con create_invoices_bulk (un INSERT de
+        # varias filas por tabla y un solo commit) en lugar de una transacción por documento.
+        resultados, preparados = [], []
+        for filename, tenant_id, sha256, tamano, resultado, error in enviados:
+            if error is not None or tenant_id is None:
+                resultados.append((None, error))
+                continue
+            if isinstance(resultado, int):
+                resultados.append((resultado, None))
+                continue
+            try:
+                extracted_invoice_data = resultado.result(timeout=settings.PARSE_TIMEOUT_SECONDS)
+            except FuturoVencido as e:
+                # El proceso sigue ocupado hasta que termine; el trabajo vuelve a la cola.
+                resultado.cancel()
+                logger.error(f"El parseo de '{filename}' para tenant '{tenant_id}' superó {settings.PARSE_TIMEOUT_SECONDS}s.")
+                resultados.append((None, e))
+                continue
+            except Exception as e:
+                logger.error(f"Error procesando '{filename}' en lote para tenant '{tenant_id}': {e}", exc_info=True)
+                resultados.append((None, e))
+                continue
+            if extracted_invoice_data is None:
+                resultados.append((None, None))
+                continue
+            extracted_invoice_data.pop('uid', None)
+            if not extracted_invoice_data.get('numero_factura') and not extracted_invoice_data.get('cufe'):
+                logger.warning(f"Factura '{filename}' no tiene número de factura ni CUFE. No se guardará.")
+                resultados.append((None, None))
+                continue
+            preparados.append((len(resultados), filename, extracted_invoice_data, tenant_id, sha256, tamano))
+            resultados.append(None)
+
+        if preparados:
+            try:
+                self._guardar_preparados(preparados, resultados)
+            except Exception as e:
+                logger.error(f"Error guardando lote de {len(preparados)} factura(s): {e}", exc_info=True)
+                self.db_session.rollback()
+                for posicion, *_ in preparados:
+                    if resultados[posicion] is None:
+                        resultados[posicion] = (None, e)
+        yield from resultados
+
+    def _guardar_preparados(self, preparados: list, resultados: list):
+        set_current_audit_user_id(None)
+        correos = {(tenant_id, data.get('correo_cliente_asociado')) for _, _, data, tenant_id, _, _ in preparados if data.get('correo_cliente_asociado')}
+        usuarios = {}
+        if correos:
+            filas = self.db_session.query(Usuario.id, Usuario.correo, Usuario.tenant_id).filter(
+                Usuario.correo.in_({correo for _, correo in correos}), Usuario.tenant_id.in_({tenant for tenant, _ in correos})
+            ).all()
+            usuarios = {(tenant, correo): user_id for user_id, correo, tenant in filas}
+
+        facturas = []
+        for _, filename, data, tenant_id, _, _ in preparados:
+            correo = data.get('correo_cliente_asociado')
+            if correo:
+                if (tenant_id, correo) in usuarios:
+                    data['usuario_id'] = usuarios[(tenant_id, correo)]
+                else:
+                    logger.warning(f"Usuario asociado '{correo}' no encontrado para tenant '{tenant_id}'. La factura se guardará sin usuario_id asociado.")
+            facturas.append((data, data.pop('items', []), tenant_id))
+
+        guardadas = self.invoice_crud.create_invoices_bulk(facturas)
+        if guardadas is None:
+            # El lote falló completo: se reintenta documento a documento para aislar el problema.
+            logger.warning(f"Fallo el guardado en bloque de {len(facturas)} factura(s). Reintentando una por una.")
+            for (posicion, filename, data, tenant_id, sha256, tamano), (_, items, _) in zip(preparados, facturas):
+                data['items'] = items
+                try:
+                    resultados[posicion] = (self._guardar_documento(filename, data, tenant_id, sha256, tamano), None)
+                except Exception as e:
+                    logger.error(f"Error guardando '{filename}' para tenant '{tenant_id}': {e}", exc_info=True)
+                    self.db_session.rollback()
+                    resultados[posicion] = (None, e)
+            return
+
+        for (posicion, filename, data, tenant_id, sha256, tamano), (invoice_id, creada) in zip(preparados, guardadas):
+            if invoice_id:
+                if creada:
+                    contar("guardadas")
+                else:
+                    contar_omitido("cufe", tamano)
+                registrar_hash(tenant_id, sha256, invoice_id)
+                if creada:
+                    logger.info(f"Factura procesada y guardada con éxito. ID: {invoice_id}. Número: {data.get('numero_factura')}")
+                else:
+                    logger.info(f"CUFE de '{filename}' ya registrado como factura {invoice_id} (tenant: {tenant_id}). Se omite.")
+            else:
+                logger.error(f"Fallo al guardar la factura para el archivo: {filename}. Revisa logs del CRUD para más detalles.")
+            resultados[posicion] = (invoice_id, None)
+
 
 
 # import os
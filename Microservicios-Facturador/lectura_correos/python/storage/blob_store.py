@@ -0,0 +1,188 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import BinaryIO, Iterator, Optional
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# PDF y XML de las facturas viven fuera de la tabla `facturas`: la fila guarda solo la clave
+# (SHA-256 del contenido) y los bytes se leen aquí cuando alguien los descarga. Un mismo
+# contenido se almacena una sola vez.
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+class BlobStore:
+    """Almacén de contenidos direccionado por SHA-256."""
+
+    def guardar(self, datos: bytes) -> str:
+        raise NotImplementedError
+
+    def abrir(self, clave: str) -> BinaryIO:
+        """Archivo binario de solo lectura; FileNotFoundError si la clave no existe."""
+        raise NotImplementedError
+
+    def existe(self, clave: str) -> bool:
+        raise NotImplementedError
+
+    def eliminar(self, clave: str):
+        raise NotImplementedError
+
+    def leer(self, clave: str) -> bytes:
+        with self.abrir(clave) as f:
+            return f.read()
+
+    def iterar(self, clave: str, tamano_bloque: int = TAMANO_BLOQUE) -> Iterator[bytes]:
+        with self.abrir(clave) as f:
+            while True:
+                bloque = f.read(tamano_bloque)
+                if not bloque:
+                    return
+                yield bloque
+
+
+def _clave(datos: bytes) -> str:
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _escribir_atomico(ruta: str, datos: bytes):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+class LocalBlobStore(BlobStore):
+    """Sistema de archivos local: raiz/ab/cd/<sha256>."""
+
+    def __init__(self, raiz: str):
+        self.raiz = raiz
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.raiz, clave[:2], clave[2:4], clave)
+
+    def guardar(self, datos: bytes) -> str:
+        clave = _clave(datos)
+        ruta = self._ruta(clave)
+        if not os.path.exists(ruta):
+            _escribir_atomico(ruta, datos)
+        return clave
+
+    def abrir(self, clave: str) -> BinaryIO:
+        return open(self._ruta(clave), 'rb')
+
+    def existe(self, clave: str) -> bool:
+        return os.path.exists(self._ruta(clave))
+
+    def eliminar(self, clave: str):
+        try:
+            os.remove(self._ruta(clave))
+        except FileNotFoundError:
+            pass
+
+
+class ObjectStore:
+    """
+    Interfaz mínima de un almacenamiento de objetos (S3, GCS, MinIO...). Un cliente real solo
+    tiene que implementar estos cuatro métodos para usarse con ObjectStoreBlobStore.
+    """
+
+    def put_object(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def get_object(self, key: str) -> BinaryIO:
+        """Cuerpo del objeto como archivo binario; FileNotFoundError si no existe."""
+        raise NotImplementedError
+
+    def head_object(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete_object(self, key: str):
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    """Sustituto local de un bucket (desarrollo y pruebas): cada clave es un archivo."""
+
+    def __init__(self, raiz: str):
+        self.raiz = raiz
+
+    def _ruta(self, key: str) -> str:
+        ruta = os.path.normpath(os.path.join(self.raiz, key))
+        if not ruta.startswith(os.path.normpath(self.raiz) + os.sep):
+            raise ValueError(f"Clave de objeto inválida: {key}")
+        return ruta
+
+    def put_object(self, key: str, data: bytes):
+        _escribir_atomico(self._ruta(key), data)
+
+    def get_object(self, key: str) -> BinaryIO:
+        return open(self._ruta(key), 'rb')
+
+    def head_object(self, key: str) -> bool:
+        return os.path.exists(self._ruta(key))
+
+    def delete_object(self, key: str):
+        try:
+            os.remove(self._ruta(key))
+        except FileNotFoundError:
+            pass
+
+
+class ObjectStoreBlobStore(BlobStore):
+    def __init__(self, cliente: ObjectStore, prefijo: str = "facturas/"):
+        self.cliente = cliente
+        self.prefijo = prefijo
+
+    def _key(self, clave: str) -> str:
+        return f"{self.prefijo}{clave[:2]}/{clave}"
+
+    def guardar(self, datos: bytes) -> str:
+        clave = _clave(datos)
+        if not self.cliente.head_object(self._key(clave)):
+            self.cliente.put_object(self._key(clave), datos)
+        return clave
+
+    def abrir(self, clave: str) -> BinaryIO:
+        return self.cliente.get_object(self._key(clave))
+
+    def existe(self, clave: str) -> bool:
+        return self.cliente.head_object(self._key(clave))
+
+    def eliminar(self, clave: str):
+        self.cliente.delete_object(self._key(clave))
+
+
+_blob_store: Optional[BlobStore] = None
+_lock = threading.Lock()
+
+
+def configurar_blob_store(store: BlobStore):
+    """Reemplaza el almacén por defecto (p. ej. un ObjectStoreBlobStore con un cliente S3)."""
+    global _blob_store
+    with _lock:
+        _blob_store = store
+
+
+def obtener_blob_store() -> BlobStore:
+    global _blob_store
+    with _lock:
+        if _blob_store is None:
+            backend = settings.BLOB_STORE_BACKEND.lower()
+            if backend == "local":
+                _blob_store = LocalBlobStore(settings.BLOB_STORE_DIR)
+            elif backend == "object":
+                _blob_store = ObjectStoreBlobStore(LocalObjectStore(settings.BLOB_STORE_DIR))
+            else:
+                raise ValueError(f"BLOB_STORE_BACKEND desconocido: '{settings.BLOB_STORE_BACKEND}' (use 'local' u 'object').")
+            logger.info(f"Almacén de blobs '{backend}' en {settings.BLOB_STORE_DIR}.")
+        return _blob_store
@@ -0,0 +1,64 @@
+"""
+Mueve al almacén de blobs el PDF y el XML guardados en línea en `facturas` (filas anteriores
+al almacén) y deja en la fila solo la clave. Se puede interrumpir y volver a ejecutar.
+
+Uso (desde lectura_correos/python):
+    python -m storage.migrar_blobs [--lote 100]
+"""
+import os
+import sys
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import update  # noqa: E402
+from database.models import SessionLocal, Factura  # noqa: E402
+from storage.blob_store import obtener_blob_store  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+_COLUMNAS = (
+    (Factura.contenido_pdf_binario, Factura.pdf_blob_key),
+    (Factura.texto_crudo_xml, Factura.xml_blob_key),
+)
+
+
+def migrar(lote: int = 100) -> int:
+    store = obtener_blob_store()
+    movidos = 0
+    db = SessionLocal()
+    try:
+        for columna, columna_clave in _COLUMNAS:
+            ultimo_id = 0
+            while True:
+                filas = db.query(Factura.id, columna).filter(
+                    Factura.id > ultimo_id, columna.isnot(None), columna_clave.is_(None)
+                ).order_by(Factura.id).limit(lote).all()
+                if not filas:
+                    break
+                for factura_id, contenido in filas:
+                    datos = contenido.encode('utf-8') if isinstance(contenido, str) else contenido
+                    db.execute(
+                        update(Factura.__table__).where(Factura.id == factura_id)
+                        .values({columna_clave.key: store.guardar(datos), columna.key: None})
+                    )
+                db.commit()
+                ultimo_id = filas[-1][0]
+                movidos += len(filas)
+                logger.info(f"{movidos} contenido(s) movidos al almacén de blobs (última factura: {ultimo_id}).")
+    finally:
+        db.close()
+    return movidos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lote', type=int, default=100, help="Facturas leídas y confirmadas por transacción")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(f"Contenidos movidos al almacén de blobs: {migrar(args.lote)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+import time
+import uuid
+import tempfile
+
+import pytest
+from cryptography.fernet import Fernet
+
+# config.settings exige estas variables al importarse: las pruebas usan una base SQLite y un
+# directorio temporal propios, sin tocar los de un .env local.
+_DIRECTORIO = tempfile.mkdtemp(prefix="lectura-correos-pruebas-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DIRECTORIO, 'pruebas.sqlite')}")
+os.environ.setdefault("SECRET_KEY", "pruebas")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("TMP_DIR", os.path.join(_DIRECTORIO, "tmp"))
+os.environ.setdefault("BLOB_STORE_DIR", os.path.join(_DIRECTORIO, "blobs"))
+
+
+@pytest.fixture(scope="session")
+def base_de_datos():
+    """Esquema migrado (alembic) en la base SQLite de las pruebas."""
+    from database.models import init_db
+    init_db()
+
+
+@pytest.fixture
+def db(base_de_datos):
+    from database.models import SessionLocal
+    sesion = SessionLocal()
+    yield sesion
+    sesion.close()
+
+
+@pytest.fixture
+def tenant_id():
+    # Un inquilino por prueba: los datos de una prueba no se ven desde otra.
+    return f"tenant-{uuid.uuid4().hex[:8]}"
+
+
+@pytest.fixture
+def cliente(base_de_datos):
+    from fastapi.testclient import TestClient
+    from api.main import app
+    with TestClient(app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def encabezados(tenant_id):
+    """Authorization con un token válido para el inquilino de la prueba."""
+    from jose import jwt
+    from config.settings import settings
+    token = jwt.encode({"id_empresa": tenant_id, "sub": "1", "exp": int(time.time()) + 3600}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
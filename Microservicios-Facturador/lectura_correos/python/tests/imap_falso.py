@@ -0,0 +1,192 @@
+import re
+import base64
+import socket
+import threading
+import socketserver
+
+# Servidor IMAP mínimo en proceso para las pruebas de ingesta: entiende solo los comandos que
+# usan imap_tools y el lector incremental (LOGIN, SELECT, STATUS, UID SEARCH, UID FETCH de
+# BODYSTRUCTURE/encabezados/partes, UID STORE, IDLE/DONE, LOGOUT). Cada mensaje es un texto
+# plano más un adjunto (un PDF, salvo que se indique otro nombre).
+
+
+def _partes(uid: int, asunto: str, cuerpo: str, pdf: bytes, nombre: str = None):
+    nombre = nombre or f"f{uid}.pdf"
+    encabezado = f"From: facturas@proveedor.co\r\nSubject: {asunto}\r\n\r\n".encode()
+    adjunto = base64.b64encode(pdf)
+    estructura = (
+        f'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" {len(cuerpo)} 1)'
+        f'("APPLICATION" "PDF" ("NAME" "{nombre}") NIL NIL "BASE64" {len(adjunto)} NIL '
+        f'("ATTACHMENT" ("FILENAME" "{nombre}")) NIL) "MIXED")'
+    )
+    return encabezado, estructura, {"1": cuerpo.encode(), "2": adjunto}
+
+
+class _Sesion(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.en_idle = False
+        self.etiqueta_idle = None
+        self._escritura = threading.Lock()
+
+    def escribir(self, datos: bytes):
+        with self._escritura:
+            self.wfile.write(datos)
+            self.wfile.flush()
+
+    def handle(self):
+        falso = self.server.falso
+        with falso.lock:
+            falso.sesiones.append(self)
+        try:
+            self.escribir(b"* OK servidor de pruebas listo\r\n")
+            while True:
+                linea = self.rfile.readline()
+                if not linea:
+                    return
+                linea = linea.decode().rstrip("\r\n")
+                if self.en_idle:
+                    if linea.upper() == "DONE":
+                        self.en_idle = False
+                        self.escribir(f"{self.etiqueta_idle} OK IDLE terminado\r\n".encode())
+                    continue
+                etiqueta, _, resto = linea.partition(" ")
+                comando, _, argumentos = resto.partition(" ")
+                if not self._responder(falso, etiqueta, comando.upper(), argumentos):
+                    return
+        except OSError:
+            return
+        finally:
+            with falso.lock:
+                falso.sesiones.remove(self)
+
+    def _responder(self, falso, etiqueta: str, comando: str, argumentos: str) -> bool:
+        if comando == "CAPABILITY":
+            self.escribir(f"* CAPABILITY IMAP4rev1 IDLE UIDPLUS\r\n{etiqueta} OK listo\r\n".encode())
+        elif comando == "LOGIN":
+            falso.logins += 1
+            self.escribir(f"{etiqueta} OK sesión iniciada\r\n".encode())
+        elif comando in ("SELECT", "EXAMINE"):
+            self.escribir((
+                f"* {len(falso.mensajes)} EXISTS\r\n* OK [UIDVALIDITY {falso.uidvalidity}]\r\n"
+                f"* OK [UIDNEXT {falso.uidnext}]\r\n{etiqueta} OK [READ-WRITE] listo\r\n"
+            ).encode())
+        elif comando == "STATUS":
+            self.escribir((
+                f"* STATUS INBOX (UIDVALIDITY {falso.uidvalidity} UIDNEXT {falso.uidnext})\r\n{etiqueta} OK listo\r\n"
+            ).encode())
+        elif comando == "IDLE":
+            self.etiqueta_idle = etiqueta
+            self.en_idle = True
+            self.escribir(b"+ esperando\r\n")
+        elif comando == "NOOP":
+            self.escribir(f"{etiqueta} OK listo\r\n".encode())
+        elif comando == "LOGOUT":
+            self.escribir(f"* BYE\r\n{etiqueta} OK listo\r\n".encode())
+            return False
+        elif comando == "UID":
+            self._uid(falso, etiqueta, argumentos)
+        else:
+            self.escribir(f"{etiqueta} BAD comando no soportado\r\n".encode())
+        return True
+
+    def _uid(self, falso, etiqueta: str, argumentos: str):
+        subcomando, _, resto = argumentos.partition(" ")
+        with falso.lock:
+            mensajes = list(falso.mensajes)
+        if subcomando.upper() == "SEARCH":
+            rango = re.search(r"(\d+):\*", resto)
+            desde = int(rango.group(1)) if rango else 1
+            uids = [m[0] for m in mensajes if m[0] >= desde]
+            if not uids and rango and mensajes:
+                # "n:*" incluye siempre el último mensaje (RFC 3501).
+                uids = [mensajes[-1][0]]
+            self.escribir(f"* SEARCH {' '.join(map(str, uids))}\r\n{etiqueta} OK listo\r\n".encode())
+        elif subcomando.upper() == "FETCH":
+            conjunto, _, items = resto.partition(" ")
+            pedidos = {int(uid) for uid in conjunto.split(",")}
+            with falso.lock:
+                falso.fetches.append((sorted(pedidos), items))
+            for numero, mensaje in enumerate(mensajes, 1):
+                if mensaje[0] not in pedidos:
+                    continue
+                encabezado, estructura, secciones = _partes(*mensaje)
+                salida = f"* {numero} FETCH (UID {mensaje[0]}".encode()
+                if "BODYSTRUCTURE" in items:
+                    salida += f" BODYSTRUCTURE {estructura}".encode()
+                if "HEADER.FIELDS" in items:
+                    salida += f" BODY[HEADER.FIELDS (FROM SUBJECT)] {{{len(encabezado)}}}\r\n".encode() + encabezado
+                for seccion in re.findall(r"BODY\.PEEK\[(\d+)\]", items):
+                    datos = secciones[seccion]
+                    salida += f" BODY[{seccion}] {{{len(datos)}}}\r\n".encode() + datos
+                self.escribir(salida + b")\r\n")
+            self.escribir(f"{etiqueta} OK listo\r\n".encode())
+        elif subcomando.upper() == "STORE":
+            conjunto, _, cambio = resto.partition(" ")
+            if "+FLAGS" in cambio.upper() and "\\SEEN" in cambio.upper():
+                with falso.lock:
+                    falso.vistos.update(int(uid) for uid in conjunto.split(","))
+            self.escribir(f"{etiqueta} OK listo\r\n".encode())
+        else:
+            self.escribir(f"{etiqueta} BAD subcomando no soportado\r\n".encode())
+
+
+class _Servidor(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ServidorImapFalso:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mensajes = []
+        self.sesiones = []
+        self.fetches = []
+        self.vistos = set()
+        self.uidnext = 1
+        self.uidvalidity = 7
+        self.logins = 0
+        self._servidor = _Servidor(("127.0.0.1", 0), _Sesion)
+        self._servidor.falso = self
+        self.puerto = self._servidor.server_address[1]
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+
+    def agregar(self, asunto: str, cuerpo: str = "Adjuntamos su documento.", pdf: bytes = b"%PDF-1.4 prueba", nombre: str = None):
+        """Agrega un mensaje y avisa EXISTS a las sesiones en IDLE."""
+        with self.lock:
+            self.mensajes.append((self.uidnext, asunto, cuerpo, pdf, nombre))
+            self.uidnext += 1
+            sesiones = [s for s in self.sesiones if s.en_idle]
+        for sesion in sesiones:
+            sesion.escribir(f"* {len(self.mensajes)} EXISTS\r\n".encode())
+
+    def en_idle(self) -> int:
+        with self.lock:
+            return sum(1 for s in self.sesiones if s.en_idle)
+
+    def despedir(self):
+        """Envía BYE a las sesiones abiertas y cierra su socket."""
+        with self.lock:
+            sesiones = list(self.sesiones)
+        for sesion in sesiones:
+            try:
+                sesion.escribir(b"* BYE cierre del servidor\r\n")
+            except OSError:
+                pass
+        self.cortar(sesiones)
+
+    def cortar(self, sesiones=None):
+        """Cierra los sockets sin aviso, como una conexión caída."""
+        if sesiones is None:
+            with self.lock:
+                sesiones = list(self.sesiones)
+        for sesion in sesiones:
+            try:
+                sesion.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def cerrar(self):
+        self.cortar()
+        self._servidor.shutdown()
+        self._servidor.server_close()
@@ -0,0 +1,131 @@
+import time
+import uuid
+import asyncio
+from datetime import date
+
+from jose import jwt
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from config.settings import settings
+from database.crud import InvoiceCRUD
+from database.crud_async import AsyncInvoiceCRUD
+from database.database import url_async
+
+
+def _factura(**extra):
+    sufijo = uuid.uuid4().hex[:8]
+    return {
+        "numero_factura": f"API-{sufijo}",
+        "cufe": f"cufe-{sufijo}",
+        "fecha_emision": "2024-03-01",
+        "monto_total": 1190.0,
+        "items": [{"descripcion": "Resma", "cantidad": 1, "valor_unitario": 1000.0, "valor_total": 1000.0}],
+        **extra,
+    }
+
+
+def _encabezados_de(tenant_id: str):
+    token = jwt.encode({"id_empresa": tenant_id, "sub": "1", "exp": int(time.time()) + 3600}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_ciclo_de_vida_de_una_factura(cliente, encabezados, tenant_id):
+    datos = _factura()
+    creada = cliente.post("/invoices/", json=datos, headers=encabezados)
+    assert creada.status_code == 201, creada.text
+    factura = creada.json()
+    assert factura["numero_factura"] == datos["numero_factura"]
+    assert factura["tenant_id"] == tenant_id
+    assert [item["descripcion"] for item in factura["items"]] == ["Resma"]
+
+    assert cliente.get(f"/invoices/{factura['id']}", headers=encabezados).json() == factura
+
+    actualizada = cliente.put(f"/invoices/{factura['id']}", json={
+        "monto_total": 2380.0,
+        "revisada_manualmente": True,
+        "items": [{"descripcion": "Tóner", "cantidad": 2, "valor_unitario": 1000.0, "valor_total": 2000.0}],
+    }, headers=encabezados)
+    assert actualizada.status_code == 200
+    assert actualizada.json()["monto_total"] == 2380.0
+    assert actualizada.json()["revisada_manualmente"] is True
+    assert [item["descripcion"] for item in actualizada.json()["items"]] == ["Tóner"]
+
+    [en_listado] = cliente.get("/invoices/", headers=encabezados).json()
+    assert en_listado["monto_total"] == 2380.0
+
+    assert cliente.delete(f"/invoices/{factura['id']}", headers=encabezados).status_code == 204
+    assert cliente.get(f"/invoices/{factura['id']}", headers=encabezados).status_code == 404
+    assert cliente.get("/invoices/", headers=encabezados).json() == []
+
+
+def test_items_de_una_factura(cliente, encabezados):
+    factura = cliente.post("/invoices/", json=_factura(items=[]), headers=encabezados).json()
+    url = f"/invoices/{factura['id']}/items/"
+
+    creado = cliente.post(url, json={"descripcion": "Grapas", "cantidad": 3, "valor_unitario": 5.0, "valor_total": 15.0}, headers=encabezados)
+    assert creado.status_code == 201
+    item = creado.json()
+    assert item["factura_id"] == factura["id"]
+
+    actualizado = cliente.put(f"{url}{item['id']}", json={"cantidad": 4, "valor_total": 20.0}, headers=encabezados)
+    assert actualizado.status_code == 200
+    assert (actualizado.json()["cantidad"], actualizado.json()["valor_total"], actualizado.json()["descripcion"]) == (4, 20.0, "Grapas")
+    assert cliente.get(f"{url}{item['id']}", headers=encabezados).json() == actualizado.json()
+
+    assert cliente.delete(f"{url}{item['id']}", headers=encabezados).status_code == 204
+    assert cliente.get(url, headers=encabezados).json() == []
+
+
+def test_usuarios(cliente, encabezados, tenant_id):
+    correo = f"{tenant_id}@empresa.com"
+    creado = cliente.post("/users/", json={"correo": correo, "password": "abcdefghijklmnop"}, headers=encabezados)
+    assert creado.status_code == 201, creado.text
+    usuario = creado.json()
+    assert (usuario["correo"], usuario["tenant_id"], usuario["is_active"]) == (correo, tenant_id, True)
+    assert cliente.post("/users/", json={"correo": correo, "password": "x"}, headers=encabezados).status_code == 400
+
+    actualizado = cliente.put(f"/users/{usuario['id']}", json={"is_active": False}, headers=encabezados)
+    assert actualizado.status_code == 200
+    assert actualizado.json()["is_active"] is False
+    assert [u["id"] for u in cliente.get("/users/", headers=encabezados).json()] == [usuario["id"]]
+
+    assert cliente.delete(f"/users/{usuario['id']}", headers=encabezados).status_code == 204
+    assert cliente.get(f"/users/{usuario['id']}", headers=encabezados).status_code == 404
+
+
+def test_otro_inquilino_no_ve_ni_modifica(cliente, encabezados, tenant_id):
+    factura = cliente.post("/invoices/", json=_factura(), headers=encabezados).json()
+    ajenos = _encabezados_de(f"{tenant_id}-otro")
+
+    assert cliente.get(f"/invoices/{factura['id']}", headers=ajenos).status_code == 404
+    assert cliente.put(f"/invoices/{factura['id']}", json={"monto_total": 1.0}, headers=ajenos).status_code == 404
+    assert cliente.delete(f"/invoices/{factura['id']}", headers=ajenos).status_code == 404
+    assert cliente.get(f"/invoices/{factura['id']}/items/", headers=ajenos).status_code == 404
+    assert cliente.get("/invoices/", headers=ajenos).json() == []
+    assert cliente.get(f"/invoices/{factura['id']}", headers=encabezados).json()["monto_total"] == 1190.0
+
+
+def test_relectura_tras_escribir_en_la_misma_sesion(db, tenant_id):
+    # La escritura corre en el threadpool con otra sesión: la relectura con la AsyncSession no
+    # debe devolver la copia que ya tenía en memoria de antes de escribir.
+    datos = {**_factura(), "fecha_emision": date(2024, 3, 1)}
+    items = datos.pop("items")
+    factura_id = InvoiceCRUD(db).create_invoice(datos, items, tenant_id)
+
+    async def escenario():
+        motor = create_async_engine(url_async(settings.DATABASE_URL), poolclass=NullPool)
+        try:
+            async with async_sessionmaker(motor, expire_on_commit=False, autoflush=False)() as sesion:
+                crud = AsyncInvoiceCRUD(sesion)
+                antes = await crud.get_invoice(factura_id, tenant_id)
+                monto_antes = antes.monto_total
+                await crud.update_invoice(tenant_id, factura_id, {"monto_total": 99.0}, [
+                    {"descripcion": "Nuevo", "cantidad": 1, "valor_unitario": 99.0, "valor_total": 99.0}
+                ])
+                despues = await crud.get_invoice(factura_id, tenant_id)
+                return monto_antes, despues.monto_total, [item.descripcion for item in despues.items]
+        finally:
+            await motor.dispose()
+
+    assert asyncio.run(escenario()) == (1190.0, 99.0, ["Nuevo"])
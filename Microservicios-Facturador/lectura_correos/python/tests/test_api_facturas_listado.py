@@ -0,0 +1,78 @@
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from api.schemas.invoices import InvoiceListItem
+from database.crud import InvoiceCRUD
+from database.database import obtener_engine_async
+
+_COLUMNAS_PESADAS = ("texto_crudo_xml", "contenido_pdf_binario", "asunto_correo", "remitente_correo")
+
+
+@pytest.fixture
+def facturas(db, tenant_id):
+    crud = InvoiceCRUD(db)
+    ids = []
+    for i in range(3):
+        sufijo = uuid.uuid4().hex[:8]
+        ids.append(crud.create_invoice({
+            "cufe": f"cufe-{sufijo}",
+            "numero_factura": f"FE-{sufijo}",
+            "fecha_emision": date(2024, 3, i + 1),
+            "monto_total": 1000.0 * (i + 1),
+            "nombre_proveedor": "Proveedor de prueba",
+            "asunto_correo": "Factura electrónica",
+            "texto_crudo_xml": "<Invoice>" + "x" * 1000 + "</Invoice>",
+            "contenido_pdf_binario": b"%PDF-1.4 " + b"x" * 1000,
+        }, [
+            {"descripcion": f"Ítem {i}-{j}", "cantidad": 1, "valor_unitario": 10.0, "valor_total": 10.0}
+            for j in range(i + 1)
+        ], tenant_id))
+    return ids
+
+
+@pytest.fixture
+def sentencias(cliente):
+    registradas = []
+
+    def registrar(conexion, cursor, sentencia, parametros, contexto, executemany):
+        registradas.append(sentencia)
+
+    motor = obtener_engine_async().sync_engine
+    event.listen(motor, "before_cursor_execute", registrar)
+    yield registradas
+    event.remove(motor, "before_cursor_execute", registrar)
+
+
+def _consultas_a(sentencias, tabla: str):
+    return [s for s in sentencias if s.lstrip().upper().startswith("SELECT") and f"FROM {tabla}" in s]
+
+
+def test_listado_sin_columnas_pesadas_ni_items(cliente, encabezados, facturas, sentencias):
+    respuesta = cliente.get("/invoices/", headers=encabezados)
+
+    assert respuesta.status_code == 200
+    cuerpo = respuesta.json()
+    assert sorted(factura["id"] for factura in cuerpo) == sorted(facturas)
+    assert all(set(factura) == set(InvoiceListItem.model_fields) for factura in cuerpo)
+
+    [consulta] = _consultas_a(sentencias, "facturas")
+    assert not [columna for columna in _COLUMNAS_PESADAS if columna in consulta]
+    assert not _consultas_a(sentencias, "items_factura")
+
+
+def test_include_items_agrega_los_items_en_una_consulta(cliente, encabezados, facturas, sentencias):
+    respuesta = cliente.get("/invoices/", params={"include": "resumen, items"}, headers=encabezados)
+
+    assert respuesta.status_code == 200
+    items_por_factura = {factura["id"]: factura["items"] for factura in respuesta.json()}
+    assert {factura_id: len(items) for factura_id, items in items_por_factura.items()} == {
+        factura_id: numero for numero, factura_id in enumerate(facturas, 1)
+    }
+    assert all(item["factura_id"] == factura_id for factura_id, items in items_por_factura.items() for item in items)
+
+    [consulta] = _consultas_a(sentencias, "facturas")
+    assert not [columna for columna in _COLUMNAS_PESADAS if columna in consulta]
+    assert len(_consultas_a(sentencias, "items_factura")) == 1
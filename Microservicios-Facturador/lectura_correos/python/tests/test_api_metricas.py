@@ -0,0 +1,9 @@
+def test_metricas_del_pool_exigen_token(cliente):
+    assert cliente.get("/metrics/pool").status_code == 401
+    assert cliente.get("/metrics/pool", headers={"Authorization": "Bearer no-es-un-token"}).status_code == 401
+
+
+def test_metricas_del_pool_con_token(cliente, encabezados):
+    respuesta = cliente.get("/metrics/pool", headers=encabezados)
+    assert respuesta.status_code == 200
+    assert isinstance(respuesta.json(), dict)
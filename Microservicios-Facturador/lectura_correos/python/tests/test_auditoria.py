@@ -0,0 +1,87 @@
+from datetime import datetime
+from contextlib import contextmanager
+
+from sqlalchemy.exc import OperationalError
+
+from config.settings import settings
+from database.auditoria import EscritorAuditoria, escritor, reconstruir_factura
+from database.crud import InvoiceCRUD, set_current_audit_tenant_id
+from database.models import Factura, FacturaAudit
+
+
+def _crear(db, tenant_id, **datos):
+    set_current_audit_tenant_id(tenant_id)
+    factura_id = InvoiceCRUD(db).create_invoice(dict(datos), [], tenant_id)
+    assert escritor.vaciar(10)
+    return factura_id
+
+
+def test_reconstruye_el_xml_de_una_version_anterior(db, tenant_id):
+    factura_id = _crear(db, tenant_id, numero_factura=f"FE-{tenant_id}", texto_crudo_xml="<Invoice>v1</Invoice>")
+    antes_del_cambio = datetime.now()
+
+    InvoiceCRUD(db).update_invoice(tenant_id, factura_id, {"texto_crudo_xml": "<Invoice>v2</Invoice>", "monto_total": 10.0})
+    assert escritor.vaciar(10)
+
+    fila = db.get(Factura, factura_id)
+    assert fila.texto_crudo_xml is None and fila.xml_blob_key
+
+    anterior = reconstruir_factura(db, factura_id, tenant_id, antes_del_cambio)
+    actual = reconstruir_factura(db, factura_id, tenant_id)
+    assert anterior["texto_crudo_xml"] == "<Invoice>v1</Invoice>"
+    assert anterior["monto_total"] is None
+    assert actual["texto_crudo_xml"] == "<Invoice>v2</Invoice>"
+    assert actual["monto_total"] == 10.0
+
+
+def test_antes_de_crearse_no_hay_version(db, tenant_id):
+    antes = datetime.now()
+    factura_id = _crear(db, tenant_id, numero_factura=f"FE-{tenant_id}")
+    assert reconstruir_factura(db, factura_id, tenant_id, antes) is None
+
+
+def test_flush_sin_confirmar_no_se_audita_al_cerrar(db, tenant_id):
+    set_current_audit_tenant_id(tenant_id)
+    db.add(Factura(numero_factura=f"FE-{tenant_id}", tenant_id=tenant_id))
+    db.flush()
+    db.close()
+
+    # La misma sesión se vuelve a usar: el commit siguiente no arrastra el flush descartado.
+    _crear(db, f"{tenant_id}-otro", numero_factura=f"FE-{tenant_id}-otro")
+    assert db.query(FacturaAudit).filter(FacturaAudit.tenant_id == tenant_id).count() == 0
+    assert db.query(FacturaAudit).filter(FacturaAudit.tenant_id == f"{tenant_id}-otro").count() == 1
+
+
+class _BaseIntermitente:
+    def __init__(self):
+        self.caida = True
+        self.escritas = []
+
+    @contextmanager
+    def begin(self):
+        if self.caida:
+            raise OperationalError("INSERT INTO facturas_audit", {}, Exception("base caída"))
+        yield self
+
+    def execute(self, sentencia, filas):
+        self.escritas.extend(filas)
+
+
+def test_con_la_cola_llena_se_descarta_y_se_cuenta(monkeypatch):
+    monkeypatch.setattr(settings, "AUDIT_RETRY_BACKOFF_MAX_SECONDS", 0.02)
+    base = _BaseIntermitente()
+    escritor_prueba = EscritorAuditoria(tamano_lote=1, intervalo=0.01, maximo_en_cola=1)
+    try:
+        # El segundo registro espera lugar en la cola; cuando entra, la cola está llena y el
+        # primero, que no se pudo escribir, se descarta.
+        escritor_prueba.encolar(base, [(FacturaAudit.__table__, {"id_factura": 1}), (FacturaAudit.__table__, {"id_factura": 2})])
+        assert not escritor_prueba.vaciar(0.2)
+        assert escritor_prueba.descartados == 1
+
+        # El segundo se reintenta hasta que la base vuelve.
+        base.caida = False
+        assert escritor_prueba.vaciar(5)
+        assert base.escritas == [{"id_factura": 2}]
+        assert escritor_prueba.descartados == 1
+    finally:
+        escritor_prueba.detener()
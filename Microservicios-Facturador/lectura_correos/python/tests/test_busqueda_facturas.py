@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+
+from database.crud import InvoiceCRUD
+
+
+@pytest.fixture
+def crear(db):
+    crud = InvoiceCRUD(db)
+
+    def crear(tenant_id: str, numero: str = None, proveedor: str = None, items=()):
+        numero = numero or f"BUS-{uuid.uuid4().hex[:8]}"
+        return crud.create_invoice({"numero_factura": numero, "cufe": f"cufe-{uuid.uuid4().hex}", "nombre_proveedor": proveedor}, [
+            {"descripcion": descripcion, "cantidad": 1, "valor_unitario": 1.0, "valor_total": 1.0} for descripcion in items
+        ], tenant_id)
+
+    return crear
+
+
+def _ids(db, tenant_id: str, texto: str):
+    return {factura.id for factura, _ in InvoiceCRUD(db).search_invoices(tenant_id, texto)}
+
+
+def test_comodines_se_buscan_literalmente(db, tenant_id, crear):
+    con_porcentaje = crear(tenant_id, proveedor="Descuentos 50% S.A.S.")
+    sin_porcentaje = crear(tenant_id, proveedor="Descuentos 500 S.A.S.")
+    con_guion_bajo = crear(tenant_id, items=["Cable UTP_CAT6"])
+    sin_guion_bajo = crear(tenant_id, items=["Cable UTPXCAT6"])
+    con_barra = crear(tenant_id, items=[r"Ruta C:\facturas"])
+
+    assert _ids(db, tenant_id, "50%") == {con_porcentaje}
+    assert _ids(db, tenant_id, "%") == {con_porcentaje}
+    assert _ids(db, tenant_id, "UTP_CAT6") == {con_guion_bajo}
+    assert _ids(db, tenant_id, "_") == {con_guion_bajo}
+    assert _ids(db, tenant_id, r"C:\facturas") == {con_barra}
+    # Sin comodines la búsqueda parcial sigue funcionando y no distingue mayúsculas.
+    assert _ids(db, tenant_id, "descuentos 50") == {con_porcentaje, sin_porcentaje}
+    assert _ids(db, tenant_id, "cable utp") == {con_guion_bajo, sin_guion_bajo}
+
+
+def test_solo_facturas_del_inquilino(db, tenant_id, crear, cliente, encabezados):
+    otro = f"{tenant_id}-otro"
+    propia = crear(tenant_id, proveedor="Papelería Central", items=["Resma carta"])
+    crear(otro, proveedor="Papelería Central", items=["Resma carta"])
+    # Coincide solo por un ítem del otro inquilino.
+    crear(otro, items=["Papelería Central a domicilio"])
+
+    assert _ids(db, tenant_id, "Papelería") == {propia}
+    assert _ids(db, tenant_id, "resma") == {propia}
+    assert len(_ids(db, otro, "Papelería")) == 2
+
+    respuesta = cliente.get("/invoices/search", params={"q": "Papelería"}, headers=encabezados)
+    assert respuesta.status_code == 200
+    assert [factura["id"] for factura in respuesta.json()] == [propia]
+
+
+def test_orden_por_puntaje(db, tenant_id, crear):
+    numero = f"ORD-{uuid.uuid4().hex[:8]}"
+    exacta = crear(tenant_id, numero=numero)
+    parcial = crear(tenant_id, numero=f"{numero}-NC")
+    por_proveedor_e_item = crear(tenant_id, proveedor=f"Proveedor {numero}", items=[f"Servicio {numero}"])
+    por_item = crear(tenant_id, items=[f"Servicio {numero}"])
+
+    resultados = InvoiceCRUD(db).search_invoices(tenant_id, numero)
+
+    # A igual puntaje, primero la más reciente (id mayor).
+    assert [(factura.id, puntaje) for factura, puntaje in resultados] == [
+        (exacta, 5.0), (por_proveedor_e_item, 2.0), (parcial, 2.0), (por_item, 1.0)
+    ]
@@ -0,0 +1,138 @@
+from datetime import datetime
+
+import pytest
+from alembic import command
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from config.settings import settings
+from database import credenciales
+from database.credenciales import CacheCredenciales
+from database.models import Usuario, configuracion_alembic
+
+_PREVIO = datetime(2024, 1, 1, 7, 0, 0)
+_ANTES = datetime(2024, 1, 1, 8, 0, 0)
+_DESPUES = datetime(2024, 1, 1, 9, 0, 0)
+
+
+class _CifradoContado:
+    """Fernet real que cuenta cuántas veces se descifra."""
+
+    def __init__(self, fernet):
+        self._fernet = fernet
+        self.descifrados = 0
+
+    def encrypt(self, datos: bytes) -> bytes:
+        return self._fernet.encrypt(datos)
+
+    def decrypt(self, datos: bytes) -> bytes:
+        self.descifrados += 1
+        return self._fernet.decrypt(datos)
+
+
+@pytest.fixture
+def sesiones(tmp_path, monkeypatch):
+    # Base aparte: la caché lee la tabla completa y los usuarios de otras pruebas la cambiarían.
+    motor = create_engine(f"sqlite:///{tmp_path / 'credenciales.sqlite'}")
+    with motor.begin() as conexion:
+        command.upgrade(configuracion_alembic(conexion), "head")
+    sesiones = sessionmaker(bind=motor)
+    monkeypatch.setattr(credenciales, "SessionLocal", sesiones)
+    monkeypatch.setattr(settings, "CREDENTIAL_CACHE_REFRESH_SECONDS", 3600)
+    yield sesiones
+    motor.dispose()
+
+
+@pytest.fixture
+def cifrado(monkeypatch):
+    cifrado = _CifradoContado(settings.CIPHER_SUITE)
+    monkeypatch.setattr(settings, "_cipher_suite", cifrado)
+    return cifrado
+
+
+def _cifrar(password: str) -> str:
+    return settings.CIPHER_SUITE.encrypt(password.encode()).decode()
+
+
+def _crear(sesiones, correo: str, password: str, updated_at=_ANTES) -> int:
+    with sesiones() as session:
+        usuario = Usuario(correo=correo, tenant_id="tenant-1", email_account_password_encrypted=_cifrar(password), updated_at=updated_at)
+        session.add(usuario)
+        session.commit()
+        return usuario.id
+
+
+def _actualizar(sesiones, user_id: int, **valores):
+    with sesiones() as session:
+        session.query(Usuario).filter(Usuario.id == user_id).update(valores)
+        session.commit()
+
+
+def _passwords(cache) -> dict:
+    return {u["correo"]: u["password"] for u in cache.obtener()}
+
+
+def test_cambio_en_el_mismo_segundo_de_la_marca(sesiones, cifrado):
+    a = _crear(sesiones, "a@empresa.com", "a-1")
+    b = _crear(sesiones, "b@empresa.com", "b-1", updated_at=_PREVIO)
+    cache = CacheCredenciales()
+    assert _passwords(cache) == {"a@empresa.com": "a-1", "b@empresa.com": "b-1"}
+
+    # Tras la lectura, b cambia en el mismo segundo de la marca y a en uno posterior: la
+    # recarga incremental (updated_at >= marca) debe traer ambos.
+    _actualizar(sesiones, b, email_account_password_encrypted=_cifrar("b-2"), updated_at=_ANTES)
+    _actualizar(sesiones, a, email_account_password_encrypted=_cifrar("a-2"), updated_at=_DESPUES)
+
+    assert _passwords(cache) == {"a@empresa.com": "a-2", "b@empresa.com": "b-2"}
+    assert cifrado.descifrados == 4
+
+
+def test_update_fuera_del_orm_mueve_updated_at(sesiones, cifrado):
+    a = _crear(sesiones, "a@empresa.com", "a-1")
+    cache = CacheCredenciales()
+    assert _passwords(cache) == {"a@empresa.com": "a-1"}
+
+    # Sin tocar updated_at: en SQLite lo actualiza el trigger de la migración 0007.
+    with sesiones() as session:
+        session.execute(text("UPDATE usuarios SET email_account_password_encrypted = :cifrado WHERE id = :id"), {"cifrado": _cifrar("a-2"), "id": a})
+        session.commit()
+        assert session.get(Usuario, a).updated_at > _ANTES
+
+    assert _passwords(cache) == {"a@empresa.com": "a-2"}
+
+
+def test_usuario_borrado_sale_de_la_cache(sesiones, cifrado):
+    _crear(sesiones, "a@empresa.com", "a-1", updated_at=_DESPUES)
+    b = _crear(sesiones, "b@empresa.com", "b-1")
+    cache = CacheCredenciales()
+    assert len(cache.obtener()) == 2
+
+    # El borrado no cambia MAX(updated_at), solo COUNT.
+    with sesiones() as session:
+        session.query(Usuario).filter(Usuario.id == b).delete()
+        session.commit()
+
+    assert _passwords(cache) == {"a@empresa.com": "a-1"}
+    assert b not in cache._usuarios
+    assert cifrado.descifrados == 2
+
+
+def test_no_descifra_si_el_cifrado_no_cambia(sesiones, cifrado, monkeypatch):
+    a = _crear(sesiones, "a@empresa.com", "a-1")
+    cache = CacheCredenciales()
+    cache.obtener()
+    assert cifrado.descifrados == 1
+
+    # Cambia el correo (y updated_at) pero no la contraseña: se actualiza sin descifrar.
+    _actualizar(sesiones, a, correo="a2@empresa.com", updated_at=_DESPUES)
+    assert _passwords(cache) == {"a2@empresa.com": "a-1"}
+    # Ni en el recorrido completo periódico.
+    monkeypatch.setattr(settings, "CREDENTIAL_CACHE_REFRESH_SECONDS", -1)
+    assert _passwords(cache) == {"a2@empresa.com": "a-1"}
+    assert cifrado.descifrados == 1
+
+    # Un texto cifrado inválido se recuerda como fallo y no se reintenta.
+    _actualizar(sesiones, a, email_account_password_encrypted="no-es-fernet")
+    assert cache.obtener() == []
+    assert cache.obtener() == []
+    assert cifrado.descifrados == 2
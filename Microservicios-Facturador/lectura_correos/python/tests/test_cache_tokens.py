@@ -0,0 +1,114 @@
+import time
+import hashlib
+
+import pytest
+from jose import jwt
+
+from auth import security
+from auth.security import CacheTokens, Principal, verificar_token
+from config.settings import settings
+
+
+class _Reloj:
+    def __init__(self, ahora: float):
+        self.ahora = ahora
+
+    def time(self) -> float:
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = _Reloj(1_000_000.0)
+    monkeypatch.setattr(security, "time", reloj)
+    return reloj
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia():
+    security.cache_tokens.limpiar()
+    yield
+    security.cache_tokens.limpiar()
+
+
+def _principal(expira_en=None) -> Principal:
+    return Principal(tenant_id="tenant-cache", user_id="1", expira_en=expira_en)
+
+
+def _token(**payload) -> str:
+    return jwt.encode({"id_empresa": "tenant-cache", "sub": "1", **payload}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+
+def test_entrada_vence_en_el_exp_del_token(reloj):
+    cache = CacheTokens(10, ttl_sin_exp=3600)
+    principal = _principal(expira_en=reloj.ahora + 30)
+    cache.guardar("clave", principal)
+
+    reloj.ahora += 29.999
+    assert cache.obtener("clave") is principal
+    reloj.ahora += 0.001
+    assert cache.obtener("clave") is None
+    # La entrada vencida se descarta, no solo se oculta.
+    reloj.ahora -= 10
+    assert cache.obtener("clave") is None
+
+
+def test_sin_exp_vence_a_los_ttl_segundos(reloj):
+    cache = CacheTokens(10, ttl_sin_exp=60)
+    cache.guardar("clave", _principal())
+
+    reloj.ahora += 59
+    assert cache.obtener("clave") is not None
+    reloj.ahora += 1
+    assert cache.obtener("clave") is None
+
+
+def test_desaloja_la_menos_usada(reloj):
+    cache = CacheTokens(2, ttl_sin_exp=60)
+    cache.guardar("a", _principal())
+    cache.guardar("b", _principal())
+    assert cache.obtener("a") is not None
+
+    cache.guardar("c", _principal())
+
+    assert cache.obtener("b") is None
+    assert cache.obtener("a") is not None and cache.obtener("c") is not None
+
+
+def test_tamano_cero_desactiva_la_cache(reloj):
+    cache = CacheTokens(0, ttl_sin_exp=60)
+    cache.guardar("a", _principal())
+    assert cache.obtener("a") is None
+
+
+def test_token_alterado_no_sale_de_la_cache():
+    token = _token(exp=int(time.time()) + 3600)
+    assert verificar_token(token).tenant_id == "tenant-cache"
+    # Queda en caché por su SHA-256, nunca por el texto del token.
+    assert security.cache_tokens.obtener(hashlib.sha256(token.encode()).hexdigest()) is not None
+    assert token not in repr(security.cache_tokens._entradas)
+
+    encabezado, cuerpo, firma = token.split(".")
+    otra_firma = firma[:-2] + ("AA" if not firma.endswith("AA") else "BB")
+    ajeno = jwt.encode({"id_empresa": "tenant-cache", "sub": "1", "exp": int(time.time()) + 3600}, "otra-clave", algorithm=settings.ALGORITHM)
+    for alterado in (f"{encabezado}.{cuerpo}.{otra_firma}", f"{token} ", ajeno):
+        assert verificar_token(alterado) is None
+
+
+def test_token_alterado_responde_401(cliente, encabezados):
+    assert cliente.get("/invoices/", headers=encabezados).status_code == 200
+    token = encabezados["Authorization"].removeprefix("Bearer ")
+    encabezado, cuerpo, firma = token.split(".")
+    alterado = f"{encabezado}.{cuerpo}.{firma[:-2]}{'AA' if not firma.endswith('AA') else 'BB'}"
+
+    assert cliente.get("/invoices/", headers={"Authorization": f"Bearer {alterado}"}).status_code == 401
+
+
+def test_token_vencido_deja_de_ser_valido():
+    token = _token(exp=int(time.time()) + 1)
+    assert verificar_token(token) is not None
+    # jose da el token por vencido cuando el segundo actual pasa de `exp`; la caché ya no lo
+    # entrega desde `exp` (test_entrada_vence_en_el_exp_del_token).
+    while int(time.time()) <= jwt.get_unverified_claims(token)["exp"]:
+        time.sleep(0.05)
+    assert verificar_token(token) is None
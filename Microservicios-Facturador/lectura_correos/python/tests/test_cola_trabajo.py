@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+from config.settings import settings
+from ingestion import cola_trabajo
+from ingestion.cola_trabajo import ColaTrabajo, FALLIDO, PENDIENTE, EN_PROCESO
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "select-update"])
+def ruta(request, tmp_path, monkeypatch):
+    # Se prueban las dos formas de reservar: con UPDATE ... RETURNING y la de SQLite < 3.35.
+    monkeypatch.setattr(cola_trabajo, "_CON_RETURNING", request.param)
+    monkeypatch.setattr(cola_trabajo, "_REINTENTO_BASE_SEGUNDOS", 0)
+    return str(tmp_path / "cola.sqlite3")
+
+
+def _encolar(cola, adjuntos: int, uid: int = 1):
+    return cola.encolar_correo({
+        "tenant_id": "tenant-cola",
+        "uid": uid,
+        "subject": f"Factura {uid}",
+        "adjuntos": [
+            {"filename": f"f{uid}-{i}.pdf", "sha256": f"{uid:04d}{i:060d}", "ruta": f"/spool/{uid}-{i}", "tamano": 10}
+            for i in range(adjuntos)
+        ],
+    })
+
+
+def test_reserva_confirma_y_reintenta(ruta):
+    cola = ColaTrabajo(ruta)
+    assert _encolar(cola, 3) == 3
+
+    primeros = cola.reservar_lote(2, timeout=0)
+    assert [t["filename"] for t in primeros] == ["f1-0.pdf", "f1-1.pdf"]
+    assert {t["intentos"] for t in primeros} == {1}
+    assert primeros[0]["metadatos"]["asunto_correo"] == "Factura 1"
+    [tercero] = cola.reservar_lote(2, timeout=0)
+    assert cola.reservar_lote(2, timeout=0) == []
+    assert cola.contar() == {EN_PROCESO: 3}
+
+    cola.confirmar(primeros[0])
+    cola.fallar(primeros[1], "sin conexión")
+    assert cola.contar() == {EN_PROCESO: 1, PENDIENTE: 1}
+
+    [reintento] = cola.reservar_lote(2, timeout=0)
+    assert reintento["id"] == primeros[1]["id"] and reintento["intentos"] == 2
+    cola.confirmar(reintento)
+    cola.confirmar(tercero)
+    assert cola.contar() == {}
+
+
+def test_agotados_quedan_fallidos(ruta, monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_MAX_ATTEMPTS", 2)
+    cola = ColaTrabajo(ruta)
+    _encolar(cola, 1)
+    for _ in range(2):
+        [trabajo] = cola.reservar_lote(1, timeout=0)
+        cola.fallar(trabajo, "ilegible")
+    assert cola.reservar_lote(1, timeout=0) == []
+    assert cola.contar() == {FALLIDO: 1}
+
+
+def test_reserva_vencida_se_vuelve_a_entregar(ruta, monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_LEASE_SECONDS", 0)
+    cola = ColaTrabajo(ruta)
+    _encolar(cola, 1)
+    [colgado] = cola.reservar_lote(1, timeout=0)
+    [nuevo] = cola.reservar_lote(1, timeout=0)
+    assert nuevo["id"] == colgado["id"] and nuevo["reserva"] != colgado["reserva"]
+
+    # La confirmación del trabajador colgado ya no vale: el trabajo es del nuevo dueño.
+    cola.confirmar(colgado)
+    assert cola.contar() == {EN_PROCESO: 1}
+    cola.confirmar(nuevo)
+    assert cola.contar() == {}
+
+
+def test_trabajadores_concurrentes_no_comparten_trabajos(ruta):
+    correos, adjuntos = 20, 3
+    cola = ColaTrabajo(ruta)
+    for uid in range(1, correos + 1):
+        _encolar(cola, adjuntos, uid)
+
+    confirmados, errores = [], []
+    lock = threading.Lock()
+
+    def trabajador(cola):
+        try:
+            while True:
+                lote = cola.reservar_lote(4, timeout=0.2)
+                if not lote:
+                    return
+                for trabajo in lote:
+                    # Un tercio falla la primera vez y se reintenta.
+                    if trabajo["id"] % 3 == 0 and trabajo["intentos"] == 1:
+                        cola.fallar(trabajo, "error transitorio")
+                        continue
+                    cola.confirmar(trabajo)
+                    with lock:
+                        confirmados.append((trabajo["id"], trabajo["intentos"]))
+        except Exception as e:  # pragma: no cover - se informa abajo
+            errores.append(e)
+
+    # Conexiones propias (como procesos distintos) y una compartida entre hilos.
+    colas = [ColaTrabajo(ruta) for _ in range(4)] + [cola, cola]
+    hilos = [threading.Thread(target=trabajador, args=(c,)) for c in colas]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=60)
+
+    assert not errores
+    ids = [trabajo_id for trabajo_id, _ in confirmados]
+    assert sorted(ids) == list(range(1, correos * adjuntos + 1))
+    assert all(intentos == (2 if trabajo_id % 3 == 0 else 1) for trabajo_id, intentos in confirmados)
+    assert cola.contar() == {}
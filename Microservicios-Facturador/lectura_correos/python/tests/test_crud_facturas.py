@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from database.crud import InvoiceCRUD
+from database.models import engine, Factura, ItemFactura
+
+
+def test_datos_invalidos_no_se_propagan(db, tenant_id):
+    # tenant_id en los datos choca con el argumento de Factura(): es un error definitivo, no
+    # algo que la cola deba reintentar.
+    assert InvoiceCRUD(db).create_invoice({"numero_factura": f"FE-{tenant_id}", "tenant_id": "otro"}, [], tenant_id) is None
+
+
+def test_error_transitorio_se_propaga(db, tenant_id, monkeypatch):
+    def caida():
+        raise OperationalError("INSERT INTO facturas", {}, Exception("conexión perdida"))
+
+    monkeypatch.setattr(db, "flush", caida)
+    with pytest.raises(OperationalError):
+        InvoiceCRUD(db).create_invoice({"numero_factura": f"FE-{tenant_id}"}, [], tenant_id)
+
+
+def test_lote_no_se_atribuye_la_factura_que_inserto_otro(db, tenant_id, monkeypatch):
+    cufe = f"CUFE-{tenant_id}"
+    verificar = InvoiceCRUD._facturas_por_clave
+
+    def verificar_y_adelantarse(self, cufes, numeros, bloquear=False):
+        existentes = verificar(self, cufes, numeros, bloquear)
+        if bloquear:
+            # Otro proceso guarda la misma factura, aún sin ítems, justo después de la verificación.
+            with engine.begin() as conexion:
+                conexion.execute(insert(Factura), {"cufe": cufe, "numero_factura": f"FE-{tenant_id}", "tenant_id": tenant_id})
+        return existentes
+
+    monkeypatch.setattr(InvoiceCRUD, "_facturas_por_clave", verificar_y_adelantarse)
+    [(factura_id, creada)] = InvoiceCRUD(db).create_invoices_bulk([
+        ({"cufe": cufe, "numero_factura": f"FE-{tenant_id}"}, [{"descripcion": "Servicio", "cantidad": 1}], tenant_id),
+    ])
+
+    assert factura_id == db.query(Factura.id).filter(Factura.cufe == cufe).scalar()
+    assert not creada
+    assert db.query(ItemFactura).filter(ItemFactura.factura_id == factura_id).count() == 0
+
+
+def test_lote_crea_y_reconoce_duplicados(db, tenant_id):
+    crud = InvoiceCRUD(db)
+    lote = [({"cufe": f"CUFE-{tenant_id}-{i}", "numero_factura": f"FE-{tenant_id}-{i}"}, [], tenant_id) for i in range(3)]
+    creadas = crud.create_invoices_bulk([(dict(datos), items, tenant) for datos, items, tenant in lote])
+    assert all(creada for _, creada in creadas)
+    assert crud.create_invoices_bulk([(dict(datos), items, tenant) for datos, items, tenant in lote]) == [
+        (factura_id, False) for factura_id, _ in creadas
+    ]
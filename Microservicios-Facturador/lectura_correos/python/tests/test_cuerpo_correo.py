@@ -0,0 +1,143 @@
+import os
+import re
+import json
+from datetime import date, datetime
+
+import pytest
+
+from extraction import email_body
+from extraction.email_body import CampoCuerpo, ConfiguracionPlantillas, ExtractorCuerpoCorreo, extraer_cuerpo_correo
+
+CUFE = "a1" * 48
+
+CUERPO = (
+    "Estimado cliente,\r\n"
+    "Empresa: Papelería Central S.A.S.\r\n"
+    "Identificación: 900123456\r\n"
+    "Fecha: 2024-03-01\r\n"
+    "Número: FE-1024\r\n"
+    f"CUFE: {CUFE}\r\n"
+)
+
+
+def _extraer_con_regex(texto: str) -> dict:
+    # Implementación anterior (re.search con IGNORECASE por campo), como referencia.
+    datos = {}
+    texto = texto.replace('\r\n', '\n').replace('\r', '\n')
+    patrones = {
+        'nombre_proveedor': r'Empresa:\s*(.+)',
+        'nit_proveedor': r'Identificación:\s*(\d{9,10})',
+        'fecha_emision': r'Fecha:\s*(\d{4}-\d{2}-\d{2})',
+        'numero_factura': r'Número:\s*([A-Za-z0-9\-\_]+)',
+        'cufe': r'CUFE:\s*([a-f0-9]{64,128})',
+    }
+    for clave, patron in patrones.items():
+        match = re.search(patron, texto, re.IGNORECASE)
+        if match:
+            valor = match.group(1).strip()
+            if clave == 'fecha_emision':
+                try:
+                    datos[clave] = datetime.strptime(valor, '%Y-%m-%d').date()
+                except ValueError:
+                    continue
+            else:
+                datos[clave] = valor
+    return datos
+
+
+@pytest.mark.parametrize("texto", [
+    CUERPO,
+    CUERPO.upper(),
+    "<p>EMPRESA:   ACME</p><p>Identificación: 12345</p><p>Identificación: 9001234567</p>",
+    "Fecha: 2024-02-30\nFecha: 2024-03-01\nNúmero: -- \nNúmero: FE_9",
+    "Número:\n\nFE-1 CUFE: xyz\nCUFE: " + CUFE.upper(),
+    "Empresa:\nSin datos",
+    "",
+])
+def test_campos_por_defecto_como_la_version_con_regex(texto):
+    assert ExtractorCuerpoCorreo().extraer(texto) == _extraer_con_regex(texto)
+
+
+def test_campos_por_defecto():
+    assert ExtractorCuerpoCorreo().extraer(CUERPO) == {
+        "nombre_proveedor": "Papelería Central S.A.S.",
+        "nit_proveedor": "900123456",
+        "fecha_emision": date(2024, 3, 1),
+        "numero_factura": "FE-1024",
+        "cufe": CUFE,
+    }
+    # Una fecha con la forma esperada pero inválida deja el campo vacío.
+    assert "fecha_emision" not in ExtractorCuerpoCorreo().extraer("Fecha: 2024-13-40")
+    assert ExtractorCuerpoCorreo().extraer(CUERPO, excluir=("cufe", "nombre_proveedor")).keys() == {
+        "nit_proveedor", "fecha_emision", "numero_factura"
+    }
+
+
+def test_etiquetas_sin_tildes_ni_mayusculas():
+    texto = "IDENTIFICACION: 900123456\nnumero: FE-7\nEmpresa: Compañía Ñandú"
+    assert ExtractorCuerpoCorreo().extraer(texto) == {
+        "nit_proveedor": "900123456",
+        "numero_factura": "FE-7",
+        # El valor conserva sus tildes; solo la etiqueta se compara normalizada.
+        "nombre_proveedor": "Compañía Ñandú",
+    }
+    # Las posiciones del texto normalizado coinciden con las del original aunque haya
+    # caracteres fuera de Latin-1 antes de la etiqueta.
+    assert ExtractorCuerpoCorreo({"numero": CampoCuerpo("Nº Factura", r"(\d+)")}).extraer("€€ — nº factura 42") == {"numero": "42"}
+
+
+@pytest.fixture
+def plantillas(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_body, "_INTERVALO_RECARGA_SEGUNDOS", 0.0)
+    ruta = tmp_path / "plantillas_cuerpo.json"
+    configuracion = ConfiguracionPlantillas(str(ruta))
+    monkeypatch.setattr(email_body, "configuracion_plantillas", configuracion)
+    mtimes = iter(range(1_700_000_000, 1_800_000_000, 10))
+
+    def escribir(datos):
+        ruta.write_text(json.dumps(datos), encoding="utf-8")
+        mtime = next(mtimes)
+        os.utime(ruta, (mtime, mtime))
+
+    return escribir
+
+
+def test_plantilla_segun_remitente(plantillas):
+    plantillas({"tenants": {
+        "tenant-a": [
+            {"proveedor": "ACME S.A.S.", "remitente": "@ACME.com.co", "campos": {
+                "numero_factura": {"etiqueta": "Factura No.", "patron": "([A-Z0-9-]+)"},
+                "fecha_emision": {"etiqueta": "Expedida el", "patron": r"(\d{2}/\d{2}/\d{4})", "formato": "%d/%m/%Y"},
+            }},
+            {"proveedor": "Genérico", "campos": {"numero_factura": {"etiqueta": "Doc:"}}},
+        ],
+        "tenant-b": [{"proveedor": "Otro", "campos": {"numero_factura": {"etiqueta": "Doc:"}}}],
+    }})
+    texto = "Factura No. AC-77\nExpedida el 05/03/2024\nDoc: X-1\nNúmero: FE-1\nIdentificación: 900123456"
+
+    # Primera plantilla del inquilino que aplica al remitente (sin distinguir mayúsculas); lo que
+    # no trae la completan los campos por defecto.
+    assert extraer_cuerpo_correo(texto, "tenant-a", "Facturas <facturas@acme.com.co>") == {
+        "numero_factura": "AC-77",
+        "fecha_emision": date(2024, 3, 5),
+        "nombre_proveedor": "ACME S.A.S.",
+        "nit_proveedor": "900123456",
+    }
+    # Otro remitente cae en la plantilla sin "remitente" del mismo inquilino.
+    assert extraer_cuerpo_correo(texto, "tenant-a", "ventas@otro.com")["numero_factura"] == "X-1"
+    assert extraer_cuerpo_correo(texto, "tenant-a", "ventas@otro.com")["nombre_proveedor"] == "Genérico"
+    # Las plantillas de un inquilino no aplican a otro ni a correos sin inquilino.
+    for tenant_id in ("tenant-c", None):
+        assert extraer_cuerpo_correo(texto, tenant_id, "facturas@acme.com.co") == ExtractorCuerpoCorreo().extraer(texto)
+
+    # Si la plantilla no encuentra su campo, queda el valor por defecto.
+    assert extraer_cuerpo_correo("Número: FE-1", "tenant-a", "facturas@acme.com.co")["numero_factura"] == "FE-1"
+
+
+def test_plantillas_se_recargan_cuando_cambia_el_archivo(plantillas):
+    texto = "Ref: R-9\nNúmero: FE-1"
+    plantillas({"tenants": {"tenant-a": [{"campos": {"numero_factura": {"etiqueta": "Ref:"}}}]}})
+    assert extraer_cuerpo_correo(texto, "tenant-a")["numero_factura"] == "R-9"
+
+    plantillas({"tenants": {}})
+    assert extraer_cuerpo_correo(texto, "tenant-a")["numero_factura"] == "FE-1"
@@ -0,0 +1,79 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import deduplicacion
+from services.deduplicacion import obtener_contadores
+from services.invoice_service import InvoiceService
+
+_FACTURA = """<?xml version="1.0" encoding="UTF-8"?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+         xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:ID>{numero}</cbc:ID>
+  <cbc:UUID>{cufe}</cbc:UUID>
+  <cbc:IssueDate>2024-03-05</cbc:IssueDate>
+</Invoice>
+{relleno}"""
+
+
+def _factura(numero: str, cufe: str, relleno: str = "") -> bytes:
+    # El relleno cambia el SHA-256 del adjunto sin cambiar la factura; numero_factura es único
+    # en toda la tabla, así que se deriva del CUFE.
+    return _FACTURA.format(numero=f"{numero}-{cufe[:8]}", cufe=cufe, relleno=relleno).encode()
+
+
+@pytest.fixture(autouse=True)
+def cache_aislada(tmp_path, monkeypatch, base_de_datos):
+    monkeypatch.setattr(deduplicacion, "DEDUP_DB_PATH", str(tmp_path / "dedup.sqlite3"))
+    monkeypatch.setattr(deduplicacion, "_conexion", None)
+    obtener_contadores(reiniciar=True)
+    yield
+    obtener_contadores(reiniciar=True)
+
+
+def test_cuenta_omitidos_por_hash_y_por_cufe(tenant_id):
+    servicio = InvoiceService()
+    cufe = uuid.uuid4().hex
+    original = _factura("FE-1", cufe)
+    reenviado = _factura("FE-1", cufe, "<!-- reenviado -->")
+
+    factura_id = servicio.process_document("f.xml", original, {}, tenant_id)
+    assert servicio.process_document("f.xml", original, {}, tenant_id) == factura_id
+    assert servicio.process_document("copia.xml", reenviado, {}, tenant_id) == factura_id
+
+    assert obtener_contadores() == {
+        "adjuntos": 3,
+        "guardadas": 1,
+        "duplicados_hash": 1,
+        "duplicados_cufe": 1,
+        "omitidos": 2,
+        "bytes_omitidos": len(original) + len(reenviado),
+    }
+
+
+def test_lote_cuenta_omitidos_por_hash_y_por_cufe(tenant_id):
+    servicio = InvoiceService()
+    cufe = uuid.uuid4().hex
+    original = _factura("FE-2", cufe)
+    reenviado = _factura("FE-2", cufe, "<!-- reenviado -->")
+    nueva = _factura("FE-3", uuid.uuid4().hex)
+    factura_id = servicio.process_document("f.xml", original, {}, tenant_id)
+    obtener_contadores(reiniciar=True)
+
+    documentos = [(nombre, contenido, {}, tenant_id) for nombre, contenido in (
+        ("f.xml", original), ("copia.xml", reenviado), ("nueva.xml", nueva),
+    )]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        resultados = list(servicio.process_documents(documentos, executor=executor))
+
+    assert [error for _, error in resultados] == [None, None, None]
+    assert [invoice_id for invoice_id, _ in resultados][:2] == [factura_id, factura_id]
+    assert obtener_contadores() == {
+        "adjuntos": 3,
+        "guardadas": 1,
+        "duplicados_hash": 1,
+        "duplicados_cufe": 1,
+        "omitidos": 2,
+        "bytes_omitidos": len(original) + len(reenviado),
+    }
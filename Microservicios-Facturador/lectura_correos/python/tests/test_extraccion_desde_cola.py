@@ -0,0 +1,50 @@
+import json
+from datetime import date
+
+from extraction import email_body
+from ingestion.cola_trabajo import ColaTrabajo
+from ingestion.spool import guardar_en_spool, guardar_texto_en_spool
+from services.invoice_service import extraer_documento
+
+TENANT = "tenant-acme"
+
+
+def _plantillas(tmp_path):
+    ruta = tmp_path / "plantillas_cuerpo.json"
+    ruta.write_text(json.dumps({"tenants": {TENANT: [{
+        "proveedor": "ACME S.A.S.",
+        "remitente": "@acme.com.co",
+        "campos": {
+            "numero_factura": {"etiqueta": "Factura No.", "patron": "([A-Z0-9-]+)"},
+            "fecha_emision": {"etiqueta": "Expedida el", "patron": r"(\d{2}/\d{2}/\d{4})", "formato": "%d/%m/%Y"},
+        },
+    }]}}), encoding="utf-8")
+    return email_body.ConfiguracionPlantillas(str(ruta))
+
+
+def test_trabajo_de_la_cola_usa_la_plantilla_del_remitente(tmp_path, monkeypatch):
+    monkeypatch.setattr(email_body, "configuracion_plantillas", _plantillas(tmp_path))
+    cola = ColaTrabajo(str(tmp_path / "cola.sqlite3"))
+    adjunto = guardar_en_spool(b"%PDF-1.4 factura de prueba")
+    cuerpo = guardar_texto_en_spool("Hola,\nFactura No. AC-2024-77\nExpedida el 05/03/2024\nGracias.")
+
+    cola.encolar_correo({
+        "tenant_id": TENANT,
+        "uid": 10,
+        "subject": "Documento electrónico",
+        "from": "Facturación ACME <facturas@acme.com.co>",
+        "correo_cliente": "cliente@empresa.com",
+        "body": cuerpo,
+        "adjuntos": [{"filename": "factura.pdf", **adjunto}],
+    })
+    [trabajo] = cola.reservar_lote(10, timeout=1)
+
+    datos = extraer_documento(trabajo["filename"], trabajo["adjunto"], trabajo["metadatos"], trabajo["tenant_id"])
+
+    assert datos["numero_factura"] == "AC-2024-77"
+    assert datos["fecha_emision"] == date(2024, 3, 5)
+    assert datos["nombre_proveedor"] == "ACME S.A.S."
+    assert datos["remitente_correo"] == "Facturación ACME <facturas@acme.com.co>"
+    assert datos["asunto_correo"] == "Documento electrónico"
+    assert datos["correo_cliente_asociado"] == "cliente@empresa.com"
+    assert datos["contenido_pdf_binario"] == b"%PDF-1.4 factura de prueba"
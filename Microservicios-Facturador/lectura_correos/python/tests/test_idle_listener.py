@@ -0,0 +1,114 @@
+import time
+import threading
+
+import pytest
+
+from config.settings import settings
+from ingestion import idle_listener
+from ingestion.idle_listener import OyenteIdle
+from imap_falso import ServidorImapFalso
+
+_BACKOFF_INICIAL = 0.05
+
+
+class _EventoRegistrado(threading.Event):
+    """Event que anota las esperas del oyente entre reconexiones."""
+
+    def __init__(self):
+        super().__init__()
+        self.esperas = []
+
+    def wait(self, timeout=None):
+        self.esperas.append(timeout)
+        return super().wait(timeout)
+
+
+def _esperar(condicion, timeout: float = 10.0):
+    fin = time.monotonic() + timeout
+    while not condicion():
+        assert time.monotonic() < fin, "la condición no se cumplió a tiempo"
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    falso = ServidorImapFalso()
+    monkeypatch.setattr(settings, "EMAIL_IMAP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "EMAIL_IMAP_PORT", falso.puerto)
+    monkeypatch.setattr(settings, "EMAIL_IMAP_SSL", False)
+    monkeypatch.setattr(settings, "EMAIL_FETCH_MODE", "incremental")
+    monkeypatch.setattr(idle_listener, "_BACKOFF_INICIAL_SEGUNDOS", _BACKOFF_INICIAL)
+    monkeypatch.setattr(idle_listener, "_INTERVALO_POLL_SEGUNDOS", 1.0)
+    # Sin jitter, para comprobar que la espera se duplica.
+    monkeypatch.setattr(idle_listener.random, "uniform", lambda minimo, maximo: maximo)
+    yield falso
+    falso.cerrar()
+
+
+@pytest.fixture
+def iniciar_oyente(servidor, request):
+    oyentes = []
+
+    def iniciar():
+        entregados = []
+        usuario = {"correo": f"{request.node.name}@empresa.com", "password": "clave", "tenant_id": "tenant-idle"}
+        oyente = OyenteIdle(usuario, entregados.append)
+        oyente.detener = _EventoRegistrado()
+        oyente.entregados = entregados
+        oyente.start()
+        oyentes.append(oyente)
+        return oyente
+
+    yield iniciar
+    for oyente in oyentes:
+        oyente.detener.set()
+        oyente.join(timeout=10)
+        assert not oyente.is_alive()
+
+
+def _asuntos(oyente):
+    return [correo["subject"] for correo in oyente.entregados]
+
+
+def test_puesta_al_dia_al_conectar(servidor, iniciar_oyente):
+    # Lo que llegó antes de la conexión se lee al conectar, antes de entrar en IDLE.
+    servidor.agregar("Factura FE-10")
+    servidor.agregar("Boletín semanal")
+    servidor.agregar("Factura FE-11")
+    oyente = iniciar_oyente()
+    _esperar(lambda: servidor.en_idle() == 1)
+    assert _asuntos(oyente) == ["Factura FE-10", "Factura FE-11"]
+    assert servidor.logins == 1
+
+
+def test_exists_dispara_lectura_incremental(servidor, iniciar_oyente):
+    oyente = iniciar_oyente()
+    _esperar(lambda: servidor.en_idle() == 1)
+
+    servidor.agregar("Su factura electrónica FE-2")
+    _esperar(lambda: _asuntos(oyente) == ["Su factura electrónica FE-2"])
+    _esperar(lambda: servidor.en_idle() == 1)
+    servidor.agregar("Factura FE-3")
+    _esperar(lambda: _asuntos(oyente) == ["Su factura electrónica FE-2", "Factura FE-3"])
+
+    # Cada EXISTS se resolvió sobre la misma conexión, sin volver a iniciar sesión.
+    assert servidor.logins == 1
+    assert [correo["uid"] for correo in oyente.entregados] == ["1", "2"]
+
+
+def test_reconecta_con_backoff_tras_bye_y_caida(servidor, iniciar_oyente):
+    oyente = iniciar_oyente()
+    _esperar(lambda: servidor.en_idle() == 1)
+
+    servidor.despedir()
+    _esperar(lambda: servidor.logins == 2 and servidor.en_idle() == 1)
+    servidor.agregar("Factura FE-20")
+    _esperar(lambda: _asuntos(oyente) == ["Factura FE-20"])
+
+    servidor.cortar()
+    _esperar(lambda: servidor.logins == 3 and servidor.en_idle() == 1)
+    servidor.agregar("Factura FE-21")
+    _esperar(lambda: _asuntos(oyente) == ["Factura FE-20", "Factura FE-21"])
+
+    # Dos caídas seguidas de conexiones cortas: la segunda espera el doble que la primera.
+    assert oyente.detener.esperas == [_BACKOFF_INICIAL, _BACKOFF_INICIAL * 2]
@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from config.settings import settings
+from ingestion.email_reader import leer_buzon
+from imap_falso import ServidorImapFalso
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    falso = ServidorImapFalso()
+    monkeypatch.setattr(settings, "EMAIL_IMAP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(settings, "EMAIL_IMAP_PORT", falso.puerto)
+    monkeypatch.setattr(settings, "EMAIL_IMAP_SSL", False)
+    monkeypatch.setattr(settings, "EMAIL_FETCH_MODE", "incremental")
+    yield falso
+    falso.cerrar()
+
+
+@pytest.fixture
+def usuario(request):
+    return {"correo": f"{request.node.name}@empresa.com", "password": "clave", "tenant_id": "tenant-lectura"}
+
+
+def _secciones_pedidas(servidor):
+    pedidas = {}
+    for uids, items in servidor.fetches:
+        for uid in uids:
+            pedidas.setdefault(uid, set()).update(re.findall(r"BODY\.PEEK\[(\d+)\]", items))
+    return pedidas
+
+
+@pytest.mark.parametrize("modo", ["incremental", "recientes"])
+def test_solo_se_descargan_las_partes_necesarias(servidor, usuario, monkeypatch, modo):
+    monkeypatch.setattr(settings, "EMAIL_FETCH_MODE", modo)
+    servidor.agregar("Factura FE-1")
+    servidor.agregar("Boletín semanal", cuerpo="Novedades del mes")
+    servidor.agregar("Factura FE-3", nombre="logo.png")
+    entregados = []
+
+    assert leer_buzon(usuario, entregados.append) == 1
+
+    assert [correo["subject"] for correo in entregados] == ["Factura FE-1"]
+    assert [adjunto["filename"] for adjunto in entregados[0]["adjuntos"]] == ["f1.pdf"]
+    # Nunca se pide el mensaje completo: primero estructura y cabeceras, luego partes sueltas.
+    assert not any(re.search(r"RFC822\b|BODY(\.PEEK)?\[\]", items) for _, items in servidor.fetches)
+    pedidas = _secciones_pedidas(servidor)
+    assert pedidas.get(1) == {"1", "2"}
+    # Sin palabra clave en el asunto basta el texto para descartarlo; sin adjunto de factura, nada.
+    assert pedidas.get(2) == {"1"}
+    assert not pedidas.get(3)
+
+
+@pytest.mark.parametrize("modo", ["incremental", "recientes"])
+@pytest.mark.parametrize("marcar", [True, False])
+def test_marca_como_leidos_solo_los_entregados(servidor, usuario, monkeypatch, marcar, modo):
+    monkeypatch.setattr(settings, "EMAIL_MARK_SEEN", marcar)
+    monkeypatch.setattr(settings, "EMAIL_FETCH_MODE", modo)
+    servidor.agregar("Factura FE-1")
+    servidor.agregar("Boletín semanal", cuerpo="Novedades del mes")
+
+    assert leer_buzon(usuario, lambda correo: None) == 1
+    assert servidor.vistos == ({1} if marcar else set())
+
+    # La siguiente lectura no depende de \Seen: el registro de UIDs evita releerlos.
+    assert leer_buzon(usuario, lambda correo: None) == 0
+
+
+def test_uidvalidity_nuevo_relee_el_buzon(servidor, usuario):
+    servidor.agregar("Factura FE-1")
+    assert leer_buzon(usuario, lambda correo: None) == 1
+    assert leer_buzon(usuario, lambda correo: None) == 0
+
+    # El servidor renumeró el buzón: el UID 1 ya no es el mismo mensaje.
+    servidor.uidvalidity += 1
+    entregados = []
+    assert leer_buzon(usuario, entregados.append) == 1
+    assert [correo["uid"] for correo in entregados] == ["1"]
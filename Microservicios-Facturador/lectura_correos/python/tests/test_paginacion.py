@@ -0,0 +1,110 @@
+import json
+import uuid
+import base64
+from datetime import date, datetime
+
+import pytest
+
+from database.crud import InvoiceCRUD
+from database.models import Factura
+from database.paginacion import CursorInvalido, codificar_cursor, decodificar_cursor
+
+_MISMO_MOMENTO = datetime(2024, 3, 1, 8, 30, 0, 123456)
+
+
+def _cursor_crudo(valores) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip("=")
+
+
+@pytest.fixture
+def facturas(db, tenant_id):
+    """Ids en el orden del listado (procesado_en DESC, id DESC); varias comparten procesado_en."""
+    crud = InvoiceCRUD(db)
+    momentos = [datetime(2024, 3, 2)] + [_MISMO_MOMENTO] * 5 + [datetime(2024, 2, 1), None]
+    creadas = []
+    for i, procesado_en in enumerate(momentos):
+        sufijo = uuid.uuid4().hex[:8]
+        datos = {"numero_factura": f"PAG-{sufijo}", "cufe": f"cufe-{sufijo}", "nit_proveedor": "900111222" if i % 2 else "800333444"}
+        factura_id = crud.create_invoice(datos, [
+            {"descripcion": f"Ítem {j}", "cantidad": 1, "valor_unitario": 1.0, "valor_total": 1.0} for j in range(5)
+        ], tenant_id)
+        creadas.append((procesado_en, factura_id))
+    # create_invoice pone procesado_en por defecto; se fija aquí para controlar empates y NULL.
+    for procesado_en, factura_id in creadas:
+        db.query(Factura).filter(Factura.id == factura_id).update({"procesado_en": procesado_en})
+    db.commit()
+    # Los NULL van al final en orden descendente, como en MySQL.
+    return [factura_id for _, factura_id in sorted(creadas, key=lambda c: (c[0] is not None, c[0] or datetime.min, c[1]), reverse=True)]
+
+
+def _recorrer(cliente, encabezados, url: str, limit: int, **params):
+    vistas, cursor, paginas = [], None, 0
+    while True:
+        respuesta = cliente.get(url, params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})}, headers=encabezados)
+        assert respuesta.status_code == 200, respuesta.text
+        vistas += [fila["id"] for fila in respuesta.json()]
+        paginas += 1
+        cursor = respuesta.headers.get("X-Next-Cursor")
+        if not cursor:
+            return vistas, paginas
+
+
+def test_cursor_recorre_todo_en_orden_estable(cliente, encabezados, facturas):
+    for limit in (1, 2, 3, len(facturas)):
+        vistas, paginas = _recorrer(cliente, encabezados, "/invoices/", limit)
+        # Sin repetir ni saltar filas aunque varias compartan procesado_en (desempata el id).
+        assert vistas == facturas
+        assert paginas == -(-len(facturas) // limit)
+
+
+def test_cursor_con_filtros(cliente, encabezados, facturas, db):
+    esperadas = [i for i in facturas if db.get(Factura, i).nit_proveedor == "900111222"]
+    vistas, _ = _recorrer(cliente, encabezados, "/invoices/", 2, nit_proveedor="900111222")
+    assert vistas == esperadas
+
+
+def test_skip_se_aplica_despues_del_cursor(cliente, encabezados, facturas):
+    primera = cliente.get("/invoices/", params={"limit": 3}, headers=encabezados)
+    cursor = primera.headers["X-Next-Cursor"]
+
+    respuesta = cliente.get("/invoices/", params={"limit": 2, "skip": 2, "cursor": cursor}, headers=encabezados)
+
+    assert [fila["id"] for fila in respuesta.json()] == facturas[5:7]
+    assert respuesta.headers["X-Next-Cursor"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "no es base64 %%%",
+    _cursor_crudo({"no": "es una lista"}),
+    _cursor_crudo([]),
+    _cursor_crudo([{"dt": "2024-03-01T08:30:00"}, 1, 2]),
+    _cursor_crudo([{"x": 1}, 1]),
+    _cursor_crudo([{"dt": "no-es-una-fecha"}, 1]),
+    _cursor_crudo([{"dt": 5}, 1]),
+])
+def test_cursor_invalido_responde_400(cliente, encabezados, facturas, cursor):
+    respuesta = cliente.get("/invoices/", params={"cursor": cursor}, headers=encabezados)
+    assert respuesta.status_code == 400
+    assert respuesta.json()["detail"] == "Cursor inválido."
+
+    respuesta = cliente.get(f"/invoices/{facturas[0]}/items/", params={"cursor": cursor}, headers=encabezados)
+    assert respuesta.status_code == 400
+
+
+def test_cursor_de_items(cliente, encabezados, facturas):
+    url = f"/invoices/{facturas[0]}/items/"
+    todos = [item["id"] for item in cliente.get(url, headers=encabezados).json()]
+
+    vistas, paginas = _recorrer(cliente, encabezados, url, 2)
+
+    assert vistas == sorted(todos) and len(todos) == 5
+    assert paginas == 3
+
+
+def test_codificar_y_decodificar_conservan_los_tipos():
+    valores = [datetime(2024, 3, 1, 8, 30, 0, 123456), date(2024, 3, 1), None, 42, "FE-1"]
+    cursor = codificar_cursor(valores)
+    assert "=" not in cursor
+    assert decodificar_cursor(cursor, len(valores)) == valores
+    with pytest.raises(CursorInvalido):
+        decodificar_cursor(cursor, len(valores) - 1)
@@ -0,0 +1,100 @@
+import os
+import json
+
+import pytest
+
+from ingestion import keyword_matcher
+from ingestion.keyword_matcher import ConfiguracionPalabras, DetectorFacturas, normalizar
+
+
+@pytest.fixture
+def archivo(tmp_path, monkeypatch):
+    # Sin espera entre revisiones: cada consulta mira el mtime del archivo.
+    monkeypatch.setattr(keyword_matcher, "_INTERVALO_RECARGA_SEGUNDOS", 0.0)
+    ruta = tmp_path / "palabras_factura.json"
+    mtimes = iter(range(1_700_000_000, 1_800_000_000, 10))
+
+    def escribir(datos):
+        ruta.write_text(datos if isinstance(datos, str) else json.dumps(datos), encoding="utf-8")
+        # mtime explícito: dos escrituras en el mismo instante del reloj del sistema de archivos
+        # no se distinguirían.
+        mtime = next(mtimes)
+        os.utime(ruta, (mtime, mtime))
+
+    escribir.ruta = str(ruta)
+    return escribir
+
+
+def test_sin_tildes_ni_mayusculas():
+    assert normalizar("FACTURACIÓN Nº 5 ñandú") == b"facturacion no 5 nandu"
+    # Lo que no cabe en Latin-1 queda como "?", sin romper la búsqueda del resto.
+    assert normalizar("Recibo € 10") == b"recibo ? 10"
+
+    detector = DetectorFacturas(["remisión", "Nota Crédito", "billing"])
+    for texto in ("REMISION 123", "Adjunto la remisión", "NOTA CRÉDITO", "nota credito", "Re: Billing"):
+        assert detector.coincide(texto), texto
+    for texto in ("remesa", "nota", "", None):
+        assert not detector.coincide(texto), texto
+
+
+def test_palabras_contenidas_en_otra_se_descartan():
+    detector = DetectorFacturas(["cuenta", "Estado de Cuenta", "  ", "CUENTA", "factura"])
+    assert detector.palabras == (b"cuenta", b"factura")
+    assert DetectorFacturas([]).coincide("factura") is False
+
+
+def test_agregar_y_excluir_por_inquilino(archivo):
+    archivo({
+        "palabras": ["factura", "recibo", "cuenta de cobro"],
+        "tenants": {
+            "tenant-a": {"agregar": ["Liquidación"], "excluir": ["RECIBO"]},
+            "tenant-b": {"excluir": ["Factura"]},
+        },
+    })
+    configuracion = ConfiguracionPalabras(archivo.ruta)
+
+    assert configuracion.detector("tenant-a").coincide("LIQUIDACION de nómina")
+    assert not configuracion.detector("tenant-a").coincide("Recibo de caja")
+    assert configuracion.detector("tenant-a").coincide("Factura 1")
+    assert not configuracion.detector("tenant-b").coincide("Factura 1")
+    assert configuracion.detector("tenant-b").coincide("Recibo de caja")
+    # Un inquilino sin ajustes y el caso sin inquilino usan las palabras generales.
+    for tenant_id in ("tenant-c", None):
+        assert configuracion.detector(tenant_id).coincide("Recibo de caja")
+        assert not configuracion.detector(tenant_id).coincide("Liquidación")
+    assert configuracion.detector("tenant-c") is configuracion.detector(None)
+
+
+def test_recarga_cuando_cambia_el_archivo(archivo):
+    archivo({"palabras": ["factura"]})
+    configuracion = ConfiguracionPalabras(archivo.ruta)
+    detector = configuracion.detector()
+    assert detector.coincide("Factura") and not detector.coincide("Remisión")
+    # Sin cambios se reutiliza el mismo detector.
+    assert configuracion.detector() is detector
+
+    archivo({"palabras": ["remisión"], "tenants": {"tenant-a": {"agregar": ["factura"]}}})
+    assert configuracion.detector().coincide("Remisión")
+    assert not configuracion.detector().coincide("Factura")
+    assert configuracion.detector("tenant-a").coincide("Factura")
+
+    # Un JSON inválido o un archivo borrado vuelven a las palabras por defecto.
+    archivo("{no es json")
+    assert configuracion.detector().coincide("Nota débito")
+    archivo({"palabras": ["remisión"]})
+    assert not configuracion.detector().coincide("Nota débito")
+    os.remove(archivo.ruta)
+    assert configuracion.detector().coincide("Nota débito")
+
+
+def test_revision_del_archivo_espaciada(archivo, monkeypatch):
+    monkeypatch.setattr(keyword_matcher, "_INTERVALO_RECARGA_SEGUNDOS", 3600.0)
+    archivo({"palabras": ["factura"]})
+    configuracion = ConfiguracionPalabras(archivo.ruta)
+    assert not configuracion.detector().coincide("Remisión")
+
+    # Dentro del intervalo no se mira el archivo.
+    archivo({"palabras": ["remisión"]})
+    assert not configuracion.detector().coincide("Remisión")
+    configuracion._revisado_en -= 3600
+    assert configuracion.detector().coincide("Remisión")
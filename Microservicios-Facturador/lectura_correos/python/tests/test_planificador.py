@@ -0,0 +1,110 @@
+import pytest
+
+from config.settings import settings
+from ingestion import utils
+from ingestion.scheduler import PlanificadorBuzones
+
+CORREO = "a@empresa.com"
+
+
+@pytest.fixture(autouse=True)
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "ESTADO_DB_PATH", str(tmp_path / "estado.sqlite3"))
+    monkeypatch.setattr(utils, "_conexion", None)
+    monkeypatch.setattr(settings, "EMAIL_POLL_MIN_SECONDS", 10)
+    monkeypatch.setattr(settings, "EMAIL_POLL_MAX_SECONDS", 1800)
+    monkeypatch.setattr(settings, "EMAIL_POLL_BACKOFF_FACTOR", 2.0)
+    yield tmp_path
+    _reiniciar()
+
+
+def _reiniciar():
+    """Como un reinicio del proceso: se cierra la conexión a la base de estado."""
+    if utils._conexion is not None:
+        utils._conexion.close()
+    utils._conexion = None
+
+
+def test_media_movil_de_la_tasa():
+    planificador = PlanificadorBuzones()
+
+    planificador.registrar_lectura(CORREO, 0, ahora=1000)
+    planificador.registrar_lectura(CORREO, 1, ahora=2000)
+    # 1 correo en 1000 s con peso 0.3: intervalo = 0.25 / tasa.
+    assert planificador._estado[CORREO]["tasa"] == pytest.approx(0.3 / 1000)
+    assert planificador._estado[CORREO]["intervalo"] == pytest.approx(0.25 / (0.3 / 1000))
+
+    planificador.registrar_lectura(CORREO, 1, ahora=2100)
+    tasa = 0.3 * (1 / 100) + 0.7 * (0.3 / 1000)
+    assert planificador._estado[CORREO]["tasa"] == pytest.approx(tasa)
+    assert planificador._estado[CORREO]["intervalo"] == pytest.approx(0.25 / tasa)
+    assert planificador._estado[CORREO]["proxima_lectura"] == pytest.approx(2100 + 0.25 / tasa)
+
+    # Sin novedades la tasa decae y el intervalo crece, sin pasar de lo que marca la tasa.
+    intervalo_previo = 0.25 / tasa
+    planificador.registrar_lectura(CORREO, 0, ahora=2200)
+    tasa *= 0.7
+    assert planificador._estado[CORREO]["tasa"] == pytest.approx(tasa)
+    assert intervalo_previo < planificador._estado[CORREO]["intervalo"] == pytest.approx(min(intervalo_previo * 2, 0.25 / tasa))
+
+
+def test_buzon_sin_novedades_espera_cada_vez_mas():
+    planificador = PlanificadorBuzones()
+    ahora, intervalos = 1000.0, []
+    for _ in range(9):
+        planificador.registrar_lectura(CORREO, 0, ahora=ahora)
+        intervalos.append(planificador._estado[CORREO]["intervalo"])
+        ahora = planificador._estado[CORREO]["proxima_lectura"]
+
+    assert intervalos == [20, 40, 80, 160, 320, 640, 1280, 1800, 1800]
+
+    # En cuanto llega un correo vuelve a un intervalo acorde a la tasa.
+    planificador.registrar_lectura(CORREO, 5, ahora=ahora)
+    assert planificador._estado[CORREO]["intervalo"] == pytest.approx(0.25 / (0.3 * 5 / 1800))
+
+
+def test_intervalo_acotado_al_minimo_y_al_maximo():
+    planificador = PlanificadorBuzones()
+
+    # Con mucho tráfico 0.25 / tasa queda por debajo del mínimo.
+    planificador.registrar_lectura(CORREO, 100, ahora=1000)
+    assert planificador._estado[CORREO]["intervalo"] == 10
+
+    # Un buzón que falla duplica su espera hasta el máximo.
+    for _ in range(12):
+        planificador.registrar_fallo(CORREO, ahora=1000)
+    assert planificador._estado[CORREO]["intervalo"] == 1800
+    assert planificador._estado[CORREO]["proxima_lectura"] == 1000 + 1800
+    # El fallo no cuenta como lectura.
+    assert planificador._estado[CORREO]["ultima_lectura"] == 1000
+
+
+def test_pendientes_y_proxima_lectura():
+    planificador = PlanificadorBuzones()
+    usuarios = [{"correo": CORREO}, {"correo": "nuevo@empresa.com"}]
+    planificador.registrar_lectura(CORREO, 0, ahora=1000)
+
+    # El buzón nuevo se lee de inmediato; el otro, al cumplirse su intervalo.
+    assert planificador.pendientes(usuarios, ahora=1010) == [{"correo": "nuevo@empresa.com"}]
+    assert planificador.pendientes(usuarios, ahora=1020) == usuarios
+    assert planificador.proxima_lectura(usuarios[:1]) == 1020
+    assert planificador.proxima_lectura(usuarios) == 0
+    assert planificador.proxima_lectura([]) is None
+
+
+def test_planificacion_persiste_tras_reiniciar():
+    planificador = PlanificadorBuzones()
+    for ahora in (1000, 1020, 1060):
+        planificador.registrar_lectura(CORREO, 0, ahora=ahora)
+    planificador.registrar_lectura("b@empresa.com", 3, ahora=1060)
+    estado = dict(planificador._estado)
+    _reiniciar()
+
+    recuperado = PlanificadorBuzones()
+
+    assert recuperado._estado == estado
+    assert recuperado._estado[CORREO]["intervalo"] == 80
+    # Tras el reinicio no vuelve a leer al ritmo mínimo: sigue esperando lo que tenía programado.
+    assert recuperado.pendientes([{"correo": CORREO}], ahora=1060 + 79) == []
+    recuperado.registrar_lectura(CORREO, 0, ahora=1140)
+    assert recuperado._estado[CORREO]["intervalo"] == 160
@@ -0,0 +1,115 @@
+import os
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoVencido
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from config.settings import settings
+from services import deduplicacion, invoice_service
+from services.invoice_service import InvoiceService, crear_pool_procesos, extraer_documento
+
+_FACTURA = """<?xml version="1.0" encoding="UTF-8"?>
+<Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+         xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+  <cbc:ID>{numero}</cbc:ID>
+  <cbc:UUID>{cufe}</cbc:UUID>
+</Invoice>"""
+
+
+def _factura(numero: str) -> bytes:
+    # numero_factura es único en toda la tabla: se le agrega un sufijo por prueba.
+    return _FACTURA.format(numero=f"{numero}-{uuid.uuid4().hex[:8]}", cufe=uuid.uuid4().hex).encode()
+
+
+def _extraer_o_caer(filename, *args):
+    # Se ejecuta en el proceso del pool: simula un worker que muere (OOM, segfault...).
+    if filename.startswith("cae"):
+        os._exit(1)
+    return extraer_documento(filename, *args)
+
+
+@pytest.fixture(autouse=True)
+def cache_aislada(tmp_path, monkeypatch, base_de_datos):
+    monkeypatch.setattr(deduplicacion, "DEDUP_DB_PATH", str(tmp_path / "dedup.sqlite3"))
+    monkeypatch.setattr(deduplicacion, "_conexion", None)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = crear_pool_procesos(2)
+    yield pool
+    pool.shutdown()
+
+
+def test_un_resultado_por_documento_en_orden(pool, tenant_id):
+    repetida = _factura("FE-1")
+    documentos = [
+        ("f1.xml", repetida, {}, tenant_id),
+        ("f2.xml", _factura("FE-2"), {}, tenant_id),
+        ("notas.txt", b"no es una factura", {}, tenant_id),
+        ("sin_tenant.xml", _factura("FE-3"), {}, None),
+        ("f1-copia.xml", repetida, {}, tenant_id),
+        ("f4.xml", _factura("FE-4"), {"tenant_id": tenant_id}, None),
+    ]
+
+    resultados = list(InvoiceService().process_documents(documentos, executor=pool, tamano_lote=2))
+
+    assert len(resultados) == len(documentos)
+    assert [error for _, error in resultados] == [None] * 6
+    ids = [invoice_id for invoice_id, _ in resultados]
+    # Los descartes definitivos llegan como (None, None) en su posición.
+    assert ids[2] is None and ids[3] is None
+    assert all(isinstance(ids[i], int) for i in (0, 1, 4, 5))
+    assert ids[4] == ids[0]
+    assert len({ids[0], ids[1], ids[5]}) == 3
+
+
+def test_caida_de_un_proceso_devuelve_error_y_el_pool_se_recupera(pool, tenant_id, monkeypatch):
+    servicio = InvoiceService()
+    monkeypatch.setattr(invoice_service, "extraer_documento", _extraer_o_caer)
+    documentos = [("cae.xml", _factura("FE-10"), {}, tenant_id)] + [
+        (f"f{i}.xml", _factura(f"FE-{i}"), {}, tenant_id) for i in range(11, 14)
+    ]
+
+    resultados = list(servicio.process_documents(documentos, executor=pool, tamano_lote=4))
+
+    assert len(resultados) == len(documentos)
+    invoice_id, error = resultados[0]
+    assert invoice_id is None and isinstance(error, BrokenProcessPool)
+    # Los demás del lote pudieron terminar antes de la caída o fallar con ella, nunca quedar sin resultado.
+    for invoice_id, error in resultados[1:]:
+        assert (invoice_id is None) == isinstance(error, BrokenProcessPool)
+
+    # El siguiente lote usa un pool nuevo en lugar de fallar entero.
+    reintentos = [documento for documento, (invoice_id, _) in zip(documentos[1:], resultados[1:]) if invoice_id is None]
+    reintentos.append(("f14.xml", _factura("FE-14"), {}, tenant_id))
+    resultados = list(servicio.process_documents(reintentos, executor=pool))
+    assert all(isinstance(invoice_id, int) and error is None for invoice_id, error in resultados)
+
+
+def test_parseo_que_supera_el_limite_devuelve_error(tenant_id, monkeypatch):
+    liberar = threading.Event()
+
+    def extraer_lento(filename, *args):
+        if filename == "lento.xml":
+            liberar.wait(10)
+        return extraer_documento(filename, *args)
+
+    monkeypatch.setattr(invoice_service, "extraer_documento", extraer_lento)
+    monkeypatch.setattr(settings, "PARSE_TIMEOUT_SECONDS", 0.2)
+    documentos = [
+        ("lento.xml", _factura("FE-20"), {}, tenant_id),
+        ("f21.xml", _factura("FE-21"), {}, tenant_id),
+    ]
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            resultados = list(InvoiceService().process_documents(documentos, executor=executor))
+            liberar.set()
+    finally:
+        liberar.set()
+
+    (lento, error), (invoice_id, sin_error) = resultados
+    assert lento is None and isinstance(error, FuturoVencido)
+    assert isinstance(invoice_id, int) and sin_error is None
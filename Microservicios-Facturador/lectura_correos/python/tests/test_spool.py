@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from ingestion import spool
+from ingestion.cola_trabajo import ColaTrabajo
+
+
+@pytest.fixture(autouse=True)
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path / "spool"))
+    return tmp_path / "spool"
+
+
+def _envejecer(manejador, segundos=2 * 3600):
+    antes = time.time() - segundos
+    os.utime(manejador["ruta"], (antes, antes))
+
+
+def _archivos(directorio):
+    return sorted(nombre for _, _, archivos in os.walk(directorio) for nombre in archivos)
+
+
+def test_guarda_por_sha256(directorio):
+    manejador = spool.guardar_en_spool(b"%PDF-1.4 factura")
+    sha256 = manejador["sha256"]
+    assert manejador["ruta"] == str(directorio / sha256[:2] / sha256[2:4] / sha256)
+    assert manejador["tamano"] == len(b"%PDF-1.4 factura")
+    assert spool.leer_bytes(manejador) == b"%PDF-1.4 factura"
+    assert spool.leer_texto(spool.guardar_texto_en_spool("Factura No. ñ-1")) == "Factura No. ñ-1"
+    # Sin temporales a medio escribir.
+    assert not any(nombre.endswith(".tmp") for nombre in _archivos(directorio))
+
+
+def test_mismo_contenido_reutiliza_el_archivo(directorio):
+    primero = spool.guardar_en_spool(b"mismo adjunto")
+    _envejecer(primero)
+    segundo = spool.guardar_en_spool(b"mismo adjunto")
+    assert segundo == primero
+    assert _archivos(directorio) == [primero["sha256"]]
+    # Volver a recibirlo refresca la fecha: la limpieza no lo borra mientras se encola.
+    assert time.time() - os.path.getmtime(segundo["ruta"]) < 60
+
+
+def test_limpieza_borra_solo_lo_viejo_sin_referencias(directorio):
+    viejo = spool.guardar_en_spool(b"viejo sin referencias")
+    referenciado = spool.guardar_en_spool(b"viejo pero en la cola")
+    reciente = spool.guardar_en_spool(b"recien llegado")
+    _envejecer(viejo)
+    _envejecer(referenciado)
+
+    assert spool.limpiar_spool({referenciado["sha256"]}) == 1
+    assert _archivos(directorio) == sorted([referenciado["sha256"], reciente["sha256"]])
+
+
+def test_la_cola_conserva_adjuntos_y_cuerpos_pendientes(tmp_path, directorio):
+    cola = ColaTrabajo(str(tmp_path / "cola.sqlite3"))
+    adjunto = spool.guardar_en_spool(b"%PDF-1.4 pendiente")
+    cuerpo = spool.guardar_texto_en_spool("Factura No. FE-9")
+    huerfano = spool.guardar_en_spool(b"ya procesado")
+    for manejador in (adjunto, cuerpo, huerfano):
+        _envejecer(manejador)
+    cola.encolar_correo({"tenant_id": "t", "uid": 1, "body": cuerpo, "adjuntos": [{"filename": "f.pdf", **adjunto}]})
+
+    assert cola.limpiar_spool() == 1
+    assert _archivos(directorio) == sorted([adjunto["sha256"], cuerpo["sha256"]])
+
+    # Confirmado el trabajo, sus archivos también se limpian.
+    cola.confirmar(cola.reservar(timeout=0))
+    assert cola.limpiar_spool() == 2
+    assert _archivos(directorio) == []
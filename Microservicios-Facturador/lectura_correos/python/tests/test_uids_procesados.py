@@ -0,0 +1,99 @@
+import json
+import logging
+import threading
+
+import pytest
+
+from ingestion import utils
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "ESTADO_DB_PATH", str(tmp_path / "estado.sqlite3"))
+    monkeypatch.setattr(utils, "PROCESSED_UIDS_DIR", str(tmp_path / "processed_uids"))
+    monkeypatch.setattr(utils, "_conexion", None)
+    monkeypatch.setattr(utils, "_migrados", set())
+    monkeypatch.setattr(utils, "_ultima_compactacion", {})
+    yield tmp_path
+    _reiniciar()
+
+
+def _reiniciar():
+    """Como un reinicio del proceso: se cierra la conexión y se olvida el estado en memoria."""
+    if utils._conexion is not None:
+        utils._conexion.close()
+    utils._conexion = None
+    utils._migrados.clear()
+    utils._ultima_compactacion.clear()
+
+
+def _filas(correo):
+    return sorted(utils._conectar().execute(
+        "SELECT uidvalidity, uid FROM uids_procesados WHERE correo = ?", (correo,)
+    ).fetchall())
+
+
+def test_persisten_tras_reiniciar(almacen):
+    utils.guardar_uids([1, 2, 3], "a@empresa.com", 7)
+    utils.guardar_estado_buzon("a@empresa.com", 7, 3)
+    _reiniciar()
+
+    assert utils.filtrar_uids_no_procesados("a@empresa.com", 7, [1, 2, 3, 4, 5]) == [4, 5]
+    assert utils.cargar_estado_buzon("a@empresa.com") == {"uidvalidity": 7, "ultimo_uid": 3}
+    assert utils.cargar_estado_buzon("otro@empresa.com") == {}
+
+
+def test_reinicio_de_uidvalidity(almacen):
+    correo = "a@empresa.com"
+    utils.guardar_uids([1, 2], correo, 7)
+    utils.guardar_uid("5", correo)  # modo "recientes": sin UIDVALIDITY
+    utils.guardar_estado_buzon(correo, 7, 2)
+    assert utils.filtrar_uids_no_procesados(correo, 7, [1, 2, 5, 6]) == [6]
+
+    # Con otro UIDVALIDITY los mismos números son mensajes nuevos, también los de "recientes".
+    assert utils.filtrar_uids_no_procesados(correo, 8, [1, 2, 5, 6]) == [1, 2, 5, 6]
+
+    # Al guardar el nuevo estado se compacta: no queda nada del UIDVALIDITY anterior.
+    utils.guardar_uids([1], correo, 8)
+    utils.guardar_estado_buzon(correo, 8, 1)
+    assert _filas(correo) == [(8, 1)]
+    assert utils.filtrar_uids_no_procesados(correo, 8, [1, 2]) == [2]
+
+
+def test_migra_los_json_legados_una_vez(almacen):
+    directorio = almacen / "processed_uids"
+    directorio.mkdir()
+    legado = directorio / "a_at_empresa_dot_com_uids.json"
+    legado.write_text(json.dumps(["3", "4"]), encoding="utf-8")
+
+    assert utils.cargar_uids_procesados("a@empresa.com") == {"3", "4"}
+    assert not legado.exists() and (directorio / "a_at_empresa_dot_com_uids.json.migrado").exists()
+    _reiniciar()
+    assert utils.cargar_uids_procesados("a@empresa.com") == {"3", "4"}
+
+
+def test_escritores_concurrentes(almacen, caplog):
+    correos = [f"buzon{i}@empresa.com" for i in range(4)]
+
+    def escribir(indice):
+        correo = correos[indice % len(correos)]
+        # Rangos que se pisan entre hilos del mismo buzón: INSERT OR IGNORE no debe fallar.
+        for inicio in range(0, 200, 20):
+            utils.guardar_uids(range(indice * 50 + inicio, indice * 50 + inicio + 20), correo, 7)
+            utils.filtrar_uids_no_procesados(correo, 7, list(range(0, 400)))
+        utils.guardar_estado_buzon(correo, 7, indice * 50 + 199)
+
+    with caplog.at_level(logging.ERROR, logger=utils.logger.name):
+        hilos = [threading.Thread(target=escribir, args=(i,)) for i in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=30)
+
+    assert not caplog.records
+    _reiniciar()
+    for posicion, correo in enumerate(correos):
+        esperados = set()
+        for indice in (posicion, posicion + len(correos)):
+            esperados.update(range(indice * 50, indice * 50 + 200))
+        assert {uid for _, uid in _filas(correo)} == esperados
@@ -0,0 +1,23 @@
+import pytest
+from alembic import command
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import verificar_indices
+from database.models import configuracion_alembic
+
+
+@pytest.fixture
+def base_propia(tmp_path, monkeypatch):
+    # Base aparte: las filas de otras pruebas cambiarían las estadísticas de ANALYZE.
+    motor = create_engine(f"sqlite:///{tmp_path / 'indices.sqlite'}")
+    with motor.begin() as conexion:
+        command.upgrade(configuracion_alembic(conexion), "head")
+    monkeypatch.setattr(verificar_indices, "engine", motor)
+    monkeypatch.setattr(verificar_indices, "SessionLocal", sessionmaker(bind=motor))
+    yield
+    motor.dispose()
+
+
+def test_filtros_del_listado_usan_su_indice_sin_ordenar(base_propia, tenant_id, capsys):
+    assert verificar_indices.verificar(tenant_id, filas=5000), capsys.readouterr().out
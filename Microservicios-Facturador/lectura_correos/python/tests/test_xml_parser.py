@@ -0,0 +1,126 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from extraction.xml_parser import parse_invoice_xml, extract_nested_invoice_xml
+
+FIXTURES = Path(__file__).parent / "fixtures" / "xml"
+
+
+def _leer(nombre: str) -> bytes:
+    return (FIXTURES / nombre).read_bytes()
+
+
+def test_factura_dian_completa():
+    datos = parse_invoice_xml(_leer("factura_dian.xml").decode("utf-8"))
+
+    # Los cbc:ID/cbc:UUID dentro de ext:UBLExtensions no cuentan como los del documento.
+    assert datos["numero_factura"] == "SETP990000123"
+    assert datos["cufe"].startswith("8f0a4b1c")
+    assert datos["fecha_emision"] == date(2024, 3, 1)
+    assert datos["hora_emision"] == "10:15:00-05:00"
+    assert datos["moneda"] == "COP"
+    assert datos["monto_subtotal"] == 3000.0
+    assert datos["monto_total"] == 3600.0
+    # Solo los TaxTotal del documento, no los de cada línea.
+    assert datos["monto_impuesto"] == 600.0
+    assert datos["fecha_vencimiento"] == date(2024, 3, 31)
+    assert datos["metodo_pago"] == "42"
+    assert datos["nombre_proveedor"] == "Suministros Andinos S.A.S."
+    assert datos["nit_proveedor"] == "900123456"
+    assert datos["email_proveedor"] == "facturacion@andinos.com.co"
+    assert datos["nombre_cliente"] == "Compras Cliente Ltda."
+    assert datos["nit_cliente"] == "800654321"
+    assert datos["correo_cliente_asociado"] == "compras@cliente.com.co"
+    assert datos["items"] == [
+        {"cantidad": 1.0, "descripcion": "Resma de papel", "valor_unitario": 1000.0, "valor_total": 1000.0},
+        {"cantidad": 2.0, "descripcion": "Café molido — 500 g", "valor_unitario": 1000.0, "valor_total": 2000.0},
+    ]
+
+
+def test_alternativas_y_valores_ausentes():
+    datos = parse_invoice_xml(_leer("factura_sin_razon_social.xml").decode("utf-8"))
+
+    # RegistrationName vacío: se usa PartyName/Name.
+    assert datos["nombre_proveedor"] == "Ferretería El Tornillo"
+    assert datos["nit_proveedor"] == "901555444"
+    # Un Party sin hijos no asigna nada: extraer_documento conserva el correo_cliente_asociado
+    # que ya tenía (el del correo) en vez de reemplazarlo por None.
+    assert not {"nombre_cliente", "nit_cliente", "correo_cliente_asociado"} & datos.keys()
+    assert datos["cufe"] is None
+    # Fecha en otro formato: se descarta en vez de fallar.
+    assert datos["fecha_emision"] is None
+    # Decimales con coma y miles con punto.
+    assert datos["monto_subtotal"] == 1234.5
+    assert datos["monto_total"] == 1469.06
+    assert datos["monto_impuesto"] is None
+    assert datos["items"] == []
+
+
+def test_caracteres_invalidos_se_limpian_solo_si_no_parsea():
+    xml = _leer("factura_dian.xml").decode("utf-8")
+    assert "\x01" not in xml
+    sucio = xml.replace("<cbc:Description>Resma de papel", "<cbc:Description>Resma\x01de papel")
+
+    datos = parse_invoice_xml(sucio)
+
+    assert datos["numero_factura"] == "SETP990000123"
+    assert datos["items"][0]["descripcion"] == "Resma de papel"
+    # En la segunda pasada también se reemplazan los caracteres fuera de Latin-1.
+    assert datos["items"][1]["descripcion"] == "Café molido   500 g"
+
+
+def test_attached_document_entrega_la_factura_del_attachment():
+    xml = extract_nested_invoice_xml(_leer("attached_document.xml"))
+
+    # El Attachment de la raíz, no el de las extensiones ni el de ParentDocumentLineReference.
+    assert xml.startswith('<?xml version="1.0" encoding="UTF-8"?><Invoice')
+    datos = parse_invoice_xml(xml)
+    assert datos["numero_factura"] == "SETP990000123"
+    assert datos["cufe"] == "cufe-adjunto"
+    assert datos["monto_total"] == 3600.0
+
+
+def test_attached_document_con_caracteres_invalidos():
+    contenido = _leer("attached_document.xml").replace(b"<cbc:LineID>1", b"<cbc:LineID>\x021")
+
+    xml = extract_nested_invoice_xml(contenido)
+
+    assert parse_invoice_xml(xml)["cufe"] == "cufe-adjunto"
+
+
+def test_factura_sin_envoltorio_se_entrega_tal_cual():
+    contenido = _leer("factura_dian.xml")
+
+    assert extract_nested_invoice_xml(contenido) == contenido.decode("utf-8")
+
+
+@pytest.mark.parametrize("contenido", [
+    _leer("application_response.xml"),
+    b"",
+    b"   \n",
+    b"<Invoice><cbc:ID>sin cerrar",
+    "<Invoice>no es UTF-8 ñ</Invoice>".encode("latin-1"),
+])
+def test_documentos_que_no_son_factura(contenido):
+    assert extract_nested_invoice_xml(contenido) is None
+
+
+@pytest.mark.parametrize("xml", ["", "  ", "<Invoice><cbc:ID>sin cerrar"])
+def test_xml_vacio_o_invalido(xml):
+    assert parse_invoice_xml(xml) is None
+
+
+def test_coincide_con_la_implementacion_anterior():
+    # Misma salida que el parser de árbol completo con búsquedas `.//` del micro-benchmark.
+    from benchmarks.xml_parser import corpus_sintetico, parse_invoice_xml_base
+    # Salvo monto_impuesto: `.//cac:TaxTotal` sumaba también el IVA de cada línea, que ya está
+    # incluido en el TaxTotal del documento.
+    for nombre, xml in corpus_sintetico(300):
+        actual, anterior = parse_invoice_xml(xml), parse_invoice_xml_base(xml)
+        lineas = len(actual["items"])
+        assert actual.pop("monto_impuesto") == sum(range(1, lineas + 1)) * 190
+        anterior.pop("monto_impuesto")
+        actual.pop("texto_crudo_xml")
+        assert actual == anterior, nombre